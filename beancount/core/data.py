@@ -462,6 +462,122 @@ def create_simple_posting_with_cost(entry, account,
 
 NoneType = type(None)
 
+
+# Tables of the expected types of the fields of transactions and postings used
+# by check_types(), as (field index, field name, types, error message) tuples.
+# The error message is formatted with the type of the invalid value.
+def _field_types(cls, *fields):
+    return tuple((cls._fields.index(name), name, types, message)
+                 for name, types, message in fields)
+
+_TRANSACTION_FIELD_TYPES = _field_types(
+    Transaction,
+    ('flag', (NoneType, str), "Invalid flag type"),
+    ('payee', (NoneType, str), "Invalid payee type"),
+    ('narration', (NoneType, str), "Invalid narration type"),
+    ('tags', (set, frozenset), "Invalid tags type: {}"),
+    ('links', (set, frozenset), "Invalid links type: {}"),
+    ('postings', (list,), "Invalid postings list type"))
+
+_TRANSACTION_FIELD_TYPES_ALLOW_NONE = tuple(
+    (index, name, (NoneType,) + types if name in ('tags', 'links') else types, message)
+    for index, name, types, message in _TRANSACTION_FIELD_TYPES)
+
+_POSTING_FIELD_TYPES = _field_types(
+    Posting,
+    ('account', (str,), "Invalid account type"),
+    ('units', (Amount, NoneType), "Invalid units type"),
+    ('cost', (Cost, CostSpec, NoneType), "Invalid cost type"),
+    ('price', (Amount, NoneType), "Invalid price type"),
+    ('flag', (str, NoneType), "Invalid flag type"))
+
+
+def _check_field_types(value, field_types):
+    """Check the types of the fields of a namedtuple value.
+
+    Args:
+      value: A namedtuple instance.
+      field_types: A table of field types, as produced by _field_types().
+    Returns:
+      None if the value is valid, or a string, the error message.
+    """
+    for index, _, types, message in field_types:
+        field_value = value[index]
+        if not isinstance(field_value, types):
+            return message.format(type(field_value))
+    return None
+
+
+def check_types(entry, allow_none_for_tags_and_links=False):
+    """Check that the entry and its postings has all correct data types.
+
+    This performs the same checks as sanity_check_types() but returns the error
+    instead of raising it. The common case of valid entries whose values are of
+    the exact types created by the parser is checked first by comparing types
+    directly, and only entries which fail that are checked again in detail with
+    isinstance(), against the tables of field types above.
+
+    Args:
+      entry: An instance of one of the entries to be checked.
+      allow_none_for_tags_and_links: A boolean, whether to allow plugins to
+        generate Transaction objects with None as value for the 'tags' or 'links'
+        attributes.
+    Returns:
+      None if the entry is valid, or a string, the error message.
+    """
+    entry_type = type(entry)
+    if entry_type not in ALL_DIRECTIVES and not isinstance(entry, ALL_DIRECTIVES):
+        return "Invalid directive type"
+    meta = entry.meta
+    if type(meta) is not dict and not isinstance(meta, dict):
+        return "Invalid type for meta"
+    if 'filename' not in meta:
+        return "Missing filename in metadata"
+    if 'lineno' not in meta:
+        return "Missing line number in metadata"
+    date = entry.date
+    if type(date) is not datetime.date and not isinstance(date, datetime.date):
+        return "Invalid date type"
+
+    if entry_type is not Transaction:
+        if not isinstance(entry, Transaction):
+            return None
+    else:
+        _, _, flag, payee, narration, tags, links, postings = entry
+        if ((flag is None or type(flag) is str) and
+            (payee is None or type(payee) is str) and
+            (narration is None or type(narration) is str) and
+            (type(tags) is frozenset or type(tags) is set) and
+            (type(links) is frozenset or type(links) is set) and
+            type(postings) is list):
+            for posting in postings:
+                if type(posting) is not Posting:
+                    break
+                account, units, cost, price, flag, _ = posting
+                if not (type(account) is str and
+                        (units is None or type(units) is Amount) and
+                        (cost is None or type(cost) is Cost or type(cost) is CostSpec) and
+                        (price is None or type(price) is Amount) and
+                        (flag is None or type(flag) is str)):
+                    break
+            else:
+                return None
+
+    # Check the transaction again in detail, to produce an error message.
+    message = _check_field_types(entry, (_TRANSACTION_FIELD_TYPES_ALLOW_NONE
+                                         if allow_none_for_tags_and_links
+                                         else _TRANSACTION_FIELD_TYPES))
+    if message is not None:
+        return message
+    for posting in entry.postings:
+        if not isinstance(posting, Posting):
+            return "Invalid posting type"
+        message = _check_field_types(posting, _POSTING_FIELD_TYPES)
+        if message is not None:
+            return message
+    return None
+
+
 def sanity_check_types(entry, allow_none_for_tags_and_links=False):
     """Check that the entry and its postings has all correct data types.
 
@@ -473,30 +589,9 @@ def sanity_check_types(entry, allow_none_for_tags_and_links=False):
     Raises:
       AssertionError: If there is anything that is unexpected, raises an exception.
     """
-    assert isinstance(entry, ALL_DIRECTIVES), "Invalid directive type"
-    assert isinstance(entry.meta, dict), "Invalid type for meta"
-    assert 'filename' in entry.meta, "Missing filename in metadata"
-    assert 'lineno' in entry.meta, "Missing line number in metadata"
-    assert isinstance(entry.date, datetime.date), "Invalid date type"
-    if isinstance(entry, Transaction):
-        assert isinstance(entry.flag, (NoneType, str)), "Invalid flag type"
-        assert isinstance(entry.payee, (NoneType, str)), "Invalid payee type"
-        assert isinstance(entry.narration, (NoneType, str)), "Invalid narration type"
-        set_types = ((NoneType, set, frozenset)
-                     if allow_none_for_tags_and_links
-                     else (set, frozenset))
-        assert isinstance(entry.tags, set_types), (
-            "Invalid tags type: {}".format(type(entry.tags)))
-        assert isinstance(entry.links, set_types), (
-            "Invalid links type: {}".format(type(entry.links)))
-        assert isinstance(entry.postings, list), "Invalid postings list type"
-        for posting in entry.postings:
-            assert isinstance(posting, Posting), "Invalid posting type"
-            assert isinstance(posting.account, str), "Invalid account type"
-            assert isinstance(posting.units, (Amount, NoneType)), "Invalid units type"
-            assert isinstance(posting.cost, (Cost, CostSpec, NoneType)), "Invalid cost type"
-            assert isinstance(posting.price, (Amount, NoneType)), "Invalid price type"
-            assert isinstance(posting.flag, (str, NoneType)), "Invalid flag type"
+    message = check_types(entry, allow_none_for_tags_and_links)
+    if message is not None:
+        raise AssertionError(message)
 
 
 def posting_has_conversion(posting):
@@ -573,6 +668,27 @@ def entry_sortkey(entry):
     return (entry.date, SORT_ORDER.get(type(entry), 0), entry.meta["lineno"])
 
 
+def entry_sortkey_int(entry):
+    """Integer sort-key for entries, which orders entries like entry_sortkey().
+
+    Comparing integers is cheaper than comparing tuples, and the key can be
+    cached. The date, the type order and the line number are packed into a
+    single integer.
+
+    Args:
+      entry: An entry instance.
+    Returns:
+      An integer, the sort key for the entry.
+    Raises:
+      TypeError: If the line number of the entry is not an integer.
+    """
+    lineno = entry.meta["lineno"]
+    if type(lineno) is not int:
+        raise TypeError("Invalid line number for integer sort key: {!r}".format(lineno))
+    return ((((entry.date.toordinal() << 3) + SORT_ORDER.get(type(entry), 0) + 4) << 64) +
+            lineno + (1 << 63))
+
+
 def sorted(entries):
     """A convenience to sort a list of entries, using entry_sortkey().
 
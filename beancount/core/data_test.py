@@ -59,6 +59,37 @@ class TestData(unittest.TestCase):
         with self.assertRaises(AssertionError):
             data.sanity_check_types(entry._replace(postings=None))
 
+    def test_check_types(self):
+        entry = self.create_empty_transaction()
+        data.create_simple_posting(entry, 'Assets:Bank:Checking', '123.45', 'USD')
+        self.assertIsNone(data.check_types(entry))
+        self.assertEqual("Invalid directive type", data.check_types('a string'))
+        self.assertEqual("Missing filename in metadata",
+                         data.check_types(entry._replace(meta={})))
+        self.assertEqual("Invalid date type",
+                         data.check_types(entry._replace(date='2014-01-01')))
+        self.assertEqual("Invalid tags type: <class 'dict'>",
+                         data.check_types(entry._replace(tags={})))
+        self.assertEqual("Invalid links type: <class 'NoneType'>",
+                         data.check_types(entry._replace(links=None)))
+        self.assertIsNone(data.check_types(entry._replace(links=None), True))
+        self.assertEqual("Invalid posting type",
+                         data.check_types(entry._replace(postings=[None])))
+        posting = entry.postings[0]
+        self.assertEqual("Invalid account type",
+                         data.check_types(entry._replace(postings=[
+                             posting._replace(account=None)])))
+        self.assertEqual("Invalid cost type",
+                         data.check_types(entry._replace(postings=[
+                             posting._replace(cost='100 USD')])))
+
+        # Subclasses of the expected types are accepted.
+        class Narration(str):
+            pass
+        self.assertIsNone(data.check_types(entry._replace(narration=Narration('a'))))
+        self.assertIsNone(data.check_types(entry._replace(
+            date=datetime.datetime(2014, 1, 1, 12, 0))))
+
     def test_posting_has_conversion(self):
         entry = self.create_empty_transaction()
         posting = data.create_simple_posting(
@@ -127,6 +158,20 @@ class TestData(unittest.TestCase):
         sorted_entries = sorted(entries, key=data.entry_sortkey)
         self.check_sorted(sorted_entries)
 
+    def test_entry_sortkey_int(self):
+        entries = self.create_sort_data()
+        sorted_entries = sorted(entries, key=data.entry_sortkey_int)
+        self.check_sorted(sorted_entries)
+
+        # Extreme line numbers sort like the tuple key.
+        entries = [entry._replace(meta=dict(entry.meta, lineno=lineno))
+                   for entry, lineno in zip(entries, [0, -5, 2**40, 7, -2**40, 3, 1])]
+        self.assertEqual(sorted(entries, key=data.entry_sortkey),
+                         sorted(entries, key=data.entry_sortkey_int))
+
+        with self.assertRaises(TypeError):
+            data.entry_sortkey_int(entries[0]._replace(meta={'lineno': None}))
+
     def test_sort(self):
         entries = self.create_sort_data()
         sorted_entries = data.sorted(entries)
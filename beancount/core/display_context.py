@@ -63,6 +63,7 @@ __license__ = "GNU GPLv2"
 import collections
 import enum
 import io
+import string
 
 from beancount.core.number import Decimal
 from beancount.core import distribution
@@ -174,11 +175,24 @@ class DisplayContext:
       ccontexts: A dict of currency string to CurrencyContext instance.
       commas: A bool, true if we should render commas. This just gets propagated
         onwards as the default value of to build with.
+      formatters: A dict of the arguments of build() to the DisplayFormatter
+        instances it has produced. This is cleared whenever a number is added.
     """
     def __init__(self):
         self.ccontexts = collections.defaultdict(_CurrencyContext)
         self.ccontexts['__default__'] = _CurrencyContext()
         self.commas = False
+        self.formatters = {}
+
+    def __getstate__(self):
+        # Don't pickle the cached formatters; they contain closures.
+        state = self.__dict__.copy()
+        state['formatters'] = {}
+        return state
+
+    def __setstate__(self, state):
+        state.setdefault('formatters', {})
+        self.__dict__.update(state)
 
     def set_commas(self, commas):
         """Set the default value for rendering commas."""
@@ -199,6 +213,8 @@ class DisplayContext:
           currency: An optional string, the currency this numbers applies to.
         """
         self.ccontexts[currency].update(number)
+        if self.formatters:
+            self.formatters.clear()
 
     def quantize(self, number, currency, precision=Precision.MOST_COMMON):
         """Quantize the given number to the given precision.
@@ -226,6 +242,10 @@ class DisplayContext:
               reserved=0):
         """Build a formatter for the given display context.
 
+        Formatters are cached; building a formatter with the same arguments
+        returns the same instance, until the context is updated with new
+        numbers.
+
         Args:
           alignment: The desired alignment.
           precision: The desired precision.
@@ -233,9 +253,20 @@ class DisplayContext:
             by the context will be used.
           reserved: An integer, the number of extra digits to be allocated in
             the maximum width calculations.
+        Returns:
+          An instance of DisplayFormatter.
         """
         if commas is None:
             commas = self.commas
+
+        # Note: Merely looking up a currency in the contexts inserts a new one,
+        # which changes the format strings, hence the number of currencies.
+        key = (alignment, precision, commas, reserved, len(self.ccontexts))
+        try:
+            return self.formatters[key]
+        except KeyError:
+            pass
+
         if alignment == Align.NATURAL:
             build_method = self._build_natural
         elif alignment == Align.RIGHT:
@@ -246,7 +277,8 @@ class DisplayContext:
             raise ValueError("Unknown alignment: {}".format(alignment))
         fmtstrings = build_method(precision, commas, reserved)
 
-        return DisplayFormatter(self, precision, fmtstrings)
+        dformat = self.formatters[key] = DisplayFormatter(self, precision, fmtstrings)
+        return dformat
 
     def _build_natural(self, precision, commas, unused_reserved):
         comma_str = ',' if commas else ''
@@ -338,6 +370,32 @@ class DisplayContext:
         return fmtstrings
 
 
+def compile_format(fmtstr):
+    """Compile a format string for a single number into a function.
+
+    The function calls the number's formatting method directly with the format
+    specification, which avoids parsing the format string on every call.
+
+    Args:
+      fmtstr: A format string with a single replacement field and an optional
+        literal suffix, e.g. '{:,.2f}  '.
+    Returns:
+      A function of a number, which returns the formatted string.
+    """
+    parsed = list(string.Formatter().parse(fmtstr))
+    if (len(parsed) > 2 or
+        parsed[0][0] or parsed[0][1] or parsed[0][3] or
+        (len(parsed) == 2 and parsed[1][1] is not None)):
+        # Not a simple format string; fall back on the generic method.
+        return fmtstr.format
+    _, _, spec, _ = parsed[0]
+    suffix = parsed[1][0] if len(parsed) == 2 else ''
+    if suffix:
+        return lambda number: format(number, spec) + suffix
+    else:
+        return lambda number: format(number, spec)
+
+
 class DisplayFormatter:
     """A class used to contain various settings that control how we output numbers.
     In particular, the precision used for each currency, and whether or not
@@ -348,24 +406,21 @@ class DisplayFormatter:
       dcontext: A DisplayContext instance.
       precision: An enum of Precision from which it was built.
       fmtstrings: A dict of currency to pre-baked format strings for it.
-      fmtfuncs: A dict of currency to pre-baked formatting functionsfor it.
+      fmtfuncs: A dict of currency to pre-baked formatting functions for it.
     """
     def __init__(self, dcontext, precision, fmtstrings):
         self.dcontext = dcontext
         self.precision = precision
         self.fmtstrings = fmtstrings
-        self.fmtfuncs = {currency: fmtstr.format
+        self.fmtfuncs = {currency: compile_format(fmtstr)
                          for currency, fmtstr in fmtstrings.items()}
+        self._default_func = self.fmtfuncs['__default__']
 
     def __str__(self):
         return 'DisplayFormatter({})'.format(self.fmtstrings)
 
     def format(self, number, currency='__default__'):
-        try:
-            func = self.fmtfuncs[currency]
-        except KeyError:
-            func = self.fmtfuncs['__default__']
-        return func(number)
+        return self.fmtfuncs.get(currency, self._default_func)(number)
 
     def quantize(self, number, currency='__default__'):
         return self.dcontext.quantize(number, currency, self.precision)
@@ -1,6 +1,7 @@
 __copyright__ = "Copyright (C) 2014-2016  Martin Blais"
 __license__ = "GNU GPLv2"
 
+import pickle
 import unittest
 
 from beancount.core import display_context
@@ -257,3 +258,53 @@ class TestDisplayContextQuantize(unittest.TestCase):
         dcontext.update(Decimal('1.2302'), 'USD')
         self.assertEqual(Decimal('3.2325'),
                          dcontext.quantize(Decimal('3.23253343'), 'USD'))
+
+
+class TestDisplayContextCache(unittest.TestCase):
+
+    def test_build_cached(self):
+        dcontext = display_context.DisplayContext()
+        dcontext.update(Decimal('1.23'), 'USD')
+        dformat = dcontext.build()
+        self.assertIs(dformat, dcontext.build())
+        self.assertIs(dformat, dcontext.build(commas=False))
+        self.assertIsNot(dformat, dcontext.build(alignment=Align.DOT))
+        self.assertIsNot(dformat, dcontext.build(precision=Precision.MAXIMUM))
+        self.assertIsNot(dformat, dcontext.build(commas=True))
+        self.assertIsNot(dformat, dcontext.build(reserved=2))
+
+    def test_build_invalidated(self):
+        dcontext = display_context.DisplayContext()
+        dcontext.update(Decimal('1.23'), 'USD')
+        dformat = dcontext.build()
+        self.assertEqual('3.14', dformat.format(Decimal('3.14159'), 'USD'))
+
+        dcontext.update(Decimal('1.234'), 'USD')
+        dcontext.update(Decimal('1.235'), 'USD')
+        new_dformat = dcontext.build()
+        self.assertIsNot(dformat, new_dformat)
+        self.assertEqual('3.142', new_dformat.format(Decimal('3.14159'), 'USD'))
+
+        # Looking up a new currency changes the formatters.
+        dcontext.quantize(Decimal('1.23'), 'CAD')
+        self.assertIsNot(new_dformat, dcontext.build())
+
+    def test_pickle(self):
+        dcontext = display_context.DisplayContext()
+        dcontext.update(Decimal('1.23'), 'USD')
+        dcontext.build()
+        new_dcontext = pickle.loads(pickle.dumps(dcontext))
+        self.assertEqual({}, new_dcontext.formatters)
+        self.assertEqual('3.14',
+                         new_dcontext.build().format(Decimal('3.14159'), 'USD'))
+
+    def test_compile_format(self):
+        for fmtstr in ['{:,.2f}', '{:>12,.2f}   ', '{:}', '{: 10.0f} ',
+                       'X{:.2f}', '{:.2f}{:.1f}']:
+            func = display_context.compile_format(fmtstr)
+            for number in [Decimal('-1234.5678'), Decimal('0'), Decimal('12')]:
+                if fmtstr.count('{') > 1:
+                    args = (number, number)
+                else:
+                    args = (number,)
+                self.assertEqual(fmtstr.format(*args), func(*args))
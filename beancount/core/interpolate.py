@@ -15,6 +15,7 @@ from beancount.core.inventory import Inventory
 from beancount.core import inventory
 from beancount.core import position
 from beancount.core import convert
+from beancount.core import flags
 from beancount.core.data import Transaction
 from beancount.core.data import Posting
 from beancount.core import getters
@@ -31,6 +32,16 @@ MAXIMUM_TOLERANCE = D('0.5')
 MAX_TOLERANCE_DIGITS = 5
 
 
+# A cache of the tolerances inferred without using costs, keyed by the identity
+# of the default tolerances, the multiplier and the set of distinct (currency,
+# exponent) pairs of the postings. Its values are pairs of the default
+# tolerances (kept for checking the identity) and the shared tolerances dict.
+_tolerances_cache = {}
+
+# The maximum number of entries of the cache of tolerances before it is cleared.
+_TOLERANCES_CACHE_SIZE = 4096
+
+
 def is_tolerance_user_specified(tolerance):
     """Return true if the given tolerance number was user-specified.
 
@@ -114,6 +125,10 @@ def compute_residual(postings):
         # Skip auto-postings inserted to absorb the residual (rounding error).
         if posting.meta and posting.meta.get(AUTOMATIC_RESIDUAL, False):
             continue
+        # Skip postings merging lots at their average cost; they sum up to zero
+        # but for the rounding of the average cost.
+        if posting.flag == flags.FLAG_MERGING:
+            continue
         # Add to total residual balance.
         inventory.add_amount(convert.get_weight(posting))
     return inventory
@@ -155,6 +170,10 @@ def infer_tolerances(postings, options_map, use_cost=None):
     Note that 'M' above is the inferred_tolerance_multiplier and its default
     value is 0.5.
 
+    Without 'use_cost', the tolerances only depend on the distinct (currency,
+    exponent) pairs of the postings, and the same immutable dict is returned
+    for all the lists of postings with the same pairs.
+
     Args:
       postings: A list of Posting instances.
       options_map: A dict of options.
@@ -172,6 +191,10 @@ def infer_tolerances(postings, options_map, use_cost=None):
     inferred_tolerance_multiplier = options_map["inferred_tolerance_multiplier"]
 
     default_tolerances = options_map['inferred_tolerance_default']
+    if not use_cost:
+        return _infer_tolerances_nocost(postings, default_tolerances,
+                                        inferred_tolerance_multiplier)
+
     tolerances = default_tolerances.copy()
 
     cost_tolerances = collections.defaultdict(D)
@@ -223,6 +246,52 @@ def infer_tolerances(postings, options_map, use_cost=None):
     return defdict.ImmutableDictWithDefault(default, tolerances)
 
 
+def _infer_tolerances_nocost(postings, default_tolerances, inferred_tolerance_multiplier):
+    """Infer tolerances from a list of postings, without using costs or prices.
+
+    See infer_tolerances().
+
+    Args:
+      postings: A list of Posting instances.
+      default_tolerances: A dict of currency to default tolerance, possibly
+        with a '*' key for all other currencies.
+      inferred_tolerance_multiplier: A Decimal, the multiplier of the smallest
+        digit of the numbers.
+    Returns:
+      An instance of ImmutableDictWithDefault, possibly shared.
+    """
+    exponents = set()
+    for posting in postings:
+        # Skip the precision on automatically inferred postings.
+        if posting.meta and AUTOMATIC_META in posting.meta:
+            continue
+        units = posting.units
+        if units is MISSING or units is None:
+            continue
+        expo = units.number.as_tuple().exponent
+        if expo < 0:
+            exponents.add((units.currency, expo))
+
+    key = (id(default_tolerances), inferred_tolerance_multiplier, frozenset(exponents))
+    cached = _tolerances_cache.get(key, None)
+    if cached is not None and cached[0] is default_tolerances:
+        return cached[1]
+
+    tolerances = default_tolerances.copy()
+    for currency, expo in exponents:
+        # Note: the exponent is a negative value.
+        tolerance = ONE.scaleb(expo) * inferred_tolerance_multiplier
+        tolerances[currency] = max(tolerance,
+                                   tolerances.get(currency, -1024))
+    default = tolerances.pop('*', ZERO)
+    tolerances = defdict.ImmutableDictWithDefault(default, tolerances)
+
+    if len(_tolerances_cache) >= _TOLERANCES_CACHE_SIZE:
+        _tolerances_cache.clear()
+    _tolerances_cache[key] = (default_tolerances, tolerances)
+    return tolerances
+
+
 # Meta-data field appended to automatically inserted postings.
 # (Note: A better name might have been '__interpolated__'.)
 AUTOMATIC_META = '__automatic__'
@@ -12,6 +12,7 @@ from beancount.core.data import create_simple_posting as P
 from beancount.core.data import create_simple_posting_with_cost as PCost
 from beancount.core import interpolate
 from beancount.core import data
+from beancount.core import flags
 from beancount.core import inventory
 from beancount.core import position
 from beancount.core import convert
@@ -68,6 +69,16 @@ class TestBalance(cmptest.TestCase):
         self.assertEqual(inventory.from_string("5 AAPL"),
                          residual.reduce(convert.get_units))
 
+    def test_compute_residual__merging(self):
+        # Postings merging lots are ignored.
+        residual = interpolate.compute_residual([
+            P(None, "Assets:Bank:Checking", "105.50", "USD"),
+            P(None, "Assets:Bank:Checking", "-105.50", "USD"),
+            P(None, "Assets:Bank:Checking", "0.01", "USD")._replace(
+                flag=flags.FLAG_MERGING),
+            ])
+        self.assertTrue(residual.is_empty())
+
     @loader.load_doc(expect_errors=True)
     def test_fill_residual_posting(self, entries, _, __):
         """
@@ -574,6 +585,40 @@ class TestInferTolerances(cmptest.TestCase):
         # default tolerance.
         pass
 
+    @loader.load_doc()
+    def test_tolerances__shared(self, entries, errors, options_map):
+        """
+        option "inferred_tolerance_default" "*:0.001"
+
+        1970-01-01 open Assets:Cash
+        1970-01-01 open Expenses:Food
+
+        2010-01-01 *
+          Expenses:Food      8.00 USD
+          Assets:Cash       -8.00 USD
+
+        2010-01-02 *
+          Expenses:Food     12.50 USD
+          Assets:Cash
+
+        2010-01-03 *
+          Expenses:Food     12.5 USD
+          Assets:Cash      -12.50 USD
+        """
+        tolerances_list = [entry.meta['__tolerances__']
+                           for entry in entries
+                           if isinstance(entry, data.Transaction)]
+        self.assertEqual({'USD': D('0.005')}, tolerances_list[0])
+        self.assertIs(tolerances_list[0], tolerances_list[1])
+        self.assertEqual({'USD': D('0.05')}, tolerances_list[2])
+        self.assertEqual(D('0.001'), tolerances_list[2]['CAD'])
+
+        # Different options produce different tolerances.
+        options_map = options_map.copy()
+        options_map['inferred_tolerance_multiplier'] = D('1')
+        self.assertEqual({'USD': D('0.01')},
+                         interpolate.infer_tolerances(entries[2].postings, options_map))
+
 
 class TestQuantize(unittest.TestCase):
 
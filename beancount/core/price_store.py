@@ -0,0 +1,174 @@
+"""A persistent database of prices, stored in an SQLite file.
+
+The store holds rates for (base, quote, date) triples, along with the name of
+the source they were obtained from, and is indexed on the pair and the date, so
+that the prices of a single pair, optionally over a range of dates, can be read
+without reading the entire database. This allows a long history of prices to
+be kept out of the input file: bean-price can write the prices it fetches to a
+store, and a price map built with a store (see prices.build_price_map()) reads
+the prices of each pair from it only when that pair is looked up.
+"""
+__copyright__ = "Copyright (C) 2013-2017  Martin Blais"
+__license__ = "GNU GPLv2"
+
+import datetime
+import sqlite3
+import threading
+from os import path
+
+from beancount.core.number import D
+from beancount.core.amount import Amount
+from beancount.core import data
+
+
+def parse_date(string):
+    """Parse a date stored in the database.
+
+    Args:
+      string: A date string in ISO 8601 format.
+    Returns:
+      A datetime.date instance.
+    """
+    return datetime.datetime.strptime(string, '%Y-%m-%d').date()
+
+
+class PriceStore:
+    """A database of prices in an SQLite file.
+
+    The store may be shared by several threads; its queries are serialized.
+
+    Attributes:
+      filename: A string, the name of the database file.
+      connection: An sqlite3.Connection instance, or None, once closed.
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        self._lock = threading.Lock()
+        self.connection = sqlite3.connect(filename, check_same_thread=False)
+        self.connection.execute("""
+          CREATE TABLE IF NOT EXISTS prices (
+            base TEXT NOT NULL,
+            quote TEXT NOT NULL,
+            date TEXT NOT NULL,
+            rate TEXT NOT NULL,
+            source TEXT,
+            PRIMARY KEY (base, quote, date)
+          ) WITHOUT ROWID
+        """)
+        self.connection.commit()
+
+    def close(self):
+        """Close the database."""
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def add_prices(self, price_entries, source=None):
+        """Insert prices into the store, replacing those at the same dates.
+
+        Args:
+          price_entries: An iterable of Price directives. Other directives are
+            ignored.
+          source: A string, the name of the source of the prices, or None, in
+            which case the filename of each directive is used.
+        Returns:
+          An integer, the number of prices inserted.
+        """
+        rows = [(entry.currency, entry.amount.currency, entry.date.isoformat(),
+                 str(entry.amount.number),
+                 source if source is not None else entry.meta.get('filename', None))
+                for entry in price_entries
+                if isinstance(entry, data.Price)]
+        with self._lock, self.connection:
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO prices VALUES (?, ?, ?, ?, ?)", rows)
+        return len(rows)
+
+    def get_pairs(self):
+        """Return the (base, quote) pairs of the prices in the store.
+
+        Returns:
+          A sorted list of pairs of currency strings.
+        """
+        with self._lock:
+            return [tuple(row) for row in self.connection.execute(
+                "SELECT DISTINCT base, quote FROM prices ORDER BY base, quote")]
+
+    def get_prices(self, base_quote, date_begin=None, date_end=None):
+        """Return the prices of a pair, optionally over a range of dates.
+
+        Args:
+          base_quote: A pair of (base, quote) currency strings.
+          date_begin: A datetime.date instance, the first date to include, or
+            None to include all prices up to 'date_end'.
+          date_end: A datetime.date instance, the last date to include, or None
+            to include all prices from 'date_begin'.
+        Returns:
+          A list of (datetime.date, Decimal) pairs, sorted by date.
+        """
+        query = "SELECT date, rate FROM prices WHERE base = ? AND quote = ?"
+        params = list(base_quote)
+        if date_begin is not None:
+            query += " AND date >= ?"
+            params.append(date_begin.isoformat())
+        if date_end is not None:
+            query += " AND date <= ?"
+            params.append(date_end.isoformat())
+        query += " ORDER BY date"
+        with self._lock:
+            rows = self.connection.execute(query, params).fetchall()
+        return [(parse_date(date), D(rate)) for date, rate in rows]
+
+    def get_entries(self):
+        """Return all the prices in the store as Price directives.
+
+        Returns:
+          A list of Price directives, sorted by date.
+        """
+        with self._lock:
+            rows = self.connection.execute(
+                "SELECT base, quote, date, rate, source FROM prices ORDER BY date"
+            ).fetchall()
+        entries = []
+        for base, quote, date, rate, source in rows:
+            meta = data.new_metadata(source or self.filename, 0)
+            entries.append(data.Price(meta, parse_date(date), base,
+                                      Amount(D(rate), quote)))
+        return entries
+
+
+# The stores opened by open_store(), keyed by filename, and a lock guarding them.
+_STORES = {}
+_STORES_LOCK = threading.Lock()
+
+
+def open_store(options_map):
+    """Open the price store configured in the options, if any.
+
+    A store is opened once per file and shared by all the callers, e.g. the
+    reports and queries of a web server rendering pages from several threads,
+    so it should not be closed by them.
+
+    Args:
+      options_map: A dict of options, as produced by the parser.
+    Returns:
+      A PriceStore instance, or None if the "price_store" option is not set.
+    """
+    filename = options_map.get('price_store', None)
+    if not filename:
+        return None
+    if options_map.get('filename', None):
+        filename = path.join(path.dirname(options_map['filename']), filename)
+    filename = path.abspath(filename)
+    with _STORES_LOCK:
+        store = _STORES.get(filename, None)
+        if store is None or store.connection is None:
+            store = _STORES[filename] = PriceStore(filename)
+    return store
@@ -0,0 +1,69 @@
+__copyright__ = "Copyright (C) 2013-2017  Martin Blais"
+__license__ = "GNU GPLv2"
+
+import datetime
+import tempfile
+import unittest
+from os import path
+
+from beancount.core.number import D
+from beancount.core import price_store
+from beancount.parser import cmptest
+from beancount import loader
+
+
+class TestPriceStore(cmptest.TestCase):
+
+    @loader.load_doc()
+    def setUp(self, entries, _, __):
+        """
+        2013-06-01 price  USD  1.10 CAD
+        2013-06-02 price  USD  1.12 CAD
+        2013-06-03 price  USD  1.14 CAD
+        2013-06-01 price  HOOL  500.00 USD
+        """
+        self.entries = entries
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+        self.filename = path.join(self.tmpdir.name, 'prices.db')
+
+    def test_add_get(self):
+        with price_store.PriceStore(self.filename) as store:
+            self.assertEqual(4, store.add_prices(self.entries, 'test'))
+            self.assertEqual([('HOOL', 'USD'), ('USD', 'CAD')], store.get_pairs())
+            self.assertEqual([(datetime.date(2013, 6, 1), D('1.10')),
+                              (datetime.date(2013, 6, 2), D('1.12')),
+                              (datetime.date(2013, 6, 3), D('1.14'))],
+                             store.get_prices(('USD', 'CAD')))
+            self.assertEqual([], store.get_prices(('CAD', 'USD')))
+
+        # The prices persist, and replace those at the same date.
+        with price_store.PriceStore(self.filename) as store:
+            store.add_prices(self.entries[:1])
+            self.assertEqual([(datetime.date(2013, 6, 2), D('1.12'))],
+                             store.get_prices(('USD', 'CAD'),
+                                              datetime.date(2013, 6, 2),
+                                              datetime.date(2013, 6, 2)))
+            self.assertEqual(2, len(store.get_prices(('USD', 'CAD'),
+                                                     date_begin=datetime.date(2013, 6, 2))))
+            self.assertEqualEntries(self.entries, store.get_entries())
+
+    def test_open_store(self):
+        self.assertIsNone(price_store.open_store({'price_store': None}))
+        store = price_store.open_store({'price_store': 'prices.db',
+                                        'filename': path.join(self.tmpdir.name,
+                                                              'ledger.beancount')})
+        self.assertEqual(self.filename, store.filename)
+        self.assertTrue(path.exists(self.filename))
+
+        # The store is shared between the callers, until it is closed.
+        self.assertIs(store, price_store.open_store({'price_store': self.filename}))
+        store.close()
+        other_store = price_store.open_store({'price_store': self.filename})
+        self.assertIsNot(store, other_store)
+        self.assertEqual([], other_store.get_pairs())
+        other_store.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -10,6 +10,8 @@ __copyright__ = "Copyright (C) 2013-2017  Martin Blais"
 __license__ = "GNU GPLv2"
 
 import collections
+import itertools
+import threading
 
 from beancount.core.number import ONE
 from beancount.core.number import ZERO
@@ -53,7 +55,7 @@ class PriceMap(dict):
     __slots__ = ('forward_pairs',)
 
 
-def build_price_map(entries):
+def build_price_map(entries, store=None, date_begin=None, date_end=None):
     """Build a price map from a list of arbitrary entries.
 
     If multiple prices are found for the same (currency, cost-currency) pair at
@@ -65,9 +67,19 @@ def build_price_map(entries):
     one that has the most price points. In that way they are reconciled into a
     single one.
 
+    If a price store is provided, its prices are merged with those of the
+    entries, which take precedence at the same date. The price map returned
+    then reads the prices of a pair from the store only when it is first looked
+    up (see LazyPriceMap).
+
     Args:
       entries: A list of directives, hopefully including some Price and/or
       Transaction entries.
+      store: An optional price_store.PriceStore instance.
+      date_begin: A datetime.date instance, the first date of the prices to
+        read from the store, or None.
+      date_end: A datetime.date instance, the last date of the prices to read
+        from the store, or None.
     Returns:
       A dict of (currency, cost-currency) keys to sorted lists of (date, number)
       pairs, where 'date' is the date the price occurs at and 'number' a Decimal
@@ -88,6 +100,20 @@ def build_price_map(entries):
         base_quote = (price.currency, price.amount.currency)
         price_map[base_quote].append((price.date, price.amount.number))
 
+    if store is not None:
+        return LazyPriceMap(price_map, store, date_begin, date_end)
+    return _build_sorted_price_map(price_map)
+
+
+def _build_sorted_price_map(price_map):
+    """Reconcile inverse pairs, sort the prices and insert their inverses.
+
+    Args:
+      price_map: A defaultdict of (base, quote) pairs to unsorted lists of (date,
+        number) pairs. This is modified.
+    Returns:
+      A PriceMap instance. See build_price_map().
+    """
     # Find pairs of inversed units.
     inversed_units = []
     for base_quote, values in price_map.items():
@@ -131,6 +157,80 @@ def build_price_map(entries):
     return sorted_price_map
 
 
+class LazyPriceMap(PriceMap):
+    """A price map which reads the prices of a pair from a price store on demand.
+
+    The first time a pair or its inverse is looked up, the prices of both are
+    read from the store, merged with those from the entries and reconciled as in
+    build_price_map(). Accessing 'forward_pairs' reads all the pairs. The map may
+    be shared by several threads; the prices are read under a lock.
+
+    Attributes:
+      entry_prices: A dict of (base, quote) pairs to lists of (date, number)
+        pairs, the prices from the entries.
+      store: A price_store.PriceStore instance.
+      date_begin: A datetime.date instance, or None.
+      date_end: A datetime.date instance, or None.
+    """
+    __slots__ = ('entry_prices', 'store', 'date_begin', 'date_end',
+                 '_loaded', '_forward_pairs', '_lock')
+
+    def __init__(self, entry_prices, store, date_begin=None, date_end=None):
+        super().__init__()
+        self.entry_prices = entry_prices
+        self.store = store
+        self.date_begin = date_begin
+        self.date_end = date_end
+
+        # A set of the pairs whose prices have been read, in both directions.
+        self._loaded = set()
+        self._forward_pairs = []
+        self._lock = threading.Lock()
+
+    def _load(self, base_quote):
+        # Note: This must be called with the lock held.
+        base, quote = base_quote
+        inverse = (quote, base)
+        price_map = collections.defaultdict(list)
+        for pair in base_quote, inverse:
+            # Insert the prices of the entries last, so they override those of
+            # the store at the same date.
+            date_rates = (self.store.get_prices(pair, self.date_begin, self.date_end) +
+                          self.entry_prices.get(pair, []))
+            if date_rates:
+                price_map[pair] = date_rates
+            self._loaded.add(pair)
+        sorted_price_map = _build_sorted_price_map(price_map)
+        self.update(sorted_price_map)
+        self._forward_pairs.extend(sorted_price_map.forward_pairs)
+
+    def __missing__(self, base_quote):
+        with self._lock:
+            # Another thread may have read the pair while we waited.
+            if base_quote not in self._loaded:
+                self._load(base_quote)
+        date_rates = dict.get(self, base_quote, None)
+        if date_rates is None:
+            raise KeyError(base_quote)
+        return date_rates
+
+    def get(self, base_quote, default=None):
+        try:
+            return self[base_quote]
+        except KeyError:
+            return default
+
+    @property
+    def forward_pairs(self):
+        """Read the prices of all the pairs and return the forward ones."""
+        with self._lock:
+            for base_quote in itertools.chain(self.store.get_pairs(),
+                                              list(self.entry_prices)):
+                if base_quote not in self._loaded:
+                    self._load(base_quote)
+            return list(self._forward_pairs)
+
+
 def normalize_base_quote(base_quote):
     """Convert a slash-separated string to a pair of strings.
 
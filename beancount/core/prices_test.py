@@ -1,11 +1,16 @@
 __copyright__ = "Copyright (C) 2014-2017  Martin Blais"
 __license__ = "GNU GPLv2"
 
+import concurrent.futures
 import unittest
 import datetime
+import tempfile
+from os import path
+from unittest import mock
 
 from beancount.core.number import D
 from beancount.core import prices
+from beancount.core import price_store
 from beancount.parser import cmptest
 from beancount import loader
 
@@ -209,3 +214,83 @@ class TestPriceMap(unittest.TestCase):
             self.assertEqual(exp_value, act_value.quantize(D('0.01')))
 
         self.assertEqual(1, len(price_map[('CAD', 'USD')]))
+
+
+class TestLazyPriceMap(unittest.TestCase):
+
+    @loader.load_doc()
+    def setUp(self, entries, _, __):
+        """
+        2013-06-01 price  USD  1.10 CAD
+        2013-06-02 price  USD  1.12 CAD
+        2013-06-05 price  CAD  0.86956 USD
+        2013-06-06 price  CAD  0.86207 USD
+        2013-06-01 price  HOOL  500.00 USD
+        2013-06-03 price  HOOL  510.00 USD
+        2013-06-10 price  AAPL  100.00 USD
+        """
+        self.entries = entries
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.store = price_store.PriceStore(path.join(self.tmpdir.name, 'prices.db'))
+        self.addCleanup(self.tmpdir.cleanup)
+        self.addCleanup(self.store.close)
+
+    def test_equivalent(self):
+        # Move the prices of the last three days into the store, with a
+        # conflicting price for USD on the 2nd, which the entries override.
+        split_date = datetime.date(2013, 6, 3)
+        self.store.add_prices([entry
+                               for entry in self.entries
+                               if entry.date >= split_date])
+        usd_entry = next(entry
+                         for entry in self.entries
+                         if entry.date == datetime.date(2013, 6, 2))
+        self.store.add_prices([usd_entry._replace(
+            amount=usd_entry.amount._replace(number=D('1.50')))])
+        lazy_map = prices.build_price_map([entry
+                                           for entry in self.entries
+                                           if entry.date < split_date],
+                                          self.store)
+        price_map = prices.build_price_map(self.entries)
+
+        self.assertIsInstance(lazy_map, prices.LazyPriceMap)
+        for base_quote in ('USD/CAD', 'CAD/USD', 'HOOL/USD', 'USD/HOOL', 'AAPL/USD'):
+            self.assertEqual(prices.get_all_prices(price_map, base_quote),
+                             prices.get_all_prices(lazy_map, base_quote))
+        self.assertEqual(sorted(price_map.forward_pairs), sorted(lazy_map.forward_pairs))
+        self.assertEqual(dict(price_map), dict(lazy_map))
+
+        with self.assertRaises(KeyError):
+            prices.get_all_prices(lazy_map, 'EWJ/JPY')
+        self.assertEqual((None, None), prices.get_price(lazy_map, 'EWJ/JPY'))
+
+    def test_lazy(self):
+        self.store.add_prices(self.entries)
+        with mock.patch.object(self.store, 'get_prices',
+                               wraps=self.store.get_prices) as get_prices:
+            lazy_map = prices.build_price_map([], self.store)
+            self.assertEqual(0, get_prices.call_count)
+            self.assertEqual((datetime.date(2013, 6, 3), D('510.00')),
+                             prices.get_price(lazy_map, 'HOOL/USD'))
+            self.assertEqual(2, get_prices.call_count)
+            prices.get_price(lazy_map, 'USD/HOOL')
+            self.assertEqual(2, get_prices.call_count)
+
+    def test_threads(self):
+        self.store.add_prices(self.entries)
+        with mock.patch.object(self.store, 'get_prices',
+                               wraps=self.store.get_prices) as get_prices:
+            lazy_map = prices.build_price_map([], self.store)
+            with concurrent.futures.ThreadPoolExecutor(8) as executor:
+                results = list(executor.map(
+                    lambda _: prices.get_price(lazy_map, 'HOOL/USD'), range(32)))
+            self.assertEqual([(datetime.date(2013, 6, 3), D('510.00'))] * 32, results)
+            self.assertEqual(2, get_prices.call_count)
+
+    def test_date_range(self):
+        self.store.add_prices(self.entries)
+        lazy_map = prices.build_price_map([], self.store,
+                                          date_end=datetime.date(2013, 6, 2))
+        self.assertEqual((datetime.date(2013, 6, 1), D('500.00')),
+                         prices.get_latest_price(lazy_map, 'HOOL/USD'))
+        self.assertEqual((None, None), prices.get_latest_price(lazy_map, 'AAPL/USD'))
@@ -18,8 +18,10 @@ list of desired directives to display and call the realize() function with them.
 __copyright__ = "Copyright (C) 2013-2016  Martin Blais"
 __license__ = "GNU GPLv2"
 
+import array
 import io
 import collections
+import collections.abc
 import operator
 import copy
 
@@ -32,6 +34,8 @@ from beancount.core.data import Close
 from beancount.core.data import Pad
 from beancount.core.data import Note
 from beancount.core.data import Document
+from beancount.core.number import ZERO
+from beancount.core.position import Position
 from beancount.core import inventory
 from beancount.core import amount
 from beancount.core import data
@@ -48,8 +52,11 @@ class RealAccount(dict):
       postings: A list of postings associated with this accounting (does not
         include the postings of children accounts).
       balance: The final balance of the list of postings associated with this account.
+      total_balance: A cached Inventory, the balance of this account and all its
+        subaccounts, or None, if it has not been computed yet. Don't access this
+        directly; call compute_balance() instead.
     """
-    __slots__ = ('account', 'txn_postings', 'balance')
+    __slots__ = ('account', 'txn_postings', 'balance', 'total_balance')
 
     def __init__(self, account_name, *args, **kwargs):
         """Create a RealAccount instance.
@@ -62,6 +69,7 @@ class RealAccount(dict):
         self.account = account_name
         self.txn_postings = []
         self.balance = inventory.Inventory()
+        self.total_balance = None
 
     def __setitem__(self, key, value):
         """Prevent the setting of non-string or non-empty keys on this dict.
@@ -80,6 +88,7 @@ class RealAccount(dict):
         if not value.account.endswith(key):
             raise ValueError("RealAccount name '{}' inconsistent with key: '{}'".format(
                 value.account, key))
+        self.total_balance = None
         return super().__setitem__(key, value)
 
     def copy(self):
@@ -118,6 +127,110 @@ class RealAccount(dict):
         return not self.__eq__(other)
 
 
+class PostingTable:
+    """A compact table of references to the postings of a list of entries.
+
+    Each row of the table refers either to a single posting of a Transaction, or
+    to another type of directive, by their indexes. This is shared by all the
+    TxnPostingsView instances of a realization, and stores two machine integers
+    per row instead of a TxnPosting tuple.
+
+    Attributes:
+      entries: The list of directives referred to by the rows.
+      entry_indexes: An array of integers, the index of the directive of each row.
+      posting_indexes: An array of integers, the index of the posting of each row
+        in its Transaction, or -1, if the row refers to the directive itself.
+    """
+    __slots__ = ('entries', 'entry_indexes', 'posting_indexes')
+
+    def __init__(self, entries):
+        self.entries = entries
+        self.entry_indexes = array.array('i')
+        self.posting_indexes = array.array('i')
+
+    def add(self, entry_index, posting_index):
+        """Add a row to the table.
+
+        Args:
+          entry_index: An integer, the index of the directive in 'entries'.
+          posting_index: An integer, the index of the posting in the
+            Transaction, or -1, to refer to the directive itself.
+        Returns:
+          An integer, the index of the new row.
+        """
+        self.entry_indexes.append(entry_index)
+        self.posting_indexes.append(posting_index)
+        return len(self.entry_indexes) - 1
+
+    def get(self, row):
+        """Materialize a row of the table.
+
+        Args:
+          row: An integer, the index of the row.
+        Returns:
+          A new TxnPosting instance, or a directive.
+        """
+        entry = self.entries[self.entry_indexes[row]]
+        posting_index = self.posting_indexes[row]
+        return (entry
+                if posting_index == -1
+                else TxnPosting(entry, entry.postings[posting_index]))
+
+
+class TxnPostingsView(collections.abc.Sequence):
+    """A read-only sequence of TxnPosting or directive instances.
+
+    This is a substitute for the list of an account's postings in a compact
+    realization (see realize()). It stores the indexes of rows of a shared
+    PostingTable and creates the TxnPosting instances only when accessed. Note
+    that accessing the same posting twice produces two equal but distinct
+    TxnPosting instances.
+
+    Attributes:
+      table: An instance of PostingTable.
+      rows: An array of integers, the indexes of the rows of the table.
+    """
+    __slots__ = ('table', 'rows')
+
+    def __init__(self, table, rows=None):
+        self.table = table
+        self.rows = rows if rows is not None else array.array('i')
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return TxnPostingsView(self.table, self.rows[index])
+        return self.table.get(self.rows[index])
+
+    def __iter__(self):
+        entries = self.table.entries
+        entry_indexes = self.table.entry_indexes
+        posting_indexes = self.table.posting_indexes
+        for row in self.rows:
+            entry = entries[entry_indexes[row]]
+            posting_index = posting_indexes[row]
+            yield (entry
+                   if posting_index == -1
+                   else TxnPosting(entry, entry.postings[posting_index]))
+
+    def __reversed__(self):
+        get = self.table.get
+        for row in reversed(self.rows):
+            yield get(row)
+
+    def __eq__(self, other):
+        if not isinstance(other, (list, tuple, TxnPostingsView)):
+            return NotImplemented
+        return list(self) == list(other)
+
+    __hash__ = None
+
+    def __repr__(self):
+        return '{}({!r})'.format(type(self).__name__, list(self))
+
+
 def iter_children(real_account, leaf_only=False):
     """Iterate this account node and all its children, depth-first.
 
@@ -183,12 +296,16 @@ def get_or_create(real_account, account_name):
         raise ValueError
     components = account.split(account_name)
     path = []
+    # The child may be modified by the caller, so reset the cached total
+    # balances of the nodes from here down to it.
+    real_account.total_balance = None
     for component in components:
         path.append(component)
         real_child = real_account.get(component, None)
         if real_child is None:
             real_child = RealAccount(account.join(*path))
             real_account[component] = real_child
+        real_child.total_balance = None
         real_account = real_child
     return real_account
 
@@ -205,7 +322,7 @@ def contains(real_account, account_name):
     return get(real_account, account_name) is not None
 
 
-def realize(entries, min_accounts=None, compute_balance=True):
+def realize(entries, min_accounts=None, compute_balance=True, compact=False):
     """Group entries by account, into a "tree" of realized accounts. RealAccount's
     are essentially containers for lists of postings and the final balance of
     each account, and may be non-leaf accounts (used strictly for organizing
@@ -249,19 +366,86 @@ def realize(entries, min_accounts=None, compute_balance=True):
         This can be used to ensure the root accounts all exist.
       compute_balance: A boolean, true if we should compute the final
         balance on the realization.
+      compact: A boolean, true if the lists of postings of the accounts should
+        be stored as TxnPostingsView instances instead of lists of TxnPosting.
+        This uses a lot less memory for large ledgers, at the cost of creating
+        the TxnPosting objects whenever the lists are iterated over.
     Returns:
       The root RealAccount instance.
     """
-    # Create lists of the entries by account.
-    txn_postings_map = postings_by_account(entries)
-
-    # Create a RealAccount tree and compute the balance for each.
     real_root = RealAccount('')
-    for account_name, txn_postings in txn_postings_map.items():
-        real_account = get_or_create(real_root, account_name)
-        real_account.txn_postings = txn_postings
-        if compute_balance:
-            real_account.balance = compute_postings_balance(txn_postings)
+    table = PostingTable(entries) if compact else None
+
+    # A mapping of account name to its RealAccount node. Each account name is
+    # looked up in the tree only once, the first time it is seen.
+    real_accounts = {}
+    def get_real_account(account_name):
+        try:
+            return real_accounts[account_name]
+        except KeyError:
+            real_account = real_accounts[account_name] = get_or_create(real_root,
+                                                                       account_name)
+            if compact:
+                real_account.txn_postings = TxnPostingsView(table)
+            return real_account
+
+    # A mapping of account name to the running balance of its postings, as a dict
+    # of (currency, cost) to a pair of (number, cost). We accumulate the numbers
+    # directly instead of adding positions to an Inventory, which would create
+    # new Position objects for every posting. Keys are deleted and re-inserted
+    # just as Inventory.add_amount() does, so that the order of the resulting
+    # positions is the same.
+    numbers_map = collections.defaultdict(dict)
+
+    # Build the tree, the lists of postings and the balances in a single pass.
+    # This must produce the same lists as postings_by_account().
+    for entry_index, entry in enumerate(entries):
+
+        if isinstance(entry, Transaction):
+            # Insert an entry for each of the postings.
+            for posting_index, posting in enumerate(entry.postings):
+                real_account = get_real_account(posting.account)
+                if compact:
+                    real_account.txn_postings.rows.append(
+                        table.add(entry_index, posting_index))
+                else:
+                    real_account.txn_postings.append(TxnPosting(entry, posting))
+
+                if compute_balance:
+                    units = posting.units
+                    cost = posting.cost
+                    numbers = numbers_map[posting.account]
+                    key = (units.currency, cost)
+                    number_cost = numbers.get(key, None)
+                    if number_cost is None:
+                        if units.number != ZERO:
+                            numbers[key] = (units.number, cost)
+                    else:
+                        number = number_cost[0] + units.number
+                        if number == ZERO:
+                            del numbers[key]
+                        else:
+                            numbers[key] = (number, cost)
+
+        elif isinstance(entry, (Open, Close, Balance, Note, Document, Pad)):
+            # Append some other entries in the realized list. Insert the pad
+            # entries in both realized accounts.
+            accounts = ((entry.account, entry.source_account)
+                        if isinstance(entry, Pad)
+                        else (entry.account,))
+            if compact:
+                row = table.add(entry_index, -1)
+                for account_name in accounts:
+                    get_real_account(account_name).txn_postings.rows.append(row)
+            else:
+                for account_name in accounts:
+                    get_real_account(account_name).txn_postings.append(entry)
+
+    # Convert the running balances to inventories.
+    for account_name, numbers in numbers_map.items():
+        real_accounts[account_name].balance = inventory.Inventory([
+            Position(amount.Amount(number, currency), cost)
+            for (currency, _), (number, cost) in numbers.items()])
 
     # Ensure a minimum set of accounts that should exist. This is typically
     # called with an instance of AccountTypes to make sure that those exist.
@@ -356,7 +540,7 @@ def get_postings(real_account):
     return accumulator
 
 
-def iterate_with_balance(txn_postings):
+def iterate_with_balance(txn_postings, balance=None):
     """Iterate over the entries, accumulating the running balance.
 
     For each entry, this yields tuples of the form:
@@ -393,12 +577,17 @@ def iterate_with_balance(txn_postings):
     Args:
       txn_postings: A list of postings or directive instances.
         Postings affect the balance; other entries do not.
+      balance: An optional Inventory instance, the balance to start accumulating
+        from. This is used to resume iteration from a checkpointed balance in the
+        middle of a list of postings. It is copied and not modified.
     Yields:
       Tuples of (entry, postings, change, balance) as described above.
     """
 
     # The running balance.
-    running_balance = inventory.Inventory()
+    running_balance = (copy.copy(balance)
+                       if balance is not None
+                       else inventory.Inventory())
 
     # Previous date.
     prev_date = None
@@ -465,14 +654,35 @@ def iterate_with_balance(txn_postings):
 def compute_balance(real_account):
     """Compute the total balance of this account and all its subaccounts.
 
+    The total balance of each node of the subtree is computed from the totals of
+    its children and cached on it, so that computing the balances of all the
+    accounts of a tree visits each node only once. Fetching a node with
+    get_or_create() resets the cache of the nodes on the path to it; a node
+    modified otherwise after the balances have been computed must have the
+    'total_balance' attribute of its ancestors reset to None.
+
     Args:
       real_account: A RealAccount instance.
     Returns:
-      An Inventory.
+      An Inventory. This is a copy, which may be modified by the caller.
+    """
+    return copy.copy(_compute_total_balance(real_account))
+
+
+def _compute_total_balance(real_account):
+    """Compute and cache the total balance of an account and its subaccounts.
+
+    Args:
+      real_account: A RealAccount instance.
+    Returns:
+      The cached Inventory instance. Do not modify it.
     """
-    total_balance = inventory.Inventory()
-    for real_acc in iter_children(real_account):
-        total_balance += real_acc.balance
+    total_balance = real_account.total_balance
+    if total_balance is None:
+        total_balance = copy.copy(real_account.balance)
+        for real_child in real_account.values():
+            total_balance.add_inventory(_compute_total_balance(real_child))
+        real_account.total_balance = total_balance
     return total_balance
 
 
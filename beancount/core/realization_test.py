@@ -322,6 +322,110 @@ class TestRealization(unittest.TestCase):
         expected_balance.add_amount(A('20 CAD'))
         self.assertEqual(expected_balance, ra0_movie.balance)
 
+    @loader.load_doc()
+    def test_realize_balance_order(self, entries, _, __):
+        """
+        2012-01-01 open Assets:Cash
+        2012-01-01 open Assets:Investing
+        2012-01-01 open Equity:Opening-Balances
+
+        2012-03-01 *
+          Assets:Investing     10 HOOL {100.0 USD}
+          Assets:Investing     20 CAD
+          Assets:Investing     30 USD
+          Equity:Opening-Balances
+
+        2012-03-02 *
+          Assets:Investing    -10 HOOL {100.0 USD}
+          Assets:Investing    -20 CAD
+          Equity:Opening-Balances
+
+        2012-03-03 *
+          Assets:Investing     5 HOOL {100.00 USD}
+          Assets:Investing     0 EUR
+          Equity:Opening-Balances
+        """
+        # The positions must be identical to those accumulated in an Inventory,
+        # in the same order, with the most recent cost.
+        real_root = realization.realize(entries)
+        for real_account in realization.iter_children(real_root):
+            expected_balance = realization.compute_postings_balance(
+                real_account.txn_postings)
+            self.assertEqual([(pos.units, pos.cost, str(pos.cost))
+                              for pos in expected_balance],
+                             [(pos.units, pos.cost, str(pos.cost))
+                              for pos in real_account.balance])
+
+        real_account = realization.get(real_root, 'Assets:Investing')
+        self.assertEqual(['30 USD', '5 HOOL {100.00 USD, 2012-03-03}'],
+                         [pos.to_string() for pos in real_account.balance])
+
+    @loader.load_doc()
+    def test_realize_postings_by_account(self, entries, _, __):
+        """
+        2012-01-01 open Assets:Cash
+        2012-01-01 open Equity:Opening-Balances
+        2012-01-15 pad Assets:Cash Equity:Opening-Balances
+        2012-02-01 balance Assets:Cash   100 USD
+        2012-03-01 *
+          Assets:Cash     -20 USD
+          Assets:Cash     -10 USD
+          Equity:Opening-Balances
+        2012-03-20 note Assets:Cash "Note"
+        """
+        real_root = realization.realize(entries)
+        txn_postings_map = realization.postings_by_account(entries)
+        self.assertEqual(
+            {account_name: txn_postings
+             for account_name, txn_postings in txn_postings_map.items()},
+            {real_account.account: real_account.txn_postings
+             for real_account in realization.iter_children(real_root)
+             if real_account.txn_postings})
+
+    @loader.load_doc()
+    def test_realize_compact(self, entries, _, __):
+        """
+        2012-01-01 open Assets:Cash
+        2012-01-01 open Equity:Opening-Balances
+        2012-01-15 pad Assets:Cash Equity:Opening-Balances
+        2012-02-01 balance Assets:Cash   100 USD
+        2012-03-01 *
+          Assets:Cash     -20 USD
+          Assets:Cash     -10 USD
+          Equity:Opening-Balances
+        2012-03-20 note Assets:Cash "Note"
+        """
+        real_root = realization.realize(entries)
+        compact_root = realization.realize(entries, compact=True)
+        self.assertEqual(real_root, compact_root)
+        self.assertEqual(realization.dump(real_root),
+                         realization.dump(compact_root))
+
+        real_cash = realization.get(real_root, 'Assets:Cash')
+        compact_cash = realization.get(compact_root, 'Assets:Cash')
+        txn_postings = compact_cash.txn_postings
+        self.assertIsInstance(txn_postings, realization.TxnPostingsView)
+        self.assertEqual(7, len(txn_postings))
+        self.assertEqual(real_cash.txn_postings, list(txn_postings))
+        self.assertEqual(real_cash.txn_postings[::-1], list(reversed(txn_postings)))
+        self.assertEqual(real_cash.txn_postings[-1], txn_postings[-1])
+        self.assertEqual(real_cash.txn_postings[1:3], txn_postings[1:3])
+        self.assertIsInstance(txn_postings[1:3], realization.TxnPostingsView)
+        self.assertEqual(real_cash.balance, compact_cash.balance)
+        self.assertEqual(realization.get_postings(real_root),
+                         realization.get_postings(compact_root))
+
+        # The pad directive is shared by the two accounts.
+        compact_equity = realization.get(compact_root, 'Equity:Opening-Balances')
+        self.assertIs(txn_postings[1], compact_equity.txn_postings[1])
+
+        # Balances computed from the views are identical.
+        self.assertEqual(
+            realization.compute_postings_balance(real_cash.txn_postings),
+            realization.compute_postings_balance(compact_cash.txn_postings))
+        self.assertEqual(realization.find_last_active_posting(real_cash.txn_postings),
+                         realization.find_last_active_posting(txn_postings))
+
 
 class TestRealFilter(unittest.TestCase):
 
@@ -582,6 +686,51 @@ class TestRealOther(test_utils.TestCase):
         balance = realization.compute_balance(realization.get(real_root, 'Assets:US:Bank'))
         self.assertEqual(inventory.from_string('310 USD'), balance)
 
+    def test_compute_balance__cached(self):
+        real_root = create_real([('Assets:US:Bank:Checking', '100 USD'),
+                                 ('Assets:US:Bank:Savings', '200 USD')])
+        real_bank = realization.get(real_root, 'Assets:US:Bank')
+        balance = realization.compute_balance(real_bank)
+        self.assertEqual(inventory.from_string('300 USD'), balance)
+        self.assertEqual(inventory.from_string('300 USD'), real_bank.total_balance)
+
+        # The returned balance is a copy; modifying it does not affect the cache.
+        balance.add_amount(A('1000 USD'))
+        self.assertEqual(inventory.from_string('300 USD'),
+                         realization.compute_balance(real_bank))
+        self.assertEqual(inventory.from_string('300 USD'),
+                         realization.compute_balance(real_root))
+
+        # Adding a child resets the cache of the node.
+        real_other = realization.RealAccount('Assets:US:Bank:Other')
+        real_other.balance = inventory.from_string('5 USD')
+        real_bank['Other'] = real_other
+        self.assertIsNone(real_bank.total_balance)
+        self.assertEqual(inventory.from_string('305 USD'),
+                         realization.compute_balance(real_bank))
+
+    def test_compute_balance__modified(self):
+        real_root = create_real([('Assets:US:Bank:Checking', '100 USD')])
+        self.assertEqual(inventory.from_string('100 USD'),
+                         realization.compute_balance(real_root))
+
+        # Adding a grandchild resets the cache of all its ancestors.
+        real_savings = realization.get_or_create(real_root, 'Assets:US:Bank:Savings')
+        real_savings.balance.add_amount(A('5 USD'))
+        real_bank = realization.get(real_root, 'Assets:US:Bank')
+        self.assertEqual(inventory.from_string('105 USD'),
+                         realization.compute_balance(real_bank))
+        self.assertEqual(inventory.from_string('105 USD'),
+                         realization.compute_balance(real_root))
+
+        # So does modifying an existing node fetched with get_or_create().
+        real_checking = realization.get_or_create(real_root, 'Assets:US:Bank:Checking')
+        real_checking.balance.add_amount(A('10 USD'))
+        self.assertEqual(inventory.from_string('115 USD'),
+                         realization.compute_balance(real_root))
+        self.assertEqual(inventory.from_string('115 USD'),
+                         realization.compute_balance(real_bank))
+
     @loader.load_doc()
     def test_dump(self, entries, _, __):
         """
@@ -3,11 +3,24 @@
 This object is used in lieu of a file in order to allow the various importers to
 reuse each others' conversion results. Converting file contents, e.g. PDF to
 text, can be expensive.
+
+The conversions may also be stored in a persistent cache on disk (see
+ConversionCache and set_persistent_cache()), in which case they are shared
+between runs and between the ingestion tools. These are keyed by a hash of the
+contents and the basename of the file, and by the identity of the converter,
+so a file whose contents change is converted again. Only converters which can
+be identified across processes are stored; see converter_key().
 """
 __copyright__ = "Copyright (C) 2016  Martin Blais"
 __license__ = "GNU GPLv2"
 
 from os import path
+import hashlib
+import os
+import pickle
+import sqlite3
+import time
+import types
 
 import chardet
 
@@ -22,19 +35,264 @@ from beancount.utils import defdict
 HEAD_DETECT_MAX_BYTES = 128 * 1024
 
 
+# The default maximum total size of the conversions in a persistent cache, in
+# bytes.
+DEFAULT_MAX_SIZE = 256 * 1024 * 1024
+
+
+def file_hash(filename):
+    """Compute the hash of the contents of a file.
+
+    Args:
+      filename: A string, the name of the file.
+    Returns:
+      A string, the hexadecimal SHA-256 digest of the contents.
+    """
+    digest = hashlib.sha256()
+    with open(filename, 'rb') as file:
+        for block in iter(lambda: file.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def converter_key(converter_func):
+    """Compute a key identifying a converter across processes.
+
+    A converter is identified by its module and qualified name, its code
+    (including its constants and the names it refers to), and the values it
+    closes over or has as defaults, so that, e.g., head(128)
+    and head(256) are distinct. Callables which can't be identified this way,
+    such as lambdas, methods, other callable objects, or functions closing
+    over values other than simple scalars, aren't stored in a persistent
+    cache.
+
+    Args:
+      converter_func: A converter callable.
+    Returns:
+      A string, or None if the converter can't be identified.
+    """
+    # Bound methods are excluded, as their results may depend on the state of
+    # their instance.
+    if (not isinstance(converter_func, types.FunctionType) or
+            converter_func.__name__ == '<lambda>'):
+        return None
+    code = converter_func.__code__
+    qualname = converter_func.__qualname__
+    try:
+        values = [cell.cell_contents for cell in converter_func.__closure__ or ()]
+    except ValueError:
+        return None
+    values.extend(converter_func.__defaults__ or ())
+    if not all(value is None or isinstance(value, (bool, int, float, str, bytes))
+               for value in values):
+        return None
+    digest = hashlib.md5()
+    update_code_digest(digest, code)
+    digest.update(repr(values).encode('utf-8'))
+    return '{}.{}:{}'.format(converter_func.__module__, qualname, digest.hexdigest())
+
+
+def update_code_digest(digest, code):
+    """Add the bytecode, constants and names of a code object to a digest.
+
+    Nested code objects, e.g. of inner functions, are added recursively.
+
+    Args:
+      digest: A hashlib hash object.
+      code: A code object.
+    """
+    digest.update(code.co_code)
+    digest.update(repr(code.co_names).encode('utf-8'))
+    for const in code.co_consts:
+        if isinstance(const, types.CodeType):
+            update_code_digest(digest, const)
+        else:
+            digest.update(repr(const).encode('utf-8'))
+
+
+class ConversionCache:
+    """A persistent cache of conversion results, stored in an SQLite file.
+
+    The results are pickled and stored along with the time they were last
+    used. When their total size exceeds the maximum, the least recently used
+    are evicted. The database may be shared by several processes, including
+    worker processes forked after it was opened.
+
+    Attributes:
+      filename: A string, the name of the database file.
+      max_size: An integer, the maximum total size of the stored results, in
+        bytes.
+    """
+
+    def __init__(self, filename, max_size=DEFAULT_MAX_SIZE):
+        self.filename = filename
+        self.max_size = max_size
+        self._connection = None
+        self._pid = None
+
+    def connection(self):
+        """Return the connection to the database for the current process.
+
+        Returns:
+          An sqlite3.Connection instance.
+        """
+        # A connection must not be used across a fork; open a new one in the
+        # child processes.
+        if self._connection is None or self._pid != os.getpid():
+            self._connection = sqlite3.connect(self.filename, timeout=60)
+            self._pid = os.getpid()
+            with self._connection:
+                self._connection.execute("""
+                  CREATE TABLE IF NOT EXISTS conversions (
+                    file_key TEXT NOT NULL,
+                    converter TEXT NOT NULL,
+                    value BLOB NOT NULL,
+                    size INTEGER NOT NULL,
+                    accessed REAL NOT NULL,
+                    PRIMARY KEY (file_key, converter)
+                  )
+                """)
+                self._connection.execute("""
+                  CREATE INDEX IF NOT EXISTS conversions_accessed
+                    ON conversions (accessed)
+                """)
+        return self._connection
+
+    def close(self):
+        """Close the database."""
+        if self._connection is not None and self._pid == os.getpid():
+            self._connection.close()
+        self._connection = None
+
+    def get(self, file_key, converter):
+        """Fetch a conversion result and mark it as recently used.
+
+        Args:
+          file_key: A string, the key of the converted file, see
+            _FileMemo.persistent_key().
+          converter: A string, the key of the converter.
+        Returns:
+          The conversion result.
+        Raises:
+          KeyError: If the result isn't in the cache.
+        """
+        connection = self.connection()
+        row = connection.execute(
+            "SELECT value FROM conversions WHERE file_key = ? AND converter = ?",
+            (file_key, converter)).fetchone()
+        if row is None:
+            raise KeyError((file_key, converter))
+        with connection:
+            connection.execute(
+                "UPDATE conversions SET accessed = ? WHERE file_key = ? AND converter = ?",
+                (time.time(), file_key, converter))
+        return pickle.loads(row[0])
+
+    def put(self, file_key, converter, value):
+        """Store a conversion result, evicting old ones if the cache is full.
+
+        Results which can't be pickled, or are larger than the cache, are not
+        stored.
+
+        Args:
+          file_key: A string, the key of the converted file, see
+            _FileMemo.persistent_key().
+          converter: A string, the key of the converter.
+          value: The conversion result.
+        Returns:
+          A boolean, true if the result was stored.
+        """
+        try:
+            blob = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        except (pickle.PicklingError, TypeError, AttributeError):
+            return False
+        if len(blob) > self.max_size:
+            return False
+        connection = self.connection()
+        with connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO conversions VALUES (?, ?, ?, ?, ?)",
+                (file_key, converter, blob, len(blob), time.time()))
+        self.evict()
+        return True
+
+    def size(self):
+        """Return the total size of the stored results.
+
+        Returns:
+          An integer, a number of bytes.
+        """
+        return self.connection().execute(
+            "SELECT COALESCE(SUM(size), 0) FROM conversions").fetchone()[0]
+
+    def evict(self):
+        """Evict the least recently used results until the cache fits its maximum size.
+
+        Returns:
+          An integer, the number of results evicted.
+        """
+        excess = self.size() - self.max_size
+        if excess <= 0:
+            return 0
+        connection = self.connection()
+        evicted = []
+        for rowid, size in connection.execute(
+                "SELECT rowid, size FROM conversions ORDER BY accessed"):
+            evicted.append((rowid,))
+            excess -= size
+            if excess <= 0:
+                break
+        with connection:
+            connection.executemany("DELETE FROM conversions WHERE rowid = ?", evicted)
+        return len(evicted)
+
+    def invalidate(self, file_key=None, converter=None):
+        """Remove stored results, of a file, of a converter, or all of them.
+
+        Args:
+          file_key: A string, the key of a file whose results to remove (see
+            _FileMemo.persistent_key()), or None for all files.
+          converter: A string, the key of a converter whose results to remove,
+            or None for all converters.
+        Returns:
+          An integer, the number of results removed.
+        """
+        conditions = []
+        params = []
+        if file_key is not None:
+            conditions.append("file_key = ?")
+            params.append(file_key)
+        if converter is not None:
+            conditions.append("converter = ?")
+            params.append(converter)
+        query = "DELETE FROM conversions"
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        connection = self.connection()
+        with connection:
+            return connection.execute(query, params).rowcount
+
+
 class _FileMemo:
     """A file memoizer which acts as a cache for on-demand evaluation of conversions.
 
     Attributes:
       name: A string, the name of the underlying file.
+      persistent_cache: A ConversionCache instance to look up and store the
+        conversions in, or None.
     """
 
-    def __init__(self, filename):
+    def __init__(self, filename, persistent_cache=None):
         self.name = filename
+        self.persistent_cache = persistent_cache
 
-        # A cache of converter function to saved conversion value.
+        # A cache of converter function (or its key, if it has one) to saved
+        # conversion value.
         self._cache = {}
 
+        # The hash of the file contents, computed on first use.
+        self._hash = None
+
     def __str__(self):
         return '<FileWrapper filename="{}">'.format(self.name)
 
@@ -46,14 +304,66 @@ class _FileMemo:
         Returns:
           A bytes object, with the contents of the entire file.
         """
+        key = converter_key(converter_func)
+        memo_key = converter_func if key is None else key
         try:
-            result = self._cache[converter_func]
+            return self._cache[memo_key]
         except KeyError:
-            # FIXME: Implement timing of conversions here. Store it for
-            # reporting later.
-            result = self._cache[converter_func] = converter_func(self.name)
+            pass
+
+        # FIXME: Implement timing of conversions here. Store it for
+        # reporting later.
+        if key is None or self.persistent_cache is None:
+            result = converter_func(self.name)
+        else:
+            try:
+                result = self.persistent_cache.get(self.persistent_key(), key)
+            except KeyError:
+                result = converter_func(self.name)
+                self.persistent_cache.put(self.persistent_key(), key, result)
+        self._cache[memo_key] = result
         return result
 
+    def hash(self):
+        """Return the hash of the contents of the file.
+
+        Returns:
+          A string, see file_hash().
+        """
+        if self._hash is None:
+            self._hash = file_hash(self.name)
+        return self._hash
+
+    def persistent_key(self):
+        """Return the key of the file in the persistent cache.
+
+        Converters are given the name of the file and may depend on it, e.g.
+        mimetype() mostly looks at the extension, so the same contents under
+        different names are cached separately.
+
+        Returns:
+          A string, the hash of the contents and the basename of the file.
+        """
+        return '{}:{}'.format(self.hash(), path.basename(self.name))
+
+    def invalidate(self, converter_func=None):
+        """Discard the saved conversions of the file, in memory and on disk.
+
+        Args:
+          converter_func: A converter callable whose result to discard, or None
+            to discard them all.
+        """
+        if converter_func is None:
+            self._cache.clear()
+            if self.persistent_cache is not None:
+                self.persistent_cache.invalidate(self.persistent_key())
+        else:
+            key = converter_key(converter_func)
+            self._cache.pop(converter_func if key is None else key, None)
+            # Converters without a key are never stored on disk.
+            if key is not None and self.persistent_cache is not None:
+                self.persistent_cache.invalidate(self.persistent_key(), key)
+
     def mimetype(self):
         """Computes the MIME type of the file."""
         return self.convert(mimetype)
@@ -120,7 +430,8 @@ def get_file(filename):
 
     Note: the FileMemo objects' lifetimes are reused for the duration of the
     process. This is usually the intended behavior. Always create them by
-    calling this constructor.
+    calling this constructor. They use the persistent cache set when they
+    were created, if any.
 
     Args:
       filename: A path string, the absolute name of the file whose memo to create.
@@ -132,4 +443,17 @@ def get_file(filename):
         "Path should be absolute in order to guarantee a single call.")
     return _CACHE[filename]
 
-_CACHE = defdict.DefaultDictWithKey(_FileMemo)
+_CACHE = defdict.DefaultDictWithKey(
+    lambda filename: _FileMemo(filename, _PERSISTENT_CACHE))
+
+
+def set_persistent_cache(persistent_cache):
+    """Set the persistent cache of the FileMemo objects created from now on.
+
+    Args:
+      persistent_cache: A ConversionCache instance, or None to disable it.
+    """
+    global _PERSISTENT_CACHE
+    _PERSISTENT_CACHE = persistent_cache
+
+_PERSISTENT_CACHE = None
@@ -2,8 +2,10 @@ __copyright__ = "Copyright (C) 2016  Martin Blais"
 __license__ = "GNU GPLv2"
 
 import tempfile
+import textwrap
 import shutil
 import unittest
+from os import path
 from unittest import mock
 
 from beancount.ingest import cache
@@ -44,3 +46,222 @@ class TestFileMemo(unittest.TestCase):
 
             mimetype = wrap.convert(cache.mimetype)
             self.assertEqual('text/x-python', mimetype)
+
+
+# The names of the files converted by counting_converter().
+CONVERSIONS = []
+
+
+def upper_converter(filename):
+    with open(filename) as file:
+        return file.read().upper()
+
+
+def counting_converter(filename):
+    CONVERSIONS.append(filename)
+    return upper_converter(filename)
+
+
+def prefix_converter(num_chars):
+    def converter(filename):
+        with open(filename) as file:
+            return file.read(num_chars)
+    return converter
+
+
+class TestConverterKey(unittest.TestCase):
+
+    def test_converter_key(self):
+        key = cache.converter_key(upper_converter)
+        self.assertTrue(key.startswith(__name__ + '.upper_converter:'))
+        self.assertEqual(key, cache.converter_key(upper_converter))
+        self.assertNotEqual(key, cache.converter_key(cache.contents))
+
+        self.assertEqual(cache.converter_key(cache.head(128)),
+                         cache.converter_key(cache.head(128)))
+        self.assertNotEqual(cache.converter_key(cache.head(128)),
+                            cache.converter_key(cache.head(256)))
+
+    def test_converter_key__code(self):
+        def define(source):
+            namespace = {'__name__': 'converters'}
+            exec(textwrap.dedent(source), namespace)
+            return cache.converter_key(namespace['convert'])
+
+        key = define("""
+            def convert(filename):
+                return ['pdftotext', '-layout', filename]
+        """)
+        self.assertEqual(key, define("""
+            def convert(filename):
+                return ['pdftotext', '-layout', filename]
+        """))
+
+        # Changes to the constants, the names referred to, or the code of inner
+        # functions produce different keys.
+        self.assertNotEqual(key, define("""
+            def convert(filename):
+                return ['pdftotext', '-raw', filename]
+        """))
+        self.assertNotEqual(key, define("""
+            def convert(filename):
+                return ['pdftotext', '-layout', filename.upper()]
+        """))
+        self.assertNotEqual(define("""
+            def convert(filename):
+                return list(map(lambda name: name + '.txt', [filename]))
+        """), define("""
+            def convert(filename):
+                return list(map(lambda name: name + '.pdf', [filename]))
+        """))
+
+    def test_converter_key__unidentified(self):
+        self.assertIsNone(cache.converter_key(lambda filename: filename))
+        self.assertIsNone(cache.converter_key(mock.MagicMock()))
+        self.assertIsNone(cache.converter_key(prefix_converter([1, 2])))
+        self.assertIsNone(cache.converter_key(TestConverterKey().convert))
+
+    def convert(self, filename):
+        return filename
+
+
+class TestConversionCache(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+        self.filename = path.join(self.tmpdir.name, 'cache.db')
+
+    def test_get_put(self):
+        conversion_cache = cache.ConversionCache(self.filename)
+        with self.assertRaises(KeyError):
+            conversion_cache.get('abc', 'converter')
+        self.assertTrue(conversion_cache.put('abc', 'converter', ['text', 1]))
+        self.assertFalse(conversion_cache.put('abc', 'other', lambda: None))
+        conversion_cache.close()
+
+        conversion_cache = cache.ConversionCache(self.filename)
+        self.assertEqual(['text', 1], conversion_cache.get('abc', 'converter'))
+        with self.assertRaises(KeyError):
+            conversion_cache.get('abc', 'other')
+        conversion_cache.close()
+
+    def test_evict(self):
+        conversion_cache = cache.ConversionCache(self.filename, max_size=2500)
+        value = 'x' * 1000
+        conversion_cache.put('a', 'converter', value)
+        conversion_cache.put('b', 'converter', value)
+        conversion_cache.get('a', 'converter')
+        conversion_cache.put('c', 'converter', value)
+
+        # The least recently used result was evicted.
+        self.assertEqual(value, conversion_cache.get('a', 'converter'))
+        self.assertEqual(value, conversion_cache.get('c', 'converter'))
+        with self.assertRaises(KeyError):
+            conversion_cache.get('b', 'converter')
+        self.assertLessEqual(conversion_cache.size(), 2500)
+
+        # Results larger than the cache aren't stored.
+        self.assertFalse(conversion_cache.put('d', 'converter', 'x' * 3000))
+        conversion_cache.close()
+
+    def test_invalidate(self):
+        conversion_cache = cache.ConversionCache(self.filename)
+        for file_hash in 'ab':
+            for converter in ['conv1', 'conv2']:
+                conversion_cache.put(file_hash, converter, file_hash + converter)
+        self.assertEqual(1, conversion_cache.invalidate('a', 'conv1'))
+        self.assertEqual(2, conversion_cache.invalidate(converter='conv2'))
+        self.assertEqual('bconv1', conversion_cache.get('b', 'conv1'))
+        self.assertEqual(1, conversion_cache.invalidate())
+        self.assertEqual(0, conversion_cache.size())
+        conversion_cache.close()
+
+    def test_file_memo(self):
+        conversion_cache = cache.ConversionCache(self.filename)
+        self.addCleanup(conversion_cache.close)
+        filename = path.join(self.tmpdir.name, 'statement.txt')
+        with open(filename, 'w') as file:
+            file.write('Statement')
+
+        # Conversions are shared between memos, e.g. across runs, and
+        # computed only once.
+        calls = CONVERSIONS
+        del calls[:]
+        for _ in range(2):
+            wrap = cache._FileMemo(filename, conversion_cache)
+            self.assertEqual('STATEMENT', wrap.convert(counting_converter))
+            self.assertEqual('STATEMENT', wrap.convert(counting_converter))
+        self.assertEqual(1, len(calls))
+
+        # A file whose contents changed is converted again.
+        with open(filename, 'w') as file:
+            file.write('Changed')
+        wrap = cache._FileMemo(filename, conversion_cache)
+        self.assertEqual('CHANGED', wrap.convert(counting_converter))
+        self.assertEqual(2, len(calls))
+
+        # Invalidated conversions are computed again.
+        wrap.invalidate(counting_converter)
+        self.assertEqual('CHANGED', wrap.convert(counting_converter))
+        wrap = cache._FileMemo(filename, conversion_cache)
+        self.assertEqual('CHANGED', wrap.convert(counting_converter))
+        self.assertEqual(3, len(calls))
+
+        # Unidentified converters are only cached in memory.
+        converter = mock.MagicMock(return_value='abc')
+        for _ in range(2):
+            wrap = cache._FileMemo(filename, conversion_cache)
+            self.assertEqual('abc', wrap.convert(converter))
+        self.assertEqual(2, converter.call_count)
+
+    def test_get_file(self):
+        conversion_cache = cache.ConversionCache(self.filename)
+        self.addCleanup(conversion_cache.close)
+        cache.set_persistent_cache(conversion_cache)
+        self.addCleanup(cache.set_persistent_cache, None)
+        filename = path.join(self.tmpdir.name, 'statement.txt')
+        with open(filename, 'w') as file:
+            file.write('Statement')
+        self.assertIs(conversion_cache, cache.get_file(filename).persistent_cache)
+        self.assertEqual('STATEMENT', cache.get_file(filename).convert(upper_converter))
+        self.assertEqual('STATEMENT', conversion_cache.get(
+            '{}:statement.txt'.format(cache.file_hash(filename)),
+            cache.converter_key(upper_converter)))
+
+    def test_file_memo__names(self):
+        conversion_cache = cache.ConversionCache(self.filename)
+        self.addCleanup(conversion_cache.close)
+        filenames = [path.join(self.tmpdir.name, name)
+                     for name in ['statement.csv', 'statement.txt']]
+        for filename in filenames:
+            with open(filename, 'w') as file:
+                file.write('Date,Amount\n2016-01-01,10.00\n')
+
+        # The same contents under a different name isn't served from the cache
+        # of the other, as the converters may depend on the name.
+        for _ in range(2):
+            for filename in filenames:
+                wrap = cache._FileMemo(filename, conversion_cache)
+                self.assertEqual(cache.mimetype(filename), wrap.mimetype())
+        self.assertNotEqual(cache.mimetype(filenames[0]), cache.mimetype(filenames[1]))
+
+    def test_file_memo__invalidate_unidentified(self):
+        conversion_cache = cache.ConversionCache(self.filename)
+        self.addCleanup(conversion_cache.close)
+        filename = path.join(self.tmpdir.name, 'statement.txt')
+        with open(filename, 'w') as file:
+            file.write('Statement')
+        wrap = cache._FileMemo(filename, conversion_cache)
+        wrap.convert(upper_converter)
+        converter = lambda filename: filename
+        wrap.convert(converter)
+
+        # Invalidating a converter which isn't stored on disk leaves the
+        # others' conversions there.
+        wrap.invalidate(converter)
+        self.assertEqual('STATEMENT', conversion_cache.get(
+            wrap.persistent_key(), cache.converter_key(upper_converter)))
+
+        wrap.invalidate()
+        self.assertEqual(0, conversion_cache.size())
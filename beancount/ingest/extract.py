@@ -6,7 +6,7 @@ downloaded files, and for each of those files, extract transactions from it.
 __copyright__ = "Copyright (C) 2016-2017  Martin Blais"
 __license__ = "GNU GPLv2"
 
-import itertools
+import functools
 import logging
 import sys
 import textwrap
@@ -61,42 +61,99 @@ def extract_from_file(filename, importer,
 
     # Note: Let the exception through on purpose. This makes developing
     # importers much easier by rendering the details of the exceptions.
-    new_entries = importer.extract(file)
+    #
+    # The importer may produce its entries as it reads the file; check them and
+    # drop those before 'min_date' as they come in, rather than holding all of
+    # them first.
+    new_entries = []
+    for entry in importer.extract(file) or ():
+        # Ensure that the entries are typed correctly.
+        data.sanity_check_types(entry, allow_none_for_tags_and_links)
+
+        # Filter out entries with dates before 'min_date'.
+        if min_date and entry.date < min_date:
+            continue
+        new_entries.append(entry)
     if not new_entries:
         return [], []
 
     # Make sure the newly imported entries are sorted; don't trust the importer.
     new_entries.sort(key=data.entry_sortkey)
 
-    # Ensure that the entries are typed correctly.
-    for entry in new_entries:
-        data.sanity_check_types(entry, allow_none_for_tags_and_links)
-
-    # Filter out entries with dates before 'min_date'.
-    if min_date:
-        new_entries = list(itertools.dropwhile(lambda x: x.date < min_date,
-                                               new_entries))
-
     # Find potential matching entries.
     duplicate_entries = []
     if existing_entries is not None:
-        duplicate_pairs = similar.find_similar_entries(new_entries, existing_entries)
-        duplicate_set = set(id(entry) for entry, _ in duplicate_pairs)
-
-        # Add a metadata marker to the extracted entries for duplicates.
-        mod_entries = []
-        for entry in new_entries:
-            if id(entry) in duplicate_set:
-                marked_meta = entry.meta.copy()
-                marked_meta[DUPLICATE_META] = True
-                entry = entry._replace(meta=marked_meta)
-                duplicate_entries.append(entry)
-            mod_entries.append(entry)
-        new_entries = mod_entries
+        new_entries, duplicate_entries = mark_duplicate_entries(
+            new_entries, similar.SimilarityIndex(existing_entries))
 
     return new_entries, duplicate_entries
 
 
+def mark_duplicate_entries(new_entries, existing_index):
+    """Mark the newly imported entries which are likely duplicates of existing ones.
+
+    Args:
+      new_entries: A list of newly imported entries.
+      existing_index: A similar.SimilarityIndex of the existing entries parsed
+        from a ledger. It may be reused for the entries of several files.
+    Returns:
+      A list of the new entries, with the duplicates replaced by a copy
+      marked with the DUPLICATE_META metadata field, and the list of those
+      marked duplicates.
+    """
+    classified = existing_index.classify_entries(new_entries)
+    duplicate_set = set(id(entry)
+                        for entry, source_entry in classified
+                        if source_entry is not None)
+
+    # Add a metadata marker to the extracted entries for duplicates.
+    duplicate_entries = []
+    mod_entries = []
+    for entry in new_entries:
+        if id(entry) in duplicate_set:
+            marked_meta = entry.meta.copy()
+            marked_meta[DUPLICATE_META] = True
+            entry = entry._replace(meta=marked_meta)
+            duplicate_entries.append(entry)
+        mod_entries.append(entry)
+    return mod_entries, duplicate_entries
+
+
+def extract_from_importers(min_date, allow_none_for_tags_and_links, filename,
+                           importers):
+    """Import entries from a file with each of the importers that matched it.
+
+    The arguments are ordered so that this function can be bound with
+    functools.partial() and applied by identify.map_imports(). Duplicates
+    are not detected here; see mark_duplicate_entries().
+
+    Args:
+      min_date: A date before which entries should be ignored, or None.
+      allow_none_for_tags_and_links: A boolean, whether to allow None as value
+        for the 'tags' or 'links' attributes.
+      filename: The name of the file to import.
+      importers: A list of importer objects that matched the file.
+    Returns:
+      A list of the entries imported by each importer, or None for the
+      importers whose extract() method raised an error.
+    """
+    entries_list = []
+    for importer in importers:
+        try:
+            new_entries, _ = extract_from_file(
+                filename,
+                importer,
+                min_date=min_date,
+                allow_none_for_tags_and_links=allow_none_for_tags_and_links)
+        except Exception as exc:
+            logging.error("Importer %s.extract() raised an unexpected error: %s",
+                          importer.name(), exc)
+            logging.error("Traceback: %s", traceback.format_exc())
+            new_entries = None
+        entries_list.append(new_entries)
+    return entries_list
+
+
 def print_extracted_entries(importer, entries, file):
     """Print the entries for the given importer.
 
@@ -131,7 +188,8 @@ def extract(importer_config,
             entries=None,
             options_map=None,
             mindate=None,
-            ascending=True):
+            ascending=True,
+            jobs=None):
     """Given an importer configuration, search for files that can be imported in the
     list of files or directories, run the signature checks on them, and if it
     succeeds, run the importer on the file.
@@ -149,31 +207,32 @@ def extract(importer_config,
       mindate: Optional minimum date to output transactions for.
       ascending: A boolean, true to print entries in ascending order, false if
         descending is desired.
+      jobs: An integer, the number of worker processes to import the files
+        with, or None to import them serially. Duplicates are always detected
+        in this process, so the existing entries aren't copied to the workers.
     """
     allow_none_for_tags_and_links = (
         options_map and options_map["allow_deprecated_none_for_tags_and_links"])
 
+    # Index the existing entries once for all the files.
+    existing_index = similar.SimilarityIndex(entries) if entries is not None else None
+
     output.write(HEADER)
-    for filename, importers in identify.find_imports(importer_config,
-                                                     files_or_directories,
-                                                     output):
-        for importer in importers:
-            # Import and process the file.
-            try:
-                new_entries, duplicate_entries = extract_from_file(
-                    filename,
-                    importer,
-                    existing_entries=entries,
-                    min_date=mindate,
-                    allow_none_for_tags_and_links=allow_none_for_tags_and_links)
-            except Exception as exc:
-                logging.error("Importer %s.extract() raised an unexpected error: %s",
-                              importer.name(), exc)
-                logging.error("Traceback: %s", traceback.format_exc())
-                continue
-            if not new_entries and not duplicate_entries:
+    process = functools.partial(extract_from_importers,
+                                mindate, allow_none_for_tags_and_links)
+    for _, importers, entries_list in identify.map_imports(importer_config,
+                                                           files_or_directories,
+                                                           process,
+                                                           logfile=output,
+                                                           jobs=jobs):
+        for importer, new_entries in zip(importers, entries_list or []):
+            if not new_entries:
                 continue
 
+            # Find potential matching entries.
+            if existing_index is not None:
+                new_entries, _ = mark_duplicate_entries(new_entries, existing_index)
+
             if not ascending:
                 new_entries.reverse()
             print_extracted_entries(importer, new_entries, output)
@@ -203,5 +262,5 @@ def main():
 
     extract(config, downloads_directories, sys.stdout,
             entries=entries, options_map=options_map,
-            mindate=None, ascending=args.ascending)
+            mindate=None, ascending=args.ascending, jobs=args.jobs)
     return 0
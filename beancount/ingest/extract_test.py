@@ -131,6 +131,28 @@ class TestScriptExtractFromFile(test_utils.TestCase):
                           if extract.DUPLICATE_META in entry.meta]
         self.assertEqual(dup_entries, marked_entries)
 
+    def test_extract_from_file__iterator(self):
+        entries, _, __ = loader.load_string("""
+
+          2016-02-03 * "C"
+            Assets:Account1    10.00 USD
+            Assets:Account2   -10.00 USD
+
+          2016-02-01 * "A"
+            Assets:Account1    10.00 USD
+            Assets:Account2   -10.00 USD
+
+          2016-02-02 * "B"
+            Assets:Account1    10.00 USD
+            Assets:Account2   -10.00 USD
+
+        """)
+        imp = mock.MagicMock()
+        imp.extract = mock.MagicMock(return_value=iter(entries))
+        new_entries, _ = extract.extract_from_file(
+            '/tmp/blabla.ofx', imp, min_date=datetime.date(2016, 2, 2))
+        self.assertEqual(["B", "C"], [entry.narration for entry in new_entries])
+
     def test_extract_from_file__raises_exception(self):
         imp = mock.MagicMock()
         imp.identify = mock.MagicMock(return_value=True)
@@ -325,6 +347,17 @@ class TestScriptExtract(test_utils.TestTempdirMixin, unittest.TestCase):
         self.assertRegex(output, r'Expenses:Books +87.30 USD')
         self.assertRegex(output, r'Expenses:Clothing +87.30 USD')
 
+    def test_extract_jobs(self):
+        outputs = []
+        for args in [[], ['--jobs=2']]:
+            with test_utils.capture('stdout', 'stderr') as (stdout, stderr):
+                test_utils.run_with_args(extract.main,
+                                         args + [self.config_filename,
+                                                 path.join(self.tempdir, 'Downloads')])
+            outputs.append(stdout.getvalue())
+        self.assertRegex(outputs[1], r'(?s)/checking.dl.*Assets:Cash.*/credit.dl')
+        self.assertEqual(outputs[0], outputs[1])
+
     def test_extract_no_files(self):
         emptydir = path.join(self.tempdir, 'Empty')
         os.makedirs(emptydir)
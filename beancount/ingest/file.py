@@ -10,6 +10,8 @@ __license__ = "GNU GPLv2"
 from os import path
 import collections
 import datetime
+import functools
+import io
 import logging
 import os
 import shutil
@@ -141,6 +143,27 @@ def file_one_file(filename, importers, destination, idify=False, logfile=None):
     return new_fullname
 
 
+def file_one_file_logged(destination, idify, filename, importers):
+    """File a single filename, capturing its log entries.
+
+    The arguments are ordered so that this function can be bound with
+    functools.partial() and applied by identify.map_imports().
+
+    Args:
+      destination: A string, the root destination directory.
+      idify: A flag, if true, remove whitespace and funky characters in the destination
+        filename.
+      filename: A string, the name of the downloaded file to be processed.
+      importers: A list of importer instances that handle this file.
+    Returns:
+      A pair of the full new destination filename (None if there was an
+      error) and a string, the log entries written out for this file.
+    """
+    logfile = io.StringIO()
+    new_fullname = file_one_file(filename, importers, destination, idify, logfile)
+    return new_fullname, logfile.getvalue()
+
+
 def file(importer_config,
          files_or_directories,
          destination,
@@ -148,7 +171,8 @@ def file(importer_config,
          mkdirs=False,
          overwrite=False,
          idify=False,
-         logfile=None):
+         logfile=None,
+         jobs=None):
     """File importable files under a destination directory.
 
     Given an importer configuration object, search for files that can be
@@ -175,12 +199,19 @@ def file(importer_config,
         filename.
       logfile: A file object to write log entries to, or None, in which case no log is
         written out.
+      jobs: An integer, the number of worker processes to identify the files and
+        compute their destinations with, or None to do it serially. The files are
+        always moved by this process, in the order they were found, once all of
+        them have been processed.
     """
-    jobs = []
+    moves = []
     has_errors = False
-    for filename, importers in identify.find_imports(importer_config,
-                                                     files_or_directories,
-                                                     logfile):
+    process = functools.partial(file_one_file_logged, destination, idify)
+    for filename, importers, result in identify.map_imports(importer_config,
+                                                            files_or_directories,
+                                                            process,
+                                                            logfile=logfile,
+                                                            jobs=jobs):
         # If we're debugging, print out the match text.
         # This option is useful when we're building our importer configuration,
         # to figure out which patterns to create as unique signatures.
@@ -188,7 +219,9 @@ def file(importer_config,
             continue
 
         # Process a single file.
-        new_fullname = file_one_file(filename, importers, destination, idify, logfile)
+        new_fullname, log = result
+        if logfile is not None:
+            logfile.write(log)
         if new_fullname is None:
             continue
 
@@ -206,12 +239,12 @@ def file(importer_config,
             has_errors = True
             continue
 
-        jobs.append((filename, new_fullname))
+        moves.append((filename, new_fullname))
 
     # Check if any two imported files would be colliding in their destination
     # name, before we move anything.
     destmap = collections.defaultdict(list)
-    for src, dest in jobs:
+    for src, dest in moves:
         destmap[dest].append(src)
     for dest, sources in destmap.items():
         if len(sources) != 1:
@@ -225,10 +258,10 @@ def file(importer_config,
         return
 
     # Actually carry out the moving job.
-    for old_filename, new_filename in jobs:
+    for old_filename, new_filename in moves:
         move_xdev_file(old_filename, new_filename, mkdirs)
 
-    return jobs
+    return moves
 
 
 def move_xdev_file(src_filename, dst_filename, mkdirs=False):
@@ -291,5 +324,6 @@ def main():
          mkdirs=True,
          overwrite=args.overwrite,
          idify=True,
-         logfile=sys.stdout)
+         logfile=sys.stdout,
+         jobs=args.jobs)
     return 0
@@ -8,6 +8,8 @@ import os
 import logging
 import datetime
 import shutil
+import io
+import runpy
 
 from beancount.utils import test_utils
 from beancount.utils import file_utils
@@ -335,6 +337,27 @@ class TestScriptFile(scripts_utils.TestScriptsBase, test_utils.TestCase):
         for regexp in expected_res:
             self.assertTrue(any(re.match(regexp, filename) for filename in moved_files))
 
+    def test_file__jobs(self):
+        config = runpy.run_path(path.join(self.tempdir, 'test.import'))['CONFIG']
+        logfile = io.StringIO()
+        moves = file.file(config, self.downloads, self.documents,
+                          mkdirs=True, idify=True, logfile=logfile, jobs=2)
+        date = datetime.date.today()
+        self.assertEqual([
+            (path.join(self.downloads, 'ofxdownload.ofx'),
+             path.join(self.documents, 'Assets', 'Checking',
+                       '{}.ofxdownload.ofx'.format(date))),
+            (path.join(self.downloads, 'Subdir', 'bank.csv'),
+             path.join(self.documents, 'Liabilities', 'CreditCard',
+                       '{}.bank.csv'.format(date)))], moves)
+        for src, dest in moves:
+            self.assertFalse(path.exists(src))
+            self.assertTrue(path.exists(dest))
+        self.assertRegex(logfile.getvalue(),
+                         r'(?s)ofxdownload.ofx\nImporter: +mybank-checking-ofx\n.*'
+                         r'Destination: .*ofxdownload.ofx\n\n'
+                         r'.*bank.csv\nImporter: +mybank-credit-csv\n')
+
     def test_file_examples(self):
         config_filename = path.join(test_utils.find_repository_root(__file__),
                                     'examples', 'ingest', 'office', 'example.import')
@@ -7,6 +7,8 @@ be associated with.
 __copyright__ = "Copyright (C) 2016  Martin Blais"
 __license__ = "GNU GPLv2"
 
+import concurrent.futures
+import itertools
 import logging
 import sys
 from os import path
@@ -26,7 +28,134 @@ SECTION = '**** {}'
 FILE_TOO_LARGE_THRESHOLD = 8*1024*1024
 
 
-def find_imports(importer_config, files_or_directories, logfile=None):
+def identify_file(importer_config, filename):
+    """Run the signature checks of the importers on a single file.
+
+    Args:
+      importer_config: A list of importer instances that define the config.
+      filename: A string, the absolute name of the file to identify.
+    Returns:
+      A list of the indexes of the importers in 'importer_config' which
+      matched the file, or None if the file was skipped.
+    """
+    # Skip files that are simply too large.
+    size = path.getsize(filename)
+    if size > FILE_TOO_LARGE_THRESHOLD:
+        logging.warning("File too large: '{}' ({} bytes); skipping.".format(
+            filename, size))
+        return None
+
+    # For each of the sources the user has declared, identify which
+    # match the text.
+    file = cache.get_file(filename)
+    indexes = []
+    for index, importer in enumerate(importer_config):
+        try:
+            matched = importer.identify(file)
+            if matched:
+                indexes.append(index)
+        except Exception as exc:
+            logging.error("Importer %s.identify() raised an unexpected error: %s",
+                          importer.name(), exc)
+    return indexes
+
+
+def process_file(importer_config, function, filename):
+    """Identify a single file and process it with the importers that matched.
+
+    Args:
+      importer_config: A list of importer instances that define the config.
+      function: A callable applied to the filename and the list of matching
+        importers if any importer matched the file, or None.
+      filename: A string, the absolute name of the file to process.
+    Returns:
+      A pair of the list of indexes of the matching importers (None if the file
+      was skipped) and the return value of 'function' (None if it wasn't
+      called).
+    """
+    indexes = identify_file(importer_config, filename)
+    result = None
+    if indexes and function is not None:
+        result = function(filename, [importer_config[index] for index in indexes])
+    return indexes, result
+
+
+# The importer configuration of a worker process, set up by _init_worker().
+_WORKER_CONFIG = None
+
+
+def _init_worker(importer_config):
+    """Initialize a worker process with the importer configuration.
+
+    Args:
+      importer_config: A list of importer instances that define the config.
+    """
+    global _WORKER_CONFIG
+    _WORKER_CONFIG = importer_config
+
+
+def _process_file_worker(function, filename):
+    """Run process_file() in a worker process, with its configuration."""
+    return process_file(_WORKER_CONFIG, function, filename)
+
+
+def map_imports(importer_config, files_or_directories, function=None, logfile=None,
+                jobs=None):
+    """Identify the files to import and process the matching ones, possibly in parallel.
+
+    When more than one job is requested, the files are identified and processed
+    over a pool of worker processes, each file in a single worker. The
+    conversions of a file are thus cached in the memo of the worker process
+    that handled it (see cache.get_file()) and are not available to the
+    caller. The results are nevertheless produced in the same order as the
+    files are found, regardless of which file completes first.
+
+    The importer configuration is handed to the workers when they start. On
+    platforms where processes are not started by forking, this requires the
+    importers to be picklable. The function and its return values are always
+    transferred between processes, so they must be picklable, e.g. a module
+    level function, or a functools.partial of one.
+
+    Args:
+      importer_config: A list of importer instances that define the config.
+      files_or_directories: a list of files of directories to walk recursively and
+        hunt for files to import.
+      function: A callable applied in the worker to the filename and the list of
+        importers matching it, for each file which matched any, or None.
+      logfile: A file object to write log entries to, or None, in which case no log is
+        written out.
+      jobs: An integer, the number of worker processes to use, or None to process
+        all the files serially in this process.
+    Yields:
+      Triples of filename found, list of importers matching this file, and the
+      return value of 'function' for it (None if it wasn't called).
+    """
+    filenames = file_utils.find_files(files_or_directories)
+    if jobs is None or jobs <= 1:
+        results = ((filename, process_file(importer_config, function, filename))
+                   for filename in filenames)
+        executor = None
+    else:
+        filenames = list(filenames)
+        executor = concurrent.futures.ProcessPoolExecutor(
+            max_workers=jobs,
+            initializer=_init_worker, initargs=(importer_config,))
+        results = zip(filenames, executor.map(_process_file_worker,
+                                               itertools.repeat(function), filenames))
+    try:
+        for filename, (indexes, result) in results:
+            if logfile is not None:
+                logfile.write(SECTION.format(filename))
+                logfile.write('\n')
+            if indexes is None:
+                continue
+            yield (filename, [importer_config[index] for index in indexes], result)
+    finally:
+        if executor is not None:
+            executor.shutdown(wait=True)
+
+
+def find_imports(importer_config, files_or_directories, logfile=None, jobs=None):
     """Given an importer configuration, search for files that can be imported in the
     list of files or directories, run the signature checks on them and return a list
     of (filename, importers), where 'importers' is a list of importers that matched
@@ -38,58 +167,49 @@ def find_imports(importer_config, files_or_directories, logfile=None):
                             hunt for files to import.
       logfile: A file object to write log entries to, or None, in which case no log is
         written out.
+      jobs: An integer, the number of worker processes to identify the files
+        with, or None to identify them serially. See map_imports().
     Yields:
-      Triples of filename found, textified contents of the file, and list of
-      importers matching this file.
+      Pairs of filename found and list of importers matching this file.
     """
-    # Iterate over all files found; accumulate the entries by identification.
-    for filename in file_utils.find_files(files_or_directories):
-        if logfile is not None:
-            logfile.write(SECTION.format(filename))
-            logfile.write('\n')
+    for filename, importers, _ in map_imports(importer_config, files_or_directories,
+                                              logfile=logfile, jobs=jobs):
+        yield (filename, importers)
+
+
+def get_file_accounts(filename, importers):
+    """Compute the filing accounts of a file.
+
+    Args:
+      filename: A string, the absolute name of the file.
+      importers: A list of importer instances that matched the file.
+    Returns:
+      A list of the account returned by each importer's file_account().
+    """
+    file = cache.get_file(filename)
+    return [importer.file_account(file) for importer in importers]
+
 
-        # Skip files that are simply too large.
-        size = path.getsize(filename)
-        if size > FILE_TOO_LARGE_THRESHOLD:
-            logging.warning("File too large: '{}' ({} bytes); skipping.".format(
-                filename, size))
-            continue
-
-        # For each of the sources the user has declared, identify which
-        # match the text.
-        file = cache.get_file(filename)
-        matching_importers = []
-        for importer in importer_config:
-            try:
-                matched = importer.identify(file)
-                if matched:
-                    matching_importers.append(importer)
-            except Exception as exc:
-                logging.error("Importer %s.identify() raised an unexpected error: %s",
-                              importer.name(), exc)
-
-        yield (filename, matching_importers)
-
-
-def identify(importer_config, files_or_directories):
+def identify(importer_config, files_or_directories, jobs=None):
     """Run the identification loop.
 
     Args:
       importer_config: A list of importer instances.
       files_or_directories: A list of strings, files or directories.
+      jobs: An integer, the number of worker processes to use, or None.
     """
     logfile = sys.stdout
-    for filename, importers in find_imports(importer_config, files_or_directories,
-                                            logfile=logfile):
-        file = cache.get_file(filename)
-        for importer in importers:
+    for _, importers, accounts in map_imports(importer_config, files_or_directories,
+                                              get_file_accounts,
+                                              logfile=logfile, jobs=jobs):
+        for importer, account in zip(importers, accounts or []):
             logfile.write('Importer:    {}\n'.format(importer.name() if importer else '-'))
-            logfile.write('Account:     {}\n'.format(importer.file_account(file)))
+            logfile.write('Account:     {}\n'.format(account))
             logfile.write('\n')
 
 
 def main():
     parser = scripts_utils.create_arguments_parser("Identify files for import")
-    _, config, downloads_directories = scripts_utils.parse_arguments(parser)
-    identify(config, downloads_directories)
+    args, config, downloads_directories = scripts_utils.parse_arguments(parser)
+    identify(config, downloads_directories, jobs=args.jobs)
     return 0
@@ -2,6 +2,7 @@ __copyright__ = "Copyright (C) 2016  Martin Blais"
 __license__ = "GNU GPLv2"
 
 from os import path
+import io
 import re
 import textwrap
 import unittest
@@ -10,6 +11,7 @@ from unittest import mock
 from beancount.utils import test_utils
 from beancount.ingest.importer import ImporterProtocol
 from beancount.ingest import identify
+from beancount.ingest import cache
 from beancount.ingest import scripts_utils
 
 
@@ -22,6 +24,10 @@ class _TestImporter(ImporterProtocol):
         return file.name == self.filename
 
 
+def _read_contents(filename, importers):
+    return cache.get_file(filename).contents(), len(importers)
+
+
 class TestScriptIdentifyFunctions(test_utils.TestTempdirMixin, unittest.TestCase):
 
     def test_find_imports(self):
@@ -42,6 +48,35 @@ class TestScriptIdentifyFunctions(test_utils.TestTempdirMixin, unittest.TestCase
                           (file3, [])],
                          imports)
 
+    def test_find_imports__jobs(self):
+        filenames = [path.join(self.tempdir, 'file{:02d}.test'.format(index))
+                     for index in range(12)]
+        for filename in filenames:
+            open(filename, 'w')
+
+        config = [_TestImporter(filename) for filename in filenames[::2]]
+        imports = list(identify.find_imports(config, self.tempdir, jobs=3))
+        self.assertEqual([(filename, [config[index // 2]] if index % 2 == 0 else [])
+                          for index, filename in enumerate(filenames)],
+                         imports)
+
+    def test_map_imports__jobs(self):
+        for name in ['file1.test', 'file2.test', 'file3.test']:
+            with open(path.join(self.tempdir, name), 'w') as file:
+                file.write(name)
+        config = [_TestImporter(path.join(self.tempdir, 'file2.test')),
+                  _TestImporter(path.join(self.tempdir, 'file3.test'))]
+        oss = io.StringIO()
+        imports = list(identify.map_imports(config, self.tempdir, _read_contents,
+                                            logfile=oss, jobs=2))
+        self.assertEqual([(path.join(self.tempdir, 'file1.test'), [], None),
+                          (path.join(self.tempdir, 'file2.test'), [config[0]],
+                           ('file2.test', 1)),
+                          (path.join(self.tempdir, 'file3.test'), [config[1]],
+                           ('file3.test', 1))],
+                         imports)
+        self.assertEqual(3, oss.getvalue().count(identify.SECTION.format('')))
+
     @mock.patch.object(identify, 'FILE_TOO_LARGE_THRESHOLD', 128)
     def test_find_imports__file_too_large(self):
         file1 = path.join(self.tempdir, 'file1.test')
@@ -89,6 +124,13 @@ class TestScriptIdentify(scripts_utils.TestScriptsBase):
         output = stdout.getvalue().strip()
         self.assertTrue(re.match(regexp, output))
 
+        with test_utils.capture('stdout', 'stderr') as (stdout, stderr):
+            test_utils.run_with_args(identify.main,
+                                     ['--jobs=2',
+                                      path.join(self.tempdir, 'test.import'),
+                                      path.join(self.tempdir, 'Downloads')])
+        self.assertEqual(output, stdout.getvalue().strip())
+
     def test_identify_examples(self):
         example_dir = path.join(
             test_utils.find_repository_root(__file__), 'examples', 'ingest')
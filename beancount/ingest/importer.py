@@ -65,7 +65,9 @@ class ImporterProtocol:
           file: A cache.FileMemo instance.
         Returns:
           A list of new, imported directives (usually mostly Transactions)
-          extracted from the file.
+          extracted from the file. This may also be an iterator, e.g. a
+          generator producing the directives as the file is read; it is
+          consumed only once.
         """
 
     def file_account(self, file):
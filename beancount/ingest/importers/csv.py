@@ -7,11 +7,12 @@ import csv
 import datetime
 import enum
 import io
+import operator
 from os import path
 
 from beancount.core.number import D
 from beancount.core.amount import Amount
-from beancount.utils.date_utils import parse_date_liberally
+from beancount.utils import date_utils
 from beancount.core import data
 from beancount.ingest import importer
 from beancount.ingest.importers import regexp
@@ -50,24 +51,61 @@ class Col(enum.Enum):
     DRCR = '[DRCR]'
 
 
-def get_amounts(iconfig, row):
-    """Get the amount columns of a row.
+def get_column(iconfig, col):
+    """Create an accessor for a column of the rows.
 
     Args:
       iconfig: A dict of Col to row index.
-      row: A row array containing the values of the given row.
+      col: A Col type.
     Returns:
-      A pair of (debit-amount, credit-amount), both of which are either an
-      instance of Decimal or None, or not available.
+      A function of a row to the value of the column in it, or None if the
+      column isn't configured.
+    """
+    return operator.itemgetter(iconfig[col]) if col in iconfig else None
+
+
+def compile_amounts(iconfig):
+    """Create an accessor for the amount columns of the rows.
+
+    Args:
+      iconfig: A dict of Col to row index.
+    Returns:
+      A function of a row to a pair of (debit-amount, credit-amount), both of
+      which are either an instance of Decimal or None, if not available.
     """
-    debit, credit = None, None
     if Col.AMOUNT in iconfig:
-        credit = row[iconfig[Col.AMOUNT]]
+        get_credit = operator.itemgetter(iconfig[Col.AMOUNT])
+        def amounts(row):
+            credit = get_credit(row)
+            return None, (D(credit) if credit else None)
     else:
-        debit, credit = [row[iconfig[col]] if col in iconfig else None
-                         for col in [Col.AMOUNT_DEBIT, Col.AMOUNT_CREDIT]]
-    return (-D(debit) if debit else None,
-            D(credit) if credit else None)
+        get_debit = get_column(iconfig, Col.AMOUNT_DEBIT)
+        get_credit = get_column(iconfig, Col.AMOUNT_CREDIT)
+        def amounts(row):
+            debit = get_debit(row) if get_debit else None
+            credit = get_credit(row) if get_credit else None
+            return (-D(debit) if debit else None,
+                    D(credit) if credit else None)
+    return amounts
+
+
+def iter_rows(filename, has_header):
+    """Read the non-empty rows of a CSV file, one at a time.
+
+    Args:
+      filename: A string, the name of the file.
+      has_header: A boolean, true if the first row should be skipped.
+    Yields:
+      Pairs of the index of the row, from 1 after the header, and the row, a
+      list of strings.
+    """
+    with open(filename) as infile:
+        reader = csv.reader(infile)
+        if has_header:
+            next(reader, None)
+        for index, row in enumerate(reader, 1):
+            if row:
+                yield index, row
 
 
 class Importer(regexp.RegexpImporterMixin, importer.ImporterProtocol):
@@ -75,7 +113,8 @@ class Importer(regexp.RegexpImporterMixin, importer.ImporterProtocol):
 
     def __init__(self, config, account, currency, regexps,
                  institution=None,
-                 debug=False):
+                 debug=False,
+                 date_format=None):
         """Constructor.
 
         Args:
@@ -84,7 +123,10 @@ class Importer(regexp.RegexpImporterMixin, importer.ImporterProtocol):
           currency: A currency string, the currenty of this account.
           regexps: A list of regular expression strings.
           institution: An optional name of an institution to rename the files to.
-          header:
+          debug: A boolean, true to print out the rows as they are read.
+          date_format: An optional strptime() format string of the dates, e.g.
+            '%m/%d/%Y'. If not provided, the dates are parsed liberally, which
+            is much slower.
         """
         if isinstance(regexps, str):
             regexps = [regexps]
@@ -97,6 +139,7 @@ class Importer(regexp.RegexpImporterMixin, importer.ImporterProtocol):
         self.account = account
         self.currency = currency
         self.debug = debug
+        self.date_format = date_format
 
         # FIXME: This probably belongs to a mixin, not here.
         self.institution = institution
@@ -118,18 +161,11 @@ class Importer(regexp.RegexpImporterMixin, importer.ImporterProtocol):
         "Get the maximum date from the file."
         iconfig, has_header = normalize_config(self.config, file.head())
         if Col.DATE in iconfig:
-            reader = iter(csv.reader(open(file.name)))
-            if has_header:
-                next(reader)
-            max_date = None
-            for row in reader:
-                if not row:
-                    continue
-                date_str = row[iconfig[Col.DATE]]
-                date = parse_date_liberally(date_str)
-                if max_date is None or date > max_date:
-                    max_date = date
-            return max_date
+            parse_date = date_utils.date_parser(self.date_format)
+            get_date = get_column(iconfig, Col.DATE)
+            return max((parse_date(get_date(row))
+                        for _, row in iter_rows(file.name, has_header)),
+                       default=None)
 
 
     # def get_description(self, row):
@@ -152,24 +188,43 @@ class Importer(regexp.RegexpImporterMixin, importer.ImporterProtocol):
     #     return payee, narration
 
     def extract(self, file):
-        entries = []
+        """Extract the transactions from the file, as its rows are read.
 
+        Args:
+          file: A cache.FileMemo instance.
+        Returns:
+          An iterator of directives, in the order of the rows of the file,
+          followed by a Balance directive if a balance column is configured.
+        """
         # Normalize the configuration to fetch by index.
         iconfig, has_header = normalize_config(self.config, file.head())
+        return self.iter_entries(file.name, iconfig, has_header)
 
-        # Skip header, if one was detected.
-        reader = iter(csv.reader(open(file.name)))
-        if has_header:
-            next(reader)
-        def get(row, ftype):
-            return row[iconfig[ftype]] if ftype in iconfig else None
+    def iter_entries(self, filename, iconfig, has_header):
+        """Generate the directives of a file.
+
+        Args:
+          filename: A string, the name of the file.
+          iconfig: A dict of Col to row index.
+          has_header: A boolean, true if the file has a header.
+        Yields:
+          Transaction directives, then an optional Balance directive.
+        """
+        # Compile the accessors of the columns once for all the rows.
+        parse_date = date_utils.date_parser(self.date_format)
+        get_date = get_column(iconfig, Col.DATE)
+        get_txn_date = get_column(iconfig, Col.TXN_DATE)
+        get_payee = get_column(iconfig, Col.PAYEE)
+        get_narrations = [get_column(iconfig, field)
+                          for field in (Col.NARRATION1, Col.NARRATION2, Col.NARRATION3)
+                          if field in iconfig]
+        get_tag = get_column(iconfig, Col.TAG)
+        get_amounts_ = compile_amounts(iconfig)
 
         # Parse all the transactions.
         first_row = last_row = None
-        for index, row in enumerate(reader, 1):
-            if not row:
-                continue
-
+        index = None
+        for index, row in iter_rows(filename, has_header):
             # If debugging, print out the rows.
             if self.debug: print(row)
 
@@ -178,54 +233,44 @@ class Importer(regexp.RegexpImporterMixin, importer.ImporterProtocol):
             last_row = row
 
             # Extract the data we need from the row, based on the configuration.
-            date = get(row, Col.DATE)
-            txn_date = get(row, Col.TXN_DATE)
-
-            payee = get(row, Col.PAYEE)
-            fields = filter(None, [get(row, field)
-                                   for field in (Col.NARRATION1,
-                                                 Col.NARRATION2,
-                                                 Col.NARRATION3)])
-            narration = ' -- '.join(fields)
-
-            tag = get(row, Col.TAG)
-            tags = {tag} if tag is not None else data.EMPTY_SET
-
-            # Create a transaction and add it to the list of new entries.
-            meta = data.new_metadata(file.name, index)
-            if txn_date is not None:
-                meta['txndate'] = parse_date_liberally(txn_date)
-            date = parse_date_liberally(date)
-            txn = data.Transaction(meta, date, self.FLAG, payee, narration,
-                                   tags, data.EMPTY_SET, [])
-            entries.append(txn)
-
-            amount_debit, amount_credit = get_amounts(iconfig, row)
-            for amount in [amount_debit, amount_credit]:
+            payee = get_payee(row) if get_payee else None
+            narration = ' -- '.join(filter(None, [get_narration(row)
+                                                  for get_narration in get_narrations]))
+
+            tags = {get_tag(row)} if get_tag else data.EMPTY_SET
+
+            meta = data.new_metadata(filename, index)
+            if get_txn_date:
+                meta['txndate'] = parse_date(get_txn_date(row))
+            date = parse_date(get_date(row))
+
+            postings = []
+            for amount in get_amounts_(row):
                 if amount is None:
                     continue
                 units = Amount(amount, self.currency)
-                txn.postings.append(
+                postings.append(
                     data.Posting(self.account, units, None, None, None, None))
 
+            # Create a transaction.
+            yield data.Transaction(meta, date, self.FLAG, payee, narration,
+                                   tags, data.EMPTY_SET, postings)
+
         # Parse the final balance.
         if Col.BALANCE in iconfig and first_row and last_row:
             # Figure out if the file is in ascending or descending order.
-            first_date = parse_date_liberally(get(first_row, Col.DATE))
-            last_date = parse_date_liberally(get(last_row, Col.DATE))
+            first_date = parse_date(get_date(first_row))
+            last_date = parse_date(get_date(last_row))
             is_ascending = first_date < last_date
 
             # Choose between the first or the last row based on the date.
             row = last_row if is_ascending else first_row
-            date = parse_date_liberally(get(row, Col.DATE)) + datetime.timedelta(days=1)
-            balance = D(get(row, Col.BALANCE))
-            meta = data.new_metadata(file.name, index)
-            entries.append(
-                data.Balance(meta, date,
-                             self.account, Amount(balance, self.currency),
-                             None, None))
-
-        return entries
+            date = parse_date(get_date(row)) + datetime.timedelta(days=1)
+            balance = D(row[iconfig[Col.BALANCE]])
+            meta = data.new_metadata(filename, index)
+            yield data.Balance(meta, date,
+                               self.account, Amount(balance, self.currency),
+                               None, None)
 
 
 def normalize_config(config, head):
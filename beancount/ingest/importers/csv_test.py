@@ -1,6 +1,7 @@
 __copyright__ = "Copyright (C) 2016  Martin Blais"
 __license__ = "GNU GPLv2"
 
+import datetime
 import textwrap
 import unittest
 
@@ -74,7 +75,7 @@ class TestCSVImporter(cmptest.TestCase):
                                 ('Details,Posting Date,"Description",Amount,'
                                  'Type,Balance,Check or Slip #,'),
                                 'chafe')
-        entries = importer.extract(file)
+        entries = list(importer.extract(file))
         self.assertEqualEntries("""
 
           2016-03-18 * "Payment to Chafe card ending in 1234 03/18"
@@ -99,6 +100,47 @@ class TestCSVImporter(cmptest.TestCase):
 
         """, entries)
 
+    @test_utils.docfile
+    def test_date_format_debit_credit(self, filename):
+        """\
+          Date,Description,Debit,Credit,Category
+          07/02/2016,COFFEE SHOP,4.50,,Food
+          07/03/2016,REFUND,,20.00,Shopping
+          07/01/2016,GROCERIES,83.21,,Food
+        """
+        file = cache.get_file(filename)
+        importer = csv.Importer({Col.DATE: 'Date',
+                                 Col.NARRATION: 'Description',
+                                 Col.AMOUNT_DEBIT: 'Debit',
+                                 Col.AMOUNT_CREDIT: 'Credit',
+                                 Col.TAG: 'Category'},
+                                'Liabilities:Card', 'USD',
+                                'Date,Description,Debit,Credit',
+                                date_format='%m/%d/%Y')
+        entries = importer.extract(file)
+        self.assertNotIsInstance(entries, list)
+        self.assertEqualEntries("""
+
+          2016-07-02 * "COFFEE SHOP" #Food
+            Liabilities:Card  -4.50 USD
+
+          2016-07-03 * "REFUND" #Shopping
+            Liabilities:Card  20.00 USD
+
+          2016-07-01 * "GROCERIES" #Food
+            Liabilities:Card  -83.21 USD
+
+        """, list(entries))
+        self.assertEqual(datetime.date(2016, 7, 3), importer.file_date(file))
+
+        # The dates must match the format.
+        importer = csv.Importer({Col.DATE: 'Date', Col.AMOUNT_DEBIT: 'Debit'},
+                                'Liabilities:Card', 'USD',
+                                'Date,Description,Debit,Credit',
+                                date_format='%Y-%m-%d')
+        with self.assertRaises(ValueError):
+            list(importer.extract(file))
+
 
 # TODO: Support credit and debit columns (capitalone).
 # TODO: Test things out with/without payee and with/without narration.
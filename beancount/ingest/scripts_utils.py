@@ -31,6 +31,24 @@ def create_arguments_parser(description):
                         default=[],
                         help='Filenames or directories to search for files to import')
 
+    parser.add_argument('-j', '--jobs', action='store', type=int, default=None,
+                        help=('Number of worker processes to identify and process '
+                              'the files with (default: process them serially)'))
+
+    parser.add_argument('--cache', action='store', metavar='CACHE_FILENAME',
+                        default=os.environ.get('BEANCOUNT_INGEST_CACHE', None),
+                        help=('Database file to store the conversions of the files '
+                              'in and reuse them across runs (default: '
+                              '$BEANCOUNT_INGEST_CACHE, if set)'))
+
+    parser.add_argument('--cache-max-size', action='store', type=int, metavar='MB',
+                        default=cache.DEFAULT_MAX_SIZE // (1024 * 1024),
+                        help=('Maximum size of the conversions cache; the least '
+                              'recently used conversions are evicted beyond it'))
+
+    parser.add_argument('--clear-cache', action='store_true',
+                        help='Remove all the conversions from the cache before running')
+
     return parser
 
 
@@ -61,6 +79,14 @@ def parse_arguments(parser, argv=None):
         if not path.exists(filename):
             parser.error("File does not exist: '{}'".format(filename))
 
+    # Open the persistent cache of conversions.
+    if args.cache:
+        conversion_cache = cache.ConversionCache(args.cache,
+                                                 args.cache_max_size * 1024 * 1024)
+        if args.clear_cache:
+            conversion_cache.invalidate()
+        cache.set_persistent_cache(conversion_cache)
+
     return args, config, list(map(path.abspath, args.files_or_directories))
 
 
@@ -7,6 +7,7 @@ from os import path
 
 from beancount.utils import test_utils
 from beancount.ingest import scripts_utils
+from beancount.ingest import cache
 
 
 class TestTestScriptsBase(scripts_utils.TestScriptsBase):
@@ -48,6 +49,29 @@ class TestTestScriptsBase(scripts_utils.TestScriptsBase):
         self.assertEqual(2, len(config))
         self.assertEqual([path.join(self.tempdir, 'Downloads')], dirs)
 
+    def test_parse_arguments__cache(self):
+        self.addCleanup(cache.set_persistent_cache, None)
+        cache_filename = path.join(self.tempdir, 'cache.db')
+        parser = scripts_utils.create_arguments_parser("Test script")
+        args, _, __ = scripts_utils.parse_arguments(parser, [
+            '--cache', cache_filename, '--cache-max-size=16',
+            path.join(self.tempdir, 'test.import'),
+            path.join(self.tempdir, 'Downloads'),
+        ])
+        conversion_cache = cache._PERSISTENT_CACHE
+        self.assertEqual(cache_filename, conversion_cache.filename)
+        self.assertEqual(16 * 1024 * 1024, conversion_cache.max_size)
+        conversion_cache.put('abc', 'converter', 'value')
+        conversion_cache.close()
+
+        scripts_utils.parse_arguments(parser, [
+            '--cache', cache_filename, '--clear-cache',
+            path.join(self.tempdir, 'test.import'),
+            path.join(self.tempdir, 'Downloads'),
+        ])
+        self.assertEqual(0, cache._PERSISTENT_CACHE.size())
+        cache._PERSISTENT_CACHE.close()
+
     def test_parse_arguments__multiple(self):
         parser = scripts_utils.create_arguments_parser("Test script")
         with test_utils.capture('stdout', 'stderr') as (stdout, stderr):
@@ -1,12 +1,17 @@
 """Identify similar entries.
 
 This can be used during import in order to identify and flag duplicate entries.
+
+The existing entries are indexed by date, account, currency and magnitude of
+amount (see SimilarityIndex), so that only the few existing transactions which
+could possibly be similar to an imported one are compared to it.
 """
 __copyright__ = "Copyright (C) 2016  Martin Blais"
 __license__ = "GNU GPLv2"
 
 import datetime
 import collections
+import math
 
 from beancount.core.number import D
 from beancount.core.number import ZERO
@@ -14,6 +19,7 @@ from beancount.core.number import ONE
 from beancount.core import data
 from beancount.core import amount
 from beancount.core import interpolate
+from beancount.utils import bisect_key
 
 
 def find_similar_entries(entries, source_entries, comparator=None, window_days=2):
@@ -25,7 +31,8 @@ def find_similar_entries(entries, source_entries, comparator=None, window_days=2
     Args:
       entries: The list of entries to classify as duplicate or note.
       source_entries: The list of entries against which to match. This is the
-        previous, or existing set of entries to compare against.
+        previous, or existing set of entries to compare against. It must be
+        sorted by date.
       comparator: A functor used to establish the similarity of two entries.
       window_days: The number of days (inclusive) before or after to scan the
         entries to classify against.
@@ -35,12 +42,15 @@ def find_similar_entries(entries, source_entries, comparator=None, window_days=2
       'source_entries'.
 
     """
+    if comparator is None or is_indexable(comparator):
+        index = SimilarityIndex(source_entries, comparator, window_days)
+        return [(entry, source_entry)
+                for entry, source_entry in index.classify_entries(entries)
+                if source_entry is not None]
+
     window_head = datetime.timedelta(days=window_days)
     window_tail = datetime.timedelta(days=window_days + 1)
 
-    if comparator is None:
-        comparator = SimilarityComparator()
-
     # For each of the new entries, look at entries at a nearby date.
     duplicates = []
     for entry in data.filter_txns(entries):
@@ -54,6 +64,153 @@ def find_similar_entries(entries, source_entries, comparator=None, window_days=2
     return duplicates
 
 
+def is_indexable(comparator):
+    """Return true if a comparator's candidates can be found with a SimilarityIndex.
+
+    Args:
+      comparator: A functor used to establish the similarity of two entries.
+    Returns:
+      A boolean, true if the comparator is a SimilarityComparator which
+      doesn't override its comparison.
+    """
+    return (isinstance(comparator, SimilarityComparator) and
+            type(comparator).__call__ is SimilarityComparator.__call__ and
+            type(comparator).compare is SimilarityComparator.compare)
+
+
+class SimilarityIndex:
+    """An index of existing transactions, to find those similar to new ones.
+
+    Two transactions can only be deemed similar by the SimilarityComparator if
+    they are within the date window of each other and they have an amount in
+    the same account and currency whose magnitudes are within its EPSILON of
+    each other, or both zero. The transactions are thus indexed by date
+    bucket, account, currency and the logarithm of the magnitude of the
+    amount, rounded to buckets wide enough that only the neighbouring buckets
+    need to be looked up. Only the candidates found in the index are compared,
+    in their original order, so that the same first match is found as when
+    comparing against all the transactions in the window.
+
+    The date buckets are indexed on demand, so that classifying a few new
+    entries doesn't require indexing a long history of existing ones.
+
+    Attributes:
+      source_entries: The list of existing entries, sorted by date.
+      comparator: A SimilarityComparator instance.
+      window_days: The number of days (inclusive) before or after an entry to
+        find similar entries in.
+    """
+
+    def __init__(self, source_entries, comparator=None, window_days=2):
+        self.source_entries = source_entries
+        self.comparator = comparator if comparator is not None else SimilarityComparator()
+        self.window_days = window_days
+
+        self._bucket_days = 2 * window_days + 1
+        self._log_width = 2 * math.log1p(float(self.comparator.EPSILON))
+
+        # A dict of date bucket number to a dict of (account, currency,
+        # magnitude) to sorted lists of indexes of transactions in
+        # 'source_entries'.
+        self._buckets = {}
+
+        # A dict of index in 'source_entries' to its amounts map.
+        self._amounts = {}
+
+    def magnitude(self, number):
+        """Compute the magnitude bucket of an amount.
+
+        Args:
+          number: A Decimal instance.
+        Returns:
+          An integer, or None for a zero amount.
+        """
+        value = abs(float(number))
+        if 0. < value < math.inf:
+            return math.floor(math.log(value) / self._log_width)
+        if number == ZERO:
+            return None
+        # The amount is out of the range of floats.
+        return math.floor(float(abs(number).ln()) / self._log_width)
+
+    def _get_bucket(self, bucket):
+        """Return the index of a date bucket, building it if necessary.
+
+        Args:
+          bucket: An integer, the date bucket number.
+        Returns:
+          A dict of (account, currency, magnitude) to lists of indexes.
+        """
+        try:
+            return self._buckets[bucket]
+        except KeyError:
+            pass
+        index = collections.defaultdict(list)
+        date_begin = datetime.date.fromordinal(max(1, bucket * self._bucket_days))
+        date_end = datetime.date.fromordinal(min(datetime.date.max.toordinal(),
+                                                 (bucket + 1) * self._bucket_days))
+        getdate = lambda entry: entry.date
+        for position in range(
+                bisect_key.bisect_left_with_key(self.source_entries, date_begin, getdate),
+                bisect_key.bisect_left_with_key(self.source_entries, date_end, getdate)):
+            entry = self.source_entries[position]
+            if not isinstance(entry, data.Transaction):
+                continue
+            amounts = self._amounts[position] = amounts_map(entry)
+            for (account, currency), number in amounts.items():
+                index[(account, currency, self.magnitude(number))].append(position)
+        self._buckets[bucket] = index
+        return index
+
+    def find_similar(self, entry, amounts=None):
+        """Find the first existing transaction similar to a transaction.
+
+        Args:
+          entry: A Transaction instance.
+          amounts: The amounts map of 'entry', or None to compute it.
+        Returns:
+          A transaction from 'source_entries', or None if none is similar.
+        """
+        if amounts is None:
+            amounts = amounts_map(entry)
+        date_begin = entry.date - datetime.timedelta(days=self.window_days)
+        date_end = entry.date + datetime.timedelta(days=self.window_days)
+        ordinal_begin = date_begin.toordinal()
+        ordinal_end = date_end.toordinal()
+
+        positions = set()
+        for bucket in range(ordinal_begin // self._bucket_days,
+                            ordinal_end // self._bucket_days + 1):
+            index = self._get_bucket(bucket)
+            for (account, currency), number in amounts.items():
+                magnitude = self.magnitude(number)
+                magnitudes = ((None,) if magnitude is None else
+                              (magnitude - 1, magnitude, magnitude + 1))
+                for magnitude in magnitudes:
+                    positions.update(index.get((account, currency, magnitude), ()))
+
+        for position in sorted(positions):
+            source_entry = self.source_entries[position]
+            if not (date_begin <= source_entry.date <= date_end):
+                continue
+            if self.comparator.compare(entry, amounts,
+                                       source_entry, self._amounts[position]):
+                return source_entry
+        return None
+
+    def classify_entries(self, entries):
+        """Find the existing transactions similar to each of a list of new entries.
+
+        Args:
+          entries: A list of new entries, e.g., extracted from a file.
+        Returns:
+          A list of (entry, source_entry) pairs, one for each transaction in
+          'entries', in the same order, where source_entry is the first similar
+          transaction from 'source_entries', or None.
+        """
+        return [(entry, self.find_similar(entry)) for entry in data.filter_txns(entries)]
+
+
 class SimilarityComparator:
     """Similarity comparator of transactions.
 
@@ -83,14 +240,6 @@ class SimilarityComparator:
         Returns:
           A boolean.
         """
-        # Check the date difference.
-        if self.max_date_delta is not None:
-            delta = ((entry1.date - entry2.date)
-                     if entry1.date > entry2.date else
-                     (entry2.date - entry1.date))
-            if delta > self.max_date_delta:
-                return False
-
         try:
             amounts1 = self.cache[id(entry1)]
         except KeyError:
@@ -99,6 +248,26 @@ class SimilarityComparator:
             amounts2 = self.cache[id(entry2)]
         except KeyError:
             amounts2 = self.cache[id(entry2)] = amounts_map(entry2)
+        return self.compare(entry1, amounts1, entry2, amounts2)
+
+    def compare(self, entry1, amounts1, entry2, amounts2):
+        """Compare two entries whose amounts maps have been computed.
+
+        Args:
+          entry1: A first Transaction directive.
+          amounts1: The amounts map of 'entry1', see amounts_map().
+          entry2: A second Transaction directive.
+          amounts2: The amounts map of 'entry2'.
+        Returns:
+          A boolean, true if they are deemed similar.
+        """
+        # Check the date difference.
+        if self.max_date_delta is not None:
+            delta = ((entry1.date - entry2.date)
+                     if entry1.date > entry2.date else
+                     (entry2.date - entry1.date))
+            if delta > self.max_date_delta:
+                return False
 
         # Look for amounts on common accounts.
         common_keys = set(amounts1) & set(amounts2)
@@ -2,8 +2,10 @@ __copyright__ = "Copyright (C) 2016  Martin Blais"
 __license__ = "GNU GPLv2"
 
 import datetime
+import random
 
 from beancount.core.number import D
+from beancount.core import amount
 from beancount.core import data
 from beancount.parser import cmptest
 from beancount.parser import parser
@@ -101,6 +103,86 @@ class TestDups(cmptest.TestCase):
         duplicates = similar.find_similar_entries(new_entries, entries, window_days=1)
         self.assertEqual(len(new_entries), len(duplicates))
 
+    def test_find_similar_entries__indexed(self):
+        # Generate random transactions with amounts close to each other, some
+        # zero and some of opposite signs, over a few accounts and currencies.
+        rand = random.Random(42)
+        accounts = ['Assets:Checking', 'Assets:Savings', 'Expenses:Food',
+                    'Expenses:Rent', 'Liabilities:Card']
+        numbers = [D('0'), D('0.01'), D('10.00'), D('10.45'), D('10.50'), D('10.55'),
+                   D('-10.00'), D('9.60'), D('1000'), D('1049.99'), D('1E-30')]
+        def create_entries(count):
+            entries = []
+            for _ in range(count):
+                date = datetime.date(2016, 1, 1) + datetime.timedelta(rand.randrange(60))
+                meta = data.new_metadata('<test>', 0)
+                postings = []
+                for account in rand.sample(accounts, rand.randint(1, 3)):
+                    units = amount.Amount(rand.choice(numbers), rand.choice(['USD', 'CAD']))
+                    postings.append(data.Posting(account, units, None, None, None, None))
+                entries.append(data.Transaction(meta, date, '*', None, '', data.EMPTY_SET,
+                                                data.EMPTY_SET, postings))
+            entries.sort(key=data.entry_sortkey)
+            return entries
+
+        source_entries = create_entries(400)
+        new_entries = create_entries(200)
+        for window_days in [0, 1, 2, 5]:
+            for max_date_delta in [None, datetime.timedelta(days=1)]:
+                comparator = similar.SimilarityComparator(max_date_delta)
+                expected = similar.find_similar_entries(
+                    new_entries, source_entries,
+                    lambda entry1, entry2, comparator=comparator: comparator(entry1,
+                                                                             entry2),
+                    window_days=window_days)
+                duplicates = similar.find_similar_entries(
+                    new_entries, source_entries,
+                    similar.SimilarityComparator(max_date_delta),
+                    window_days=window_days)
+                self.assertGreater(len(expected), 10)
+                self.assertEqual([(id(entry1), id(entry2)) for entry1, entry2 in expected],
+                                 [(id(entry1), id(entry2)) for entry1, entry2 in duplicates])
+
+    @loader.load_doc()
+    def test_similarity_index(self, entries, _, __):
+        """
+            2016-01-01 open Assets:Account1
+            2016-01-01 open Assets:Account2
+
+            2016-02-01 * "A"
+              Assets:Account1    10.00 USD
+              Assets:Account2   -10.00 USD
+
+            2016-02-02 balance Assets:Account1   10.00 USD
+
+            2016-02-02 * "B"
+              Assets:Account1    20.00 USD
+              Assets:Account2   -20.00 USD
+        """
+        index = similar.SimilarityIndex(entries, window_days=1)
+        new_entries, _, __ = loader.load_string("""
+            2016-01-01 open Assets:Account1
+            2016-01-01 open Assets:Account2
+
+            2016-02-02 * "A"
+              Assets:Account1    10.20 USD
+              Assets:Account2   -10.20 USD
+
+            2016-02-02 * "C"
+              Assets:Account1    30.00 USD
+              Assets:Account2   -30.00 USD
+
+            2016-02-04 * "B"
+              Assets:Account1    20.00 USD
+              Assets:Account2   -20.00 USD
+        """)
+        txns = list(data.filter_txns(entries))
+        new_txns = list(data.filter_txns(new_entries))
+        self.assertEqual([(new_txns[0], txns[0]), (new_txns[1], None), (new_txns[2], None)],
+                         index.classify_entries(new_entries))
+        self.assertIs(txns[1], index.find_similar(new_txns[2]._replace(
+            date=datetime.date(2016, 2, 3))))
+
     @parser.parse_doc(allow_incomplete=True)
     def test_amounts_map(self, entries, _, __):
         """
@@ -3,6 +3,7 @@
 __copyright__ = "Copyright (C) 2013-2016  Martin Blais"
 __license__ = "GNU GPLv2"
 
+from concurrent import futures
 import collections
 import functools
 import hashlib
@@ -10,6 +11,7 @@ import importlib
 import io
 import itertools
 import logging
+import operator
 import os
 import pickle
 import struct
@@ -19,6 +21,7 @@ import warnings
 from os import path
 
 from beancount.utils import misc_utils
+from beancount.utils import profiling
 from beancount.core import data
 from beancount.parser import parser
 from beancount.parser import booking
@@ -53,7 +56,7 @@ PICKLE_CACHE_THRESHOLD = 1.0
 
 
 def load_file(filename, log_timings=None, log_errors=None, extra_validations=None,
-              encoding=None):
+              encoding=None, profiler=None):
     """Open a Beancount input file, parse it, run transformations and validate.
 
     Args:
@@ -65,6 +68,9 @@ def load_file(filename, log_timings=None, log_errors=None, extra_validations=Non
       extra_validations: A list of extra validation functions to run after loading
         this list of entries.
       encoding: A string or None, the encoding to decode the input filename with.
+      profiler: An optional instance of profiling.Profiler to record the profile
+        of each of the stages of loading to. The pickle cache is bypassed if a
+        profiler is given.
     Returns:
       A triple of (entries, errors, option_map) where "entries" is a date-sorted
       list of entries from the file, "errors" a list of error objects generated
@@ -80,7 +86,12 @@ def load_file(filename, log_timings=None, log_errors=None, extra_validations=Non
         entries, errors, options_map = load_encrypted_file(
             filename,
             log_timings, log_errors,
-            extra_validations, False, encoding)
+            extra_validations, False, encoding, profiler)
+    elif profiler is not None:
+        entries, errors, options_map = _uncached_load_file(
+            filename, log_timings,
+            extra_validations, encoding, profiler)
+        _log_errors(errors, log_errors)
     else:
         entries, errors, options_map = _load_file(
             filename, log_timings,
@@ -90,7 +101,7 @@ def load_file(filename, log_timings=None, log_errors=None, extra_validations=Non
 
 
 def load_encrypted_file(filename, log_timings=None, log_errors=None, extra_validations=None,
-                        dedent=False, encoding=None):
+                        dedent=False, encoding=None, profiler=None):
     """Load an encrypted Beancount input file.
 
     Args:
@@ -100,6 +111,7 @@ def load_encrypted_file(filename, log_timings=None, log_errors=None, extra_valid
       extra_validations: See load_string().
       dedent: See load_string().
       encoding: See load_string().
+      profiler: See load_string().
     Returns:
       A triple of (entries, errors, option_map) where "entries" is a date-sorted
       list of entries from the file, "errors" a list of error objects generated
@@ -111,7 +123,8 @@ def load_encrypted_file(filename, log_timings=None, log_errors=None, extra_valid
                        log_timings=log_timings,
                        log_errors=log_errors,
                        extra_validations=extra_validations,
-                       encoding=encoding)
+                       encoding=encoding,
+                       profiler=profiler)
 
 
 def _log_errors(errors, log_errors):
@@ -247,7 +260,7 @@ def compute_input_hash(filenames):
 
 
 def load_string(string, log_timings=None, log_errors=None, extra_validations=None,
-                dedent=False, encoding=None):
+                dedent=False, encoding=None, profiler=None):
 
     """Open a Beancount input string, parse it, run transformations and validate.
 
@@ -261,6 +274,8 @@ def load_string(string, log_timings=None, log_errors=None, extra_validations=Non
         this list of entries.
       dedent: A boolean, if set, remove the whitespace in front of the lines.
       encoding: A string or None, the encoding to decode the input filename with.
+      profiler: An optional instance of profiling.Profiler to record the profile
+        of each of the stages of loading to.
     Returns:
       A triple of (entries, errors, option_map) where "entries" is a date-sorted
       list of entries from the string, "errors" a list of error objects
@@ -270,7 +285,7 @@ def load_string(string, log_timings=None, log_errors=None, extra_validations=Non
     if dedent:
         string = textwrap.dedent(string)
     entries, errors, options_map = _load([(string, False)], log_timings,
-                                         extra_validations, encoding)
+                                         extra_validations, encoding, profiler)
     _log_errors(errors, log_errors)
     return entries, errors, options_map
 
@@ -408,7 +423,7 @@ def aggregate_options_map(options_map, src_options_map):
         commodities.add(currency)
 
 
-def _load(sources, log_timings, extra_validations, encoding):
+def _load(sources, log_timings, extra_validations, encoding, profiler=None):
     """Parse Beancount input, run its transformations and validate it.
 
     (This is an internal method.)
@@ -428,6 +443,8 @@ def _load(sources, log_timings, extra_validations, encoding):
       extra_validations: A list of extra validation functions to run after loading
         this list of entries.
       encoding: A string or None, the encoding to decode the input filename with.
+      profiler: An optional instance of profiling.Profiler to record the profile
+        of each of the stages to, or None.
     Returns:
       See load() or load_string().
     """
@@ -437,22 +454,38 @@ def _load(sources, log_timings, extra_validations, encoding):
         log_timings = log_timings.write
 
     # Parse all the files recursively.
-    entries, parse_errors, options_map = _parse_recursive(sources, log_timings, encoding)
+    with profiling.stage('parse', profiler) as stage:
+        entries, parse_errors, options_map = _parse_recursive(sources, log_timings,
+                                                              encoding)
 
-    # Ensure that the entries are sorted before running any processes on them.
-    entries.sort(key=data.entry_sortkey)
+        # Ensure that the entries are sorted before running any processes on them.
+        entries.sort(key=data.entry_sortkey)
+        stage.entries = entries
 
     # Run interpolation on incomplete entries.
-    entries, balance_errors = booking.book(entries, options_map)
-    parse_errors.extend(balance_errors)
-
-    # Transform the entries.
-    entries, errors = run_transformations(entries, parse_errors, options_map, log_timings)
+    with profiling.stage('booking', profiler, entries) as stage:
+        entries, balance_errors = booking.book(entries, options_map)
+        parse_errors.extend(balance_errors)
+        stage.entries = entries
+
+    # Transform the entries. If enabled, keep a reference to the entries produced
+    # by the parser and the booking code, so that only those created or replaced
+    # by plugins get their data types checked.
+    booked_entries = (list(entries)
+                      if options_map['check_plugin_entries_only']
+                      else None)
+    with profiling.stage('run_transformations', profiler, entries) as stage:
+        entries, errors = run_transformations(entries, parse_errors, options_map,
+                                              log_timings, profiler)
+        stage.entries = entries
 
     # Validate the list of entries.
-    with misc_utils.log_time('beancount.ops.validate', log_timings, indent=1):
+    with misc_utils.log_time('beancount.ops.validate', log_timings, indent=1), \
+         profiling.stage('validate', profiler):
         valid_errors = validation.validate(entries, options_map, log_timings,
-                                           extra_validations)
+                                           extra_validations,
+                                           trusted_entries=booked_entries,
+                                           profiler=profiler)
         errors.extend(valid_errors)
 
         # Note: We could go hardcore here and further verify that the entries
@@ -465,17 +498,25 @@ def _load(sources, log_timings, extra_validations, encoding):
     return entries, errors, options_map
 
 
-def run_transformations(entries, parse_errors, options_map, log_timings):
+def run_transformations(entries, parse_errors, options_map, log_timings,
+                        profiler=None):
     """Run the various transformations on the entries.
 
     This is where entries are being synthesized, checked, plugins are run, etc.
 
+    Plugin modules which declare themselves read-only by setting a true
+    '__plugins_readonly__' attribute only produce errors and return the list of
+    entries unchanged. Consecutive read-only plugins are run concurrently on the
+    same list of entries, and the entries are not sorted again after them.
+
     Args:
       entries: A list of directives as read from the parser.
       parse_errors: A list of errors so far.
       options_map: An options dict as read from the parser.
       log_timings: A function to write timing log entries to, or None, if it
         should be quiet.
+      profiler: An optional instance of profiling.Profiler to record the profile
+        of each of the plugins to.
     Returns:
       A list of modified entries, and a list of errors, also possibly modified.
     """
@@ -493,6 +534,13 @@ def run_transformations(entries, parse_errors, options_map, log_timings):
         assert "Invalid value for plugin_processing_mode: {}".format(
             options_map['plugin_processing_mode'])
 
+    # A list of consecutive read-only plugins to be run together, as
+    # (plugin name, plugin config, module) tuples.
+    readonly_plugins = []
+
+    # The cached sort keys of the entries, for sort_entries().
+    sortkey_cache = SortKeyCache()
+
     for plugin_name, plugin_config in plugins_iter:
 
         # Issue a warning on a renamed module.
@@ -506,25 +554,37 @@ def run_transformations(entries, parse_errors, options_map, log_timings):
         # Try to import the module.
         try:
             module = importlib.import_module(plugin_name)
+        except ImportError as exc:
+            module = None
+            import_error = exc
+
+        # Defer read-only plugins until the next plugin which may modify the
+        # entries, in order to run them all together.
+        if (module is not None and
+            hasattr(module, '__plugins__') and
+            getattr(module, '__plugins_readonly__', False)):
+            readonly_plugins.append((plugin_name, plugin_config, module))
+            continue
+        errors.extend(run_readonly_plugins(entries, options_map, readonly_plugins,
+                                           log_timings, profiler))
+        readonly_plugins = []
+
+        try:
+            if module is None:
+                raise import_error
             if not hasattr(module, '__plugins__'):
                 continue
 
-            with misc_utils.log_time(plugin_name, log_timings, indent=1):
+            with misc_utils.log_time(plugin_name, log_timings, indent=1), \
+                 profiling.stage(plugin_name, profiler, entries) as stage:
+                entries, plugin_errors = run_plugin(module, entries, options_map,
+                                                    plugin_config)
+                errors.extend(plugin_errors)
 
-                # Run each transformer function in the plugin.
-                for function_name in module.__plugins__:
-                    callback = getattr(module, function_name)
-
-                    if plugin_config is not None:
-                        entries, plugin_errors = callback(entries, options_map,
-                                                          plugin_config)
-                    else:
-                        entries, plugin_errors = callback(entries, options_map)
-                    errors.extend(plugin_errors)
-
-            # Ensure that the entries are sorted. Don't trust the plugins
-            # themselves.
-            entries.sort(key=data.entry_sortkey)
+                # Ensure that the entries are sorted. Don't trust the plugins
+                # themselves.
+                sort_entries(entries, sortkey_cache)
+                stage.entries = entries
 
         except ImportError as exc:
             # Upon failure, just issue an error.
@@ -532,9 +592,146 @@ def run_transformations(entries, parse_errors, options_map, log_timings):
                                     'Error importing "{}": {}'.format(
                                         plugin_name, str(exc)), None))
 
+    errors.extend(run_readonly_plugins(entries, options_map, readonly_plugins,
+                                       log_timings, profiler))
+
     return entries, errors
 
 
+class SortKeyCache:
+    """A cache of the integer sort keys of entries, by identity.
+
+    Attributes:
+      keys: A dict of the id of an entry to its integer sort key.
+      entries: A list of all the entries whose keys are cached. This keeps them
+        alive, so that their ids are not reused for other objects.
+    """
+    __slots__ = ('keys', 'entries')
+
+    def __init__(self):
+        self.keys = {}
+        self.entries = []
+
+    def __len__(self):
+        return len(self.keys)
+
+    def clear(self):
+        self.keys.clear()
+        self.entries.clear()
+
+
+def sort_entries(entries, sortkey_cache):
+    """Sort a list of entries in place, like entries.sort(key=data.entry_sortkey).
+
+    The integer sort keys of the entries are cached by identity, so that only
+    the entries created since the previous call have their keys computed, and
+    the list is only reordered if it is not already sorted. Lists returned by
+    plugins are mostly sorted, so sorting them is little more than a merge of
+    the runs of new entries into the existing ones.
+
+    Args:
+      entries: A list of directives, sorted in place.
+      sortkey_cache: An instance of SortKeyCache, updated in place.
+    """
+    # Don't let the entries removed by plugins accumulate in the cache.
+    if len(sortkey_cache) > 2 * len(entries):
+        sortkey_cache.clear()
+
+    cached_keys = sortkey_cache.keys
+    keys = list(map(cached_keys.get, map(id, entries)))
+    if None in keys:
+        try:
+            for index in itertools.compress(
+                    range(len(keys)), map(operator.is_, keys, itertools.repeat(None))):
+                entry = entries[index]
+                keys[index] = cached_keys[id(entry)] = data.entry_sortkey_int(entry)
+                sortkey_cache.entries.append(entry)
+        except TypeError:
+            # Some entries have unusual line numbers; use the regular key.
+            entries.sort(key=data.entry_sortkey)
+            return
+
+    if any(map(operator.gt, keys, itertools.islice(keys, 1, None))):
+        indexes = sorted(range(len(keys)), key=keys.__getitem__)
+        entries[:] = [entries[index] for index in indexes]
+
+
+def run_plugin(module, entries, options_map, plugin_config):
+    """Run each of the transformer functions of a plugin module.
+
+    Args:
+      module: A plugin module, with a '__plugins__' attribute.
+      entries: A list of directives.
+      options_map: An options dict as read from the parser.
+      plugin_config: The configuration string of the plugin, or None.
+    Returns:
+      A list of modified entries, and a list of new errors.
+    """
+    errors = []
+    for function_name in module.__plugins__:
+        callback = getattr(module, function_name)
+
+        if plugin_config is not None:
+            entries, plugin_errors = callback(entries, options_map,
+                                              plugin_config)
+        else:
+            entries, plugin_errors = callback(entries, options_map)
+        errors.extend(plugin_errors)
+    return entries, errors
+
+
+# The maximum number of read-only plugins to run concurrently.
+MAX_READONLY_PLUGIN_WORKERS = 8
+
+
+def run_readonly_plugins(entries, options_map, plugins, log_timings, profiler=None):
+    """Run read-only plugins concurrently on the same list of entries.
+
+    The plugins are run in a pool of threads. They must not modify the list of
+    entries nor the entries themselves; a plugin returning a list of entries
+    other than the one it was given produces an error and its entries are
+    ignored. If a profiler is given, the plugins are run one after the other, so
+    that their individual profiles are meaningful.
+
+    Args:
+      entries: A sorted list of directives.
+      options_map: An options dict as read from the parser.
+      plugins: A list of (plugin name, plugin config, module) tuples.
+      log_timings: A function to write timing log entries to, or None, if it
+        should be quiet.
+      profiler: An optional instance of profiling.Profiler to record the profile
+        of each of the plugins to.
+    Returns:
+      A list of the errors of all the plugins, in the order of the plugins.
+    """
+    def run(plugin_name, plugin_config, module):
+        "Run a single read-only plugin and return its errors."
+        try:
+            with misc_utils.log_time(plugin_name, log_timings, indent=1), \
+                 profiling.stage(plugin_name, profiler, entries):
+                new_entries, plugin_errors = run_plugin(module, entries, options_map,
+                                                        plugin_config)
+        except ImportError as exc:
+            return [LoadError(data.new_metadata("<load>", 0),
+                              'Error importing "{}": {}'.format(
+                                  plugin_name, str(exc)), None)]
+        if new_entries is not entries:
+            plugin_errors = plugin_errors + [
+                LoadError(data.new_metadata("<load>", 0),
+                          'Read-only plugin "{}" modified the entries; '
+                          'its changes are ignored'.format(plugin_name), None)]
+        return plugin_errors
+
+    if len(plugins) <= 1 or profiler is not None:
+        errors_list = [run(*plugin) for plugin in plugins]
+    else:
+        num_workers = min(len(plugins), MAX_READONLY_PLUGIN_WORKERS)
+        with futures.ThreadPoolExecutor(max_workers=num_workers) as executor:
+            errors_list = list(executor.map(lambda plugin: run(*plugin), plugins))
+
+    return [error for plugin_errors in errors_list for error in plugin_errors]
+
+
 def load_doc(expect_errors=False):
     """A factory of decorators that loads the docstring and calls the function with entries.
 
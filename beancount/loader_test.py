@@ -5,11 +5,15 @@ import logging
 import unittest
 import tempfile
 import textwrap
+import threading
 import os
+import sys
+import types
 from unittest import mock
 from os import path
 
 from beancount import loader
+from beancount.core import data
 from beancount.parser import parser
 from beancount.utils import test_utils
 
@@ -93,6 +97,169 @@ class TestLoader(unittest.TestCase):
         self.assertFalse(errors)
 
 
+class TestSortEntries(unittest.TestCase):
+
+    def test_sort_entries(self):
+        entries, _, __ = loader.load_string(textwrap.dedent("""
+          2014-01-01 open Assets:Cash
+          2014-01-01 open Expenses:Food
+          2014-02-01 * "Lunch"
+            Assets:Cash     -10 USD
+            Expenses:Food    10 USD
+          2014-02-02 balance Assets:Cash  -10 USD
+          2014-03-01 close Expenses:Food
+        """))
+        sortkey_cache = loader.SortKeyCache()
+        loader.sort_entries(entries, sortkey_cache)
+        self.assertEqual(len(entries), len(sortkey_cache))
+
+        # Sorted entries are left unchanged.
+        sorted_entries = list(entries)
+        loader.sort_entries(entries, sortkey_cache)
+        self.assertEqual(sorted_entries, entries)
+
+        # New and reordered entries are sorted like with the regular key.
+        new_entries = [entry._replace(meta=dict(entry.meta, lineno=100 + index))
+                       for index, entry in enumerate(entries)]
+        entries = list(reversed(entries)) + new_entries
+        expected_entries = sorted(entries, key=data.entry_sortkey)
+        loader.sort_entries(entries, sortkey_cache)
+        self.assertEqual(expected_entries, entries)
+        for expected_entry, entry in zip(expected_entries, entries):
+            self.assertIs(expected_entry, entry)
+
+        # The cache does not grow unbounded.
+        for _ in range(3):
+            entries = [entry._replace() for entry in entries]
+            loader.sort_entries(entries, sortkey_cache)
+        self.assertLessEqual(len(sortkey_cache), 2 * len(entries))
+
+        # Unusual line numbers fall back on the regular key.
+        entries.insert(0, entries.pop()._replace(meta={'lineno': 1.5}))
+        loader.sort_entries(entries, sortkey_cache)
+        self.assertEqual(sorted(entries, key=data.entry_sortkey), entries)
+
+
+def create_plugin_module(name, function, readonly):
+    """Create a plugin module with a single function, to insert in sys.modules.
+
+    Args:
+      name: A string, the name of the module.
+      function: A plugin function.
+      readonly: A boolean, true if the plugin declares itself read-only.
+    Returns:
+      A new module object.
+    """
+    module = types.ModuleType(name)
+    module.plugin = function
+    module.__plugins__ = ('plugin',)
+    if readonly:
+        module.__plugins_readonly__ = True
+    return module
+
+
+class TestReadOnlyPlugins(unittest.TestCase):
+
+    def test_readonly_plugins_errors_order(self):
+        entries, errors, options_map = loader.load_string("""
+          plugin "beancount.plugins.nounused"
+          plugin "beancount.plugins.leafonly"
+          plugin "beancount.plugins.onecommodity"
+
+          2014-01-01 open Assets:Cash
+          2014-01-01 open Assets:Cash:Sub
+          2014-01-01 open Assets:Unused
+          2014-01-01 open Expenses:Food
+
+          2014-02-01 * "Lunch"
+            Assets:Cash     -10 USD
+            Expenses:Food    10 USD
+
+          2014-02-02 * "Dinner"
+            Assets:Cash     -10 CAD
+            Expenses:Food    10 CAD
+        """, dedent=True)
+        self.assertEqual(['UnusedAccountError', 'UnusedAccountError',
+                          'LeafOnlyError', 'OneCommodityError', 'OneCommodityError'],
+                         [type(error).__name__ for error in errors])
+
+    def test_readonly_plugins_concurrent(self):
+        # Two read-only plugins which both wait for the other to be running.
+        barrier = threading.Barrier(2, timeout=10)
+        threads = []
+        def plugin(entries, options_map):
+            barrier.wait()
+            threads.append(threading.current_thread())
+            return entries, []
+
+        modules = {'readonly_plugin_{}'.format(index): create_plugin_module(
+            'readonly_plugin_{}'.format(index), plugin, True) for index in range(2)}
+        with mock.patch.dict(sys.modules, modules):
+            entries, errors, options_map = loader.load_string("""
+              plugin "readonly_plugin_0"
+              plugin "readonly_plugin_1"
+
+              2014-01-01 open Assets:Cash
+            """, dedent=True)
+        self.assertFalse(errors)
+        self.assertEqual(2, len(set(threads)))
+
+    def test_readonly_plugins_modified(self):
+        def plugin(entries, options_map):
+            return entries[:1], []
+        modules = {'modifying_plugin': create_plugin_module(
+            'modifying_plugin', plugin, True)}
+        with mock.patch.dict(sys.modules, modules):
+            entries, errors, options_map = loader.load_string("""
+              plugin "modifying_plugin"
+
+              2014-01-01 open Assets:Cash
+              2014-01-01 open Assets:Other
+            """, dedent=True)
+        self.assertEqual(2, len(entries))
+        self.assertEqual([loader.LoadError], list(map(type, errors)))
+        self.assertRegex(errors[0].message, 'modified the entries')
+
+
+def append_invalid_posting(entries, options_map):
+    """A plugin which appends a malformed posting to transactions, in place."""
+    for entry in data.filter_txns(entries):
+        entry.postings.append(entry.postings[0]._replace(flag=123))
+    return entries, []
+
+
+class TestCheckDataTypes(unittest.TestCase):
+
+    INPUT = """
+      {}
+      plugin "invalid_posting_plugin"
+
+      2014-01-01 open Assets:Cash
+      2014-01-01 open Expenses:Food
+
+      2014-02-01 * "Lunch"
+        Assets:Cash     -10 USD
+        Expenses:Food    10 USD
+    """
+
+    def load(self, option):
+        module = create_plugin_module('invalid_posting_plugin',
+                                      append_invalid_posting, False)
+        with mock.patch.dict(sys.modules, {'invalid_posting_plugin': module}):
+            _, errors, __ = loader.load_string(self.INPUT.format(option), dedent=True)
+        return [error.message
+                for error in errors
+                if error.message.startswith('Invalid data types')]
+
+    def test_entries_modified_in_place(self):
+        # All the entries are checked, including those modified by plugins.
+        self.assertEqual(['Invalid data types: Invalid flag type'], self.load(''))
+
+    def test_check_plugin_entries_only(self):
+        # Entries from the parser are trusted, even if modified in place.
+        self.assertEqual([], self.load('option "check_plugin_entries_only" "TRUE"'))
+
+
 class TestLoadDoc(unittest.TestCase):
 
     def test_load_doc(self):
@@ -11,8 +11,6 @@ from beancount.core.data import Transaction
 from beancount.core.data import Balance
 from beancount.core import amount
 from beancount.core import account
-from beancount.core import inventory
-from beancount.core import realization
 from beancount.core import getters
 
 __plugins__ = ('check',)
@@ -66,44 +64,64 @@ def check(entries, options_map):
     check_errors = []
 
     # This is similar to realization, but performed in a different order, and
-    # where we only accumulate inventories for accounts that have balance
-    # assertions in them (this saves on time). Here we process the entries one
-    # by one along with the balance checks. We use a temporary realization in
-    # order to hold the incremental tree of balances, so that we can easily get
-    # the amounts of an account's subaccounts for making checks on parent
-    # accounts.
-    real_root = realization.RealAccount('')
-
-    # Figure out the set of accounts for which we need to compute a running
-    # inventory balance.
+    # where we only accumulate balances for accounts that have balance
+    # assertions on them or on one of their parents (this saves on time). Here
+    # we process the entries one by one along with the balance checks.
     asserted_accounts = {entry.account
                          for entry in entries
                          if isinstance(entry, Balance)}
 
-    # Add all children accounts of an asserted account to be calculated as well,
-    # and pre-create these accounts, and only those (we're just being tight to
-    # make sure).
-    asserted_match_list = [account.parent_matcher(account_)
-                           for account_ in asserted_accounts]
+    # For each account to be tracked, find the asserted accounts whose balance
+    # it contributes to, that is, itself and its asserted parents, and for each
+    # asserted account, the list of accounts to sum up to compute its balance.
+    # We want to support checks for parent accounts for the total sum of their
+    # subaccounts.
+    asserted_parents = {}
+    subtree_accounts = collections.defaultdict(list)
     for account_ in getters.get_accounts(entries):
-        if (account_ in asserted_accounts or
-            any(match(account_) for match in asserted_match_list)):
-            realization.get_or_create(real_root, account_)
+        parents = [parent
+                   for parent in account.parents(account_)
+                   if parent in asserted_accounts]
+        if parents:
+            asserted_parents[account_] = parents
+            for parent in parents:
+                subtree_accounts[parent].append(account_)
+
+    # The running balance of the units of each tracked account, as a dict of
+    # currency to non-zero number. Lots are irrelevant to balance checks.
+    balances = {account_: {} for account_ in asserted_parents}
+
+    # A cache of the balances of asserted accounts and their subaccounts, as a
+    # dict of asserted account to a dict of currency to number. An asserted
+    # account's entry is discarded when a posting to one of its subaccounts is
+    # processed.
+    subtree_balances = {}
 
     # Get the Open directives for each account.
     open_close_map = getters.get_account_open_close(entries)
 
     for entry in entries:
         if isinstance(entry, Transaction):
-            # For each of the postings' accounts, update the balance inventory.
+            # For each of the postings' accounts, update the balance.
             for posting in entry.postings:
-                real_account = realization.get(real_root, posting.account)
+                parents = asserted_parents.get(posting.account, None)
 
-                # The account will have been created only if we're meant to track it.
-                if real_account is not None:
+                # The account will have a balance only if we're meant to track it.
+                if parents is not None:
                     # Note: Always allow negative lots for the purpose of balancing.
                     # This error should show up somewhere else than here.
-                    real_account.balance.add_position(posting)
+                    units = posting.units
+                    balance = balances[posting.account]
+                    number = balance.get(units.currency, ZERO) + units.number
+                    # Remove the currencies which sum to zero, as an Inventory
+                    # removes empty positions, so as to render the balances with
+                    # the same precision.
+                    if number:
+                        balance[units.currency] = number
+                    else:
+                        balance.pop(units.currency, None)
+                    for parent in parents:
+                        subtree_balances.pop(parent, None)
 
         elif isinstance(entry, Balance):
             # Check that the currency of the balance check is one of the allowed
@@ -119,19 +137,17 @@ def check(entries, options_map):
                                      expected_amount.currency),
                                  entry))
 
-            # Check the balance against the check entry.
-            real_account = realization.get(real_root, entry.account)
-            assert real_account is not None, "Missing {}".format(entry.account)
-
-            # Sum up the current balances for this account and its
-            # sub-accounts. We want to support checks for parent accounts
-            # for the total sum of their subaccounts.
-            subtree_balance = inventory.Inventory()
-            for real_child in realization.iter_children(real_account, False):
-                subtree_balance += real_child.balance
-
-            # Get only the amount in the desired currency.
-            balance_amount = subtree_balance.get_currency_units(expected_amount.currency)
+            # Sum up the current balances for this account and its sub-accounts
+            # in the desired currency, unless cached since the last posting.
+            currency = expected_amount.currency
+            subtree_balance = subtree_balances.setdefault(entry.account, {})
+            number = subtree_balance.get(currency, None)
+            if number is None:
+                number = subtree_balance[currency] = sum(
+                    (balances[account_].get(currency, ZERO)
+                     for account_ in subtree_accounts[entry.account]),
+                    ZERO) or ZERO
+            balance_amount = amount.Amount(number, currency)
 
             # Check if the amount is within bounds of the expected amount.
             diff_amount = amount.sub(balance_amount, expected_amount)
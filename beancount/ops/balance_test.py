@@ -5,6 +5,7 @@ import unittest
 
 from beancount.core.number import D
 from beancount.core.amount import A
+from beancount.core import data
 from beancount.ops import balance
 from beancount import loader
 
@@ -194,6 +195,37 @@ class TestBalance(unittest.TestCase):
                         if isinstance(entry, balance.Balance)]
         self.assertEqual([None], diff_amounts)
 
+    @loader.load_doc(expect_errors=True)
+    def test_parents_repeated(self, entries, errors, __):
+        """
+          2013-05-01 open Assets:Bank
+          2013-05-01 open Assets:Bank:Checking1
+          2013-05-01 open Assets:Bank:Checking2
+          2013-05-01 open Equity:Opening-Balances
+
+          2013-05-02 *
+            Assets:Bank:Checking1                100 USD
+            Assets:Bank:Checking2                 20 CAD
+            Equity:Opening-Balances
+
+          2013-05-03 balance Assets:Bank             100 USD
+          2013-05-03 balance Assets:Bank              20 CAD
+          2013-05-03 balance Assets:Bank:Checking1   100 USD
+
+          2013-05-04 *
+            Assets:Bank:Checking2                 10 USD
+            Equity:Opening-Balances
+
+          2013-05-05 balance Assets:Bank             100 USD
+          2013-05-05 balance Assets:Bank:Checking1   100 USD
+          2013-05-06 balance Assets:Bank             110 USD
+        """
+        diff_amounts = [entry.diff_amount
+                        for entry in entries
+                        if isinstance(entry, balance.Balance)]
+        self.assertEqual([None, None, None, A('10 USD'), None, None], diff_amounts)
+        self.assertEqual(1, len(errors))
+
     @loader.load_doc()
     def test_with_lots(self, entries, errors, __):
         """
@@ -305,6 +337,43 @@ class TestBalance(unittest.TestCase):
         """
         self.assertEqual([], list(map(type, errors)))
 
+    @loader.load_doc(expect_errors=True)
+    def test_balance_zero_precision(self, entries, errors, __):
+        """
+          2013-05-01 open Assets:Bank
+          2013-05-01 open Assets:Bank:Checking
+          2013-05-01 open Assets:Bank:Savings
+          2013-05-01 open Equity:Opening-Balances
+
+          2013-05-02 *
+            Assets:Bank:Checking                100.00 USD
+            Equity:Opening-Balances
+
+          2013-05-03 *
+            Assets:Bank:Checking               -100.00 USD
+            Equity:Opening-Balances
+
+          2013-05-10 balance Assets:Bank:Checking   5 USD
+
+          2013-05-11 *
+            Assets:Bank:Checking                 20.00 USD
+            Assets:Bank:Savings                 -20.00 USD
+
+          2013-05-12 balance Assets:Bank   5 USD
+        """
+        # Balances which sum to zero are rendered without a precision, as the
+        # empty positions of an Inventory would be.
+        self.assertEqual([
+            "Balance failed for 'Assets:Bank:Checking': "
+            "expected 5 USD != accumulated 0 USD (5 too little)",
+            "Balance failed for 'Assets:Bank': "
+            "expected 5 USD != accumulated 0 USD (5 too little)",
+        ], [error.message for error in errors])
+        self.assertEqual(['-5 USD', '-5 USD'],
+                         [str(entry.diff_amount)
+                          for entry in entries
+                          if isinstance(entry, data.Balance)])
+
 
 class TestBalancePrecision(unittest.TestCase):
 
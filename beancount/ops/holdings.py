@@ -9,14 +9,12 @@ from beancount.core.number import ZERO
 from beancount.core import account
 from beancount.core import amount
 from beancount.core import position
-from beancount.core import realization
 from beancount.core import account_types
 from beancount.core import data
 from beancount.core import flags
 from beancount.core import getters
 from beancount.core import prices
 from beancount.ops import summarize
-from beancount.utils import misc_utils
 
 
 # A holding, a flattened position with an account, and optionally, price and
@@ -46,6 +44,174 @@ Holding = collections.namedtuple('Holding',
                                  'book_value market_value price_number price_date')
 
 
+class HoldingsTable:
+    """The positions of a set of accounts, stored as parallel columns.
+
+    Each position is a row across the lists of the table. Valuing the positions
+    as a batch this way allows the price of each distinct (currency,
+    cost-currency) pair to be looked up only once, however many accounts or
+    lots hold it.
+
+    Attributes:
+      accounts: A list of account name strings.
+      numbers: A list of Decimal instances, the numbers of units.
+      currencies: A list of strings, the currencies of the units.
+      cost_numbers: A list of Decimal instances, the per-unit costs, or None
+        for positions held without a cost.
+      cost_currencies: A list of strings, the currencies of the costs, or None
+        for positions held without a cost.
+    """
+    __slots__ = ('accounts', 'numbers', 'currencies', 'cost_numbers', 'cost_currencies')
+
+    def __init__(self):
+        self.accounts = []
+        self.numbers = []
+        self.currencies = []
+        self.cost_numbers = []
+        self.cost_currencies = []
+
+    def __len__(self):
+        return len(self.accounts)
+
+    def append(self, account_name, number, currency, cost):
+        """Add a position to the table.
+
+        Args:
+          account_name: A string, the account holding the position.
+          number: A Decimal, the number of units.
+          currency: A string, the currency of the units.
+          cost: A Cost instance, or None.
+        """
+        self.accounts.append(account_name)
+        self.numbers.append(number)
+        self.currencies.append(currency)
+        if cost is None:
+            self.cost_numbers.append(None)
+            self.cost_currencies.append(None)
+        else:
+            self.cost_numbers.append(cost.number)
+            self.cost_currencies.append(cost.currency)
+
+    def get_prices(self, price_map, date=None):
+        """Look up the prices of the positions held at cost.
+
+        Args:
+          price_map: A dict of prices, as built by prices.build_price_map().
+          date: A datetime.date instance, the date of the prices, or None for
+            the latest prices.
+        Returns:
+          A pair of lists, of the dates and of the numbers of the prices of the
+          positions, in their cost currencies. Both are None for the positions
+          held without a cost.
+        """
+        pair_prices = {pair: prices.get_price(price_map, pair, date)
+                       for pair in set(zip(self.currencies, self.cost_currencies))
+                       if pair[1] is not None}
+        no_price = (None, None)
+        price_list = [pair_prices[pair] if pair[1] is not None else no_price
+                      for pair in zip(self.currencies, self.cost_currencies)]
+        return [price[0] for price in price_list], [price[1] for price in price_list]
+
+    def to_holdings(self, price_map=None, date=None):
+        """Value the positions and convert them to holdings.
+
+        Args:
+          price_map: A dict of prices, as built by prices.build_price_map(), or
+            None to leave the prices and market values of the positions held at
+            cost unset.
+          date: A datetime.date instance, the date at which to price the
+            holdings, or None for the latest prices.
+        Returns:
+          A list of Holding instances, in the order of the rows.
+        """
+        if price_map is not None:
+            price_dates, price_numbers = self.get_prices(price_map, date)
+        else:
+            price_dates = price_numbers = [None] * len(self)
+
+        holdings = []
+        for (account_name, number, currency, cost_number, cost_currency,
+             price_date, price_number) in zip(self.accounts, self.numbers,
+                                              self.currencies, self.cost_numbers,
+                                              self.cost_currencies,
+                                              price_dates, price_numbers):
+            if cost_currency is None:
+                holdings.append(Holding(account_name, number, currency, None,
+                                        currency, number, number, None, None))
+            else:
+                holdings.append(Holding(
+                    account_name, number, currency, cost_number, cost_currency,
+                    number * cost_number,
+                    number * price_number if price_number is not None else None,
+                    price_number, price_date))
+        return holdings
+
+
+def add_postings(numbers_map, postings):
+    """Add postings to running balances.
+
+    The balances are accumulated as in realization.realize(), so that their
+    positions come out in the same order as those of the realized inventories.
+
+    Args:
+      numbers_map: A defaultdict of account name to a dict of (currency, cost)
+        to (number, cost) pairs, updated in place.
+      postings: A list of Posting instances.
+    """
+    for posting in postings:
+        units = posting.units
+        cost = posting.cost
+        numbers = numbers_map[posting.account]
+        key = (units.currency, cost)
+        number_cost = numbers.get(key, None)
+        if number_cost is None:
+            if units.number != ZERO:
+                numbers[key] = (units.number, cost)
+        else:
+            number = number_cost[0] + units.number
+            if number == ZERO:
+                del numbers[key]
+            else:
+                numbers[key] = (number, cost)
+
+
+def build_holdings_table(numbers_map, included_account_types=None):
+    """Build a table of the positions of running balances.
+
+    Args:
+      numbers_map: A dict of account name to a dict of (currency, cost) to
+        (number, cost) pairs, as accumulated by add_postings().
+      included_account_types: A sequence of strings, the account types to
+        include, or None to include all accounts.
+    Returns:
+      A HoldingsTable instance, sorted by account.
+    """
+    table = HoldingsTable()
+    for account_name in sorted(numbers_map):
+        if (included_account_types and
+            account_types.get_account_type(account_name) not in included_account_types):
+            continue
+        for (currency, _), (number, cost) in numbers_map[account_name].items():
+            table.append(account_name, number, currency, cost)
+    return table
+
+
+def is_holdings_entry(entry):
+    """Return true if the entry affects the holdings.
+
+    The entries inserted by unrealized gains/losses do affect asset accounts,
+    but we don't want them to appear in holdings.
+
+    Args:
+      entry: A directive.
+    Returns:
+      A boolean.
+    """
+    # Note: Perhaps it would make sense to generalize this concept of "inserted
+    # unrealized gains."
+    return isinstance(entry, data.Transaction) and entry.flag != flags.FLAG_UNREALIZED
+
+
 def get_final_holdings(entries, included_account_types=None, price_map=None, date=None):
     """Get a dictionary of the latest holdings by account.
 
@@ -68,68 +234,44 @@ def get_final_holdings(entries, included_account_types=None, price_map=None, dat
       date: A datetime.date instance, the date at which to price the
         holdings. If left unspecified, we use the latest price information.
     Returns:
-      A list of dicts, with the following fields:
+      A list of Holding instances, sorted by account.
     """
-    # Remove the entries inserted by unrealized gains/losses. Those entries do
-    # affect asset accounts, and we don't want them to appear in holdings.
-    #
-    # Note: Perhaps it would make sense to generalize this concept of "inserted
-    # unrealized gains."
-    simple_entries = [entry
-                      for entry in entries
-                      if (not isinstance(entry, data.Transaction) or
-                          entry.flag != flags.FLAG_UNREALIZED)]
-
-    # Realize the accounts into a tree (because we want the positions by-account).
-    root_account = realization.realize(simple_entries)
-
-    # For each account, look at the list of positions and build a list.
-    holdings = []
-    for real_account in sorted(list(realization.iter_children(root_account)),
-                               key=lambda ra: ra.account):
-
-        if included_account_types:
-            # Skip accounts of invalid types, we only want to reflect the requested
-            # account types, typically assets and liabilities.
-            account_type = account_types.get_account_type(real_account.account)
-            if account_type not in included_account_types:
-                continue
-
-        for pos in real_account.balance.get_positions():
-            if pos.cost is not None:
-                # Get price information if we have a price_map.
-                market_value = None
-                if price_map is not None:
-                    base_quote = (pos.units.currency, pos.cost.currency)
-                    price_date, price_number = prices.get_price(price_map,
-                                                                base_quote, date)
-                    if price_number is not None:
-                        market_value = pos.units.number * price_number
-                else:
-                    price_date, price_number = None, None
-
-                holding = Holding(real_account.account,
-                                  pos.units.number,
-                                  pos.units.currency,
-                                  pos.cost.number,
-                                  pos.cost.currency,
-                                  pos.units.number * pos.cost.number,
-                                  market_value,
-                                  price_number,
-                                  price_date)
-            else:
-                holding = Holding(real_account.account,
-                                  pos.units.number,
-                                  pos.units.currency,
-                                  None,
-                                  pos.units.currency,
-                                  pos.units.number,
-                                  pos.units.number,
-                                  None,
-                                  None)
-            holdings.append(holding)
+    numbers_map = collections.defaultdict(dict)
+    for entry in entries:
+        if is_holdings_entry(entry):
+            add_postings(numbers_map, entry.postings)
+    table = build_holdings_table(numbers_map, included_account_types)
+    return table.to_holdings(price_map, date)
+
 
-    return holdings
+def get_holdings_series(entries, dates, included_account_types=None, price_map=None):
+    """Get the holdings at the end of each of a list of dates.
+
+    This is equivalent to calling get_final_holdings() on the entries up to and
+    including each date and pricing the holdings at that date, but makes a
+    single pass over the entries, updating running balances as it goes.
+
+    Args:
+      entries: A sorted list of directives.
+      dates: A sorted list of datetime.date instances.
+      included_account_types: A sequence of strings, the account types to
+        include in the output. If not specified, include all account types.
+      price_map: A dict of prices, as built by prices.build_price_map(), or
+        None.
+    Yields:
+      Pairs of a datetime.date instance and the list of Holding instances at
+      the end of that date.
+    """
+    numbers_map = collections.defaultdict(dict)
+    entries_iter = iter(entries)
+    entry = next(entries_iter, None)
+    for date in dates:
+        while entry is not None and entry.date <= date:
+            if is_holdings_entry(entry):
+                add_postings(numbers_map, entry.postings)
+            entry = next(entries_iter, None)
+        table = build_holdings_table(numbers_map, included_account_types)
+        yield date, table.to_holdings(price_map, date)
 
 
 # Note: This should use the same routines as in beancount.prices.find_prices.
@@ -199,6 +341,106 @@ def get_commodities_at_date(entries, options_map, date=None):
     return commodities_symbols_list
 
 
+class HoldingAggregate:
+    """An accumulator of the sums and the distinct attributes of holdings.
+
+    Attributes:
+      units: A Decimal, the sum of the numbers of units.
+      book_value: A Decimal, the sum of the book values.
+      market_value: A Decimal, the sum of the market values.
+      book_value_seen: A boolean, true if a book value was added.
+      market_value_seen: A boolean, true if a market value was added.
+      accounts: A set of the account names.
+      currencies: A set of the currencies.
+      cost_currencies: A set of the cost currencies.
+      price_dates: A set of the price dates.
+    """
+    __slots__ = ('units', 'book_value', 'market_value',
+                 'book_value_seen', 'market_value_seen',
+                 'accounts', 'currencies', 'cost_currencies', 'price_dates')
+
+    def __init__(self):
+        self.units = ZERO
+        self.book_value = ZERO
+        self.market_value = ZERO
+        self.book_value_seen = False
+        self.market_value_seen = False
+        self.accounts = set()
+        self.currencies = set()
+        self.cost_currencies = set()
+        self.price_dates = set()
+
+    def add(self, holding):
+        """Add a holding to the aggregate.
+
+        Args:
+          holding: A Holding instance.
+        """
+        self.units += holding.number
+        self.accounts.add(holding.account)
+        self.price_dates.add(holding.price_date)
+        self.currencies.add(holding.currency)
+        self.cost_currencies.add(holding.cost_currency)
+
+        # Note: Holding is a bit overspecified with book and market values. We
+        # recompute them from cost and price numbers here anyhow.
+        if holding.book_value is not None:
+            self.book_value += holding.book_value
+            self.book_value_seen = True
+        elif holding.cost_number is not None:
+            self.book_value += holding.number * holding.cost_number
+            self.book_value_seen = True
+
+        if holding.market_value is not None:
+            self.market_value += holding.market_value
+            self.market_value_seen = True
+        elif holding.price_number is not None:
+            self.market_value += holding.number * holding.price_number
+            self.market_value_seen = True
+
+    def get_holding(self):
+        """Return the aggregated holding.
+
+        Returns:
+          A Holding instance.
+        Raises:
+          ValueError: If multiple cost currencies were encountered.
+        """
+        units = self.units
+        if self.book_value_seen:
+            total_book_value = self.book_value
+            average_cost = total_book_value / units if units else None
+        else:
+            total_book_value = None
+            average_cost = None
+
+        if self.market_value_seen:
+            total_market_value = self.market_value
+            average_price = total_market_value / units if units else None
+        else:
+            total_market_value = None
+            average_price = None
+
+        if len(self.cost_currencies) != 1:
+            raise ValueError(
+                "Cost currencies are not homogeneous for aggregation: {}".format(
+                    ','.join(map(str, self.cost_currencies))))
+
+        currencies = self.currencies
+        units = units if len(currencies) == 1 else ZERO
+        currency = next(iter(currencies)) if len(currencies) == 1 else '*'
+        cost_currency = next(iter(self.cost_currencies))
+        accounts = self.accounts
+        account_ = (next(iter(accounts))
+                    if len(accounts) == 1
+                    else account.commonprefix(accounts))
+        price_date = (next(iter(self.price_dates))
+                      if len(self.price_dates) == 1
+                      else None)
+        return Holding(account_, units, currency, average_cost, cost_currency,
+                       total_book_value, total_market_value, average_price, price_date)
+
+
 def aggregate_holdings_by(holdings, keyfun):
     """Aggregate holdings by some key.
 
@@ -212,13 +454,15 @@ def aggregate_holdings_by(holdings, keyfun):
     Returns:
       A list of aggregated holdings.
     """
-    # Aggregate the groups of holdings.
-    grouped = collections.defaultdict(list)
+    # Aggregate the groups of holdings, in a single pass.
+    aggregates = {}
     for holding in holdings:
         key = (keyfun(holding), holding.cost_currency)
-        grouped[key].append(holding)
-    grouped_holdings = (aggregate_holdings_list(key_holdings)
-                        for key_holdings in grouped.values())
+        aggregate = aggregates.get(key, None)
+        if aggregate is None:
+            aggregate = aggregates[key] = HoldingAggregate()
+        aggregate.add(holding)
+    grouped_holdings = (aggregate.get_holding() for aggregate in aggregates.values())
 
     # We could potentially filter out holdings with zero units here. These types
     # of holdings might occur on a group with leaked (i.e., non-zero) cost basis
@@ -255,65 +499,13 @@ def aggregate_holdings_list(holdings):
     """
     if not holdings:
         return None
-
-    # Note: Holding is a bit overspecified with book and market values. We
-    # recompute them from cost and price numbers here anyhow.
-    units, total_book_value, total_market_value = ZERO, ZERO, ZERO
-    accounts = set()
-    currencies = set()
-    cost_currencies = set()
-    price_dates = set()
-    book_value_seen = False
-    market_value_seen = False
+    aggregate = HoldingAggregate()
     for holding in holdings:
-        units += holding.number
-        accounts.add(holding.account)
-        price_dates.add(holding.price_date)
-        currencies.add(holding.currency)
-        cost_currencies.add(holding.cost_currency)
+        aggregate.add(holding)
+    return aggregate.get_holding()
 
-        if holding.book_value is not None:
-            total_book_value += holding.book_value
-            book_value_seen = True
-        elif holding.cost_number is not None:
-            total_book_value += holding.number * holding.cost_number
-            book_value_seen = True
 
-        if holding.market_value is not None:
-            total_market_value += holding.market_value
-            market_value_seen = True
-        elif holding.price_number is not None:
-            total_market_value += holding.number * holding.price_number
-            market_value_seen = True
-
-    if book_value_seen:
-        average_cost = total_book_value / units if units else None
-    else:
-        total_book_value = None
-        average_cost = None
-
-    if market_value_seen:
-        average_price = total_market_value / units if units else None
-    else:
-        total_market_value = None
-        average_price = None
-
-    if len(cost_currencies) != 1:
-        raise ValueError("Cost currencies are not homogeneous for aggregation: {}".format(
-            ','.join(map(str, cost_currencies))))
-
-    units = units if len(currencies) == 1 else ZERO
-    currency = currencies.pop() if len(currencies) == 1 else '*'
-    cost_currency = cost_currencies.pop()
-    account_ = (accounts.pop()
-                if len(accounts) == 1
-                else account.commonprefix(accounts))
-    price_date = price_dates.pop() if len(price_dates) == 1 else None
-    return Holding(account_, units, currency, average_cost, cost_currency,
-                   total_book_value, total_market_value, average_price, price_date)
-
-
-def convert_to_currency(price_map, target_currency, holdings_list):
+def convert_to_currency(price_map, target_currency, holdings_list, date=None):
     """Convert the given list of holdings's fields to a common currency.
 
     If the rate is not available to convert, leave the fields empty.
@@ -322,12 +514,14 @@ def convert_to_currency(price_map, target_currency, holdings_list):
       price_map: A price-map, as built by prices.build_price_map().
       target_currency: The target common currency to convert amounts to.
       holdings_list: A list of holdings.Holding instances.
+      date: A datetime.date instance, the date of the conversion rates, or None
+        to use the latest rates.
     Returns:
       A modified list of holdings, with the 'extra' field set to the value in
       'currency', or None, if it was not possible to convert.
     """
-    # A list of the fields we should convert.
-    convert_fields = ('cost_number', 'book_value', 'market_value', 'price_number')
+    # The conversion rate of each cost currency, looked up once.
+    rates = {}
 
     new_holdings = []
     for holding in holdings_list:
@@ -350,31 +544,89 @@ def convert_to_currency(price_map, target_currency, holdings_list):
                     holding = holding._replace(market_value=holding.number)
 
             assert holding.cost_currency, "Missing cost currency: {}".format(holding)
-            base_quote = (holding.cost_currency, target_currency)
 
             # Get the conversion rate and replace the required numerical
             # fields..
-            _, rate = prices.get_latest_price(price_map, base_quote)
+            try:
+                rate = rates[holding.cost_currency]
+            except KeyError:
+                _, rate = prices.get_price(price_map, (holding.cost_currency,
+                                                       target_currency), date)
+                rates[holding.cost_currency] = rate
             if rate is not None:
-                new_holding = misc_utils.map_namedtuple_attributes(
-                    convert_fields,
-                    lambda number, r=rate: number if number is None else number * r,
-                    holding)
                 # Ensure we set the new cost currency after conversion.
-                new_holding = new_holding._replace(cost_currency=target_currency)
+                new_holding = holding._replace(
+                    cost_number=(holding.cost_number * rate
+                                 if holding.cost_number is not None else None),
+                    book_value=(holding.book_value * rate
+                                if holding.book_value is not None else None),
+                    market_value=(holding.market_value * rate
+                                  if holding.market_value is not None else None),
+                    price_number=(holding.price_number * rate
+                                  if holding.price_number is not None else None),
+                    cost_currency=target_currency)
             else:
                 # Could not get the rate... clear every field and set the cost
                 # currency to None. This enough marks the holding conversion as
                 # a failure.
-                new_holding = misc_utils.map_namedtuple_attributes(
-                    convert_fields, lambda number: None, holding)
-                new_holding = new_holding._replace(cost_currency=None)
+                new_holding = holding._replace(cost_number=None,
+                                               book_value=None,
+                                               market_value=None,
+                                               price_number=None,
+                                               cost_currency=None)
 
         new_holdings.append(new_holding)
 
     return new_holdings
 
 
+def get_net_worth(holdings_list, currency, price_map, date=None):
+    """Compute the total market value of a list of holdings in a currency.
+
+    The holdings which cannot be converted to the currency are left out.
+
+    Args:
+      holdings_list: A list of Holding instances.
+      currency: A string, the currency to value the holdings in.
+      price_map: A price-map, as built by prices.build_price_map().
+      date: A datetime.date instance, the date of the conversion rates, or None
+        to use the latest rates.
+    Returns:
+      A Decimal, or None if none of the holdings could be valued in the currency.
+    """
+    aggregate = HoldingAggregate()
+    for holding in convert_to_currency(price_map, currency, holdings_list, date):
+        if holding.cost_currency is not None:
+            aggregate.add(holding)
+    if not aggregate.cost_currencies:
+        return None
+    return aggregate.get_holding().market_value
+
+
+def get_net_worth_series(entries, dates, currencies, price_map, included_account_types):
+    """Compute the net worth at the end of each of a list of dates.
+
+    This makes a single pass over the entries, keeping running balances by
+    account, and values the holdings at each date with the prices and
+    conversion rates of that date. See get_holdings_series().
+
+    Args:
+      entries: A sorted list of directives.
+      dates: A sorted list of datetime.date instances.
+      currencies: A list of strings, the currencies to value the holdings in.
+      price_map: A price-map, as built by prices.build_price_map().
+      included_account_types: A sequence of strings, the account types to
+        include, typically the types of assets and liabilities.
+    Yields:
+      Pairs of a datetime.date instance and a list of the net worths in each of
+      the currencies, as returned by get_net_worth().
+    """
+    for date, holdings_list in get_holdings_series(entries, dates,
+                                                   included_account_types, price_map):
+        yield date, [get_net_worth(holdings_list, currency, price_map, date)
+                     for currency in currencies]
+
+
 def reduce_relative(holdings):
     """Convert the market and book values of the given list of holdings to relative data.
 
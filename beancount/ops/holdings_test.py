@@ -172,6 +172,82 @@ class TestHoldings(unittest.TestCase):
         self.assertEqual(1, len(holdings_list))
         self.assertEqual('EUR', holdings_list[0].cost_currency)
 
+    @loader.load_doc()
+    def test_get_holdings_series(self, entries, _, __):
+        """
+        2013-01-01 open Assets:Account1
+        2013-01-01 open Assets:Cash
+        2013-01-01 open Equity:Unknown
+
+        2013-03-01 *
+          Equity:Unknown
+          Assets:Cash			50000 USD
+
+        2013-04-01 *
+          Assets:Account1             15 HOOL {518.73 USD}
+          Assets:Cash
+
+        2013-05-01 price HOOL  560.00 USD
+
+        2013-06-01 *
+          Assets:Account1            -15 HOOL {518.73 USD}
+          Assets:Cash
+
+        2013-06-01 price HOOL  578.02 USD
+        """
+        price_map = prices.build_price_map(entries)
+        dates = [datetime.date(2013, 2, 1),
+                 datetime.date(2013, 4, 1),
+                 datetime.date(2013, 5, 15),
+                 datetime.date(2013, 7, 1)]
+        series = list(holdings.get_holdings_series(entries, dates, ('Assets',),
+                                                   price_map))
+        self.assertEqual(dates, [date for date, _ in series])
+        self.assertEqual([], series[0][1])
+        self.assertEqual([('Assets:Account1', D('15'), None, None),
+                          ('Assets:Cash', D('42219.05'), None, None)],
+                         [(holding.account, holding.number,
+                           holding.price_number, holding.price_date)
+                          for holding in series[1][1]])
+        self.assertEqual((D('560.00'), datetime.date(2013, 5, 1), D('8400.00')),
+                         (series[2][1][0].price_number, series[2][1][0].price_date,
+                          series[2][1][0].market_value))
+        self.assertEqual(['Assets:Cash'], [holding.account for holding in series[3][1]])
+
+        # Each element of the series is the same as the final holdings of the
+        # entries up to its date.
+        for date, holdings_list in series:
+            self.assertEqual(
+                holdings.get_final_holdings(
+                    [entry for entry in entries if entry.date <= date],
+                    ('Assets',), price_map, date),
+                holdings_list)
+
+    def test_holdings_table(self):
+        table = holdings.HoldingsTable()
+        cost = position.Cost(D('100'), 'USD', None, None)
+        table.append('Assets:Account1', D('10'), 'HOOL', cost)
+        table.append('Assets:Account2', D('5'), 'HOOL', cost)
+        table.append('Assets:Account2', D('3'), 'ITOT', cost)
+        table.append('Assets:Cash', D('20'), 'USD', None)
+        self.assertEqual(4, len(table))
+
+        price_map = {('HOOL', 'USD'): [(datetime.date(2013, 6, 1), D('110'))]}
+        price_dates, price_numbers = table.get_prices(price_map)
+        self.assertEqual([D('110'), D('110'), None, None], price_numbers)
+        self.assertEqual([datetime.date(2013, 6, 1)] * 2 + [None, None], price_dates)
+
+        self.assertEqual(
+            [holdings.Holding('Assets:Account1', D('10'), 'HOOL', D('100'), 'USD',
+                              D('1000'), D('1100'), D('110'), datetime.date(2013, 6, 1)),
+             holdings.Holding('Assets:Account2', D('5'), 'HOOL', D('100'), 'USD',
+                              D('500'), D('550'), D('110'), datetime.date(2013, 6, 1)),
+             holdings.Holding('Assets:Account2', D('3'), 'ITOT', D('100'), 'USD',
+                              D('300'), None, None, None),
+             holdings.Holding('Assets:Cash', D('20'), 'USD', None, 'USD',
+                              D('20'), D('20'), None, None)],
+            table.to_holdings(price_map))
+
     @loader.load_doc()
     def test_get_commodities_at_date(self, entries, _, options_map):
         """
@@ -453,6 +529,54 @@ class TestHoldings(unittest.TestCase):
             converted_holdings = holdings.convert_to_currency(price_map, 'USD',
                                                               [none_holding])
 
+    @loader.load_doc()
+    def test_get_net_worth_series(self, entries, _, __):
+        """
+        2013-01-01 open Assets:Cash
+        2013-01-01 open Assets:Account1
+        2013-01-01 open Assets:Euros
+        2013-01-01 open Equity:Unknown
+
+        2013-03-01 *
+          Equity:Unknown
+          Assets:Cash			10000 USD
+
+        2013-04-01 *
+          Assets:Account1             10 HOOL {500.00 USD}
+          Assets:Cash
+
+        2013-04-01 *
+          Equity:Unknown
+          Assets:Euros			100 EUR
+
+        2013-05-01 price HOOL  550.00 USD
+        2013-05-01 price EUR   1.20 USD
+        2013-06-01 price EUR   1.50 USD
+        """
+        price_map = prices.build_price_map(entries)
+        dates = [datetime.date(2013, 2, 1),
+                 datetime.date(2013, 4, 15),
+                 datetime.date(2013, 5, 15),
+                 datetime.date(2013, 6, 15)]
+        series = list(holdings.get_net_worth_series(entries, dates, ['USD', 'CAD'],
+                                                    price_map, ('Assets',)))
+        self.assertEqual([
+            (datetime.date(2013, 2, 1), [None, None]),
+            # The HOOL and EUR holdings have no price yet.
+            (datetime.date(2013, 4, 15), [D('5000.00'), None]),
+            (datetime.date(2013, 5, 15), [D('10620.00'), None]),
+            (datetime.date(2013, 6, 15), [D('10650.00'), None]),
+        ], series)
+
+        # The latest rates are used without a date.
+        holdings_list = holdings.get_final_holdings(entries, ('Assets',), price_map)
+        self.assertEqual(D('10650.00'),
+                         holdings.get_net_worth(holdings_list, 'USD', price_map))
+        self.assertEqual(D('10620.00'),
+                         holdings.get_net_worth(holdings_list, 'USD', price_map,
+                                                datetime.date(2013, 5, 15)))
+        self.assertIsNone(holdings.get_net_worth(holdings_list, 'CAD', price_map))
+
     def test_reduce_relative(self):
         # Test with a few different cost currencies.
         test_holdings = list(itertools.starmap(holdings.Holding, [
@@ -11,7 +11,6 @@ from beancount.core import inventory
 from beancount.core import data
 from beancount.core import position
 from beancount.core import flags
-from beancount.core import realization
 from beancount.utils import misc_utils
 from beancount.ops import balance
 
@@ -41,119 +40,58 @@ def pad(entries, options_map):
       A new list of directives, with Pad entries inserte, and a list of new
       errors produced.
     """
-    pad_errors = []
-
-    # Find all the pad entries and group them by account.
+    # Find all the pad entries and the accounts they pad.
     pads = list(misc_utils.filter_type(entries, data.Pad))
-    pad_dict = misc_utils.groupby(lambda x: x.account, pads)
-
-    # Partially realize the postings, so we can iterate them by account.
-    by_account = realization.postings_by_account(entries)
+    padded_accounts = {pad.account for pad in pads}
+
+    # The running state of each padded account, which includes the postings of
+    # the account and of its subaccounts.
+    padded_states = {account_: _PaddedAccount(account_)
+                     for account_ in padded_accounts}
+
+    # A mapping of account name to the list of states of the padded accounts it
+    # contributes to, that is, itself and its padded parents. This is filled in
+    # lazily, as accounts are encountered.
+    account_states = {}
+    def get_states(account_):
+        states = account_states.get(account_, None)
+        if states is None:
+            states = account_states[account_] = [
+                padded_states[parent]
+                for parent in account.parents(account_)
+                if parent in padded_accounts]
+        return states
 
     # A dict of pad -> list of entries to be inserted.
     new_entries = {id(pad): [] for pad in pads}
 
-    # Process each account that has a padding group.
-    for account_, pad_list in sorted(pad_dict.items()):
-
-        # Last encountered / currency active pad entry.
-        active_pad = None
-
-        # Gather all the postings for the account and its children.
-        postings = []
-        is_child = account.parent_matcher(account_)
-        for item_account, item_postings in by_account.items():
-            if is_child(item_account):
-                postings.extend(item_postings)
-        postings.sort(key=data.posting_sortkey)
-
-        # A set of currencies already padded so far in this account.
-        padded_lots = set()
-
-        pad_balance = inventory.Inventory()
-        for entry in postings:
-
-            assert not isinstance(entry, data.Posting)
-            if isinstance(entry, data.TxnPosting):
-                # This is a transaction; update the running balance for this
-                # account.
-                pad_balance.add_position(entry.posting)
+    # Process the entries in a single pass, only updating the running balances
+    # of padded accounts.
+    if padded_accounts:
+        for entry in entries:
+            if isinstance(entry, data.Transaction):
+                for posting in entry.postings:
+                    for state in get_states(posting.account):
+                        state.balance.add_position(posting)
 
             elif isinstance(entry, data.Pad):
-                if entry.account == account_:
-                    # Mark this newly encountered pad as active and allow all lots
-                    # to be padded heretofore.
-                    active_pad = entry
-                    padded_lots = set()
+                # Mark this newly encountered pad as active and allow all lots
+                # to be padded heretofore.
+                state = padded_states[entry.account]
+                state.active_pad = entry
+                state.padded_lots = set()
 
             elif isinstance(entry, data.Balance):
-                check_amount = entry.amount
-
-                # Compare the current balance amount to the expected one from
-                # the check entry. IMPORTANT: You need to understand that this
-                # does not check a single position, but rather checks that the
-                # total amount for a particular currency (which itself is
-                # distinct from the cost).
-                balance_amount = pad_balance.get_currency_units(check_amount.currency)
-                diff_amount = amount.sub(balance_amount, check_amount)
-
-                # Use the specified tolerance or automatically infer it.
-                tolerance = balance.get_balance_tolerance(entry, options_map)
-
-                if abs(diff_amount.number) > tolerance:
-                    # The check fails; we need to pad.
-
-                    # Pad only if pad entry is active and we haven't already
-                    # padded that lot since it was last encountered.
-                    if active_pad and (check_amount.currency not in padded_lots):
-
-                        # Note: we decide that it's an error to try to pad
-                        # positions at cost; we check here that all the existing
-                        # positions with that currency have no cost.
-                        positions = [pos
-                                     for pos in pad_balance.get_positions()
-                                     if pos.units.currency == check_amount.currency]
-                        for position_ in positions:
-                            if position_.cost is not None:
-                                pad_errors.append(
-                                    PadError(entry.meta,
-                                             ("Attempt to pad an entry with cost for "
-                                              "balance: {}".format(pad_balance)),
-                                             active_pad))
-
-                        # Thus our padding lot is without cost by default.
-                        diff_position = position.Position.from_amounts(
-                            amount.Amount(check_amount.number - balance_amount.number,
-                                          check_amount.currency))
-
-                        # Synthesize a new transaction entry for the difference.
-                        narration = ('(Padding inserted for Balance of {} for '
-                                     'difference {})').format(check_amount, diff_position)
-                        new_entry = data.Transaction(
-                            active_pad.meta.copy(), active_pad.date, flags.FLAG_PADDING,
-                            None, narration, data.EMPTY_SET, data.EMPTY_SET, [])
-
-                        new_entry.postings.append(
-                            data.Posting(active_pad.account,
-                                         diff_position.units, diff_position.cost,
-                                         None, None, None))
-                        neg_diff_position = -diff_position
-                        new_entry.postings.append(
-                            data.Posting(active_pad.source_account,
-                                         neg_diff_position.units, neg_diff_position.cost,
-                                         None, None, None))
-
+                for state in get_states(entry.account):
+                    new_entry = state.check(entry, options_map)
+                    if new_entry is not None:
                         # Save it for later insertion after the active pad.
-                        new_entries[id(active_pad)].append(new_entry)
-
-                        # Fixup the running balance.
-                        pos, _ = pad_balance.add_position(diff_position)
-                        if pos is not None and pos.is_negative_at_cost():
-                            raise ValueError(
-                                "Position held at cost goes negative: {}".format(pos))
+                        new_entries[id(state.active_pad)].append(new_entry)
 
-                # Mark this lot as padded. Further checks should not pad this lot.
-                padded_lots.add(check_amount.currency)
+    # Collect the errors in the order of the padded accounts.
+    pad_errors = []
+    for account_, state in sorted(padded_states.items()):
+        pad_errors.extend(state.errors)
 
     # Insert the newly created entries right after the pad entries that created them.
     padded_entries = []
@@ -169,3 +107,102 @@ def pad(entries, options_map):
                     PadError(entry.meta, "Unused Pad entry", entry))
 
     return padded_entries, pad_errors
+
+
+class _PaddedAccount:
+    """The running state of an account with Pad directives.
+
+    Attributes:
+      account: A string, the name of the padded account.
+      balance: An Inventory, the running balance of the account and its
+        subaccounts.
+      active_pad: The last Pad directive encountered for the account, or None.
+      padded_lots: A set of the currencies already padded since the active pad
+        was encountered.
+      errors: A list of PadError instances.
+    """
+
+    def __init__(self, account_):
+        self.account = account_
+        self.balance = inventory.Inventory()
+        self.active_pad = None
+        self.padded_lots = set()
+        self.errors = []
+
+    def check(self, entry, options_map):
+        """Process a Balance directive for the account or one of its subaccounts.
+
+        Args:
+          entry: A Balance directive.
+          options_map: A parser options dict.
+        Returns:
+          A new padding Transaction to insert after the active pad, or None.
+        """
+        new_entry = None
+        check_amount = entry.amount
+        pad_balance = self.balance
+        active_pad = self.active_pad
+
+        # Compare the current balance amount to the expected one from the check
+        # entry. IMPORTANT: You need to understand that this does not check a
+        # single position, but rather checks that the total amount for a
+        # particular currency (which itself is distinct from the cost).
+        balance_amount = pad_balance.get_currency_units(check_amount.currency)
+        diff_amount = amount.sub(balance_amount, check_amount)
+
+        # Use the specified tolerance or automatically infer it.
+        tolerance = balance.get_balance_tolerance(entry, options_map)
+
+        if abs(diff_amount.number) > tolerance:
+            # The check fails; we need to pad.
+
+            # Pad only if pad entry is active and we haven't already padded that
+            # lot since it was last encountered.
+            if active_pad and (check_amount.currency not in self.padded_lots):
+
+                # Note: we decide that it's an error to try to pad positions at
+                # cost; we check here that all the existing positions with that
+                # currency have no cost.
+                positions = [pos
+                             for pos in pad_balance.get_positions()
+                             if pos.units.currency == check_amount.currency]
+                for position_ in positions:
+                    if position_.cost is not None:
+                        self.errors.append(
+                            PadError(entry.meta,
+                                     ("Attempt to pad an entry with cost for "
+                                      "balance: {}".format(pad_balance)),
+                                     active_pad))
+
+                # Thus our padding lot is without cost by default.
+                diff_position = position.Position.from_amounts(
+                    amount.Amount(check_amount.number - balance_amount.number,
+                                  check_amount.currency))
+
+                # Synthesize a new transaction entry for the difference.
+                narration = ('(Padding inserted for Balance of {} for '
+                             'difference {})').format(check_amount, diff_position)
+                new_entry = data.Transaction(
+                    active_pad.meta.copy(), active_pad.date, flags.FLAG_PADDING,
+                    None, narration, data.EMPTY_SET, data.EMPTY_SET, [])
+
+                new_entry.postings.append(
+                    data.Posting(active_pad.account,
+                                 diff_position.units, diff_position.cost,
+                                 None, None, None))
+                neg_diff_position = -diff_position
+                new_entry.postings.append(
+                    data.Posting(active_pad.source_account,
+                                 neg_diff_position.units, neg_diff_position.cost,
+                                 None, None, None))
+
+                # Fixup the running balance.
+                pos, _ = pad_balance.add_position(diff_position)
+                if pos is not None and pos.is_negative_at_cost():
+                    raise ValueError(
+                        "Position held at cost goes negative: {}".format(pos))
+
+        # Mark this lot as padded. Further checks should not pad this lot.
+        self.padded_lots.add(check_amount.currency)
+
+        return new_entry
@@ -301,6 +301,50 @@ class TestPadding(cmptest.TestCase):
 
         """, entries)
 
+    @loader.load_doc()
+    def test_pad_parent_and_child(self, entries, errors, __):
+        """
+          2013-05-01 open Assets:US
+          2013-05-01 open Assets:US:Checking
+          2013-05-01 open Equity:Opening-Balances
+
+          2013-05-10 *
+            Assets:US:Checking                     5.00 USD
+            Equity:Opening-Balances               -5.00 USD
+
+          2013-05-20 pad Assets:US Equity:Opening-Balances
+          2013-06-01 balance Assets:US            25.00 USD
+
+          2013-06-10 pad Assets:US:Checking Equity:Opening-Balances
+          2013-07-01 balance Assets:US:Checking   15.00 USD
+        """
+        self.assertFalse(errors)
+        self.assertEqualEntries("""
+          2013-05-01 open Assets:US
+          2013-05-01 open Assets:US:Checking
+          2013-05-01 open Equity:Opening-Balances
+
+          2013-05-10 *
+            Assets:US:Checking                     5.00 USD
+            Equity:Opening-Balances               -5.00 USD
+
+          2013-05-20 pad Assets:US Equity:Opening-Balances
+
+          2013-05-20 P "(Padding inserted for Balance of 25.00 USD for difference 20.00 USD)"
+            Assets:US                             20.00 USD
+            Equity:Opening-Balances              -20.00 USD
+
+          2013-06-01 balance Assets:US            25.00 USD
+
+          2013-06-10 pad Assets:US:Checking Equity:Opening-Balances
+
+          2013-06-10 P "(Padding inserted for Balance of 15.00 USD for difference 10.00 USD)"
+            Assets:US:Checking                    10.00 USD
+            Equity:Opening-Balances              -10.00 USD
+
+          2013-07-01 balance Assets:US:Checking   15.00 USD
+        """, entries)
+
     @loader.load_doc()
     def test_pad_multiple_currencies(self, entries, errors, __):
         """
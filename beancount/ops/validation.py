@@ -12,6 +12,8 @@ __license__ = "GNU GPLv2"
 
 from os import path
 import collections
+import functools
+import time
 
 from beancount.core.data import Open
 from beancount.core.data import Close
@@ -22,6 +24,7 @@ from beancount.core import data
 from beancount.core import getters
 from beancount.core import interpolate
 from beancount.utils import misc_utils
+from beancount.utils import profiling
 
 
 # An error from one of the checks.
@@ -32,6 +35,412 @@ ValidationError = collections.namedtuple('ValidationError', 'source message entr
 ALLOW_AFTER_CLOSE = (Document, Note)
 
 
+class Validator:
+    """Base class for validations that run in a single pass over the entries.
+
+    Rather than iterating over the list of entries itself, a validator declares
+    handlers for the types of directives it is interested in, and all the
+    validators are run together by run_validators(), which visits each entry only
+    once and dispatches it to the handlers of all the validators in turn.
+
+    Subclasses set 'handlers' to a list of (directive type or tuple of types,
+    method name) pairs. Each method is called with each entry of a matching
+    type, in order. Handlers accumulate errors in the 'errors' attribute, and
+    finish() is called after all the entries have been visited to return them.
+
+    Attributes:
+      options_map: An options map.
+      errors: A list of ValidationError instances.
+    """
+
+    # A list of (directive type, name of the handler method) pairs.
+    handlers = []
+
+    def __init__(self, options_map):
+        self.options_map = options_map
+        self.errors = []
+
+    def finish(self, unused_entries):
+        """Complete the validation, after all the entries have been visited.
+
+        Args:
+          unused_entries: The list of directives that were visited.
+        Returns:
+          A list of new errors, if any were found.
+        """
+        return self.errors
+
+
+class OpenCloseValidator(Validator):
+    """Check constraints on open and close directives themselves.
+    See validate_open_close().
+
+    Attributes:
+      open_map: A dict of account name to its first Open directive.
+      close_map: A dict of account name to its first Close directive.
+    """
+    handlers = [(Open, 'on_open'),
+                (Close, 'on_close')]
+
+    def __init__(self, options_map):
+        super().__init__(options_map)
+        self.open_map = {}
+        self.close_map = {}
+
+    def on_open(self, entry):
+        if entry.account in self.open_map:
+            self.errors.append(
+                ValidationError(
+                    entry.meta,
+                    "Duplicate open directive for {}".format(entry.account),
+                    entry))
+        else:
+            self.open_map[entry.account] = entry
+
+    def on_close(self, entry):
+        if entry.account in self.close_map:
+            self.errors.append(
+                ValidationError(
+                    entry.meta,
+                    "Duplicate close directive for {}".format(entry.account),
+                    entry))
+        else:
+            try:
+                open_entry = self.open_map[entry.account]
+                if entry.date <= open_entry.date:
+                    self.errors.append(
+                        ValidationError(
+                            entry.meta,
+                            "Internal error: closing date for {} "
+                            "appears before opening date".format(entry.account),
+                            entry))
+            except KeyError:
+                self.errors.append(
+                    ValidationError(
+                        entry.meta,
+                        "Unopened account {} is being closed".format(entry.account),
+                        entry))
+
+            self.close_map[entry.account] = entry
+
+
+class DuplicateBalancesValidator(Validator):
+    """Check that balance entries occur only once per day.
+    See validate_duplicate_balances().
+
+    Attributes:
+      balance_entries: A dict of (account, currency, date) to Balance entry.
+    """
+    handlers = [(data.Balance, 'on_balance')]
+
+    def __init__(self, options_map):
+        super().__init__(options_map)
+        self.balance_entries = {}
+
+    def on_balance(self, entry):
+        key = (entry.account, entry.amount.currency, entry.date)
+        try:
+            previous_entry = self.balance_entries[key]
+            if entry.amount != previous_entry.amount:
+                self.errors.append(
+                    ValidationError(
+                        entry.meta,
+                        "Duplicate balance assertion with different amounts",
+                        entry))
+        except KeyError:
+            self.balance_entries[key] = entry
+
+
+class DuplicateCommoditiesValidator(Validator):
+    """Check that commodty entries are unique for each commodity.
+    See validate_duplicate_commodities().
+
+    Attributes:
+      commodity_entries: A dict of currency to its first Commodity entry.
+    """
+    handlers = [(data.Commodity, 'on_commodity')]
+
+    def __init__(self, options_map):
+        super().__init__(options_map)
+        self.commodity_entries = {}
+
+    def on_commodity(self, entry):
+        key = entry.currency
+        try:
+            previous_entry = self.commodity_entries[key]
+            if previous_entry:
+                self.errors.append(
+                    ValidationError(
+                        entry.meta,
+                        "Duplicate commodity directives for '{}'".format(key),
+                        entry))
+        except KeyError:
+            self.commodity_entries[key] = entry
+
+
+class ActiveAccountsValidator(Validator):
+    """Check that all references to accounts occurs on active accounts.
+    See validate_active_accounts().
+
+    Attributes:
+      active_set: A set of the names of the currently open accounts.
+      opened_accounts: A set of the names of the accounts opened so far.
+      error_pairs: A list of (account name, entry) pairs of invalid references.
+    """
+    handlers = [(data.ALL_DIRECTIVES, 'on_entry')]
+
+    def __init__(self, options_map):
+        super().__init__(options_map)
+        self.active_set = set()
+        self.opened_accounts = set()
+        self.error_pairs = []
+
+    def on_entry(self, entry):
+        if isinstance(entry, data.Open):
+            self.active_set.add(entry.account)
+            self.opened_accounts.add(entry.account)
+
+        elif isinstance(entry, data.Close):
+            self.active_set.discard(entry.account)
+
+        else:
+            for account in getters.get_entry_accounts(entry):
+                if account not in self.active_set:
+                    # Allow document and note directives that occur after an
+                    # account is closed.
+                    if (isinstance(entry, ALLOW_AFTER_CLOSE) and
+                        account in self.opened_accounts):
+                        continue
+
+                    # Register an error to be logged later, with an appropriate
+                    # message.
+                    self.error_pairs.append((account, entry))
+
+    def finish(self, unused_entries):
+        # Refine the error message to disambiguate between the case of an account
+        # that has never been seen and one that was simply not active at the time.
+        for account, entry in self.error_pairs:
+            if account in self.opened_accounts:
+                message = "Invalid reference to inactive account '{}'".format(account)
+            else:
+                message = "Invalid reference to unknown account '{}'".format(account)
+            self.errors.append(ValidationError(entry.meta, message, entry))
+        return self.errors
+
+
+class CurrencyConstraintsValidator(Validator):
+    """Check the currency constraints from account open declarations.
+    See validate_currency_constraints().
+
+    The constraints of an account apply to all of its postings, including those
+    which precede its Open directive. Postings are checked against the
+    constraints seen so far and in the rare case where constraints are declared
+    for an account after some of its postings, all the transactions are checked
+    again at the end.
+
+    Attributes:
+      open_map: A dict of account name to the last Open directive with
+        currency constraints seen for it.
+      posted_accounts: A set of the names of the accounts with postings seen so
+        far.
+      stale: A boolean, true if constraints were declared for an account after
+        some of its postings were checked.
+    """
+    handlers = [(Open, 'on_open'),
+                (Transaction, 'on_transaction')]
+
+    def __init__(self, options_map):
+        super().__init__(options_map)
+        self.open_map = {}
+        self.posted_accounts = set()
+        self.stale = False
+
+    def on_open(self, entry):
+        if entry.currencies:
+            self.open_map[entry.account] = entry
+            if entry.account in self.posted_accounts:
+                self.stale = True
+
+    def on_transaction(self, entry):
+        posted_accounts = self.posted_accounts
+        for posting in entry.postings:
+            posted_accounts.add(posting.account)
+        self.check_transaction(entry)
+
+    def check_transaction(self, entry):
+        """Check the postings of a transaction against the constraints seen so far.
+
+        Args:
+          entry: An instance of Transaction.
+        """
+        for posting in entry.postings:
+            # Look up the corresponding account's valid currencies; skip the
+            # check if there are none specified.
+            try:
+                open_entry = self.open_map[posting.account]
+                valid_currencies = open_entry.currencies
+                if not valid_currencies:
+                    continue
+            except KeyError:
+                continue
+
+            # Perform the check.
+            if posting.units.currency not in valid_currencies:
+                self.errors.append(
+                    ValidationError(
+                        entry.meta,
+                        "Invalid currency {} for account '{}'".format(
+                            posting.units.currency, posting.account),
+                        entry))
+
+    def finish(self, entries):
+        if self.stale:
+            # Check all the transactions again, against the final constraints.
+            self.errors = []
+            for entry in entries:
+                if isinstance(entry, Transaction):
+                    self.check_transaction(entry)
+        return self.errors
+
+
+class DocumentsPathsValidator(Validator):
+    """Check that all filenames in resolved Document entries are absolute filenames.
+    See validate_documents_paths().
+    """
+    handlers = [(Document, 'on_document')]
+
+    def on_document(self, entry):
+        if not path.isabs(entry.filename):
+            self.errors.append(
+                ValidationError(entry.meta, "Invalid relative path for entry", entry))
+
+
+class DataTypesValidator(Validator):
+    """Check that all the data types of the attributes of entries are as expected.
+    See validate_data_types().
+
+    Attributes:
+      trusted_ids: A set of the ids of entries known to be well-formed, which
+        need not be checked, or None, to check all the entries.
+      allow_none: A boolean, the value of the option to allow None for the tags
+        and links of transactions.
+    """
+    handlers = [(data.ALL_DIRECTIVES, 'on_entry')]
+
+    def __init__(self, options_map, trusted_entries=None):
+        super().__init__(options_map)
+        self.trusted_ids = (set(map(id, trusted_entries))
+                            if trusted_entries is not None
+                            else None)
+        self.allow_none = options_map["allow_deprecated_none_for_tags_and_links"]
+
+    def on_entry(self, entry):
+        if self.trusted_ids is not None and id(entry) in self.trusted_ids:
+            return
+        message = data.check_types(entry, self.allow_none)
+        if message is not None:
+            self.errors.append(
+                ValidationError(entry.meta,
+                                "Invalid data types: {}".format(message),
+                                entry))
+
+
+class TransactionBalancesValidator(Validator):
+    """Check again that all transaction postings balance.
+    See validate_check_transaction_balances().
+    """
+    handlers = [(Transaction, 'on_transaction')]
+
+    def on_transaction(self, entry):
+        # IMPORTANT: This validation is _crucial_ and cannot be skipped.
+        # This is where we actually detect and warn on unbalancing
+        # transactions. This _must_ come after the user routines, because
+        # unbalancing input is legal, as those types of transactions may be
+        # "fixed up" by a user-plugin. In other words, we want to allow
+        # users to input unbalancing transactions as long as the final
+        # transactions objects that appear on the stream (after processing
+        # the plugins) are balanced. See {9e6c14b51a59}.
+        #
+        # Detect complete sets of postings that have residual balance;
+        residual = interpolate.compute_residual(entry.postings)
+        tolerances = interpolate.infer_tolerances(entry.postings, self.options_map)
+        if not residual.is_small(tolerances):
+            self.errors.append(
+                ValidationError(entry.meta,
+                                "Transaction does not balance: {}".format(residual),
+                                entry))
+
+
+def run_validators(entries, options_map, validator_classes, log_timings=None,
+                   profiler=None):
+    """Run a list of validators together, in a single pass over the entries.
+
+    Args:
+      entries: A list of directives.
+      options_map: An options map.
+      validator_classes: A list of subclasses of Validator.
+      log_timings: An optional function to use for logging the time spent in
+        each of the validators.
+      profiler: An optional instance of profiling.Profiler to record the time
+        spent in each of the validators to.
+    Returns:
+      A list of lists of errors, one for each of the validators, in order.
+    """
+    validators = [validator_class(options_map)
+                  for validator_class in validator_classes]
+
+    # Accumulated times spent in each of the validators, if requested.
+    times = [0.0] * len(validators)
+
+    def timed(method, index):
+        "Wrap a handler to accumulate the time spent in it."
+        def timed_method(entry):
+            time1 = time.time()
+            method(entry)
+            times[index] += time.time() - time1
+        return timed_method
+
+    # Gather the handlers for each type of directive.
+    registered_handlers = []
+    for index, validator in enumerate(validators):
+        for types, method_name in validator.handlers:
+            method = getattr(validator, method_name)
+            if log_timings or profiler is not None:
+                method = timed(method, index)
+            registered_handlers.append((types, method))
+
+    # A mapping of the concrete type of each directive to the list of handlers
+    # to invoke on it, computed lazily.
+    type_handlers = {}
+
+    for entry in entries:
+        entry_type = type(entry)
+        try:
+            handlers = type_handlers[entry_type]
+        except KeyError:
+            handlers = type_handlers[entry_type] = [
+                method
+                for types, method in registered_handlers
+                if issubclass(entry_type, types)]
+        for handler in handlers:
+            handler(entry)
+
+    errors_list = []
+    for index, validator in enumerate(validators):
+        time1 = time.time()
+        errors_list.append(validator.finish(entries))
+        times[index] += time.time() - time1
+        if log_timings:
+            log_timings("Operation: {:48} Time: {}{:6.0f} ms".format(
+                "'validator: {}'".format(type(validator).__name__),
+                '      '*2, times[index] * 1000))
+        if profiler is not None:
+            profiler.record('validator: {}'.format(type(validator).__name__),
+                            times[index])
+
+    return errors_list
+
+
 def validate_open_close(entries, unused_options_map):
     """Check constraints on open and close directives themselves.
 
@@ -52,48 +461,7 @@ def validate_open_close(entries, unused_options_map):
     Returns:
       A list of new errors, if any were found.
     """
-    errors = []
-    open_map = {}
-    close_map = {}
-    for entry in entries:
-
-        if isinstance(entry, Open):
-            if entry.account in open_map:
-                errors.append(
-                    ValidationError(
-                        entry.meta,
-                        "Duplicate open directive for {}".format(entry.account),
-                        entry))
-            else:
-                open_map[entry.account] = entry
-
-        elif isinstance(entry, Close):
-            if entry.account in close_map:
-                errors.append(
-                    ValidationError(
-                        entry.meta,
-                        "Duplicate close directive for {}".format(entry.account),
-                        entry))
-            else:
-                try:
-                    open_entry = open_map[entry.account]
-                    if entry.date <= open_entry.date:
-                        errors.append(
-                            ValidationError(
-                                entry.meta,
-                                "Internal error: closing date for {} "
-                                "appears before opening date".format(entry.account),
-                                entry))
-                except KeyError:
-                    errors.append(
-                        ValidationError(
-                            entry.meta,
-                            "Unopened account {} is being closed".format(entry.account),
-                            entry))
-
-                close_map[entry.account] = entry
-
-    return errors
+    return run_validators(entries, unused_options_map, [OpenCloseValidator])[0]
 
 
 def validate_duplicate_balances(entries, unused_options_map):
@@ -110,27 +478,7 @@ def validate_duplicate_balances(entries, unused_options_map):
     Returns:
       A list of new errors, if any were found.
     """
-    errors = []
-
-    # Mapping of (account, currency, date) to Balance entry.
-    balance_entries = {}
-    for entry in entries:
-        if not isinstance(entry, data.Balance):
-            continue
-
-        key = (entry.account, entry.amount.currency, entry.date)
-        try:
-            previous_entry = balance_entries[key]
-            if entry.amount != previous_entry.amount:
-                errors.append(
-                    ValidationError(
-                        entry.meta,
-                        "Duplicate balance assertion with different amounts",
-                        entry))
-        except KeyError:
-            balance_entries[key] = entry
-
-    return errors
+    return run_validators(entries, unused_options_map, [DuplicateBalancesValidator])[0]
 
 
 def validate_duplicate_commodities(entries, unused_options_map):
@@ -142,27 +490,8 @@ def validate_duplicate_commodities(entries, unused_options_map):
     Returns:
       A list of new errors, if any were found.
     """
-    errors = []
-
-    # Mapping of (account, currency, date) to Balance entry.
-    commodity_entries = {}
-    for entry in entries:
-        if not isinstance(entry, data.Commodity):
-            continue
-
-        key = entry.currency
-        try:
-            previous_entry = commodity_entries[key]
-            if previous_entry:
-                errors.append(
-                    ValidationError(
-                        entry.meta,
-                        "Duplicate commodity directives for '{}'".format(key),
-                        entry))
-        except KeyError:
-            commodity_entries[key] = entry
-
-    return errors
+    return run_validators(entries, unused_options_map,
+                          [DuplicateCommoditiesValidator])[0]
 
 
 def validate_active_accounts(entries, unused_options_map):
@@ -185,41 +514,7 @@ def validate_active_accounts(entries, unused_options_map):
     Returns:
       A list of new errors, if any were found.
     """
-    error_pairs = []
-    active_set = set()
-    opened_accounts = set()
-    for entry in entries:
-        if isinstance(entry, data.Open):
-            active_set.add(entry.account)
-            opened_accounts.add(entry.account)
-
-        elif isinstance(entry, data.Close):
-            active_set.discard(entry.account)
-
-        else:
-            for account in getters.get_entry_accounts(entry):
-                if account not in active_set:
-                    # Allow document and note directives that occur after an
-                    # account is closed.
-                    if (isinstance(entry, ALLOW_AFTER_CLOSE) and
-                        account in opened_accounts):
-                        continue
-
-                    # Register an error to be logged later, with an appropriate
-                    # message.
-                    error_pairs.append((account, entry))
-
-    # Refine the error message to disambiguate between the case of an account
-    # that has never been seen and one that was simply not active at the time.
-    errors = []
-    for account, entry in error_pairs:
-        if account in opened_accounts:
-            message = "Invalid reference to inactive account '{}'".format(account)
-        else:
-            message = "Invalid reference to unknown account '{}'".format(account)
-        errors.append(ValidationError(entry.meta, message, entry))
-
-    return errors
+    return run_validators(entries, unused_options_map, [ActiveAccountsValidator])[0]
 
 
 def validate_currency_constraints(entries, options_map):
@@ -236,38 +531,7 @@ def validate_currency_constraints(entries, options_map):
     Returns:
       A list of new errors, if any were found.
     """
-
-    # Get all the open entries with currency constraints.
-    open_map = {entry.account: entry
-                for entry in entries
-                if isinstance(entry, Open) and entry.currencies}
-
-    errors = []
-    for entry in entries:
-        if not isinstance(entry, Transaction):
-            continue
-
-        for posting in entry.postings:
-            # Look up the corresponding account's valid currencies; skip the
-            # check if there are none specified.
-            try:
-                open_entry = open_map[posting.account]
-                valid_currencies = open_entry.currencies
-                if not valid_currencies:
-                    continue
-            except KeyError:
-                continue
-
-            # Perform the check.
-            if posting.units.currency not in valid_currencies:
-                errors.append(
-                    ValidationError(
-                        entry.meta,
-                        "Invalid currency {} for account '{}'".format(
-                            posting.units.currency, posting.account),
-                        entry))
-
-    return errors
+    return run_validators(entries, options_map, [CurrencyConstraintsValidator])[0]
 
 
 def validate_documents_paths(entries, options_map):
@@ -283,10 +547,7 @@ def validate_documents_paths(entries, options_map):
     Returns:
       A list of new errors, if any were found.
     """
-    return [ValidationError(entry.meta, "Invalid relative path for entry", entry)
-            for entry in entries
-            if (isinstance(entry, Document) and
-                not path.isabs(entry.filename))]
+    return run_validators(entries, options_map, [DocumentsPathsValidator])[0]
 
 
 def validate_data_types(entries, options_map):
@@ -303,17 +564,7 @@ def validate_data_types(entries, options_map):
     Returns:
       A list of new errors, if any were found.
     """
-    errors = []
-    for entry in entries:
-        try:
-            data.sanity_check_types(
-                entry, options_map["allow_deprecated_none_for_tags_and_links"])
-        except AssertionError as exc:
-            errors.append(
-                ValidationError(entry.meta,
-                                "Invalid data types: {}".format(exc),
-                                entry))
-    return errors
+    return run_validators(entries, options_map, [DataTypesValidator])[0]
 
 
 def validate_check_transaction_balances(entries, options_map):
@@ -328,28 +579,21 @@ def validate_check_transaction_balances(entries, options_map):
     """
     # Note: this is a bit slow; we could limit our checks to the original
     # transactions by using the hash function in the loader.
-    errors = []
-    for entry in entries:
-        if isinstance(entry, Transaction):
-            # IMPORTANT: This validation is _crucial_ and cannot be skipped.
-            # This is where we actually detect and warn on unbalancing
-            # transactions. This _must_ come after the user routines, because
-            # unbalancing input is legal, as those types of transactions may be
-            # "fixed up" by a user-plugin. In other words, we want to allow
-            # users to input unbalancing transactions as long as the final
-            # transactions objects that appear on the stream (after processing
-            # the plugins) are balanced. See {9e6c14b51a59}.
-            #
-            # Detect complete sets of postings that have residual balance;
-            residual = interpolate.compute_residual(entry.postings)
-            tolerances = interpolate.infer_tolerances(entry.postings, options_map)
-            if not residual.is_small(tolerances):
-                errors.append(
-                    ValidationError(entry.meta,
-                                    "Transaction does not balance: {}".format(residual),
-                                    entry))
+    return run_validators(entries, options_map, [TransactionBalancesValidator])[0]
 
-    return errors
+
+# A mapping of the validation functions above to the validators they run, so
+# that they can be fused together in a single pass by validate().
+VALIDATORS = {
+    validate_open_close: OpenCloseValidator,
+    validate_duplicate_balances: DuplicateBalancesValidator,
+    validate_duplicate_commodities: DuplicateCommoditiesValidator,
+    validate_active_accounts: ActiveAccountsValidator,
+    validate_currency_constraints: CurrencyConstraintsValidator,
+    validate_documents_paths: DocumentsPathsValidator,
+    validate_data_types: DataTypesValidator,
+    validate_check_transaction_balances: TransactionBalancesValidator,
+}
 
 
 # A list of reasonably fast validations to always run by default.
@@ -359,41 +603,75 @@ BASIC_VALIDATIONS = [validate_open_close,
                      validate_duplicate_balances,
                      validate_duplicate_commodities,
                      validate_documents_paths,
-                     validate_check_transaction_balances]
+                     validate_check_transaction_balances,
+                     validate_data_types]
 
-# These are slow, and thus only turned on in the check() routine.
-# We're hoping to optimize these and make them decently fast, so
-# we're not providing an option at this moment, this can be enabled
-# by modifying the 'VALIDATIONS' attribute below.
-HARDCORE_VALIDATIONS = [validate_data_types]
+# Slow validations, only turned on in the check() routine. There are none at the
+# moment; checking data types is now fast enough to always be run.
+HARDCORE_VALIDATIONS = []
 
 # The list of validations to run.
 VALIDATIONS = BASIC_VALIDATIONS
 
 
-def validate(entries, options_map, log_timings=None, extra_validations=None):
+def validate(entries, options_map, log_timings=None, extra_validations=None,
+             trusted_entries=None, profiler=None):
     """Perform all the standard checks on parsed contents.
 
+    The validations which have a corresponding Validator, either listed in
+    VALIDATORS or provided directly as a subclass of Validator, are all run
+    together in a single pass over the entries. Other validation functions are
+    run separately. The errors are returned in the order of the validations.
+
     Args:
       entries: A list of directives.
       unused_options_map: An options map.
       log_timings: An optional function to use for logging the time of individual
         operations.
-      extra_validations: A list of extra validation functions to run after loading
-        this list of entries.
+      extra_validations: A list of extra validation functions or Validator
+        subclasses to run after loading this list of entries.
+      trusted_entries: An optional list of entries known to be well-formed, such
+        as those produced by the parser, whose data types are not checked. The
+        identity of the entries is used, so only those entries which are left
+        unmodified by the plugins are skipped.
+      profiler: An optional instance of profiling.Profiler to record the time
+        spent in each of the validations to.
     Returns:
       A list of new errors, if any were found.
     """
-    validation_tests = VALIDATIONS
+    validation_tests = list(VALIDATIONS)
     if extra_validations:
-        validation_tests += extra_validations
-
-    # Run various validation routines define above.
+        validation_tests.extend(extra_validations)
+
+    # Run all the validators together.
+    is_validator = [(isinstance(validation_test, type) and
+                     issubclass(validation_test, Validator)) or
+                    validation_test in VALIDATORS
+                    for validation_test in validation_tests]
+    validator_classes = []
+    for validation_test, run_together in zip(validation_tests, is_validator):
+        if not run_together:
+            continue
+        validator_class = VALIDATORS.get(validation_test, validation_test)
+        if validator_class is DataTypesValidator and trusted_entries is not None:
+            validator_class = functools.partial(DataTypesValidator,
+                                                trusted_entries=trusted_entries)
+        validator_classes.append(validator_class)
+    with misc_utils.log_time('validators', log_timings, indent=2), \
+         profiling.stage('validators', profiler):
+        errors_list = iter(run_validators(entries, options_map, validator_classes,
+                                          log_timings, profiler))
+
+    # Run the other validation functions and collect the errors in order.
     errors = []
-    for validation_function in validation_tests:
-        with misc_utils.log_time('function: {}'.format(validation_function.__name__),
-                                 log_timings, indent=2):
-            new_errors = validation_function(entries, options_map)
+    for validation_test, run_together in zip(validation_tests, is_validator):
+        if run_together:
+            new_errors = next(errors_list)
+        else:
+            name = 'function: {}'.format(validation_test.__name__)
+            with misc_utils.log_time(name, log_timings, indent=2), \
+                 profiling.stage(name, profiler):
+                new_errors = validation_test(entries, options_map)
         errors.extend(new_errors)
 
     return errors
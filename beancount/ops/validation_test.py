@@ -246,6 +246,27 @@ class TestValidateCurrencyConstraints(cmptest.TestCase):
                                      'expected' in entry.tags)],
                                 [error.entry for error in errors])
 
+    @loader.load_doc(expect_errors=True)
+    def test_validate_currency_constraints__late_open(self, entries, _, options_map):
+        """
+        2014-01-01 open  Equity:Opening-Balances
+
+        2014-01-02 * "Before the open" #expected
+          Assets:Account1             1 CAD
+          Equity:Opening-Balances    -1 CAD
+
+        2014-01-03 open  Assets:Account1    USD
+
+        2014-01-04 * "After the open" #expected
+          Assets:Account1             1 CAD
+          Equity:Opening-Balances    -1 CAD
+        """
+        errors = validation.validate_currency_constraints(entries, options_map)
+        self.assertEqualEntries([entry for entry in entries
+                                 if (isinstance(entry, data.Transaction) and
+                                     'expected' in entry.tags)],
+                                [error.entry for error in errors])
+
 
 class TestValidateDocumentPaths(cmptest.TestCase):
 
@@ -284,6 +305,31 @@ class TestValidateDataTypes(cmptest.TestCase):
         valid_errors = validation.validate_data_types([new_entry], options_map)
         self.assertEqual([validation.ValidationError], list(map(type, valid_errors)))
 
+    @loader.load_doc(expect_errors=True)
+    def test_validate_data_types__trusted(self, entries, errors, options_map):
+        """
+        2014-06-24 * "Narration"
+          Assets:Investments:Stock    1 HOOL {500 USD}
+          Assets:Investments:Cash  -500 USD
+
+        2014-06-25 * "Narration"
+          Assets:Investments:Stock    1 HOOL {500 USD}
+          Assets:Investments:Cash  -500 USD
+        """
+        # Only the entries which aren't trusted are checked.
+        invalid_entries = [entry._replace(narration={"INVALID_SET_TYPE"})
+                           for entry in entries]
+        valid_errors = validation.validate(invalid_entries, options_map,
+                                           trusted_entries=invalid_entries[:1])
+        self.assertEqual([invalid_entries[1]],
+                         [error.entry for error in valid_errors
+                          if error.message.startswith('Invalid data types')])
+
+        valid_errors = validation.validate(invalid_entries, options_map)
+        self.assertEqual(invalid_entries,
+                         [error.entry for error in valid_errors
+                          if error.message.startswith('Invalid data types')])
+
 
 class TestValidateCheckTransactionBalances(cmptest.TestCase):
 
@@ -332,6 +378,104 @@ class TestValidate(cmptest.TestCase):
         self.assertRegex(validation_errors[0].message, 'Invalid currency')
 
 
+class TestRunValidators(cmptest.TestCase):
+
+    @loader.load_doc(expect_errors=True)
+    def test_run_validators__same_errors(self, entries, _, options_map):
+        """
+        2014-01-01 open Assets:Investments:Cash
+        2014-01-01 open Assets:Investments:Cash
+        2014-01-01 open Assets:Investments:Stock   AAPL
+        2014-01-01 commodity AAPL
+        2014-01-01 commodity AAPL
+
+        2014-06-23 * "Use invalid currency"
+          Assets:Investments:Stock    1 HOOG {500 USD}
+          Assets:Investments:Cash  -500 USD
+
+        2014-06-24 * "Unknown account"
+          Assets:Investments:Other    1 USD
+          Assets:Investments:Cash    -1 USD
+
+        2014-06-25 balance Assets:Investments:Cash  -500 USD
+        2014-06-25 balance Assets:Investments:Cash  -501 USD
+
+        2014-07-01 close Assets:Investments:Stock
+        2014-07-01 close Assets:Investments:Stock
+        2014-07-02 close Assets:Investments:Unknown
+        """
+        validations = (validation.BASIC_VALIDATIONS +
+                       validation.HARDCORE_VALIDATIONS)
+        expected_errors = []
+        for validation_function in validations:
+            expected_errors.extend(validation_function(entries, options_map))
+        self.assertEqual(7, len(expected_errors))
+
+        errors = validation.validate(entries, options_map,
+                                     extra_validations=validation.HARDCORE_VALIDATIONS)
+        self.assertEqual(expected_errors, errors)
+
+        # The default list of validations is not modified.
+        self.assertEqual(len(validation.BASIC_VALIDATIONS),
+                         len(validation.VALIDATIONS))
+
+    @loader.load_doc()
+    def test_run_validators__custom(self, entries, _, options_map):
+        """
+        2014-01-01 open Assets:Cash
+        2014-01-01 open Expenses:Restaurant
+
+        2014-06-23 * "Dinner"
+          Expenses:Restaurant   10 USD
+          Assets:Cash
+
+        2014-06-24 * "Lunch"
+          Expenses:Restaurant    5 USD
+          Assets:Cash
+        """
+        class CountingValidator(validation.Validator):
+            handlers = [(data.Open, 'on_open'),
+                        ((data.Transaction, data.Open), 'on_entry')]
+            def __init__(self, options_map):
+                super().__init__(options_map)
+                self.visited = []
+            def on_open(self, entry):
+                self.visited.append('open')
+            def on_entry(self, entry):
+                self.visited.append(type(entry).__name__)
+            def finish(self, entries):
+                return [validation.ValidationError(None, ' '.join(self.visited), None)]
+
+        timings = []
+        errors = validation.validate(entries, options_map, timings.append,
+                                     extra_validations=[CountingValidator])
+        self.assertEqual(['open Open open Open Transaction Transaction'],
+                         [error.message for error in errors])
+        self.assertTrue(any('CountingValidator' in line for line in timings))
+        self.assertTrue(any('TransactionBalancesValidator' in line for line in timings))
+
+    @loader.load_doc()
+    def test_validate_callable_class(self, entries, _, options_map):
+        """
+        2014-01-01 open Assets:Cash
+        2014-01-01 open Expenses:Restaurant
+
+        2014-06-24 * "Lunch"
+          Expenses:Restaurant    5 USD
+          Assets:Cash
+        """
+        # A class which isn't a Validator is called like a validation function.
+        class CallableValidation:
+            def __init__(self, entries, options_map):
+                self.errors = [validation.ValidationError(None, 'Callable', None)]
+            def __iter__(self):
+                return iter(self.errors)
+
+        errors = validation.validate(entries, options_map,
+                                     extra_validations=[CallableValidation])
+        self.assertEqual(['Callable'], [error.message for error in errors])
+
+
 class TestValidateTolerances(cmptest.TestCase):
 
     @loader.load_doc()
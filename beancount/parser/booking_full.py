@@ -72,9 +72,10 @@ improving on the algorithm above.
 __copyright__ = "Copyright (C) 2015-2017  Martin Blais"
 __license__ = "GNU GPLv2"
 
+import bisect
 import collections
-import copy
 import enum
+import itertools
 
 from beancount.core.number import MISSING
 from beancount.core.number import ZERO
@@ -90,6 +91,7 @@ from beancount.core import position
 from beancount.core import inventory
 from beancount.core import interpolate
 from beancount.core import convert
+from beancount.core import flags
 from beancount.parser import printer
 from beancount.utils import misc_utils
 
@@ -126,7 +128,9 @@ def _book(entries, options_map, methods):
     """
     new_entries = []
     errors = []
-    balances = collections.defaultdict(inventory.Inventory)
+    # The running balances are maintained as LotIndex instances, which are
+    # converted to Inventory instances at the end.
+    balances = collections.defaultdict(LotIndex)
     for entry in entries:
         if isinstance(entry, Transaction):
             # Group postings by currency.
@@ -192,6 +196,10 @@ def _book(entries, options_map, methods):
                     errors.extend(interpolation_errors)
                 repl_postings.extend(inter_postings)
 
+            # Merge the lots of the accounts using the AVERAGE method which the
+            # postings augment into a single lot.
+            repl_postings.extend(pool_average_lots(repl_postings, balances, methods))
+
             # Replace postings by interpolated ones.
             meta = entry.meta.copy()
             meta[interpolate.AUTOMATIC_TOLERANCES] = tolerances
@@ -210,7 +218,81 @@ def _book(entries, options_map, methods):
 
         new_entries.append(entry)
 
-    return new_entries, errors, balances
+    inventories = collections.defaultdict(inventory.Inventory)
+    for account, balance in balances.items():
+        inventories[account] = balance.to_inventory()
+
+    return new_entries, errors, inventories
+
+
+def pool_average_lots(postings, balances, methods):
+    """Merge the lots augmented in accounts using the AVERAGE booking method.
+
+    For each account using the AVERAGE method and each currency which the
+    postings of a transaction augment at cost, if the account already held lots
+    of that currency, all of its lots of that currency after the transaction are
+    merged into a single lot at their average cost, dated as the oldest of them.
+    As for reductions (see booking_method.booking_method_AVERAGE()), this is
+    recorded by postings flagged with FLAG_MERGING which remove each of the lots
+    and add the merged one, so the number of lots of such an account stays the
+    same as it accumulates positions. Lots of mixed signs or in multiple cost
+    currencies are left alone.
+
+    Args:
+      postings: A list of the booked and interpolated Posting instances of a
+        transaction, whose costs are all of type Cost.
+      balances: A dict of account name to LotIndex, the balances before the
+        transaction.
+      methods: A mapping of account name to their corresponding booking method.
+    Returns:
+      A list of the merging postings to add to the transaction.
+    """
+    pooled_postings = []
+    pooled = set()
+    for posting in postings:
+        if (posting.cost is None or
+            posting.flag == flags.FLAG_MERGING or
+            methods[posting.account] is not Booking.AVERAGE):
+            continue
+        currency = posting.units.currency
+        key = (posting.account, currency)
+        balance = balances.get(posting.account, None)
+        if (key in pooled or
+            balance is None or
+            currency not in balance.currency_costs):
+            continue
+
+        # Only augmentations of lots of the same sign are merged.
+        ante_positions = [balance.positions[(currency, cost)]
+                          for cost in balance.currency_costs[currency]]
+        if any(pos.units.number * posting.units.number < ZERO for pos in ante_positions):
+            continue
+        pooled.add(key)
+
+        # Compute the lots after the transaction.
+        lots = LotIndex(ante_positions)
+        for other_posting in postings:
+            if (other_posting.account == posting.account and
+                other_posting.units.currency == currency):
+                lots.add_position(other_posting)
+        positions = list(lots.positions.values())
+        if (len(positions) < 2 or
+            any(pos.cost is None for pos in positions) or
+            lots.signs[(currency, True)] and lots.signs[(currency, False)]):
+            continue
+        merged = booking_method.merge_lots(positions)
+        if merged is None:
+            continue
+
+        # Insert postings to remove all the lots and replace them with a single
+        # merged lot.
+        units, cost = merged
+        pooled_postings.extend(posting._replace(units=-pos.units, cost=pos.cost,
+                                                price=None, flag=flags.FLAG_MERGING)
+                               for pos in positions)
+        pooled_postings.append(posting._replace(units=units, cost=cost, price=None,
+                                                flag=flags.FLAG_MERGING))
+    return pooled_postings
 
 
 # An error raised if we failed to bucket a posting to a particular currency.
@@ -268,7 +350,7 @@ def categorize_by_currency(entry, balances):
     Args:
       postings: A list of incomplete postings to categorize.
       balances: A dict of currency to inventory contents before the transaction is
-        applied.
+        applied, as Inventory or LotIndex instances.
     Returns:
       A list of (currency string, list of tuples) items describing each postings
       and its interpolated currencies, and a list of generated errors for
@@ -496,6 +578,366 @@ def has_self_reduction(postings, methods):
     return False
 
 
+class LotIndex:
+    """The positions of an account's inventory, indexed for booking reductions.
+
+    This holds the same positions as the Inventory which results from adding
+    the same postings to it, in the same order, but is updated without scanning
+    its positions, and indexes the positions held at cost by currency, label,
+    cost number and date, so that the lots matching a reducing posting can be
+    found without scanning all the lots of the account. This matters for
+    accounts which accumulate a large number of lots over time.
+
+    Attributes:
+      positions: A dict of (currency, cost) to Position, in inventory order.
+      currency_costs: A dict of currency to a dict whose keys are the costs of
+        the positions in that currency, in inventory order (an ordered set).
+      label_costs: A dict of (currency, label) to an ordered set of costs.
+      number_costs: A dict of (currency, cost number) to an ordered set of costs.
+      dated_costs: A dict of currency to a list of (date, sequence, cost) tuples
+        of the positions held at cost, sorted by date and then by the order of
+        the positions in the inventory.
+      undated: A Counter of currency to the number of positions held at a cost
+        without a date.
+      signs: A Counter of (currency, is-non-negative) to the number of positions
+        of that currency and sign.
+      cost_currency_counts: A Counter of cost currency to the number of positions
+        held at a cost in that currency.
+      sequences: A dict of (currency, cost) to the sequence number of the
+        position held at cost, for its entry in 'dated_costs'.
+    """
+
+    def __init__(self, positions=None):
+        """Create an index from an existing list of positions.
+
+        Args:
+          positions: An optional iterable of Position instances, e.g., an
+            Inventory.
+        """
+        self.positions = {}
+        self.currency_costs = {}
+        self.label_costs = {}
+        self.number_costs = {}
+        self.dated_costs = {}
+        self.undated = collections.Counter()
+        self.signs = collections.Counter()
+        self.cost_currency_counts = collections.Counter()
+        self.sequences = {}
+        self.counter = itertools.count()
+        if positions is not None:
+            for pos in positions:
+                self.add_position(pos)
+
+    def __len__(self):
+        return len(self.positions)
+
+    def add_position(self, pos):
+        """Add a position or posting, with strict lot matching.
+
+        This has the same effect as Inventory.add_position().
+
+        Args:
+          pos: The Posting or Position to add.
+        """
+        units = pos.units
+        cost = pos.cost
+        currency = units.currency
+        key = (currency, cost)
+        previous = self.positions.get(key, None)
+        if previous is None:
+            if units.number != ZERO:
+                self._insert(key, Position(units, cost))
+        else:
+            previous_number = previous.units.number
+            number = previous_number + units.number
+            if number == ZERO:
+                self._remove(key, previous)
+            else:
+                self.positions[key] = Position(Amount(number, currency), cost)
+                if (number >= ZERO) != (previous_number >= ZERO):
+                    self.signs[(currency, previous_number >= ZERO)] -= 1
+                    self.signs[(currency, number >= ZERO)] += 1
+
+    def _insert(self, key, pos):
+        """Insert a new position.
+
+        Args:
+          key: A (currency, cost) tuple.
+          pos: A Position instance.
+        """
+        currency, cost = key
+        self.positions[key] = pos
+        self.currency_costs.setdefault(currency, {})[cost] = None
+        self.signs[(currency, pos.units.number >= ZERO)] += 1
+        if cost is None:
+            return
+        self.cost_currency_counts[cost.currency] += 1
+        self.number_costs.setdefault((currency, cost.number), {})[cost] = None
+        if cost.label:
+            self.label_costs.setdefault((currency, cost.label), {})[cost] = None
+        if cost.date is None:
+            self.undated[currency] += 1
+        else:
+            sequence = next(self.counter)
+            self.sequences[key] = sequence
+            bisect.insort(self.dated_costs.setdefault(currency, []),
+                          (cost.date, sequence, cost))
+
+    def _remove(self, key, pos):
+        """Remove an existing position.
+
+        Args:
+          key: A (currency, cost) tuple.
+          pos: The Position instance stored for the key.
+        """
+        currency, cost = key
+        del self.positions[key]
+        _discard(self.currency_costs, currency, cost)
+        self.signs[(currency, pos.units.number >= ZERO)] -= 1
+        if cost is None:
+            return
+        self.cost_currency_counts[cost.currency] -= 1
+        _discard(self.number_costs, (currency, cost.number), cost)
+        if cost.label:
+            _discard(self.label_costs, (currency, cost.label), cost)
+        if cost.date is None:
+            self.undated[currency] -= 1
+        else:
+            dated = self.dated_costs[currency]
+            index = bisect.bisect_left(dated, (cost.date, self.sequences.pop(key)))
+            del dated[index]
+            if not dated:
+                del self.dated_costs[currency]
+
+    def currencies(self):
+        """Return the set of units currencies held, like Inventory.currencies()."""
+        return set(self.currency_costs)
+
+    def cost_currencies(self):
+        """Return the set of cost currencies held, like Inventory.cost_currencies()."""
+        return set(currency
+                   for currency, count in self.cost_currency_counts.items()
+                   if count > 0)
+
+    def to_inventory(self):
+        """Convert this index to an equivalent Inventory.
+
+        Returns:
+          An instance of Inventory, with its positions in the same order.
+        """
+        inv = inventory.Inventory()
+        inv.extend(self.positions.values())
+        return inv
+
+
+def _discard(ordered_sets, key, cost):
+    """Remove a cost from one of the ordered sets of a mapping, and the set if empty.
+
+    Args:
+      ordered_sets: A dict of key to dicts used as ordered sets.
+      key: The key of the set to remove the cost from.
+      cost: The cost to remove.
+    """
+    costs = ordered_sets[key]
+    del costs[cost]
+    if not costs:
+        del ordered_sets[key]
+
+
+class _LocalLots:
+    """A view of a LotIndex with the reductions booked by a single transaction.
+
+    This lets book_reductions() take into account the cumulative effect of the
+    postings of a transaction without modifying (or copying) the ante-inventory.
+
+    Attributes:
+      lots: An instance of LotIndex, the ante-inventory.
+      changes: A dict of (currency, cost) to the reduced Position, or None if the
+        lot has been closed.
+      added: An ordered set (a dict) of the (currency, cost) keys of the lots
+        created by the transaction, e.g., lots merged for average cost booking.
+    """
+
+    def __init__(self, lots):
+        self.lots = lots
+        self.changes = {}
+        self.added = {}
+
+    def get(self, key):
+        """Return the current position for a (currency, cost) key, or None."""
+        changes = self.changes
+        if changes and key in changes:
+            return changes[key]
+        return self.lots.positions.get(key, None)
+
+    def is_reduced_by(self, units):
+        """Return true if the amount could reduce this inventory.
+
+        See Inventory.is_reduced_by().
+
+        Args:
+          units: An instance of Amount.
+        Returns:
+          A boolean.
+        """
+        if units.number == ZERO:
+            return False
+        currency = units.currency
+        reducible = units.number < ZERO
+        count = self.lots.signs[(currency, reducible)]
+        for key, pos in self.changes.items():
+            if key[0] != currency:
+                continue
+            original = self.lots.positions.get(key, None)
+            if original is not None and (original.units.number >= ZERO) == reducible:
+                count -= 1
+            if pos is not None and (pos.units.number >= ZERO) == reducible:
+                count += 1
+        return count > 0
+
+    def add_position(self, posting):
+        """Book a reducing (or merging) posting.
+
+        Args:
+          posting: A Posting instance whose cost is an instance of Cost.
+        """
+        key = (posting.units.currency, posting.cost)
+        if key not in self.lots.positions:
+            self.added[key] = None
+        pos = self.get(key)
+        number = (pos.units.number if pos is not None else ZERO) + posting.units.number
+        self.changes[key] = (Position(Amount(number, key[0]), posting.cost)
+                             if number != ZERO
+                             else None)
+
+    def to_inventory(self):
+        """Convert this view to an equivalent Inventory.
+
+        Returns:
+          An instance of Inventory.
+        """
+        inv = inventory.Inventory()
+        inv.extend(pos
+                   for pos in map(self.get, itertools.chain(self.lots.positions,
+                                                            self.added))
+                   if pos is not None)
+        return inv
+
+    def match(self, units, costspec, cost_number):
+        """Find the lots which match a reducing posting, in inventory order.
+
+        Args:
+          units: An Amount, the units of the reducing posting.
+          costspec: A CostSpec instance, the cost of the reducing posting.
+          cost_number: The per-unit cost number of the posting, or None.
+        Returns:
+          A list of matching Position instances.
+        """
+        lots = self.lots
+        currency = units.currency
+        if not currency:
+            keys = list(lots.positions)
+        else:
+            if costspec.label:
+                costs = lots.label_costs.get((currency, costspec.label), ())
+            elif cost_number is not None:
+                costs = lots.number_costs.get((currency, cost_number), ())
+            else:
+                costs = lots.currency_costs.get(currency, ())
+            keys = [(currency, cost) for cost in costs]
+        if self.added:
+            keys.extend(key
+                        for key in self.added
+                        if not currency or key[0] == currency)
+        return [pos
+                for pos in map(self.get, keys)
+                if pos is not None and _matches_costspec(pos, costspec, cost_number)]
+
+    def match_dated(self, units, costspec, reverse_order):
+        """Find the oldest (or newest) lots which match a reducing posting.
+
+        This returns the lots in the order in which the FIFO and LIFO methods
+        consume them, and only as many as necessary to reduce the posting. If
+        there are not enough lots, all the matching lots are returned in
+        inventory order, as match() does.
+
+        Args:
+          units: An Amount, the units of the reducing posting.
+          costspec: A CostSpec instance, the cost of the reducing posting, without
+            a label, number or date.
+          reverse_order: A boolean, true to return the newest lots first.
+        Returns:
+          A list of matching Position instances, or None if the lots of the
+          currency can't be ordered by date.
+        """
+        currency = units.currency
+        if (not currency or self.lots.undated[currency] or
+            any(key[0] == currency for key in self.added)):
+            return None
+        dated = self.lots.dated_costs.get(currency, [])
+        if reverse_order:
+            dated = _reverse_dates(dated)
+
+        matches = []
+        sign = -1 if units.number < ZERO else 1
+        remaining = abs(units.number)
+        for _, _, cost in dated:
+            pos = self.get((currency, cost))
+            if pos is None or not _matches_costspec(pos, costspec, None):
+                continue
+            matches.append(pos)
+            if pos.units.number * sign < ZERO:
+                remaining -= abs(pos.units.number)
+                if remaining <= ZERO:
+                    return matches
+
+        # There aren't enough lots; produce the same errors as the full match.
+        return self.match(units, costspec, None)
+
+
+def _reverse_dates(dated):
+    """Iterate over sorted dated costs by decreasing date, with ties in original order.
+
+    This is the order of sorted(..., reverse=True) on the dates, which is stable.
+
+    Args:
+      dated: A list of (date, sequence, cost) tuples, sorted.
+    Yields:
+      The tuples of the list.
+    """
+    end = len(dated)
+    while end > 0:
+        date = dated[end - 1][0]
+        start = bisect.bisect_left(dated, (date,), 0, end)
+        yield from itertools.islice(dated, start, end)
+        end = start
+
+
+def _matches_costspec(pos, costspec, cost_number):
+    """Return true if a position matches the cost specification of a reduction.
+
+    Args:
+      pos: A Position instance from the ante-inventory.
+      costspec: A CostSpec instance.
+      cost_number: The per-unit cost number computed from the spec, or None.
+    Returns:
+      A boolean.
+    """
+    cost = pos.cost
+    # Skip balance positions not held at cost.
+    if cost is None:
+        return False
+    if cost_number is not None and cost.number != cost_number:
+        return False
+    if isinstance(costspec.currency, str) and cost.currency != costspec.currency:
+        return False
+    if costspec.date and cost.date != costspec.date:
+        return False
+    if costspec.label and cost.label != costspec.label:
+        return False
+    return True
+
+
 def book_reductions(entry, group_postings, balances,
                     methods):
     """Book inventory reductions against the ante-balances.
@@ -514,7 +956,9 @@ def book_reductions(entry, group_postings, balances,
       entry: An instance of Transaction. This is only used to refer to when
         logging errors.
       group_postings: A list of Posting instances for the group.
-      balances: A dict of account name to inventory contents.
+      balances: A dict of account name to inventory contents, either Inventory
+        or LotIndex instances. Providing LotIndex instances avoids indexing the
+        inventories on every call.
       methods: A mapping of account name to their corresponding booking
         method enum.
     Returns:
@@ -529,12 +973,11 @@ def book_reductions(entry, group_postings, balances,
     """
     errors = []
 
-    # A local copy of the balances dictionary which is updated just for the
+    # A local view of each of the balances which is updated just for the
     # duration of this function's updates, in order to take into account the
     # cumulative effect of all the postings inferred here
     local_balances = {}
 
-    empty = inventory.Inventory()
     booked_postings = []
     for posting in group_postings:
         # Process a single posting.
@@ -542,93 +985,84 @@ def book_reductions(entry, group_postings, balances,
         costspec = posting.cost
         account = posting.account
 
+        # Check if this is a lot held at cost.
+        if costspec is None:
+            # This posting is not held at cost; we do nothing.
+            booked_postings.append(posting)
+            continue
+
         # Note: We ensure there is no mutation on 'balances' to keep this
-        # function without side-effects. Note that we may be able to optimize
-        # performance later on by giving up this property.
+        # function without side-effects.
         #
         # Also note that if there is no existing balance, then won't be any lot
         # reduction because none of the postings will be able to match against
         # any currencies of the balance.
-        previous_balance = balances.get(account, empty)
-        balance = local_balances.setdefault(account, copy.copy(previous_balance))
-
-        # Check if this is a lot held at cost.
-        if costspec is None:
-            # This posting is not held at cost; we do nothing.
-            booked_postings.append(posting)
+        balance = local_balances.get(account, None)
+        if balance is None:
+            lots = balances.get(account, None)
+            if not isinstance(lots, LotIndex):
+                lots = LotIndex(lots)
+            balance = local_balances[account] = _LocalLots(lots)
+
+        # This posting is held at cost; figure out if it's a reduction or an
+        # augmentation.
+        method = methods[account]
+        if (method is not Booking.NONE and
+            balance.is_reduced_by(units)):
+            # This posting is a reduction.
+
+            # Match the positions. The FIFO and LIFO methods only need the
+            # oldest or newest lots when no particular lot is specified.
+            cost_number = compute_cost_number(costspec, units)
+            matches = None
+            if (method in (Booking.FIFO, Booking.LIFO) and
+                cost_number is None and
+                not costspec.date and
+                not costspec.label):
+                matches = balance.match_dated(units, costspec,
+                                              method is Booking.LIFO)
+            if matches is None:
+                matches = balance.match(units, costspec, cost_number)
+
+            # Check for ambiguous matches.
+            if len(matches) == 0:
+                errors.append(
+                    ReductionError(entry.meta,
+                                   'No position matches "{}" against balance {}'.format(
+                                       posting, balance.to_inventory()),
+                                   entry))
+                return [], errors  # This is irreconcilable, remove these postings.
+
+            reduction_postings, ambi_errors = booking_method.handle_ambiguous_matches(
+                entry, posting, matches, method)
+            if ambi_errors:
+                errors.extend(ambi_errors)
+                return [], errors
+
+            # Add the reductions to the resulting list of booked postings.
+            booked_postings.extend(reduction_postings)
+
+            # Update the local balance in order to avoid matching against
+            # the same postings twice when processing multiple postings in
+            # the same transaction. Note that we only do this for postings
+            # held at cost because the other postings may need interpolation
+            # in order to be resolved properly.
+            for posting in reduction_postings:
+                balance.add_position(posting)
         else:
-            # This posting is held at cost; figure out if it's a reduction or an
-            # augmentation.
-            method = methods[account]
-            if (method is not Booking.NONE and
-                balance is not None and
-                balance.is_reduced_by(units)):
-                # This posting is a reduction.
-
-                # Match the positions.
-                cost_number = compute_cost_number(costspec, units)
-                matches = []
-                for position in balance:
-                    # Skip inventory contents of a different currency.
-                    if (units.currency and
-                        position.units.currency != units.currency):
-                        continue
-                    # Skip balance positions not held at cost.
-                    if position.cost is None:
-                        continue
-                    if (cost_number is not None and
-                        position.cost.number != cost_number):
-                        continue
-                    if (isinstance(costspec.currency, str) and
-                        position.cost.currency != costspec.currency):
-                        continue
-                    if (costspec.date and
-                        position.cost.date != costspec.date):
-                        continue
-                    if (costspec.label and
-                        position.cost.label != costspec.label):
-                        continue
-                    matches.append(position)
-
-                # Check for ambiguous matches.
-                if len(matches) == 0:
-                    errors.append(
-                        ReductionError(entry.meta,
-                                       'No position matches "{}" against balance {}'.format(
-                                           posting, balance),
-                                       entry))
-                    return [], errors  # This is irreconcilable, remove these postings.
-
-                reduction_postings, ambi_errors = booking_method.handle_ambiguous_matches(
-                    entry, posting, matches, method)
-                if ambi_errors:
-                    errors.extend(ambi_errors)
-                    return [], errors
-
-                # Add the reductions to the resulting list of booked postings.
-                booked_postings.extend(reduction_postings)
-
-                # Update the local balance in order to avoid matching against
-                # the same postings twice when processing multiple postings in
-                # the same transaction. Note that we only do this for postings
-                # held at cost because the other postings may need interpolation
-                # in order to be resolved properly.
-                for posting in reduction_postings:
-                    balance.add_position(posting)
-            else:
-                # This posting is an augmentation.
-                #
-                # Note that we do not convert the CostSpec instances to Cost
-                # instances, because we want to let the subsequent interpolation
-                # process able to interpolate either the cost per-unit or the
-                # total cost, separately.
-
-                # Put in the date of the parent Transaction if there is no
-                # explicit date specified on the spec.
-                if costspec.date is None:
-                    dated_costspec = costspec._replace(date=entry.date)
-                    posting = posting._replace(cost=dated_costspec)
-                booked_postings.append(posting)
+            # This posting is an augmentation.
+            #
+            # Note that we do not convert the CostSpec instances to Cost
+            # instances, because we want to let the subsequent interpolation
+            # process able to interpolate either the cost per-unit or the
+            # total cost, separately.
+
+            # Put in the date of the parent Transaction if there is no
+            # explicit date specified on the spec.
+            if costspec.date is None:
+                dated_costspec = costspec._replace(date=entry.date)
+                posting = posting._replace(cost=dated_costspec)
+            booked_postings.append(posting)
 
     return booked_postings, errors
 
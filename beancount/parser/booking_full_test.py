@@ -6,6 +6,7 @@ import datetime
 import textwrap
 import functools
 import unittest
+import random
 import re
 import io
 from unittest import mock
@@ -23,6 +24,7 @@ from beancount.core import inventory
 from beancount.core import position
 from beancount.core import amount
 from beancount.core import data
+from beancount.core import flags
 from beancount.core import interpolate
 from beancount.parser import parser
 from beancount.parser import printer
@@ -2363,7 +2365,7 @@ class TestBookAmbiguousLIFO(_BookingTestBase):
         """
 
 
-class _TestBookAmbiguousAVERAGE(_BookingTestBase):
+class TestBookAmbiguousAVERAGE(_BookingTestBase):
 
     @book_test(Booking.AVERAGE)
     def test_ambiguous__AVERAGE__trivial1(self, _, __):
@@ -2663,6 +2665,108 @@ class _TestBookAmbiguousAVERAGE(_BookingTestBase):
         """
 
 
+class TestBookAverage(unittest.TestCase):
+
+    @loader.load_doc()
+    def test_average__pool(self, entries, _, __):
+        """
+        option "booking_method" "AVERAGE"
+
+        2015-01-01 open Assets:Invest
+        2015-01-01 open Assets:Cash
+        2015-01-01 open Income:Gains
+
+        2015-02-01 * "Buy"
+          Assets:Invest    10 HOOL {100.00 USD}
+          Assets:Cash
+
+        2015-03-01 * "Reinvest"
+          Assets:Invest    1.234 HOOL {101.37 USD}
+          Assets:Cash
+
+        2015-04-01 * "Reinvest"
+          Assets:Invest    0.777 HOOL {99.13 USD}
+          Assets:Cash
+
+        2015-05-01 * "Sell"
+          Assets:Invest    -5 HOOL {} @ 110.00 USD
+          Assets:Cash      550.00 USD
+          Income:Gains
+
+        2015-06-01 * "Reinvest"
+          Assets:Invest    0.5 HOOL {105.00 USD}
+          Assets:Cash
+
+        2015-07-01 * "Sell"
+          Assets:Invest    -3 HOOL {} @ 111.00 USD
+          Assets:Cash      333.00 USD
+          Income:Gains
+        """
+        balance = inventory.Inventory()
+        for entry in data.filter_txns(entries):
+            for posting in entry.postings:
+                if posting.account == 'Assets:Invest':
+                    balance.add_position(posting)
+        self.assertEqual(1, len(balance))
+        self.assertEqual(A('4.511 HOOL'), balance[0].units)
+        self.assertEqual(datetime.date(2015, 2, 1), balance[0].cost.date)
+        self.assertEqual(D('100.41'), balance[0].cost.number.quantize(D('0.01')))
+
+    @loader.load_doc()
+    def test_average__accumulate_only(self, entries, _, __):
+        """
+        option "booking_method" "AVERAGE"
+
+        2015-01-01 open Assets:Invest
+        2015-01-01 open Assets:Cash
+        2015-01-01 open Income:Gains
+
+        2015-02-01 * "Reinvest"
+          Assets:Invest    1 HOOL {100.00 USD}
+          Assets:Cash
+
+        2015-03-01 * "Reinvest"
+          Assets:Invest    1 HOOL {101.00 USD}
+          Assets:Cash
+
+        2015-04-01 * "Reinvest"
+          Assets:Invest    1 HOOL {102.00 USD}
+          Assets:Cash
+
+        2015-05-01 * "Reinvest"
+          Assets:Invest    1 HOOL {103.00 USD}
+          Assets:Cash
+
+        2015-06-01 * "Sell"
+          Assets:Invest    -1 HOOL {} @ 110.00 USD
+          Assets:Cash      110.00 USD
+          Income:Gains
+        """
+        # Each augmentation is folded into the existing average lot, so an account
+        # which is only ever augmented holds a single lot.
+        txns = list(data.filter_txns(entries))
+        balance = inventory.Inventory()
+        for entry in txns[:-1]:
+            for posting in entry.postings:
+                if posting.account == 'Assets:Invest':
+                    balance.add_position(posting)
+            self.assertEqual(1, len(balance))
+        self.assertEqual(A('4 HOOL'), balance[0].units)
+        self.assertEqual(D('101.50'), balance[0].cost.number)
+        self.assertEqual(datetime.date(2015, 2, 1), balance[0].cost.date)
+
+        # The reduction then needs no merging.
+        sell = txns[-1]
+        self.assertFalse([posting for posting in sell.postings
+                          if posting.flag == flags.FLAG_MERGING])
+        for posting in sell.postings:
+            if posting.account == 'Assets:Invest':
+                balance.add_position(posting)
+        self.assertEqual(1, len(balance))
+        self.assertEqual(A('3 HOOL'), balance[0].units)
+        self.assertEqual(D('101.50'), balance[0].cost.number)
+
+
 class TestBasicBooking(_BookingTestBase):
 
     @book_test(Booking.STRICT)
@@ -2974,3 +3078,86 @@ class TestBook(unittest.TestCase):
                 None, None, None),
             data.Posting('Assets:Other', A('100.00 USD'), None, None, None, None),
             ], postings)
+
+
+class TestLotIndex(unittest.TestCase):
+
+    def random_positions(self, rnd, num):
+        dates = [datetime.date(2015, 1, day) for day in (1, 2, 3)]
+        positions = []
+        for _ in range(num):
+            currency = rnd.choice(['HOOL', 'AAPL'])
+            if rnd.random() < 0.1:
+                cost = None
+            else:
+                cost = Cost(D(rnd.choice(['100', '101', '102'])),
+                            rnd.choice(['USD', 'CAD']),
+                            rnd.choice(dates),
+                            rnd.choice([None, 'a', 'b']))
+            number = D(rnd.choice(['-2', '-1', '1', '2', '3']))
+            positions.append(Position(amount.Amount(number, currency), cost))
+        return positions
+
+    def test_same_as_inventory(self):
+        rnd = random.Random(0)
+        inv = inventory.Inventory()
+        lots = bf.LotIndex()
+        for pos in self.random_positions(rnd, 2000):
+            inv.add_position(pos)
+            lots.add_position(pos)
+            self.assertEqual(list(inv), list(lots.to_inventory()))
+        self.assertEqual(inv.currencies(), lots.currencies())
+        self.assertEqual(inv.cost_currencies(), lots.cost_currencies())
+
+        local_lots = bf._LocalLots(lots)
+        for units in [A('1 HOOL'), A('-1 HOOL'), A('0 HOOL'), A('-1 MSFT')]:
+            self.assertEqual(inv.is_reduced_by(units),
+                             local_lots.is_reduced_by(units))
+
+        # Check the order of the index of the lots by date.
+        for currency, dated in lots.dated_costs.items():
+            lots_in_order = [pos.cost
+                             for pos in inv
+                             if pos.units.currency == currency and pos.cost is not None]
+            self.assertEqual(sorted(lots_in_order, key=lambda cost: cost.date),
+                             [cost for _, _, cost in dated])
+            self.assertEqual(sorted(lots_in_order, key=lambda cost: cost.date,
+                                    reverse=True),
+                             [cost for _, _, cost in bf._reverse_dates(dated)])
+
+    def test_local_lots(self):
+        inv = I('10 HOOL {100.00 USD, 2015-10-01}, '
+                '5 HOOL {101.00 USD, 2015-10-02}, '
+                '-3 AAPL {50.00 USD, 2015-10-02}')
+        local_lots = bf._LocalLots(bf.LotIndex(inv))
+        cost = Cost(D('101.00'), 'USD', datetime.date(2015, 10, 2), None)
+        local_lots.add_position(Position(A('-5 HOOL'), cost))
+        self.assertEqual(I('10 HOOL {100.00 USD, 2015-10-01}, '
+                           '-3 AAPL {50.00 USD, 2015-10-02}'),
+                         local_lots.to_inventory())
+        self.assertEqual(3, len(local_lots.lots))
+
+        spec = CostSpec(MISSING, None, MISSING, None, None, False)
+        self.assertEqual([inv[0]], local_lots.match(A('-1 HOOL'), spec, None))
+        self.assertEqual([inv[0]], local_lots.match_dated(A('-12 HOOL'), spec, False))
+        self.assertTrue(local_lots.is_reduced_by(A('-1 HOOL')))
+        self.assertTrue(local_lots.is_reduced_by(A('1 AAPL')))
+        self.assertFalse(local_lots.is_reduced_by(A('-1 AAPL')))
+
+    def test_match_dated(self):
+        inv = I('1 HOOL {100.00 USD, 2015-10-03}, '
+                '2 HOOL {101.00 USD, 2015-10-01}, '
+                '3 HOOL {102.00 USD, 2015-10-02}, '
+                '4 HOOL {103.00 USD, 2015-10-01}')
+        local_lots = bf._LocalLots(bf.LotIndex(inv))
+        spec = CostSpec(MISSING, None, MISSING, None, None, False)
+        self.assertEqual([inv[1], inv[3]],
+                         local_lots.match_dated(A('-5 HOOL'), spec, False))
+        self.assertEqual([inv[0], inv[2]],
+                         local_lots.match_dated(A('-4 HOOL'), spec, True))
+        self.assertEqual([inv[0], inv[2], inv[1]],
+                         local_lots.match_dated(A('-5 HOOL'), spec, True))
+
+        # Without enough lots, all the matches are returned in inventory order.
+        self.assertEqual(list(inv),
+                         local_lots.match_dated(A('-11 HOOL'), spec, True))
@@ -7,7 +7,6 @@ __license__ = "GNU GPLv2"
 import collections
 
 from beancount.core.number import ZERO
-from beancount.core.number import Decimal
 from beancount.core.data import Booking
 from beancount.core.amount import Amount
 from beancount.core.position import Cost
@@ -29,7 +28,9 @@ def handle_ambiguous_matches(entry, posting, matches, method):
       posting: An instance of Posting, the reducing posting which we're
         attempting to match.
       matches: A list of matching Position instances from the ante-inventory.
-        Those positions are known to already match the 'posting' spec.
+        Those positions are known to already match the 'posting' spec. For the
+        FIFO and LIFO methods, this may only include the oldest (or newest)
+        positions sufficient to reduce the posting.
       methods: A mapping of account name to their corresponding booking
         method.
     Returns:
@@ -166,73 +167,107 @@ def booking_method_NONE(entry, posting, matches):
 
 
 def booking_method_AVERAGE(entry, posting, matches):
-    """AVERAGE booking method implementation."""
+    """AVERAGE booking method implementation.
+
+    If the reduction matches more than a single lot, the matching lots are first
+    merged into a single lot at their average cost, dated as the oldest of them,
+    and the reduction is booked against that lot. This is recorded by inserting
+    postings flagged with FLAG_MERGING in the transaction, which remove each of
+    the matching lots and add the merged lot. The inventory of an account thus
+    holds a single lot per currency after each reduction.
+
+    Augmentations are pooled as well, at booking time (see
+    booking_full.pool_average_lots()), so an account which is only ever
+    augmented, e.g. one receiving reinvested dividends, also holds a single lot
+    per currency and its reductions normally match just that lot.
+
+    Args:
+      entry: The parent Transaction instance.
+      posting: An instance of Posting, the reducing posting which we're
+        attempting to match.
+      matches: A list of matching Position instances from the ante-inventory.
+        Those positions are known to already match the 'posting' spec.
+    Returns:
+      A triple of
+        booked_postings: A list of matched Posting instances, whose 'cost'
+          attributes are ensured to be of type Cost.
+        errors: A list of errors to be generated.
+        insufficient: A boolean, true if we could not find enough matches
+          to fulfill the reduction.
+    """
     postings = []
-    errors = [AmbiguousMatchError(entry.meta, "AVERAGE method is not supported", entry)]
-    return postings, errors, False
-
-    # FIXME: Future implementation here.
-    # pylint: disable=unreachable
-    if False: # pylint: disable=using-constant-test
-        # DISABLED - This is the code for AVERAGE, which is currently disabled.
-
-        # If there is more than a single match we need to ultimately merge the
-        # postings. Also, if the reducing posting provides a specific cost, we
-        # need to update the cost basis as well. Both of these cases are carried
-        # out by removing all the matches and readding them later on.
-        if len(matches) == 1 and (
-                not isinstance(posting.cost.number_per, Decimal) and
-                not isinstance(posting.cost.number_total, Decimal)):
-            # There is no cost. Just reduce the one leg. This should be the
-            # normal case if we always merge augmentations and the user lets
-            # Beancount deal with the cost.
-            match = matches[0]
-            sign = -1 if posting.units.number < ZERO else 1
-            number = min(abs(match.units.number), abs(posting.units.number))
-            match_units = Amount(number * sign, match.units.currency)
-            postings.append(posting._replace(units=match_units, cost=match.cost))
-            insufficient = (match_units.number != posting.units.number)
-        else:
-            # Merge the matching postings to a single one.
-            merged_units = inventory.Inventory()
-            merged_cost = inventory.Inventory()
-            for match in matches:
-                merged_units.add_amount(match.units)
-                merged_cost.add_amount(convert.get_weight(match))
-            if len(merged_units) != 1 or len(merged_cost) != 1:
-                errors.append(
-                    AmbiguousMatchError(
-                        entry.meta,
-                        'Cannot merge positions in multiple currencies: {}'.format(
-                            ', '.join(position.to_string(match_posting)
-                                      for match_posting in matches)), entry))
-            else:
-                if (isinstance(posting.cost.number_per, Decimal) or
-                    isinstance(posting.cost.number_total, Decimal)):
-                    errors.append(
-                        AmbiguousMatchError(
-                            entry.meta,
-                            "Explicit cost reductions aren't supported yet: {}".format(
-                                position.to_string(posting)), entry))
-                else:
-                    # Insert postings to remove all the matches.
-                    postings.extend(posting._replace(units=-match.units, cost=match.cost,
-                                                     flag=flags.FLAG_MERGING)
-                                    for match in matches)
-                    units = merged_units[0].units
-                    date = matches[0].cost.date  ## FIXME: Select which one,
-                                                 ## oldest or latest.
-                    cost_units = merged_cost[0].units
-                    cost = Cost(cost_units.number/units.number, cost_units.currency,
-                                date, None)
-
-                    # Insert a posting to refill those with a replacement match.
-                    postings.append(posting._replace(units=units, cost=cost,
-                                                     flag=flags.FLAG_MERGING))
-
-                    # Now, match the reducing request against this lot.
-                    postings.append(posting._replace(units=posting.units, cost=cost))
-                    insufficient = abs(posting.units.number) > abs(units.number)
+    errors = []
+    insufficient = False
+
+    if len(matches) == 1:
+        # There is a single lot; just reduce it. This is the normal case if the
+        # account only gets reduced with average cost booking.
+        match = matches[0]
+        sign = -1 if posting.units.number < ZERO else 1
+        number = min(abs(match.units.number), abs(posting.units.number))
+        match_units = Amount(number * sign, match.units.currency)
+        postings.append(posting._replace(units=match_units, cost=match.cost))
+        insufficient = (match_units.number != posting.units.number)
+        return postings, errors, insufficient
+
+    # Merge the matching lots into a single one.
+    merged = merge_lots(matches)
+    if merged is None:
+        errors.append(
+            AmbiguousMatchError(
+                entry.meta,
+                'Cannot merge positions in multiple currencies: {}'.format(
+                    ', '.join(position.to_string(match_posting)
+                              for match_posting in matches)), entry))
+        return postings, errors, insufficient
+
+    units, cost = merged
+    if posting.units.number * units.number >= ZERO:
+        errors.append(
+            AmbiguousMatchError(
+                entry.meta,
+                'Cannot merge positions of mixed signs: {}'.format(
+                    ', '.join(position.to_string(match_posting)
+                              for match_posting in matches)), entry))
+        return postings, errors, insufficient
+
+    # Insert postings to remove all the matches and replace them with a single
+    # merged lot.
+    postings.extend(posting._replace(units=-match.units, cost=match.cost, price=None,
+                                     flag=flags.FLAG_MERGING)
+                    for match in matches)
+    postings.append(posting._replace(units=units, cost=cost, price=None,
+                                     flag=flags.FLAG_MERGING))
+
+    # Now, match the reducing request against this lot.
+    postings.append(posting._replace(units=posting.units, cost=cost))
+    insufficient = abs(posting.units.number) > abs(units.number)
+
+    return postings, errors, insufficient
+
+
+def merge_lots(positions):
+    """Compute the single lot at average cost equivalent to a list of lots.
+
+    Args:
+      positions: A list of Position or Posting instances held at cost, whose
+        'cost' attributes are of type Cost.
+    Returns:
+      A pair of the units, an Amount instance, and the Cost of the merged lot,
+      dated as the oldest of the lots, or None, if the lots are in multiple
+      currencies or cost currencies, or if their units sum to zero.
+    """
+    merged_units = inventory.Inventory()
+    merged_cost = inventory.Inventory()
+    for pos in positions:
+        merged_units.add_amount(pos.units)
+        merged_cost.add_amount(convert.get_weight(pos))
+    if len(merged_units) != 1 or len(merged_cost) != 1:
+        return None
+    units = merged_units[0].units
+    cost_units = merged_cost[0].units
+    date = min(pos.cost.date for pos in positions)
+    return units, Cost(cost_units.number / units.number, cost_units.currency, date, None)
 
 
 _BOOKING_METHODS = {
@@ -368,6 +368,14 @@ PUBLIC_OPTION_GROUPS = [
       must have the following filename format: YYYY-MM-DD.(.*)
     """, [Opt("documents", [], "/path/to/your/documents/archive")]),
 
+    OptGroup("""
+      The filename of a price database, relative to the directory of the
+      top-level input file, as written by "bean-price --store". If set, the
+      reports use the prices it contains in addition to the Price directives,
+      reading them only for the pairs of commodities they look up. This allows
+      you to keep a long history of prices out of your input file.
+    """, [Opt("price_store", None, "prices.db")]),
+
     OptGroup("""
       A list of currencies that we single out during reporting and create
       dedicated columns for. This is used to indicate the main currencies that
@@ -402,6 +410,15 @@ PUBLIC_OPTION_GROUPS = [
     """, [Opt("plugin_processing_mode", "default", "raw",
               converter=options_validate_processing_mode)]),
 
+    OptGroup("""
+      A boolean, true if the data types of the entries produced by the parser
+      are trusted, so that only the entries which plugins create or replace are
+      type-checked after the plugins run. This makes loading faster, but entries
+      which plugins modify in place, e.g. by appending postings to an existing
+      transaction, are not checked. bean-check always checks all the entries.
+    """, [Opt("check_plugin_entries_only", False, "TRUE",
+              converter=options_validate_boolean)]),
+
     OptGroup("""
       The number of lines beyond which a multi-line string will trigger a
       overly long line warning. This warning is meant to help detect a dangling
@@ -459,9 +476,11 @@ PUBLIC_OPTION_GROUPS = [
       When a posting is matched against the contents of an account's inventory
       to reduce its contents and multiple lots match, the method dictates how
       this ambiguity is resolved. Methods include "STRICT" which raises an
-      error, "FIFO" which selects the oldest lot, and "NONE" which allows any
-      reduction to be added to the inventory despite the absence of a match
-      (resulting in mixed inventories).
+      error, "FIFO" which selects the oldest lot, "LIFO" which selects the
+      newest lot, "AVERAGE" which merges the lots of a commodity into a single
+      lot at their average cost as they are augmented or reduced, and "NONE"
+      which allows any reduction to be added to the inventory despite the
+      absence of a match (resulting in mixed inventories).
 
       (Note that this is only used with the new "FULL" booking algorithm.)
 
@@ -14,6 +14,8 @@ from beancount.core import getters
 
 __plugins__ = ('validate_commodity_directives',)
 
+__plugins_readonly__ = True
+
 
 CheckCommodityError = collections.namedtuple('CheckCommodityError', 'source message entry')
 
@@ -12,6 +12,8 @@ from beancount.core import data
 
 __plugins__ = ('validate_coherent_cost',)
 
+__plugins_readonly__ = True
+
 
 CoherentCostError = collections.namedtuple('CoherentCostError', 'source message entry')
 
@@ -17,6 +17,8 @@ from beancount.core import realization
 
 __plugins__ = ('validate_leaf_only',)
 
+__plugins_readonly__ = True
+
 
 LeafOnlyError = collections.namedtuple('LeafOnlyError', 'source message entry')
 
@@ -7,6 +7,8 @@ from beancount.core import compare
 
 __plugins__ = ('validate_no_duplicates',)
 
+__plugins_readonly__ = True
+
 
 def validate_no_duplicates(entries, unused_options_map):
     """Check that the entries are unique, by computing hashes.
@@ -10,6 +10,8 @@ from beancount.core import getters
 
 __plugins__ = ('validate_unused_accounts',)
 
+__plugins_readonly__ = True
+
 
 UnusedAccountError = collections.namedtuple('UnusedAccountError', 'source message entry')
 
@@ -9,6 +9,8 @@ from beancount.core import data
 
 __plugins__ = ('validate_one_commodity',)
 
+__plugins_readonly__ = True
+
 
 OneCommodityError = collections.namedtuple('OneCommodityError', 'source message entry')
 
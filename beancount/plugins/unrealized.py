@@ -133,7 +133,7 @@ def add_unrealized_gains(entries, options_map, subaccount=None):
                          gain_loss_str, h=holding)
         entry = data.Transaction(data.new_metadata(meta["filename"], lineno=1000 + index),
                                  latest_date, flags.FLAG_UNREALIZED,
-                                 None, narration, None, None, [])
+                                 None, narration, data.EMPTY_SET, data.EMPTY_SET, [])
 
         # Book this as income, converting the account name to be the same, but as income.
         # Note: this is a rather convenient but arbitraty choice--maybe it would be best to
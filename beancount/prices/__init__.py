@@ -37,6 +37,20 @@ You can use an option to fetch historical prices for a desired date instead:
 
   bean-price --date=2015-02-03
 
+Backfill
+--------
+
+You can also fill in the history of prices of the commodities held at cost in
+your input files. This computes the weekly dates over the periods each commodity
+was held, removes those for which the files already have a recent price, and
+fetches the remaining ones up to the date given with --date or today:
+
+  bean-price --backfill /home/joe/finances/joe.beancount
+
+Each range of consecutive missing weeks is fetched in a single request from
+sources which implement get_prices_series(); other sources are queried once per
+date.
+
 Inverse
 -------
 
@@ -128,6 +142,22 @@ You can also instruct the script to clear the cache before fetching its prices:
 
   bean-price --clear-cache
 
+Concurrency
+-----------
+
+The price jobs are processed by a pool of worker threads (--workers). The
+requests made to each source are limited in number at any one time
+(--source-concurrency) and, optionally, in rate (--source-rate, in requests per
+second). Requests which fail with a network error are retried (--retries) after
+a delay which doubles every time (--retry-backoff). Statistics on the requests
+made to each source are logged at the end with --verbose.
+
+With --async, all the jobs are instead started at once on a single thread, and
+the sources which provide an AsyncSource (currently, Yahoo) make their requests
+on a pool of keep-alive connections, at most --source-concurrency to each host,
+so that a large number of prices can be fetched without opening a connection
+for each one. The other sources are still called from the worker threads.
+
 About Sources and Data Availability
 -----------------------------------
 
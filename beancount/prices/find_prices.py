@@ -4,12 +4,15 @@ __copyright__ = "Copyright (C) 2015-2016  Martin Blais"
 __license__ = "GNU GPLv2"
 
 import collections
+import datetime
 import logging
 import re
 import sys
 
 from beancount.core import data
 from beancount.core import amount
+from beancount.core import prices
+from beancount.ops import lifetimes
 from beancount.ops import summarize
 from beancount.prices.sources import yahoo as default_source
 
@@ -28,6 +31,17 @@ from beancount.prices.sources import yahoo as default_source
 DatedPrice = collections.namedtuple('DatedPrice', 'base quote date sources')
 
 
+# A price source description for a series of dates, to be fetched as a range.
+#
+# Attributes:
+#   base: A commodity string, the base for the given symbol from the input file.
+#   quote: A commodity string, the quote currency that defines the units of the price.
+#   dates: A sorted list of datetime.date objects, the dates to fetch prices
+#     for. The range fetched spans from the first to the last of them.
+#   sources: A list of PriceSource instances describing where to fetch prices from.
+DatedPriceRange = collections.namedtuple('DatedPriceRange', 'base quote dates sources')
+
+
 # A price source.
 #
 #   module: A Python module, the module to be called to create a price source.
@@ -55,6 +69,27 @@ def format_dated_price_str(dprice):
         ','.join(psstrs))
 
 
+def format_dated_price_range_str(drange):
+    """Convert a dated price range to a one-line printable string.
+
+    Args:
+      drange: A DatedPriceRange instance.
+    Returns:
+      The string for a DatedPriceRange instance.
+    """
+    psstrs = ['{}({}{})'.format(psource.module.__name__,
+                                '1/' if psource.invert else '',
+                                psource.symbol)
+              for psource in drange.sources]
+    base_quote = '{} /{}'.format(drange.base, drange.quote)
+    return '{:<32} @ {}..{} ({:3d} dates) [ {} ]'.format(
+        base_quote,
+        drange.dates[0].isoformat(),
+        drange.dates[-1].isoformat(),
+        len(drange.dates),
+        ','.join(psstrs))
+
+
 def parse_source_map(source_map_spec):
     """Parse a source map specification string.
 
@@ -385,3 +420,93 @@ def get_price_jobs_at_date(entries, date=None, inactive=False, undeclared=False)
 
         jobs.append(DatedPrice(base, quote, date, psources))
     return sorted(jobs)
+
+
+def get_missing_weekly_dates(dates, price_map, base_quote):
+    """Filter a list of weekly dates to those without a recent price.
+
+    A date is considered covered if the price map has a price for the pair
+    within the week ending on it.
+
+    Args:
+      dates: A list of datetime.date instances.
+      price_map: A price map, as built by prices.build_price_map().
+      base_quote: A pair of (base, quote) currency strings.
+    Returns:
+      A list of the datetime.date instances of 'dates' without a price.
+    """
+    missing_dates = []
+    for date in dates:
+        price_date, _ = prices.get_price(price_map, base_quote, date)
+        if price_date is None or date - price_date >= lifetimes.ONE_WEEK:
+            missing_dates.append(date)
+    return missing_dates
+
+
+def split_weekly_ranges(dates):
+    """Split a sorted list of weekly dates into runs of consecutive weeks.
+
+    Args:
+      dates: A sorted list of datetime.date instances.
+    Returns:
+      A list of non-empty lists of datetime.date instances.
+    """
+    ranges = []
+    for date in dates:
+        if ranges and date - ranges[-1][-1] <= lifetimes.ONE_WEEK:
+            ranges[-1].append(date)
+        else:
+            ranges.append([date])
+    return ranges
+
+
+def get_price_jobs_backfill(entries, date_last=None, undeclared=False, store=None):
+    """Get a list of ranges of weekly prices missing from a stream of entries.
+
+    The weekly dates at which prices are required are computed from the
+    lifetimes of the commodities held at cost (see
+    ops.lifetimes.required_weekly_prices()). The dates for which the entries
+    already have a price are removed, and the remaining ones are grouped into
+    ranges of consecutive weeks for each commodity, so that each range can be
+    fetched with a single request.
+
+    Args:
+      entries: A list of directives.
+      date_last: A datetime.date instance, the last date to fetch prices for.
+        If not specified, today is used.
+      undeclared: A boolean, true if we should include commodities without a
+        Commodity directive with a price source, using the default source.
+      store: An optional price_store.PriceStore instance, whose prices are
+        considered in addition to those of the entries.
+    Returns:
+      A list of DatedPriceRange instances.
+    """
+    if date_last is None:
+        date_last = datetime.date.today()
+
+    declared_triples = find_currencies_declared(entries)
+    currency_map = {(base, quote): psources
+                    for base, quote, psources in declared_triples}
+
+    # Group the required dates by commodity.
+    lifetimes_map = lifetimes.get_commodity_lifetimes(entries)
+    required_dates = collections.defaultdict(list)
+    for date, base, quote in lifetimes.required_weekly_prices(lifetimes_map,
+                                                              date_last):
+        required_dates[(base, quote)].append(date)
+
+    price_map = prices.build_price_map(entries, store)
+    jobs = []
+    for base_quote, dates in sorted(required_dates.items()):
+        psources = currency_map.get(base_quote, None)
+        if not psources:
+            if not undeclared:
+                continue
+            psources = [PriceSource(default_source, base_quote[0], False)]
+
+        missing_dates = get_missing_weekly_dates(sorted(set(dates)), price_map,
+                                                 base_quote)
+        base, quote = base_quote
+        for range_dates in split_weekly_ranges(missing_dates):
+            jobs.append(DatedPriceRange(base, quote, range_dates, psources))
+    return jobs
@@ -316,3 +316,53 @@ class TestFilters(unittest.TestCase):
         jobs = find_prices.get_price_jobs_at_date(entries, None, False, True)
         self.assertEqual({('QQQ', 'USD'), ('VEA', 'USD')},
                          {(job.base, job.quote) for job in jobs})
+
+
+class TestBackfill(unittest.TestCase):
+
+    def test_split_weekly_ranges(self):
+        dates = [datetime.date(2014, 2, 7) + datetime.timedelta(days=7 * week)
+                 for week in (0, 1, 3, 4, 5, 8)]
+        self.assertEqual([dates[0:2], dates[2:5], dates[5:6]],
+                         find_prices.split_weekly_ranges(dates))
+        self.assertEqual([], find_prices.split_weekly_ranges([]))
+
+    @loader.load_doc()
+    def test_get_price_jobs_backfill(self, entries, _, __):
+        """
+        2000-01-10 open Assets:US:Invest:QQQ
+        2000-01-10 open Assets:US:Invest:VEA
+        2000-01-10 open Assets:US:Invest:Margin
+
+        2014-01-01 commodity QQQ
+          price: "USD:google/NASDAQ:QQQ"
+
+        2014-02-06 *
+          Assets:US:Invest:QQQ             100 QQQ {86.23 USD}
+          Assets:US:Invest:VEA             200 VEA {43.22 USD}
+          Assets:US:Invest:Margin
+
+        2014-02-20 price QQQ  87.10 USD
+
+        2014-03-20 *
+          Assets:US:Invest:QQQ            -100 QQQ {86.23 USD} @ 91.23 USD
+          Assets:US:Invest:Margin
+        """
+        date_last = datetime.date(2014, 3, 28)
+        jobs = find_prices.get_price_jobs_backfill(entries, date_last, False)
+        fridays = [datetime.date(2014, 2, 7) + datetime.timedelta(days=7 * week)
+                   for week in range(6)]
+        self.assertEqual([
+            find_prices.DatedPriceRange('QQQ', 'USD', fridays[0:2],
+                                        [PS(google, 'NASDAQ:QQQ', False)]),
+            find_prices.DatedPriceRange('QQQ', 'USD', fridays[3:6],
+                                        [PS(google, 'NASDAQ:QQQ', False)]),
+        ], jobs)
+
+        jobs = find_prices.get_price_jobs_backfill(entries, date_last, True)
+        self.assertEqual(3, len(jobs))
+        self.assertEqual(find_prices.DatedPriceRange(
+            'VEA', 'USD', fridays + [datetime.date(2014, 3, 21)],
+            [PS(yahoo, 'VEA', False)]), jobs[2])
+        self.assertRegex(find_prices.format_dated_price_range_str(jobs[2]),
+                         r'VEA /USD +@ 2014-02-07\.\.2014-03-21 \(  7 dates\)')
@@ -3,8 +3,10 @@
 __copyright__ = "Copyright (C) 2015-2017  Martin Blais"
 __license__ = "GNU GPLv2"
 
+import bisect
 import datetime
 import functools
+import itertools
 from os import path
 import shelve
 import tempfile
@@ -12,16 +14,20 @@ import hashlib
 import os
 import sys
 import argparse
+import asyncio
 import logging
-from concurrent import futures
+import threading
 
 from beancount.core.number import ONE
 import beancount.prices
 from beancount import loader
 from beancount.core import data
 from beancount.core import amount
+from beancount.core import price_store
 from beancount.parser import printer
 from beancount.prices import find_prices
+from beancount.prices import scheduler
+from beancount.utils import async_http
 from beancount.utils import date_utils
 
 
@@ -35,13 +41,99 @@ _CACHE = None
 # Expiration for latest prices in the cache.
 DEFAULT_EXPIRATION = datetime.timedelta(seconds=30*60)  # 30 mins.
 
+# The number of days to look back for the price of a date, in order to hop over
+# weekends and national holidays. This is the same lookback as the historical
+# queries of the default sources.
+HISTORICAL_LOOKBACK = datetime.timedelta(days=5)
+
 
 def now():
     "Indirection in order to be able to mock it out in the tests."
     return datetime.datetime.now()
 
 
-def fetch_cached_price(source, symbol, date):
+def call_source(scheduler, method, *args):
+    """Call a method of a source, through the scheduler if there is one.
+
+    Args:
+      scheduler: A Scheduler instance, or None.
+      method: A bound method of a Source instance.
+      *args: The arguments to the method.
+    Returns:
+      The return value of the method.
+    """
+    if scheduler is None:
+        return method(*args)
+    return scheduler.call(method, *args)
+
+
+async def call_source_async(scheduler, method, *args):
+    """Call a coroutine method of a source, through the scheduler if there is one.
+
+    Args:
+      scheduler: A Scheduler instance, or None.
+      method: A bound coroutine method of an AsyncSource instance.
+      *args: The arguments to the method.
+    Returns:
+      The return value of the method.
+    """
+    if scheduler is None:
+        return await method(*args)
+    return await scheduler.call_async(method, *args)
+
+
+def cache_key(source, *args):
+    """Compute the key of the result of a request to a source in the cache.
+
+    The key depends on the module of the source and not its class, so that the
+    results of the Source and AsyncSource implementations of a module are
+    shared.
+
+    Args:
+      source: A Source or AsyncSource instance.
+      *args: The arguments of the request.
+    Returns:
+      A string, the key.
+    """
+    md5 = hashlib.md5()
+    md5.update(str((type(source).__module__,) + args).encode('utf-8'))
+    return md5.hexdigest()
+
+
+class ThreadSafeCache:
+    """A price cache which may be accessed from the fetching threads.
+
+    This wraps a shelve object, whose accesses are serialized with a lock.
+
+    Attributes:
+      shelf: A shelve.Shelf instance.
+      expiration: A datetime.timedelta instance, the expiration of the cached
+        latest prices.
+    """
+
+    def __init__(self, shelf, expiration):
+        self.shelf = shelf
+        self.expiration = expiration
+        self.lock = threading.Lock()
+
+    def __getitem__(self, key):
+        with self.lock:
+            return self.shelf[key]
+
+    def __setitem__(self, key, value):
+        with self.lock:
+            self.shelf[key] = value
+
+    def __len__(self):
+        with self.lock:
+            return len(self.shelf)
+
+    def close(self):
+        with self.lock:
+            self.shelf.close()
+
+
+def fetch_cached_price(source, symbol, date, scheduler=None):
     """Call Source to fetch a price, but look and/or update the cache first.
 
     This function entirely deals with caching and correct expiration. It keeps
@@ -52,42 +144,170 @@ def fetch_cached_price(source, symbol, date):
       source: A Python module object.
       symbol: A string, the ticker to fetch.
       date: A datetime.date instance, None if we're to fetch the latest date.
+      scheduler: A Scheduler instance to make the calls to the source through,
+        or None.
     Returns:
       A SourcePrice instance.
     """
     time_now = now()
     if _CACHE is None:
         # The cache is disabled; just call and return.
-        result = (source.get_latest_price(symbol)
+        result = (call_source(scheduler, source.get_latest_price, symbol)
                   if date is None else
-                  source.get_historical_price(symbol, date))
+                  call_source(scheduler, source.get_historical_price, symbol, date))
     elif date is None or date >= time_now.date():
         # The cache is enabled and we have to compute the current/latest price.
         # Fetch from the cache but miss if the price is too old.
-        md5 = hashlib.md5()
-        md5.update(str((type(source).__module__, symbol)).encode('utf-8'))
-        key = md5.hexdigest()
+        key = cache_key(source, symbol)
         try:
             time_created, result = _CACHE[key]
             if (time_now - time_created) > _CACHE.expiration:
                 raise KeyError
         except KeyError:
-            result = source.get_latest_price(symbol)
-            _CACHE[key] = (time_now, result)
+            result = call_source(scheduler, source.get_latest_price, symbol)
+            # Don't cache failures, e.g. when the scheduler gives up retrying,
+            # so that they are retried on the next run.
+            if result is not None:
+                _CACHE[key] = (time_now, result)
     else:
         # The cache is enabled and we are asked to provide an old price. Assume
         # it doesn't change and return the cached value if at all available.
-        md5 = hashlib.md5()
-        md5.update(str((type(source).__module__, symbol, date)).encode('utf-8'))
-        key = md5.hexdigest()
+        key = cache_key(source, symbol, date)
         try:
             _, result = _CACHE[key]
         except KeyError:
-            result = source.get_historical_price(symbol, date)
+            result = call_source(scheduler, source.get_historical_price, symbol, date)
+            if result is not None:
+                _CACHE[key] = (None, result)
+    return result
+
+
+async def fetch_cached_price_async(source, symbol, date, scheduler=None):
+    """Call an AsyncSource to fetch a price, but look and/or update the cache first.
+
+    This is the asynchronous version of fetch_cached_price(), with the same
+    caching and expiration, and sharing the same cache entries.
+
+    Args:
+      source: An AsyncSource instance.
+      symbol: A string, the ticker to fetch.
+      date: A datetime.date instance, None if we're to fetch the latest date.
+      scheduler: A Scheduler instance to make the calls to the source through,
+        or None.
+    Returns:
+      A SourcePrice instance.
+    """
+    time_now = now()
+    latest = date is None or date >= time_now.date()
+    if _CACHE is None:
+        return await (call_source_async(scheduler, source.get_latest_price, symbol)
+                      if date is None else
+                      call_source_async(scheduler, source.get_historical_price,
+                                        symbol, date))
+
+    key = cache_key(source, symbol) if latest else cache_key(source, symbol, date)
+    try:
+        time_created, result = _CACHE[key]
+        if latest and (time_now - time_created) > _CACHE.expiration:
+            raise KeyError
+    except KeyError:
+        if latest:
+            result = await call_source_async(scheduler, source.get_latest_price, symbol)
+        else:
+            result = await call_source_async(scheduler, source.get_historical_price,
+                                             symbol, date)
+        if result is not None:
+            _CACHE[key] = (time_now if latest else None, result)
+    return result
+
+
+def fetch_cached_prices_series(source, symbol, date_begin, date_end, scheduler=None):
+    """Call Source to fetch a range of prices, but look and/or update the cache first.
+
+    Like historical prices, ranges which end before today are assumed not to
+    change and are cached indefinitely. Ranges which include today are always
+    fetched.
+
+    Args:
+      source: A Python module object, which implements get_prices_series().
+      symbol: A string, the ticker to fetch.
+      date_begin: A datetime.date instance, the first date of the range.
+      date_end: A datetime.date instance, the last date of the range.
+      scheduler: A Scheduler instance, or None.
+    Returns:
+      A list of SourcePrice instances, or None.
+    """
+    if _CACHE is None or date_end >= now().date():
+        return call_source(scheduler, source.get_prices_series,
+                           symbol, date_begin, date_end)
+
+    key = cache_key(source, symbol, date_begin, date_end)
+    try:
+        _, result = _CACHE[key]
+    except KeyError:
+        result = call_source(scheduler, source.get_prices_series,
+                             symbol, date_begin, date_end)
+        if result is not None:
             _CACHE[key] = (None, result)
     return result
 
 
+def select_series_prices(series, dates):
+    """Select the prices of a list of dates from a series of prices.
+
+    For each date, the latest price at or before it is selected, as
+    get_historical_price() would return it, provided that it is no older than
+    HISTORICAL_LOOKBACK. A price selected for consecutive dates is only included
+    once.
+
+    Args:
+      series: A list of SourcePrice instances, sorted by time.
+      dates: A sorted list of datetime.date instances.
+    Returns:
+      A list of SourcePrice instances.
+    """
+    series_dates = [srcprice.time.date() for srcprice in series]
+    selected = []
+    for date in dates:
+        index = bisect.bisect_right(series_dates, date)
+        if index == 0 or date - series_dates[index - 1] > HISTORICAL_LOOKBACK:
+            continue
+        srcprice = series[index - 1]
+        if not selected or selected[-1].time != srcprice.time:
+            selected.append(srcprice)
+    return selected
+
+
+def fetch_prices_series(source, symbol, dates, scheduler=None):
+    """Fetch the prices of a symbol at a list of dates.
+
+    If the source implements get_prices_series(), the range spanning all the
+    dates is fetched in a single request. Otherwise, we fall back to fetching
+    the price of each date separately.
+
+    Args:
+      source: A Python module object.
+      symbol: A string, the ticker to fetch.
+      dates: A sorted, non-empty list of datetime.date instances.
+      scheduler: A Scheduler instance, or None.
+    Returns:
+      A list of SourcePrice instances, empty if none could be fetched.
+    """
+    if hasattr(source, 'get_prices_series'):
+        series = fetch_cached_prices_series(source, symbol,
+                                            dates[0] - HISTORICAL_LOOKBACK, dates[-1],
+                                            scheduler)
+        return select_series_prices(series, dates) if series else []
+
+    srcprices = []
+    for date in dates:
+        srcprice = fetch_cached_price(source, symbol, date, scheduler)
+        if srcprice is not None and (not srcprices or
+                                     srcprices[-1].time != srcprice.time):
+            srcprices.append(srcprice)
+    return srcprices
+
+
 def setup_cache(cache_filename, clear_cache):
     """Setup the results cache.
 
@@ -104,8 +324,7 @@ def setup_cache(cache_filename, clear_cache):
             cache_filename))
 
         global _CACHE
-        _CACHE = shelve.open(cache_filename, 'c')
-        _CACHE.expiration = DEFAULT_EXPIRATION
+        _CACHE = ThreadSafeCache(shelve.open(cache_filename, 'c'), DEFAULT_EXPIRATION)
 
 
 def reset_cache():
@@ -116,20 +335,60 @@ def reset_cache():
     _CACHE = None
 
 
-def fetch_price(dprice, swap_inverted=False):
+def fetch_price(dprice, swap_inverted=False, scheduler=None):
     """Fetch a price for the DatePrice job.
 
     Args:
       dprice: A DatedPrice instances.
       swap_inverted: A boolean, true if we should invert currencies instead of
         rate for an inverted price source.
+      scheduler: A Scheduler instance, or None.
     Returns:
       A Price entry corresponding to the output of the jobs processed.
 
     """
     for psource in dprice.sources:
         source = psource.module.Source()
-        srcprice = fetch_cached_price(source, psource.symbol, dprice.date)
+        srcprice = fetch_cached_price(source, psource.symbol, dprice.date, scheduler)
+        if srcprice is not None:
+            break
+    else:
+        if dprice.sources:
+            logging.error("Could not fetch for job: %s", dprice)
+        return None
+
+    return create_price_entry(dprice.base, dprice.quote, psource, srcprice,
+                              swap_inverted)
+
+
+async def fetch_price_async(dprice, client, swap_inverted=False, scheduler=None):
+    """Fetch a price for the DatePrice job, on an event loop.
+
+    The sources whose module provides an AsyncSource make their requests on the
+    given connection pool; the others are called on the pool of workers of the
+    loop.
+
+    Args:
+      dprice: A DatedPrice instances.
+      client: An async_http.ConnectionPool instance.
+      swap_inverted: A boolean, true if we should invert currencies instead of
+        rate for an inverted price source.
+      scheduler: A Scheduler instance, or None.
+    Returns:
+      A Price entry corresponding to the output of the jobs processed.
+    """
+    loop = asyncio.get_event_loop()
+    for psource in dprice.sources:
+        async_source_class = getattr(psource.module, 'AsyncSource', None)
+        if async_source_class is not None:
+            srcprice = await fetch_cached_price_async(async_source_class(client),
+                                                      psource.symbol, dprice.date,
+                                                      scheduler)
+        else:
+            srcprice = await loop.run_in_executor(None, fetch_cached_price,
+                                                  psource.module.Source(),
+                                                  psource.symbol, dprice.date,
+                                                  scheduler)
         if srcprice is not None:
             break
     else:
@@ -137,8 +396,51 @@ def fetch_price(dprice, swap_inverted=False):
             logging.error("Could not fetch for job: %s", dprice)
         return None
 
-    base = dprice.base
-    quote = dprice.quote or srcprice.quote_currency
+    return create_price_entry(dprice.base, dprice.quote, psource, srcprice,
+                              swap_inverted)
+
+
+def fetch_price_range(drange, swap_inverted=False, scheduler=None):
+    """Fetch the prices for the DatedPriceRange job.
+
+    Args:
+      drange: A DatedPriceRange instance.
+      swap_inverted: A boolean, true if we should invert currencies instead of
+        rate for an inverted price source.
+      scheduler: A Scheduler instance, or None.
+    Returns:
+      A list of Price entries for the dates of the job.
+    """
+    for psource in drange.sources:
+        source = psource.module.Source()
+        srcprices = fetch_prices_series(source, psource.symbol, drange.dates, scheduler)
+        if srcprices:
+            break
+    else:
+        if drange.sources:
+            logging.error("Could not fetch for job: %s",
+                          find_prices.format_dated_price_range_str(drange))
+        return []
+
+    return [create_price_entry(drange.base, drange.quote, psource, srcprice,
+                               swap_inverted)
+            for srcprice in srcprices]
+
+
+def create_price_entry(base, quote, psource, srcprice, swap_inverted):
+    """Create a Price entry from a price fetched from a source.
+
+    Args:
+      base: A commodity string, the base currency of the job.
+      quote: A commodity string, the quote currency of the job, or None.
+      psource: The PriceSource instance the price was fetched from.
+      srcprice: A SourcePrice instance.
+      swap_inverted: A boolean, true if we should invert currencies instead of
+        rate for an inverted price source.
+    Returns:
+      A Price entry.
+    """
+    quote = quote or srcprice.quote_currency
     price = srcprice.price
 
     # Invert the rate if requested.
@@ -149,7 +451,7 @@ def fetch_price(dprice, swap_inverted=False):
             price = ONE/price
 
     assert base is not None
-    fileloc = data.new_metadata('<{}>'.format(type(psource.module).__name__), 0)
+    fileloc = data.new_metadata('<{}>'.format(psource.module.__name__), 0)
     return data.Price(fileloc, srcprice.time.date(), base,
                       amount.Amount(price, quote or UNKNOWN_CURRENCY))
 
@@ -239,6 +541,12 @@ def process_args():
         "results in 1.25, by default we would output \"price CAD  0.8000 USD\". "
         "Using this option we would instead output \" price USD   1.2500 CAD\"."))
 
+    parser.add_argument('-b', '--backfill', action='store_true', help=(
+        "Fetch the weekly prices missing from the input files over the periods "
+        "where each commodity was held at cost, up to --date or today. Each "
+        "range of consecutive missing weeks is fetched in a single request "
+        "from the sources which support it."))
+
     parser.add_argument('-n', '--dry-run', action='store_true', help=(
         "Don't actually fetch the prices, just print the list of the ones to be fetched."))
 
@@ -256,6 +564,33 @@ def process_args():
     cache_group.add_argument('--clear-cache', action='store_true',
                              help="Clear the cache prior to startup")
 
+    parser.add_argument('--store', action='store', help=(
+        "The filename of a price database to insert the fetched prices into. "
+        "It is created if it does not exist. With --backfill, the prices "
+        "already in the database are not fetched again."))
+
+    # Scheduling options.
+    fetch_group = parser.add_argument_group('fetching')
+    fetch_group.add_argument('-j', '--workers', action='store', type=int, default=3,
+                             help="Number of price fetching jobs to run simultaneously.")
+    fetch_group.add_argument('--async', dest='use_async', action='store_true', help=(
+        "Run all the jobs concurrently on a single thread, with asynchronous "
+        "requests over reused connections, for the sources which support it. "
+        "The other sources are still called from --workers threads."))
+    fetch_group.add_argument('--source-concurrency', action='store', type=int,
+                             default=2, help=(
+        "Maximum number of simultaneous requests made to each source."))
+    fetch_group.add_argument('--source-rate', action='store', type=float, help=(
+        "Maximum number of requests per second made to each source. "
+        "By default, the rate is not limited."))
+    fetch_group.add_argument('--retries', action='store', type=int, default=3,
+                             help=("Maximum number of attempts of requests which "
+                                   "fail with a network error."))
+    fetch_group.add_argument('--retry-backoff', action='store', type=float,
+                             default=1., help=(
+        "Delay before the first retry of a request, in seconds; this doubles "
+        "with every subsequent retry."))
+
     args = parser.parse_args()
 
     verbose_levels = {None: logging.WARN,
@@ -275,7 +610,12 @@ def process_args():
     logging.info("Processing at date: %s", args.date or datetime.date.today())
     jobs = []
     all_entries = []
+    if args.backfill and args.use_async:
+        parser.error('--async is not supported with --backfill')
     if args.expressions:
+        if args.backfill:
+            parser.error('--backfill requires input filenames')
+
         # Interpret the arguments as price sources.
         for source_str in args.sources:
             psources = []
@@ -300,9 +640,17 @@ def process_args():
                 continue
             logging.info('Loading "%s"', filename)
             entries, errors, options_map = loader.load_file(filename, log_errors=sys.stderr)
-            jobs.extend(
-                find_prices.get_price_jobs_at_date(
-                    entries, args.date, args.inactive, args.undeclared))
+            if args.backfill:
+                store = price_store.PriceStore(args.store) if args.store else None
+                jobs.extend(
+                    find_prices.get_price_jobs_backfill(
+                        entries, args.date, args.undeclared, store))
+                if store is not None:
+                    store.close()
+            else:
+                jobs.extend(
+                    find_prices.get_price_jobs_at_date(
+                        entries, args.date, args.inactive, args.undeclared))
             all_entries.extend(entries)
 
     return args, jobs, data.sorted(all_entries)
@@ -314,13 +662,36 @@ def main():
     # If we're just being asked to list the jobs, do this here.
     if args.dry_run:
         for dprice in jobs:
-            print(find_prices.format_dated_price_str(dprice))
+            print(find_prices.format_dated_price_range_str(dprice)
+                  if args.backfill else
+                  find_prices.format_dated_price_str(dprice))
         return
 
     # Fetch all the required prices, processing all the jobs.
-    executor = futures.ThreadPoolExecutor(max_workers=3)
-    price_entries = filter(None, executor.map(
-        functools.partial(fetch_price, swap_inverted=args.swap_inverted), jobs))
+    price_scheduler = scheduler.Scheduler(args.workers,
+                                          args.source_concurrency,
+                                          args.source_rate,
+                                          args.retries,
+                                          args.retry_backoff)
+    if args.backfill:
+        price_entries = itertools.chain.from_iterable(price_scheduler.map(
+            functools.partial(fetch_price_range, swap_inverted=args.swap_inverted,
+                              scheduler=price_scheduler),
+            jobs))
+    elif args.use_async:
+        client = async_http.ConnectionPool(args.source_concurrency)
+        price_entries = filter(None, price_scheduler.run_async(
+            functools.partial(fetch_price_async, client=client,
+                              swap_inverted=args.swap_inverted,
+                              scheduler=price_scheduler),
+            jobs, client.close))
+    else:
+        price_entries = filter(None, price_scheduler.map(
+            functools.partial(fetch_price, swap_inverted=args.swap_inverted,
+                              scheduler=price_scheduler),
+            jobs))
+    logging.info("Requests made to the price sources:\n%s",
+                 price_scheduler.format_stats())
 
     # Sort them by currency, regardless of date (the dates should be close
     # anyhow, and we tend to put them in chunks in the input files anyhow).
@@ -332,5 +703,11 @@ def main():
         for entry in ignored_entries:
             logging.info("Ignored to avoid clobber: %s %s", entry.date, entry.currency)
 
+    # Save the entries to the price database.
+    if args.store:
+        with price_store.PriceStore(args.store) as store:
+            num_prices = store.add_prices(price_entries)
+        logging.info("Inserted %d prices into %s", num_prices, args.store)
+
     # Print out the entries.
     printer.print_entries(price_entries)
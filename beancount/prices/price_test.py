@@ -3,7 +3,10 @@
 __copyright__ = "Copyright (C) 2015-2017  Martin Blais"
 __license__ = "GNU GPLv2"
 
+import asyncio
 import datetime
+import functools
+import types
 import unittest
 import shutil
 import tempfile
@@ -13,9 +16,12 @@ from unittest import mock
 
 from beancount.prices import price
 from beancount.prices import find_prices
+from beancount.prices import scheduler
 from beancount.prices import source
 from beancount.prices.sources import google
+from beancount.prices.sources import yahoo
 from beancount.core.number import D
+from beancount.utils import async_http
 from beancount.utils import test_utils
 from beancount.parser import cmptest
 from beancount import loader
@@ -150,6 +156,39 @@ class TestCache(unittest.TestCase):
             if path.exists(tmpdir):
                 shutil.rmtree(tmpdir)
 
+    def test_fetch_cached_price__failure(self):
+        tmpdir = tempfile.mkdtemp()
+        tmpfile = path.join(tmpdir, 'prices.cache')
+        try:
+            price.setup_cache(tmpfile, False)
+
+            class FailingSource:
+                __file__ = '<module>'
+                def __init__(self):
+                    self.calls = 0
+                def get_historical_price(self, ticker, date):
+                    self.calls += 1
+                    raise IOError("Network is unreachable")
+
+            # The scheduler gives up on the source; the failure isn't cached.
+            day = datetime.date(2006, 1, 2)
+            source = FailingSource()
+            price_scheduler = scheduler.Scheduler(max_retry=2, sleep=lambda _: None)
+            with test_utils.capture('stderr'):
+                self.assertIsNone(price.fetch_cached_price(source, 'HOOL', day,
+                                                           price_scheduler))
+                self.assertEqual(2, source.calls)
+                self.assertEqual(0, len(price._CACHE))
+
+                # The price is fetched again on the next run.
+                self.assertIsNone(price.fetch_cached_price(source, 'HOOL', day,
+                                                           price_scheduler))
+                self.assertEqual(4, source.calls)
+        finally:
+            price.reset_cache()
+            if path.exists(tmpdir):
+                shutil.rmtree(tmpdir)
+
 
 class TestProcessArguments(unittest.TestCase):
 
@@ -269,3 +308,197 @@ class TestInverted(cmptest.TestCase):
             find_prices.PriceSource(google, 'CURRENCY:USDJPY', True)]), True)
         self.assertEqual(('USD', 'JPY'), (entry.currency, entry.amount.currency))
         self.assertEqual(D('125.00'), entry.amount.number)
+
+
+class FakeSeriesSource(source.Source):
+    "A fake source with daily prices on weekdays, which fetches ranges."
+
+    calls = []
+
+    def get_historical_price(self, ticker, date):
+        raise AssertionError("Per-date method called")
+
+    def get_prices_series(self, ticker, date_begin, date_end):
+        self.calls.append((ticker, date_begin, date_end))
+        series = []
+        date = date_begin
+        while date <= date_end:
+            if date.weekday() < 5:
+                series.append(source.SourcePrice(
+                    D(date.day), datetime.datetime.combine(date, datetime.time()),
+                    'USD'))
+            date += datetime.timedelta(days=1)
+        return series
+
+
+class FakeDateSource:
+    "A fake source which only fetches prices one date at a time."
+
+    calls = []
+
+    def get_historical_price(self, ticker, date):
+        self.calls.append((ticker, date))
+        return source.SourcePrice(
+            D(date.day), datetime.datetime.combine(date, datetime.time()), 'USD')
+
+
+class TestFetchPriceRange(unittest.TestCase):
+
+    def setUp(self):
+        FakeSeriesSource.calls = []
+        FakeDateSource.calls = []
+        self.dates = [datetime.date(2015, 11, 6) + datetime.timedelta(days=7 * week)
+                      for week in range(4)]
+        mock.patch('beancount.prices.price._CACHE', None).start()
+        self.addCleanup(mock.patch.stopall)
+
+    def fetch(self, *source_classes, price_scheduler=None):
+        psources = [
+            find_prices.PriceSource(types.SimpleNamespace(Source=source_class,
+                                                          __name__='fake'),
+                                    'HOOL', False)
+            for source_class in source_classes]
+        drange = find_prices.DatedPriceRange('HOOL', None, self.dates, psources)
+        return price.fetch_price_range(drange, scheduler=price_scheduler)
+
+    def test_fetch_price_range__series(self):
+        entries = self.fetch(FakeSeriesSource)
+        self.assertEqual([('HOOL', datetime.date(2015, 11, 1), datetime.date(2015, 11, 27))],
+                         FakeSeriesSource.calls)
+        self.assertEqual(self.dates, [entry.date for entry in entries])
+        self.assertEqual([D(date.day) for date in self.dates],
+                         [entry.amount.number for entry in entries])
+        self.assertEqual({('HOOL', 'USD')},
+                         {(entry.currency, entry.amount.currency) for entry in entries})
+
+    def test_fetch_price_range__per_date(self):
+        entries = self.fetch(FakeDateSource)
+        self.assertEqual([('HOOL', date) for date in self.dates], FakeDateSource.calls)
+        self.assertEqual(self.dates, [entry.date for entry in entries])
+
+    def test_fetch_price_range__fallback_source(self):
+        with mock.patch.object(FakeSeriesSource, 'get_prices_series', return_value=None):
+            entries = self.fetch(FakeSeriesSource, FakeDateSource)
+        self.assertEqual(4, len(FakeDateSource.calls))
+        self.assertEqual(self.dates, [entry.date for entry in entries])
+
+    def test_fetch_price_range__scheduler(self):
+        price_scheduler = scheduler.Scheduler()
+        self.fetch(FakeSeriesSource, price_scheduler=price_scheduler)
+        self.fetch(FakeDateSource, price_scheduler=price_scheduler)
+        self.assertEqual({__name__: 5},
+                         {name: stats.requests
+                          for name, stats in price_scheduler.stats.items()})
+
+    def test_select_series_prices(self):
+        def srcprice(day):
+            return source.SourcePrice(D(day), datetime.datetime(2015, 11, day), 'USD')
+        series = [srcprice(2), srcprice(3), srcprice(11)]
+        dates = [datetime.date(2015, 11, day) for day in (1, 6, 7, 9, 13)]
+        # Nov 1 has no earlier price, Nov 9 is more than 5 days after Nov 3,
+        # and the price of Nov 3 is only selected once.
+        self.assertEqual([srcprice(3), srcprice(11)],
+                         price.select_series_prices(series, dates))
+
+
+def run_coroutine(coroutine):
+    """Run a coroutine to completion on a new event loop."""
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coroutine)
+    finally:
+        loop.close()
+
+
+class FakeAsyncSource(source.AsyncSource):
+    "A fake asynchronous source which fails for the tickers starting with 'X'."
+
+    calls = []
+
+    async def get_historical_price(self, ticker, date):
+        self.calls.append((ticker, date))
+        if ticker.startswith('X'):
+            return None
+        return source.SourcePrice(
+            D(date.day), datetime.datetime.combine(date, datetime.time()), 'USD')
+
+
+class TestFetchPriceAsync(unittest.TestCase):
+
+    def setUp(self):
+        FakeAsyncSource.calls = []
+        FakeDateSource.calls = []
+        self.date = datetime.date(2015, 11, 6)
+
+    def fetch(self, dprices):
+        price_scheduler = scheduler.Scheduler()
+        return price_scheduler.run_async(
+            functools.partial(price.fetch_price_async, client=None,
+                              scheduler=price_scheduler),
+            dprices)
+
+    def dated_price(self, base, *modules):
+        psources = [find_prices.PriceSource(module, base, False) for module in modules]
+        return find_prices.DatedPrice(base, 'USD', self.date, psources)
+
+    def test_fetch_price_async(self):
+        async_module = types.SimpleNamespace(Source=None, AsyncSource=FakeAsyncSource,
+                                             __name__='fake_async')
+        sync_module = types.SimpleNamespace(Source=FakeDateSource, __name__='fake')
+        with mock.patch('beancount.prices.price._CACHE', None):
+            entries = self.fetch([self.dated_price('HOOL', async_module, sync_module),
+                                  self.dated_price('XOOL', async_module, sync_module),
+                                  self.dated_price('XOOL', async_module)])
+        self.assertEqual([('HOOL', self.date), ('XOOL', self.date), ('XOOL', self.date)],
+                         FakeAsyncSource.calls)
+        self.assertEqual([('XOOL', self.date)], FakeDateSource.calls)
+        self.assertEqual(['<fake_async>', '<fake>'],
+                         [entry.meta['filename'] for entry in entries[:2]])
+        self.assertEqual([D('6'), D('6')], [entry.amount.number for entry in entries[:2]])
+        self.assertIsNone(entries[2])
+
+    def test_fetch_cached_price_async(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            price.setup_cache(path.join(tmpdir, 'prices.cache'), False)
+            try:
+                async_source = FakeAsyncSource(None)
+                srcprice = run_coroutine(
+                    price.fetch_cached_price_async(async_source, 'HOOL', self.date))
+                self.assertEqual(D('6'), srcprice.price)
+                self.assertEqual(1, len(FakeAsyncSource.calls))
+
+                # The cached price is shared with the Source of the same module.
+                sync_source = FakeDateSource()
+                with mock.patch.object(FakeDateSource, '__module__',
+                                       FakeAsyncSource.__module__):
+                    self.assertEqual(srcprice, price.fetch_cached_price(
+                        sync_source, 'HOOL', self.date))
+                self.assertEqual([], FakeDateSource.calls)
+            finally:
+                price.reset_cache()
+
+    def test_fetch_price_async__yahoo(self):
+        # Fetch the prices of a thousand tickers from a server replaying the
+        # responses of Yahoo.
+        tickers = ['T{}'.format(index) for index in range(1000)]
+        server = test_utils.ReplayHTTPServer({
+            yahoo.get_prices_series_url(ticker, self.date - datetime.timedelta(days=5),
+                                        self.date)[len('http://ichart.yahoo.com'):]: (
+                "Date,Open,High,Low,Close,Volume,Adj Close\n"
+                "2015-11-05,1.00,1.00,1.00,1.00,100,{0}.00\n"
+                "2015-11-06,1.00,1.00,1.00,1.00,100,{0}.50\n").format(index).encode()
+            for index, ticker in enumerate(tickers)})
+        with server, mock.patch('beancount.prices.price._CACHE', None):
+            client = async_http.ConnectionPool(max_connections=4, hosts={
+                ('ichart.yahoo.com', 80): server.address})
+            price_scheduler = scheduler.Scheduler(source_concurrency=4)
+            entries = price_scheduler.run_async(
+                functools.partial(price.fetch_price_async, client=client,
+                                  scheduler=price_scheduler),
+                [self.dated_price(ticker, yahoo) for ticker in tickers],
+                client.close)
+        self.assertEqual([D('{}.50'.format(index)) for index in range(1000)],
+                         [entry.amount.number for entry in entries])
+        self.assertEqual(tickers, [entry.currency for entry in entries])
+        self.assertEqual(1000, len(server.requests))
+        self.assertLessEqual(server.num_connections, 4)
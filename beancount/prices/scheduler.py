@@ -0,0 +1,291 @@
+"""Scheduling of the requests made to price sources.
+
+The Scheduler runs the price fetching jobs on a pool of worker threads, and all
+the calls made to the sources go through it. It limits the number of
+simultaneous requests to each source and the rate at which they are made,
+retries requests which fail with a network error, with the same exponential
+backoff as net_utils.retrying_urlopen(), and keeps statistics about the requests
+made to each source.
+
+The scheduler can also run the jobs as coroutines on an asyncio event loop
+instead, for sources which implement the AsyncSource interface, with the same
+limits, retries and statistics. Since the jobs then wait on the network without
+occupying a thread, thousands of them can be in progress at once.
+"""
+__copyright__ = "Copyright (C) 2015-2017  Martin Blais"
+__license__ = "GNU GPLv2"
+
+import asyncio
+import http.client
+import io
+import logging
+import threading
+import time
+from concurrent import futures
+
+from beancount.utils import net_utils
+
+
+# The exceptions that cause a request to a source to be retried.
+RETRY_EXCEPTIONS = (OSError, http.client.HTTPException)
+
+# The exceptions that cause a request to an asynchronous source to be retried.
+ASYNC_RETRY_EXCEPTIONS = RETRY_EXCEPTIONS + (asyncio.TimeoutError,
+                                             asyncio.IncompleteReadError)
+
+
+class RateLimiter:
+    """A limit on the rate at which requests are made, shared between threads.
+
+    Requests are spaced evenly, at least 1/rate seconds apart.
+
+    Attributes:
+      rate: A float, the maximum number of requests per second, or None if
+        unlimited.
+    """
+
+    def __init__(self, rate, clock=time.monotonic, sleep=time.sleep):
+        self.rate = rate
+        self.clock = clock
+        self.sleep = sleep
+        self.lock = threading.Lock()
+        self.next_time = None
+
+    def reserve(self):
+        """Reserve the slot of the next request.
+
+        Returns:
+          A float, the number of seconds to wait before making the request.
+        """
+        if not self.rate:
+            return 0
+        with self.lock:
+            time_now = self.clock()
+            if self.next_time is None or self.next_time < time_now:
+                self.next_time = time_now
+            delay = self.next_time - time_now
+            self.next_time += 1. / self.rate
+        return delay
+
+    def acquire(self):
+        """Wait until a request may be made, and reserve its slot."""
+        delay = self.reserve()
+        if delay > 0:
+            self.sleep(delay)
+
+
+class SourceStats:
+    """Statistics about the requests made to a source.
+
+    Attributes:
+      requests: An integer, the number of requests made, including retries.
+      failures: An integer, the number of requests which raised an error.
+      latencies: A list of floats, the duration of each request, in seconds.
+    """
+
+    def __init__(self):
+        self.requests = 0
+        self.failures = 0
+        self.latencies = []
+
+
+class Scheduler:
+    """A scheduler of the requests made to price sources.
+
+    Attributes:
+      max_workers: An integer, the number of jobs processed simultaneously.
+      source_concurrency: An integer, the maximum number of simultaneous
+        requests to each source.
+      source_rate: A float, the maximum number of requests per second made to
+        each source, or None if unlimited.
+      max_retry: An integer, the maximum number of attempts of each request.
+      backoff: A float, the delay before the first retry of a request, in
+        seconds. See net_utils.retry_delays().
+      stats: A dict of source module name to SourceStats instances.
+    """
+
+    def __init__(self, max_workers=3, source_concurrency=2, source_rate=None,
+                 max_retry=3, backoff=1., clock=time.monotonic, sleep=time.sleep):
+        self.max_workers = max_workers
+        self.source_concurrency = source_concurrency
+        self.source_rate = source_rate
+        self.max_retry = max_retry
+        self.backoff = backoff
+        self.clock = clock
+        self.sleep = sleep
+        self.stats = {}
+
+        # A dict of source module name to (semaphore, rate limiter) pairs,
+        # created on the first request to each source. The asynchronous calls
+        # use semaphores of their own, but share the rate limiters.
+        self._limits = {}
+        self._async_semaphores = {}
+        self._lock = threading.Lock()
+
+    def _get_limits(self, name):
+        with self._lock:
+            limits = self._limits.get(name, None)
+            if limits is None:
+                limits = self._limits[name] = (
+                    threading.Semaphore(self.source_concurrency),
+                    RateLimiter(self.source_rate, self.clock, self.sleep))
+                self.stats[name] = SourceStats()
+            return limits
+
+    def call(self, method, *args):
+        """Call a method of a source, within the limits of that source.
+
+        Args:
+          method: A bound method of a Source instance.
+          *args: The arguments to the method.
+        Returns:
+          The return value of the method, or None if every attempt raised one of
+          RETRY_EXCEPTIONS.
+        """
+        name = type(method.__self__).__module__
+        semaphore, rate_limiter = self._get_limits(name)
+        stats = self.stats[name]
+        for delay in net_utils.retry_delays(self.max_retry, self.backoff):
+            if delay:
+                self.sleep(delay)
+            with semaphore:
+                rate_limiter.acquire()
+                time_before = self.clock()
+                try:
+                    result = method(*args)
+                    failed = False
+                except RETRY_EXCEPTIONS as exc:
+                    logging.warning("Error fetching from %s: %s", name, exc)
+                    failed = True
+                latency = self.clock() - time_before
+            with self._lock:
+                stats.requests += 1
+                stats.latencies.append(latency)
+                if failed:
+                    stats.failures += 1
+            if not failed:
+                return result
+        logging.error("Giving up on %s%s after %d attempts", name, args, self.max_retry)
+        return None
+
+    async def call_async(self, method, *args):
+        """Call a coroutine method of a source, within the limits of that source.
+
+        This must be called from the event loop of run_async().
+
+        Args:
+          method: A bound coroutine method of an AsyncSource instance.
+          *args: The arguments to the method.
+        Returns:
+          The return value of the method, or None if every attempt raised one of
+          ASYNC_RETRY_EXCEPTIONS.
+        """
+        name = type(method.__self__).__module__
+        _, rate_limiter = self._get_limits(name)
+        semaphore = self._async_semaphores.get(name, None)
+        if semaphore is None:
+            semaphore = self._async_semaphores[name] = asyncio.Semaphore(
+                self.source_concurrency)
+        stats = self.stats[name]
+        for delay in net_utils.retry_delays(self.max_retry, self.backoff):
+            if delay:
+                await asyncio.sleep(delay)
+            async with semaphore:
+                delay = rate_limiter.reserve()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                time_before = self.clock()
+                try:
+                    result = await method(*args)
+                    failed = False
+                except ASYNC_RETRY_EXCEPTIONS as exc:
+                    logging.warning("Error fetching from %s: %r", name, exc)
+                    failed = True
+                latency = self.clock() - time_before
+            with self._lock:
+                stats.requests += 1
+                stats.latencies.append(latency)
+                if failed:
+                    stats.failures += 1
+            if not failed:
+                return result
+        logging.error("Giving up on %s%s after %d attempts", name, args, self.max_retry)
+        return None
+
+    def run_async(self, function, jobs, cleanup=None):
+        """Process a list of jobs concurrently on a new event loop, logging the progress.
+
+        All the jobs are started at once; the number of requests actually made
+        at any one time is bounded by the limits of each source. Functions
+        which are not coroutines may be run on the pool of workers of the loop,
+        with loop.run_in_executor(None, ...).
+
+        Args:
+          function: A coroutine function to call on each job.
+          jobs: A list of jobs.
+          cleanup: A function to call on the loop once the jobs are done, e.g.
+            to close the connections they used, or None.
+        Returns:
+          A list of the results of the function, in the order of the jobs.
+        """
+        async def run_all():
+            tasks = [asyncio.ensure_future(function(job)) for job in jobs]
+            try:
+                for index, future in enumerate(asyncio.as_completed(tasks), 1):
+                    await future
+                    logging.info("Processed %d/%d jobs", index, len(jobs))
+            finally:
+                if cleanup is not None:
+                    cleanup()
+            return [task.result() for task in tasks]
+
+        # The semaphores of asyncio belong to the loop they are first used in.
+        self._async_semaphores = {}
+        loop = asyncio.new_event_loop()
+        executor = futures.ThreadPoolExecutor(max_workers=self.max_workers)
+        loop.set_default_executor(executor)
+        try:
+            return loop.run_until_complete(run_all())
+        finally:
+            loop.close()
+            executor.shutdown()
+
+    def map(self, function, jobs):
+        """Process a list of jobs on the pool of workers, logging the progress.
+
+        Args:
+          function: A function to call on each job.
+          jobs: A list of jobs.
+        Returns:
+          A list of the results of the function, in the order of the jobs.
+        """
+        results = []
+        with futures.ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            for index, result in enumerate(executor.map(function, jobs), 1):
+                logging.info("Processed %d/%d jobs", index, len(jobs))
+                results.append(result)
+        return results
+
+    def format_stats(self):
+        """Render the statistics of the requests made to each source.
+
+        Returns:
+          A string, the rendered table.
+        """
+        oss = io.StringIO()
+        line_format = '{:<40} {:>8} {:>8} {:>9} {:>9} {:>9}\n'
+        oss.write(line_format.format('Source', 'Requests', 'Failures',
+                                     'Mean ms', 'Median ms', 'Max ms'))
+        for name, stats in sorted(self.stats.items()):
+            latencies = sorted(stats.latencies)
+            if latencies:
+                mean, median, maximum = (
+                    '{:.1f}'.format(value * 1000)
+                    for value in (sum(latencies) / len(latencies),
+                                  latencies[len(latencies) // 2],
+                                  latencies[-1]))
+            else:
+                mean = median = maximum = ''
+            oss.write(line_format.format(name, stats.requests, stats.failures,
+                                         mean, median, maximum))
+        return oss.getvalue()
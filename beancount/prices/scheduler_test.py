@@ -0,0 +1,168 @@
+__copyright__ = "Copyright (C) 2015-2017  Martin Blais"
+__license__ = "GNU GPLv2"
+
+import asyncio
+import threading
+import time
+import unittest
+
+from beancount.prices import scheduler
+
+
+class FakeClock:
+
+    def __init__(self):
+        self.time = 0.
+        self.sleeps = []
+
+    def clock(self):
+        return self.time
+
+    def sleep(self, delay):
+        self.sleeps.append(delay)
+        self.time += delay
+
+
+class FakeSource:
+
+    def __init__(self, errors=0):
+        self.errors = errors
+        self.calls = 0
+        self.running = 0
+        self.max_running = 0
+        self.lock = threading.Lock()
+
+    def get_latest_price(self, ticker):
+        self.calls += 1
+        if self.calls <= self.errors:
+            raise OSError("Connection reset")
+        return ticker.lower()
+
+    def get_historical_price(self, ticker, _):
+        with self.lock:
+            self.running += 1
+            self.max_running = max(self.max_running, self.running)
+        time.sleep(0.01)
+        with self.lock:
+            self.running -= 1
+        return ticker
+
+
+class FakeAsyncSource:
+
+    def __init__(self, errors=0):
+        self.errors = errors
+        self.calls = 0
+        self.running = 0
+        self.max_running = 0
+
+    async def get_latest_price(self, ticker):
+        self.calls += 1
+        if self.calls <= self.errors:
+            raise asyncio.TimeoutError()
+        return ticker.lower()
+
+    async def get_historical_price(self, ticker, _):
+        self.running += 1
+        self.max_running = max(self.max_running, self.running)
+        await asyncio.sleep(0.001)
+        self.running -= 1
+        return ticker
+
+
+class TestRateLimiter(unittest.TestCase):
+
+    def test_acquire(self):
+        fake_clock = FakeClock()
+        limiter = scheduler.RateLimiter(2, fake_clock.clock, fake_clock.sleep)
+        for _ in range(3):
+            limiter.acquire()
+        self.assertEqual([0.5, 0.5], fake_clock.sleeps)
+
+        # Time elapsed since the last request counts toward the next one.
+        fake_clock.time += 10
+        limiter.acquire()
+        self.assertEqual([0.5, 0.5], fake_clock.sleeps)
+
+    def test_unlimited(self):
+        fake_clock = FakeClock()
+        limiter = scheduler.RateLimiter(None, fake_clock.clock, fake_clock.sleep)
+        for _ in range(3):
+            limiter.acquire()
+        self.assertEqual([], fake_clock.sleeps)
+
+
+class TestScheduler(unittest.TestCase):
+
+    def test_call_retry(self):
+        fake_clock = FakeClock()
+        price_scheduler = scheduler.Scheduler(max_retry=3, backoff=1.,
+                                              clock=fake_clock.clock,
+                                              sleep=fake_clock.sleep)
+        source = FakeSource(errors=2)
+        self.assertEqual('hool', price_scheduler.call(source.get_latest_price, 'HOOL'))
+        self.assertEqual([1., 2.], fake_clock.sleeps)
+
+        stats = price_scheduler.stats[__name__]
+        self.assertEqual((3, 2), (stats.requests, stats.failures))
+        self.assertEqual(3, len(stats.latencies))
+        self.assertRegex(price_scheduler.format_stats(),
+                         r'\n{} +3 +2 '.format(__name__.replace('.', r'\.')))
+
+    def test_call_give_up(self):
+        fake_clock = FakeClock()
+        price_scheduler = scheduler.Scheduler(max_retry=2, clock=fake_clock.clock,
+                                              sleep=fake_clock.sleep)
+        source = FakeSource(errors=2)
+        with self.assertLogs(level='ERROR'):
+            self.assertIsNone(price_scheduler.call(source.get_latest_price, 'HOOL'))
+        self.assertEqual(2, source.calls)
+
+    def test_map_concurrency(self):
+        price_scheduler = scheduler.Scheduler(max_workers=6, source_concurrency=2)
+        source = FakeSource()
+        tickers = ['T{}'.format(index) for index in range(12)]
+        results = price_scheduler.map(
+            lambda ticker: price_scheduler.call(source.get_historical_price, ticker, None),
+            tickers)
+        self.assertEqual(tickers, results)
+        self.assertLessEqual(source.max_running, 2)
+        self.assertEqual(12, price_scheduler.stats[__name__].requests)
+
+
+class TestSchedulerAsync(unittest.TestCase):
+
+    def test_call_async_retry(self):
+        price_scheduler = scheduler.Scheduler(max_retry=3, backoff=0)
+        source = FakeAsyncSource(errors=2)
+        async def fetch(ticker):
+            return await price_scheduler.call_async(source.get_latest_price, ticker)
+        self.assertEqual(['hool'], price_scheduler.run_async(fetch, ['HOOL']))
+        stats = price_scheduler.stats[__name__]
+        self.assertEqual((3, 2), (stats.requests, stats.failures))
+
+    def test_call_async_give_up(self):
+        price_scheduler = scheduler.Scheduler(max_retry=2, backoff=0)
+        source = FakeAsyncSource(errors=2)
+        async def fetch(ticker):
+            return await price_scheduler.call_async(source.get_latest_price, ticker)
+        with self.assertLogs(level='ERROR'):
+            self.assertEqual([None], price_scheduler.run_async(fetch, ['HOOL']))
+
+    def test_run_async_concurrency(self):
+        price_scheduler = scheduler.Scheduler(source_concurrency=8)
+        source = FakeAsyncSource()
+        tickers = ['T{}'.format(index) for index in range(2000)]
+        cleanups = []
+        async def fetch(ticker):
+            return await price_scheduler.call_async(source.get_historical_price,
+                                                    ticker, None)
+        results = price_scheduler.run_async(fetch, tickers, lambda: cleanups.append(1))
+        self.assertEqual(tickers, results)
+        self.assertEqual(8, source.max_running)
+        self.assertEqual(2000, price_scheduler.stats[__name__].requests)
+        self.assertEqual([1], cleanups)
+
+
+if __name__ == '__main__':
+    unittest.main()
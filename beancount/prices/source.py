@@ -20,7 +20,18 @@ SourcePrice = collections.namedtuple('SourcePrice', 'price time quote_currency')
 
 
 class Source:
-    "Interface to be implemented by all price sources."
+    """Interface to be implemented by all price sources.
+
+    Sources which can fetch the prices of a range of dates in a single request
+    should also implement the optional method
+
+      get_prices_series(self, ticker, date_begin, date_end)
+
+    which returns a list of the SourcePrice instances available from
+    'date_begin' to 'date_end' inclusively, sorted by time, or None if the
+    prices could not be fetched. When it is absent, the driver falls back to
+    calling get_historical_price() once for each date it requires.
+    """
 
     def get_latest_price(self, ticker):
         """Fetch the current latest price. The date may differ.
@@ -58,3 +69,30 @@ class Source:
           guarantee that a price source will be able to fetch its value; client
           code must be able to handle this.
         """
+
+
+class AsyncSource:
+    """Interface to be implemented by price sources which fetch asynchronously.
+
+    A price source module may provide an AsyncSource class in addition to its
+    Source class. Its instances are created with the connection pool to make
+    their requests with, and its methods are coroutines with the same
+    arguments and return values as those of Source, including the optional
+    get_prices_series(). This allows the driver to run a large number of
+    requests concurrently, on a single thread, over a few reused connections.
+    """
+
+    def __init__(self, client):
+        """Create a source.
+
+        Args:
+          client: A beancount.utils.async_http.ConnectionPool instance, the
+            pool to make the requests with.
+        """
+        self.client = client
+
+    async def get_latest_price(self, ticker):
+        """Fetch the current latest price. See Source.get_latest_price()."""
+
+    async def get_historical_price(self, ticker, date):
+        """Return the historical price of a date. See Source.get_historical_price()."""
@@ -136,6 +136,135 @@ from beancount.prices import source
 from beancount.utils import net_utils
 
 
+# The fields to request for the latest price, in order of preference: a
+# "realtime" price, bid/ask pairs, and the previous close, along with the number
+# of prices in each.
+LATEST_FIELDS = [('l1d1', 1),
+                 ('b3b2d2', 2),
+                 ('b0a0d2', 2),
+                 ('p0d2', 1)]
+
+
+def get_latest_price_url(ticker, fields):
+    """Return the URL of a query of the latest price.
+
+    Args:
+      ticker: A string, the ticker to fetch.
+      fields: A string, the codes of the fields to request, from LATEST_FIELDS.
+    Returns:
+      A string, the URL to fetch.
+    """
+    return 'http://finance.yahoo.com/d/quotes.csv?s={}&f=c4{}'.format(ticker, fields)
+
+
+def is_valid_latest_data(data):
+    """Return true if the response to a query of the latest price has a price.
+
+    Args:
+      data: A string, the stripped content of the response.
+    Returns:
+      A boolean.
+    """
+    return bool(data) and not re.match('N/A', data)
+
+
+def parse_latest_price(data, num_prices):
+    """Parse the response to a query of the latest price.
+
+    Args:
+      data: A string, the stripped content of the response.
+      num_prices: An integer, 1 for a single price, 2 for a bid/ask pair.
+    Returns:
+      A SourcePrice instance.
+    """
+    components = data.split(',')
+
+    # Get the currency.
+    currency = components[0].strip('"')
+
+    # Get the
+    if num_prices == 1:
+        # Process just a price.
+        price = D(components[1])
+    else:
+        # Process separate bid/offer.
+        bid = D(components[1])
+        ask = D(components[2])
+        price = (bid + ask)/2
+
+    # Get the trade date for that price.
+    trade_date = datetime.datetime.strptime(components[-1], '"%m/%d/%Y"')
+
+    return source.SourcePrice(price, trade_date, currency)
+
+
+def get_prices_series_url(ticker, date_begin, date_end):
+    """Return the URL of a query of the daily prices over a range of dates.
+
+    Args:
+      ticker: A string, the ticker to fetch.
+      date_begin: A datetime.date instance, the first date of the range.
+      date_end: A datetime.date instance, the last date of the range.
+    Returns:
+      A string, the URL to fetch.
+    """
+    params = parse.urlencode(sorted({
+        's': ticker,
+        'a': date_begin.month - 1,
+        'b': date_begin.day,
+        'c': date_begin.year,
+        'd': date_end.month - 1,
+        'e': date_end.day,
+        'f': date_end.year,
+        'g': 'd',
+        'ignore': '.csv',
+    }.items()))
+    return 'http://ichart.yahoo.com/table.csv?{}'.format(params)
+
+
+def parse_prices_series(data):
+    """Parse the response to a query of the daily prices over a range of dates.
+
+    Args:
+      data: A string, the stripped CSV content of the response.
+    Returns:
+      A list of SourcePrice instances, sorted by time.
+    """
+    lines = data.splitlines()
+    assert len(lines) >= 2, "Too few lines in returned data: {}".format(len(lines))
+
+    # Parse the header, find the column for the adjusted close.
+    columns = lines[0].split(',')
+    index_price = columns.index('Adj Close')
+    assert index_price >= 0, "Could not find 'Adj Close' data column."
+    index_date = columns.index('Date')
+    assert index_date >= 0, "Could not find 'Date' data column."
+
+    # The data is returned with the most recent dates first.
+    series = []
+    for line in lines[1:]:
+        row = line.split(',')
+        close_price = D(row[index_price])
+        date = datetime.datetime.strptime(row[index_date], '%Y-%m-%d')
+        series.append(source.SourcePrice(close_price, date, None))
+    series.sort(key=lambda srcprice: srcprice.time)
+    return series
+
+
+def get_historical_range(date):
+    """Return the range of dates to query for the historical price of a date.
+
+    We look back some number of days in the past in order to make sure we hop
+    over national holidays.
+
+    Args:
+      date: A datetime.date instance.
+    Returns:
+      A pair of the first and last datetime.date instances of the range.
+    """
+    return date - datetime.timedelta(days=5), date
+
+
 class Source(source.Source):
     "Yahoo Finance CSV API price extractor."
 
@@ -143,11 +272,8 @@ class Source(source.Source):
         """See contract in beancount.prices.source.Source."""
 
         # Try "realtime" and just regular bid/ask pairs.
-        for fields, num_prices in [('l1d1', 1),
-                                   ('b3b2d2', 2),
-                                   ('b0a0d2', 2),
-                                   ('p0d2', 1)]:
-            url = 'http://finance.yahoo.com/d/quotes.csv?s={}&f=c4{}'.format(ticker, fields)
+        for fields, num_prices in LATEST_FIELDS:
+            url = get_latest_price_url(ticker, fields)
             logging.info("Fetching %s", url)
             try:
                 response = net_utils.retrying_urlopen(url)
@@ -156,51 +282,22 @@ class Source(source.Source):
                 data = response.read().decode('utf-8').strip()
             except error.HTTPError:
                 return None
-            if data and not re.match('N/A', data):
+            if is_valid_latest_data(data):
                 break
         else:
             return None
-        components = data.split(',')
-
-        # Get the currency.
-        currency = components[0].strip('"')
-
-        # Get the
-        if num_prices == 1:
-            # Process just a price.
-            price = D(components[1])
-        else:
-            # Process separate bid/offer.
-            bid = D(components[1])
-            ask = D(components[2])
-            price = (bid + ask)/2
-
-        # Get the trade date for that price.
-        trade_date = datetime.datetime.strptime(components[-1], '"%m/%d/%Y"')
-
-        return source.SourcePrice(price, trade_date, currency)
+        return parse_latest_price(data, num_prices)
 
     def get_historical_price(self, ticker, date):
         """See contract in beancount.prices.source.Source."""
 
-        # Look back some number of days in the past in order to make sure we hop
-        # over national holidays.
-        begin_date = date - datetime.timedelta(days=5)
-        end_date = date
-
-        # Make the query.
-        params = parse.urlencode(sorted({
-            's': ticker,
-            'a': begin_date.month - 1,
-            'b': begin_date.day,
-            'c': begin_date.year,
-            'd': end_date.month - 1,
-            'e': end_date.day,
-            'f': end_date.year,
-            'g': 'd',
-            'ignore': '.csv',
-        }.items()))
-        url = 'http://ichart.yahoo.com/table.csv?{}'.format(params)
+        # Get the latest data returned.
+        series = self.get_prices_series(ticker, *get_historical_range(date))
+        return series[-1] if series else None
+
+    def get_prices_series(self, ticker, date_begin, date_end):
+        """See contract in beancount.prices.source.Source."""
+        url = get_prices_series_url(ticker, date_begin, date_end)
         try:
             response = net_utils.retrying_urlopen(url)
             if response is None:
@@ -208,22 +305,48 @@ class Source(source.Source):
             data = response.read().decode('utf-8').strip()
         except error.HTTPError:
             return None
-        if response is None:
-            return None
+        return parse_prices_series(data)
 
-        lines = data.splitlines()
-        assert len(lines) >= 2, "Too few lines in returned data: {}".format(len(lines))
 
-        # Parse the header, find the column for the adjusted close.
-        columns = lines[0].split(',')
-        index_price = columns.index('Adj Close')
-        assert index_price >= 0, "Could not find 'Adj Close' data column."
-        index_date = columns.index('Date')
-        assert index_date >= 0, "Could not find 'Date' data column."
+class AsyncSource(source.AsyncSource):
+    "Yahoo Finance CSV API price extractor, on an asynchronous connection pool."
 
-        # Get the latest data returned.
-        most_recent_data = lines[1].split(',')
-        close_price = D(most_recent_data[index_price])
-        date = datetime.datetime.strptime(most_recent_data[index_date], '%Y-%m-%d')
+    async def fetch(self, url):
+        """Fetch a URL from the pool.
+
+        Args:
+          url: A string, the URL to fetch.
+        Returns:
+          A string, the stripped content of the response, or None if the
+          response has an error status.
+        """
+        response = await self.client.get(url)
+        if response.status != 200:
+            return None
+        return response.body.decode('utf-8').strip()
 
-        return source.SourcePrice(close_price, date, None)
+    async def get_latest_price(self, ticker):
+        """See contract in beancount.prices.source.AsyncSource."""
+        for fields, num_prices in LATEST_FIELDS:
+            url = get_latest_price_url(ticker, fields)
+            logging.info("Fetching %s", url)
+            data = await self.fetch(url)
+            if data is None:
+                return None
+            if is_valid_latest_data(data):
+                break
+        else:
+            return None
+        return parse_latest_price(data, num_prices)
+
+    async def get_historical_price(self, ticker, date):
+        """See contract in beancount.prices.source.AsyncSource."""
+        series = await self.get_prices_series(ticker, *get_historical_range(date))
+        return series[-1] if series else None
+
+    async def get_prices_series(self, ticker, date_begin, date_end):
+        """See contract in beancount.prices.source.AsyncSource."""
+        data = await self.fetch(get_prices_series_url(ticker, date_begin, date_end))
+        if data is None:
+            return None
+        return parse_prices_series(data)
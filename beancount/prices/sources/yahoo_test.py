@@ -1,6 +1,7 @@
 __copyright__ = "Copyright (C) 2015-2016  Martin Blais"
 __license__ = "GNU GPLv2"
 
+import asyncio
 import textwrap
 import datetime
 import unittest
@@ -11,6 +12,8 @@ from urllib import error
 from beancount.prices.sources import yahoo
 from beancount.core.number import D
 from beancount.core.number import Decimal
+from beancount.utils import async_http
+from beancount.utils import test_utils
 
 
 class YahooFinancePriceFetcher(unittest.TestCase):
@@ -83,7 +86,82 @@ class YahooFinancePriceFetcher(unittest.TestCase):
         self.assertEqual(D('515.14'), srcprice.price)
         self.assertEqual(expected_date, srcprice.time.date())
 
+    def test_get_prices_series(self):
+        self.url_object.read.return_value = textwrap.dedent("""
+           Date,Open,High,Low,Close,Volume,Adj Close
+           2014-05-06,525.23,526.81,515.06,515.14,1684400,515.14
+           2014-05-05,524.82,528.90,521.32,527.81,1021300,527.81
+           2014-05-02,533.76,534.00,525.61,527.93,1683900,527.93
+        """).encode('utf-8')
+        series = self.fetcher.get_prices_series('HOOL', datetime.date(2014, 5, 1),
+                                                datetime.date(2014, 5, 7))
+        self.assertEqual([(datetime.date(2014, 5, 2), D('527.93')),
+                          (datetime.date(2014, 5, 5), D('527.81')),
+                          (datetime.date(2014, 5, 6), D('515.14'))],
+                         [(srcprice.time.date(), srcprice.price) for srcprice in series])
+
     def test_get_historical_price__invalid(self):
         self.url_object.read.side_effect = error.HTTPError('url', 'code', '404', {}, None)
         srcprice = self.fetcher.get_historical_price('INVALID', datetime.date(2014, 5, 7))
         self.assertIsNone(srcprice)
+
+
+class YahooFinanceAsyncPriceFetcher(unittest.TestCase):
+
+    def setUp(self):
+        history = textwrap.dedent("""
+           Date,Open,High,Low,Close,Volume,Adj Close
+           2014-05-06,525.23,526.81,515.06,515.14,1684400,515.14
+           2014-05-05,524.82,528.90,521.32,527.81,1021300,527.81
+           2014-05-02,533.76,534.00,525.61,527.93,1683900,527.93
+        """).encode('utf-8')
+        history_url = yahoo.get_prices_series_url('HOOL', datetime.date(2014, 5, 2),
+                                                  datetime.date(2014, 5, 7))
+        self.server = test_utils.ReplayHTTPServer({
+            '/d/quotes.csv?s=HOOL&f=c4l1d1': b'N/A,N/A\r\n',
+            '/d/quotes.csv?s=HOOL&f=c4b3b2d2': b'USD,553.37,556.70,"12/7/2015"\r\n',
+            '/d/quotes.csv?s=INVALID&f=c4l1d1': b'N/A,N/A\r\n',
+            '/d/quotes.csv?s=INVALID&f=c4b3b2d2': b'N/A,N/A\r\n',
+            '/d/quotes.csv?s=INVALID&f=c4b0a0d2': b'N/A,N/A\r\n',
+            '/d/quotes.csv?s=INVALID&f=c4p0d2': b'N/A,N/A\r\n',
+            history_url[len('http://ichart.yahoo.com'):]: history,
+        })
+        self.server.__enter__()
+        self.addCleanup(self.server.__exit__)
+        self.client = async_http.ConnectionPool(hosts={
+            ('finance.yahoo.com', 80): self.server.address,
+            ('ichart.yahoo.com', 80): self.server.address})
+        self.fetcher = yahoo.AsyncSource(self.client)
+
+    def run_fetcher(self, coroutine):
+        async def run():
+            try:
+                return await coroutine
+            finally:
+                self.client.close()
+        loop = asyncio.new_event_loop()
+        try:
+            return loop.run_until_complete(run())
+        finally:
+            loop.close()
+
+    def test_get_latest_price(self):
+        srcprice = self.run_fetcher(self.fetcher.get_latest_price('HOOL'))
+        self.assertEqual(D('555.035'), srcprice.price)
+        self.assertEqual('USD', srcprice.quote_currency)
+        self.assertEqual(datetime.datetime(2015, 12, 7), srcprice.time)
+        self.assertEqual(1, self.server.num_connections)
+
+    def test_get_latest_price__invalid(self):
+        self.assertIsNone(self.run_fetcher(self.fetcher.get_latest_price('INVALID')))
+        self.assertEqual(4, len(self.server.requests))
+
+    def test_get_latest_price__not_found(self):
+        self.assertIsNone(self.run_fetcher(self.fetcher.get_latest_price('MISSING')))
+        self.assertEqual(1, len(self.server.requests))
+
+    def test_get_historical_price(self):
+        srcprice = self.run_fetcher(
+            self.fetcher.get_historical_price('HOOL', datetime.date(2014, 5, 7)))
+        self.assertEqual(D('515.14'), srcprice.price)
+        self.assertEqual(datetime.date(2014, 5, 6), srcprice.time.date())
@@ -18,6 +18,7 @@ from beancount.parser import printer
 from beancount.parser import options
 from beancount.ops import summarize
 from beancount.core import prices
+from beancount.core import price_store
 from beancount.utils import misc_utils
 
 
@@ -210,7 +211,7 @@ def execute_query(query, entries, options_map):
     context.account_types = options.get_account_types(options_map)
     context.open_close_map = getters.get_account_open_close(entries)
     context.commodity_map = getters.get_commodity_map(entries)
-    context.price_map = prices.build_price_map(entries)
+    context.price_map = prices.build_price_map(entries, price_store.open_store(options_map))
 
     # Dispatch between the non-aggregated queries and aggregated queries.
     c_where = query.c_where
@@ -4,6 +4,7 @@ __copyright__ = "Copyright (C) 2014-2017  Martin Blais"
 __license__ = "GNU GPLv2"
 
 import csv
+import datetime
 
 from beancount.core.number import D
 from beancount.core.number import ZERO
@@ -13,11 +14,13 @@ from beancount.core import flags
 from beancount.parser import options
 from beancount.parser import printer
 from beancount.core import prices
+from beancount.core import price_store
 from beancount.core import convert
 from beancount.ops import holdings
 from beancount.ops import summarize
 from beancount.reports import table
 from beancount.reports import base
+from beancount.utils import date_utils
 
 
 def get_assets_holdings(entries, options_map, currency=None):
@@ -32,7 +35,7 @@ def get_assets_holdings(entries, options_map, currency=None):
       A list of Holding instances and a price-map.
     """
     # Compute a price map, to perform conversions.
-    price_map = prices.build_price_map(entries)
+    price_map = prices.build_price_map(entries, price_store.open_store(options_map))
 
     # Get the list of holdings.
     account_types = options.get_account_types(options_map)
@@ -315,42 +318,63 @@ class CashReport(base.TableReport):
         return table.create_table(holdings_list, FIELD_SPEC)
 
 
+def get_period_end_dates(date_first, date_last, period):
+    """Compute the last dates of the periods spanning a range of dates.
+
+    Args:
+      date_first: A datetime.date instance, a date within the first period.
+      date_last: A datetime.date instance, a date within the last period.
+      period: A string, one of 'weekly' (weeks ending on Sundays), 'monthly' or
+        'yearly'.
+    Returns:
+      A list of datetime.date instances.
+    """
+    if period == 'weekly':
+        date = date_first + datetime.timedelta(days=6 - date_first.weekday())
+        next_date = lambda date: date + datetime.timedelta(days=7)
+    elif period == 'monthly':
+        date = date_utils.next_month(date_first) - datetime.timedelta(days=1)
+        next_date = lambda date: (date_utils.next_month(date + datetime.timedelta(days=1))
+                                  - datetime.timedelta(days=1))
+    elif period == 'yearly':
+        date = datetime.date(date_first.year, 12, 31)
+        next_date = lambda date: date.replace(year=date.year + 1)
+    else:
+        raise ValueError("Invalid period: {}".format(period))
+    dates = [date]
+    while dates[-1] < date_last:
+        dates.append(next_date(dates[-1]))
+    return dates
+
+
 class NetWorthReport(base.TableReport):
     """Generate a table of total net worth for each operating currency."""
 
     names = ['networth', 'equity']
 
+    @classmethod
+    def add_args(cls, parser):
+        parser.add_argument('-p', '--period', action='store', default=None,
+                            choices=['weekly', 'monthly', 'yearly'],
+                            help=("Render the net worth at the end of each period "
+                                  "instead of only the final net worth"))
+
     def generate_table(self, entries, errors, options_map):
+        operating_currencies = options_map['operating_currency']
+        if self.args.period:
+            return self.generate_series_table(entries, options_map, operating_currencies)
+
         holdings_list, price_map = get_assets_holdings(entries, options_map)
 
+        # Note: It's entirely possible that the price map does not have all the
+        # necessary rate conversions here. The holdings which cannot be
+        # converted are left out; if none can, the currency is skipped
+        # altogether.
         net_worths = []
-        for currency in options_map['operating_currency']:
-
-            # Convert holdings to a unified currency.
-            #
-            # Note: It's entirely possible that the price map does not have all
-            # the necessary rate conversions here. The resulting holdings will
-            # simply have no cost when that is the case. We must handle this
-            # gracefully below.
-            currency_holdings_list = holdings.convert_to_currency(price_map,
-                                                                  currency,
-                                                                  holdings_list)
-            if not currency_holdings_list:
-                continue
-
-            holdings_list = holdings.aggregate_holdings_by(
-                currency_holdings_list, lambda holding: holding.cost_currency)
-
-            holdings_list = [holding
-                             for holding in holdings_list
-                             if holding.currency and holding.cost_currency]
-
-            # If after conversion there are no valid holdings, skip the currency
-            # altogether.
-            if not holdings_list:
-                continue
-
-            net_worths.append((currency, holdings_list[0].market_value))
+        for currency in operating_currencies:
+            net_worth = holdings.get_net_worth(holdings_list, currency, price_map)
+            if net_worth is not None:
+                net_worths.append((currency, net_worth))
 
         field_spec = [
             (0, 'Currency'),
@@ -358,6 +382,31 @@ class NetWorthReport(base.TableReport):
         ]
         return table.create_table(net_worths, field_spec)
 
+    def generate_series_table(self, entries, options_map, currencies):
+        """Render the net worth at the end of each period.
+
+        Args:
+          entries: A list of directives.
+          options_map: A dict of parsed options.
+          currencies: A list of strings, the currencies to value the net worth
+            in, one per column.
+        Returns:
+          A Table instance.
+        """
+        transactions = list(data.filter_txns(entries))
+        dates = (get_period_end_dates(transactions[0].date, transactions[-1].date,
+                                      self.args.period)
+                 if transactions else [])
+        price_map = prices.build_price_map(entries, price_store.open_store(options_map))
+        account_types = options.get_account_types(options_map)
+        rows = [(date,) + tuple(net_worths)
+                for date, net_worths in holdings.get_net_worth_series(
+                    entries, dates, currencies, price_map,
+                    (account_types.assets, account_types.liabilities))]
+
+        field_spec = [(0, 'Date')] + [(index, currency, '{:,.2f}'.format)
+                                      for index, currency in enumerate(currencies, 1)]
+        return table.create_table(rows, field_spec)
 
 __reports__ = [
     HoldingsReport,
@@ -1,6 +1,7 @@
 __copyright__ = "Copyright (C) 2014-2017  Martin Blais"
 __license__ = "GNU GPLv2"
 
+import datetime
 import unittest
 import io
 
@@ -61,6 +62,45 @@ class TestHoldingsReports(unittest.TestCase):
             output = report_.render(self.entries, self.errors, self.options_map, format_)
             self.assertTrue(output)
 
+    @loader.load_doc()
+    def test_report_networth__period(self, entries, errors, options_map):
+        """
+        option "operating_currency" "USD"
+
+        2014-01-01 open Assets:Bank1
+        2014-01-01 open Income:Something
+
+        2014-01-15 *
+          Assets:Bank1         100 MSFT {200.00 USD}
+          Income:Something
+
+        2014-02-10 price MSFT  210.00 USD
+
+        2014-03-01 *
+          Assets:Bank1         -50 MSFT {200.00 USD}
+          Income:Something
+        """
+        report_ = holdings_reports.NetWorthReport.from_args(['--period', 'monthly'])
+        table_ = report_.generate_table(entries, errors, options_map)
+        self.assertEqual(['Date', 'USD'], table_.header)
+        self.assertEqual([['2014-01-31', ''],
+                          ['2014-02-28', '21,000.00'],
+                          ['2014-03-31', '10,500.00']], table_.body)
+
+    def test_get_period_end_dates(self):
+        date_first, date_last = datetime.date(2014, 1, 15), datetime.date(2014, 3, 1)
+        self.assertEqual([datetime.date(2014, 1, 31),
+                          datetime.date(2014, 2, 28),
+                          datetime.date(2014, 3, 31)],
+                         holdings_reports.get_period_end_dates(date_first, date_last,
+                                                               'monthly'))
+        self.assertEqual([datetime.date(2014, 12, 31)],
+                         holdings_reports.get_period_end_dates(date_first, date_last,
+                                                               'yearly'))
+        weekly = holdings_reports.get_period_end_dates(date_first, date_last, 'weekly')
+        self.assertEqual((datetime.date(2014, 1, 19), datetime.date(2014, 3, 2), 7),
+                         (weekly[0], weekly[-1], len(weekly)))
+
     def test_load_from_csv(self):
         oss = io.StringIO()
         table_ = holdings_reports.report_holdings(
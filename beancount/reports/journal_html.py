@@ -3,12 +3,16 @@
 __copyright__ = "Copyright (C) 2014-2017  Martin Blais"
 __license__ = "GNU GPLv2"
 
+import bisect
 import collections
+import copy
+import itertools
 from os import path
 
 from beancount.core import data
 from beancount.core import position
 from beancount.core import convert
+from beancount.core import inventory
 from beancount.core import realization
 from beancount.core import flags
 
@@ -42,7 +46,7 @@ Row = collections.namedtuple('Row',
                              'description links amount_str balance_str')
 
 
-def iterate_html_postings(txn_postings, formatter):
+def iterate_html_postings(txn_postings, formatter, balance=None):
     """Iterate through the list of transactions with rendered HTML strings for each cell.
 
     This pre-renders all the data for each row to HTML. This is reused by the entries
@@ -52,10 +56,12 @@ def iterate_html_postings(txn_postings, formatter):
       txn_postings: A list of TxnPosting or directive instances.
       formatter: An instance of HTMLFormatter, to be render accounts,
         inventories, links and docs.
+      balance: An optional Inventory instance, the running balance to start
+        from. See realization.iterate_with_balance().
     Yields:
       Instances of Row tuples. See above.
     """
-    for entry_line in realization.iterate_with_balance(txn_postings):
+    for entry_line in realization.iterate_with_balance(txn_postings, balance):
         entry, leg_postings, change, entry_balance = entry_line
 
         # Prepare the data to be rendered for this row.
@@ -125,6 +131,24 @@ def iterate_html_postings(txn_postings, formatter):
                   flag, description, links, amount_str, balance_str)
 
 
+# The header of a table of entries with a running balance.
+BALANCE_TABLE_HEADER = '''
+      <table class="entry-table">
+      <thead>
+        <tr>
+         <th class="datecell">Date</th>
+         <th class="flag">F</th>
+         <th class="description">Narration/Payee</th>
+         <th class="position">Position</th>
+         <th class="price">Price</th>
+         <th class="cost">Cost</th>
+         <th class="change">Change</th>
+         <th class="balance">Balance</th>
+        </tr>
+      </thead>
+    '''
+
+
 def html_entries_table_with_balance(oss, txn_postings, formatter, render_postings=True):
     """Render a list of entries into an HTML table, with a running balance.
 
@@ -140,72 +164,234 @@ def html_entries_table_with_balance(oss, txn_postings, formatter, render_posting
     """
     write = lambda data: (oss.write(data), oss.write('\n'))
 
+    write(BALANCE_TABLE_HEADER)
+    for row in iterate_html_postings(txn_postings, formatter):
+        write_balance_row(write, row, formatter, render_postings)
+    write('</table>')
+
+
+def write_balance_row(write, row, formatter, render_postings):
+    """Render a single row of a table of entries with a running balance.
+
+    Args:
+      write: A function to call to write out a string.
+      row: An instance of Row, as produced by iterate_html_postings().
+      formatter: An instance of HTMLFormatter, to be render accounts,
+        inventories, links and docs.
+      render_postings: A boolean; if true, render the postings as rows under the
+        main transaction row.
+    """
+    entry = row.entry
+
+    description = row.description
+    if row.links:
+        description += render_links(row.links)
+
+    # Render a row.
     write('''
-      <table class="entry-table">
-      <thead>
-        <tr>
-         <th class="datecell">Date</th>
-         <th class="flag">F</th>
-         <th class="description">Narration/Payee</th>
-         <th class="position">Position</th>
-         <th class="price">Price</th>
-         <th class="cost">Cost</th>
-         <th class="change">Change</th>
-         <th class="balance">Balance</th>
-        </tr>
-      </thead>
-    ''')
+      <tr class="{} {}" title="{}">
+        <td class="datecell"><a href="{}">{}</a></td>
+        <td class="flag">{}</td>
+        <td class="description" colspan="4">{}</td>
+        <td class="change num">{}</td>
+        <td class="balance num">{}</td>
+      </tr>
+    '''.format(row.rowtype, row.extra_class,
+               '{}:{}'.format(entry.meta["filename"], entry.meta["lineno"]),
+               formatter.render_context(entry), entry.date,
+               row.flag, description,
+               row.amount_str, row.balance_str))
+
+    if render_postings and isinstance(entry, data.Transaction):
+        for posting in entry.postings:
+
+            classes = ['Posting']
+            if posting.flag == flags.FLAG_WARNING:
+                classes.append('warning')
+            if posting in row.leg_postings:
+                classes.append('leg')
+
+            write('''
+              <tr class="{}">
+                <td class="datecell"></td>
+                <td class="flag">{}</td>
+                <td class="description">{}</td>
+                <td class="position num">{}</td>
+                <td class="price num">{}</td>
+                <td class="cost num">{}</td>
+                <td class="change num"></td>
+                <td class="balance num"></td>
+              </tr>
+            '''.format(' '.join(classes),
+                       posting.flag or '',
+                       formatter.render_account(posting.account),
+                       position.to_string(posting),
+                       posting.price or '',
+                       convert.get_weight(posting)))
+
+
+# A saved state of the running balance, from which rendering can resume.
+#
+# Attributes:
+#   row_index: An integer, the number of rows rendered before this checkpoint.
+#   txn_posting_index: An integer, the index in the list of postings at which
+#     rendering for this row resumes. This is always at a date boundary.
+#   balance: An Inventory instance, the running balance before this row.
+#
+Checkpoint = collections.namedtuple('Checkpoint',
+                                    'row_index txn_posting_index balance')
 
-    for row in iterate_html_postings(txn_postings, formatter):
-        entry = row.entry
+# An index over a list of postings, used to render pages of it.
+#
+# Attributes:
+#   txn_postings: The list of TxnPosting or directive instances indexed.
+#   num_rows: An integer, the total number of rows iterate_html_postings()
+#     would produce from txn_postings.
+#   checkpoints: A list of Checkpoint instances, sorted by row index. The first
+#     checkpoint is always at the very beginning of the list.
+#   checkpoint_rows: A list of integers, the row index of each checkpoint, to
+#     bisect.
+#
+JournalIndex = collections.namedtuple('JournalIndex',
+                                      'txn_postings num_rows checkpoints checkpoint_rows')
 
-        description = row.description
-        if row.links:
-            description += render_links(row.links)
 
-        # Render a row.
-        write('''
-          <tr class="{} {}" title="{}">
-            <td class="datecell"><a href="{}">{}</a></td>
-            <td class="flag">{}</td>
-            <td class="description" colspan="4">{}</td>
-            <td class="change num">{}</td>
-            <td class="balance num">{}</td>
-          </tr>
-        '''.format(row.rowtype, row.extra_class,
-                   '{}:{}'.format(entry.meta["filename"], entry.meta["lineno"]),
-                   formatter.render_context(entry), entry.date,
-                   row.flag, description,
-                   row.amount_str, row.balance_str))
+def build_journal_index(txn_postings, interval):
+    """Count the rows of a journal and checkpoint its running balance.
 
-        if render_postings and isinstance(entry, data.Transaction):
-            for posting in entry.postings:
+    This makes a single pass over the postings, accumulating the balance without
+    rendering anything, and saves a copy of the running balance at the first
+    date boundary following every 'interval' rows. The row grouping is identical
+    to that of realization.iterate_with_balance().
 
-                classes = ['Posting']
-                if posting.flag == flags.FLAG_WARNING:
-                    classes.append('warning')
-                if posting in row.leg_postings:
-                    classes.append('leg')
+    Args:
+      txn_postings: A list of TxnPosting or directive instances.
+      interval: An integer, the minimum number of rows between checkpoints.
+    Returns:
+      An instance of JournalIndex.
+    """
+    checkpoints = [Checkpoint(0, 0, inventory.Inventory())]
+    balance = inventory.Inventory()
+    num_rows = 0
+    prev_date = None
+
+    # The number of rows at the current date and the set of ids of transactions
+    # that have already produced a row at this date.
+    date_rows = 0
+    date_txns = set()
+
+    for index, txn_posting in enumerate(txn_postings):
+        if isinstance(txn_posting, realization.TxnPosting):
+            posting = txn_posting.posting
+            entry = txn_posting.txn
+        else:
+            posting = None
+            entry = txn_posting
 
-                write('''
-                  <tr class="{}">
-                    <td class="datecell"></td>
-                    <td class="flag">{}</td>
-                    <td class="description">{}</td>
-                    <td class="position num">{}</td>
-                    <td class="price num">{}</td>
-                    <td class="cost num">{}</td>
-                    <td class="change num"></td>
-                    <td class="balance num"></td>
-                  </tr>
-                '''.format(' '.join(classes),
-                           posting.flag or '',
-                           formatter.render_account(posting.account),
-                           position.to_string(posting),
-                           posting.price or '',
-                           convert.get_weight(posting)))
+        if entry.date != prev_date:
+            prev_date = entry.date
+            num_rows += date_rows
+            date_rows = 0
+            date_txns.clear()
+            if num_rows - checkpoints[-1].row_index >= interval:
+                checkpoints.append(Checkpoint(num_rows, index, copy.copy(balance)))
 
-    write('</table>')
+        if posting is not None:
+            balance.add_position(posting)
+            if id(entry) in date_txns:
+                continue
+            date_txns.add(id(entry))
+        date_rows += 1
+
+    num_rows += date_rows
+    return JournalIndex(txn_postings, num_rows, checkpoints,
+                        [checkpoint.row_index for checkpoint in checkpoints])
+
+
+def get_num_pages(journal_index, page_size):
+    """Compute the number of pages of a journal.
+
+    Args:
+      journal_index: An instance of JournalIndex.
+      page_size: An integer, the number of rows per page.
+    Returns:
+      An integer, the number of pages. This is at least one, even if the journal
+      is empty.
+    """
+    return max(1, -(-journal_index.num_rows // page_size))
+
+
+def iterate_html_postings_page(journal_index, formatter, page, page_size):
+    """Render the rows of a single page of a journal, newest first.
+
+    Page zero holds the most recent rows. Only the postings between the closest
+    checkpoints around the page are iterated over, so the cost of rendering a
+    page does not depend on the length of the journal.
+
+    Args:
+      journal_index: An instance of JournalIndex.
+      formatter: An instance of HTMLFormatter, to be render accounts,
+        inventories, links and docs.
+      page: An integer, the page number to render.
+      page_size: An integer, the number of rows per page.
+    Returns:
+      A list of Row instances, most recent first.
+    """
+    end = journal_index.num_rows - page * page_size
+    begin = max(0, end - page_size)
+    if end <= 0:
+        return []
+
+    # Render from the last checkpoint at or before the beginning of the page, up
+    # to the first checkpoint at or after its end, if there is one.
+    checkpoints = journal_index.checkpoints
+    checkpoint_rows = journal_index.checkpoint_rows
+    checkpoint = checkpoints[bisect.bisect_right(checkpoint_rows, begin) - 1]
+    index_end = bisect.bisect_left(checkpoint_rows, end)
+    txn_posting_end = (checkpoints[index_end].txn_posting_index
+                       if index_end < len(checkpoints)
+                       else None)
+
+    txn_postings = journal_index.txn_postings[checkpoint.txn_posting_index:
+                                              txn_posting_end]
+    rows = list(itertools.islice(
+        iterate_html_postings(txn_postings, formatter, checkpoint.balance),
+        begin - checkpoint.row_index, end - checkpoint.row_index))
+    rows.reverse()
+    return rows
+
+
+def html_entries_table_with_balance_page(oss, journal_index, formatter,
+                                         page, page_size, render_postings=True,
+                                         header=True):
+    """Render a single page of a journal into an HTML table, newest first.
+
+    (This function returns nothing, it write to oss as a side-effect.)
+
+    Args:
+      oss: A file object to write the output to.
+      journal_index: An instance of JournalIndex.
+      formatter: An instance of HTMLFormatter, to be render accounts,
+        inventories, links and docs.
+      page: An integer, the page number to render. Page zero holds the most
+        recent entries.
+      page_size: An integer, the number of rows per page.
+      render_postings: A boolean; if true, render the postings as rows under the
+        main transaction row.
+      header: A boolean; if false, render only the rows of the table, without
+        the enclosing table tags. This is used to fetch further pages from the
+        client and append them to an existing table.
+    """
+    write = lambda data: (oss.write(data), oss.write('\n'))
+
+    if header:
+        write(BALANCE_TABLE_HEADER)
+    write('<tbody>')
+    for row in iterate_html_postings_page(journal_index, formatter, page, page_size):
+        write_balance_row(write, row, formatter, render_postings)
+    write('</tbody>')
+    if header:
+        write('</table>')
 
 
 def html_entries_table(oss, txn_postings, formatter, render_postings=True):
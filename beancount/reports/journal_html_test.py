@@ -107,6 +107,75 @@ class TestJournalRender(unittest.TestCase):
         self.assertTrue(isinstance(html, str))
         self.assertRegex(html, '<table')
 
+    def test_build_journal_index(self):
+        txn_postings = self.real_account.txn_postings
+        journal_index = journal_html.build_journal_index(txn_postings, 3)
+        self.assertEqual(11, journal_index.num_rows)
+        self.assertEqual([0, 3, 6, 9], [checkpoint.row_index
+                                        for checkpoint in journal_index.checkpoints])
+        self.assertEqual([0, 3, 6, 9], journal_index.checkpoint_rows)
+        self.assertEqual(4, journal_html.get_num_pages(journal_index, 3))
+        self.assertEqual(1, journal_html.get_num_pages(
+            journal_html.build_journal_index([], 3), 3))
+
+    def test_iterate_html_postings_page__sliced(self):
+        # The postings are sliced around the page, rather than iterated over
+        # from the beginning of the list.
+        class UniterableList(list):
+            def __iter__(self):
+                raise AssertionError("Iterating over all the postings")
+
+        formatter = html_formatter.HTMLFormatter(display_context.DEFAULT_DISPLAY_CONTEXT)
+        txn_postings = self.real_account.txn_postings
+        expected_rows = list(journal_html.iterate_html_postings(txn_postings,
+                                                                formatter))
+        journal_index = journal_html.build_journal_index(txn_postings, 3)._replace(
+            txn_postings=UniterableList(txn_postings))
+        rows = journal_html.iterate_html_postings_page(journal_index, formatter, 1, 3)
+        self.assertEqual([(row.entry, row.balance_str) for row in expected_rows[5:8]],
+                         [(row.entry, row.balance_str) for row in reversed(rows)])
+
+    def test_iterate_html_postings_page(self):
+        formatter = html_formatter.HTMLFormatter(display_context.DEFAULT_DISPLAY_CONTEXT)
+        txn_postings = self.real_account.txn_postings
+        expected_rows = list(journal_html.iterate_html_postings(txn_postings,
+                                                                formatter))
+        for interval in 1, 2, 5, 100:
+            journal_index = journal_html.build_journal_index(txn_postings, interval)
+            for page_size in 1, 3, 4, 11, 20:
+                rows = []
+                num_pages = journal_html.get_num_pages(journal_index, page_size)
+                for page in range(num_pages):
+                    rows.extend(journal_html.iterate_html_postings_page(
+                        journal_index, formatter, page, page_size))
+                rows.reverse()
+                self.assertEqual(
+                    [(row.entry, row.amount_str, row.balance_str)
+                     for row in expected_rows],
+                    [(row.entry, row.amount_str, row.balance_str)
+                     for row in rows])
+                self.assertEqual([], journal_html.iterate_html_postings_page(
+                    journal_index, formatter, num_pages, page_size))
+
+    def test_html_entries_table_with_balance_page(self):
+        formatter = html_formatter.HTMLFormatter(display_context.DEFAULT_DISPLAY_CONTEXT)
+        journal_index = journal_html.build_journal_index(
+            self.real_account.txn_postings, 4)
+
+        oss = io.StringIO()
+        journal_html.html_entries_table_with_balance_page(
+            oss, journal_index, formatter, 0, 4, True)
+        html = oss.getvalue()
+        self.assertRegex(html, '<table')
+        self.assertRegex(html, '<tbody>')
+
+        oss = io.StringIO()
+        journal_html.html_entries_table_with_balance_page(
+            oss, journal_index, formatter, 1, 4, True, header=False)
+        html = oss.getvalue()
+        self.assertNotRegex(html, '<table')
+        self.assertRegex(html, '<tbody>')
+
     def test_render_links(self):
         html = journal_html.render_links({'132333b32eab', '6e3ac126f337'})
         self.assertRegex(html, '132333b32eab')
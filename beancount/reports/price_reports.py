@@ -14,6 +14,7 @@ from beancount.core import data
 from beancount.core import amount
 from beancount.core import getters
 from beancount.core import prices
+from beancount.core import price_store
 from beancount.ops import lifetimes
 
 
@@ -24,7 +25,7 @@ class CommoditiesReport(base.TableReport):
     default_format = 'text'
 
     def generate_table(self, entries, errors, options_map):
-        price_map = prices.build_price_map(entries)
+        price_map = prices.build_price_map(entries, price_store.open_store(options_map))
         return table.create_table([(base_quote,)
                                    for base_quote in sorted(price_map.forward_pairs)],
                                   [(0, "Base/Quote", self.formatter.render_commodity)])
@@ -72,14 +73,14 @@ class CommodityPricesReport(base.TableReport):
                             action='store', default=None,
                             help="The commodity pair to display.")
 
-    def get_date_rates(self, entries):
+    def get_date_rates(self, entries, options_map):
         if not self.args.commodity:
             self.parser.error("Commodity pair must be specified (in BASE/QUOTE format)")
         if not re.match('{ccy}/{ccy}$'.format(ccy=amount.CURRENCY_RE),
                         self.args.commodity):
             self.parser.error(('Invalid commodity pair "{}"; '
                                'must be in BASE/QUOTE format').format(self.args.commodity))
-        price_map = prices.build_price_map(entries)
+        price_map = prices.build_price_map(entries, price_store.open_store(options_map))
         try:
             date_rates = prices.get_all_prices(price_map, self.args.commodity)
         except KeyError:
@@ -88,13 +89,13 @@ class CommodityPricesReport(base.TableReport):
         return date_rates
 
     def generate_table(self, entries, errors, options_map):
-        date_rates = self.get_date_rates(entries)
+        date_rates = self.get_date_rates(entries, options_map)
         return table.create_table(date_rates,
                                   [(0, "Date", datetime.date.isoformat),
                                    (1, "Price", '{:.5f}'.format)])
 
     def render_htmldiv(self, entries, errors, options_map, file):
-        date_rates = self.get_date_rates(entries)
+        date_rates = self.get_date_rates(entries, options_map)
         dates, rates = zip(*date_rates)
         scripts = gviz.gviz_timeline(dates,
                                      {'rates': rates, 'rates2': rates},
@@ -148,7 +149,7 @@ class PriceDBReport(base.Report):
 
     def render_beancount(self, entries, errors, options_map, file):
         dcontext = options_map['dcontext']
-        price_map = prices.build_price_map(entries)
+        price_map = prices.build_price_map(entries, price_store.open_store(options_map))
         meta = data.new_metadata('<report_prices_db>', 0)
         for base_quote in price_map.forward_pairs:
             price_list = price_map[base_quote]
@@ -10,12 +10,14 @@ __license__ = "GNU GPLv2"
 
 import argparse
 import functools
+import json
 import logging
 import os
 import subprocess
 import shutil
 import shlex
 import re
+import urllib.request
 from os import path
 
 import lxml.html
@@ -117,7 +119,102 @@ def save_scraped_document(output_dir, url, response, contents, html_root, skippe
         outfile.write(contents)
 
 
-def bake_to_directory(webargs, output_dir, quiet=False, full_mode=True):
+# The name of the file recording the pages of a bake, used to bake incrementally.
+MANIFEST_FILENAME = '.bake-manifest.json'
+
+
+class BakeManifest:
+    """A record of the pages of a bake, to avoid re-rendering unchanged pages.
+
+    For each page baked, this records the fingerprint of the data it was
+    rendered from (see web.get_fingerprint()) and the links found on it. On a
+    subsequent bake, pages whose fingerprint has not changed are not fetched
+    again; their recorded links are followed instead.
+
+    Attributes:
+      output_dir: A string, the output directory of the bake.
+      fetch: A function to fetch full URLs with.
+      url_format: The pattern for building full URLs from paths.
+      old_pages: A dict of URL path to page record, from the previous bake.
+      new_pages: A dict of URL path to page record, for the current bake.
+      fingerprints: A dict of fingerprint URL to fingerprint string, a cache.
+    """
+
+    def __init__(self, output_dir, fetch, url_format):
+        self.output_dir = output_dir
+        self.fetch = fetch
+        self.url_format = url_format
+        self.old_pages = {}
+        self.new_pages = {}
+        self.fingerprints = {}
+
+        filename = path.join(output_dir, MANIFEST_FILENAME)
+        if path.exists(filename):
+            with open(filename) as infile:
+                self.old_pages = json.load(infile)
+
+    def get_fingerprint(self, url):
+        """Fetch the fingerprint of the data a page is rendered from.
+
+        Args:
+          url: A string, the path of a page.
+        Returns:
+          A string, the fingerprint.
+        """
+        fingerprint_url = web.get_fingerprint_url(url)
+        try:
+            return self.fingerprints[fingerprint_url]
+        except KeyError:
+            response = self.fetch(self.url_format.format(fingerprint_url))
+            fingerprint = self.fingerprints[fingerprint_url] = (
+                response.read().decode('ascii'))
+            return fingerprint
+
+    def get_cached_links(self, url):
+        """Return the links of a page if it is unchanged since the last bake.
+
+        Args:
+          url: A string, the path of a page.
+        Returns:
+          A list of link strings, or None, if the page needs to be fetched.
+        """
+        page = self.old_pages.get(url)
+        if (page is None or
+            page['fingerprint'] != self.get_fingerprint(url) or
+            not (url.endswith('/') or
+                 path.exists(path.join(self.output_dir,
+                                       normalize_filename(url).lstrip('/'))))):
+            return None
+        self.new_pages[url] = page
+        return page['links']
+
+    def save_scraped_document(self, url, response, contents, html_root, skipped_urls):
+        """Save a document being scraped and record it in the manifest.
+
+        See save_scraped_document() for a description of the arguments.
+        """
+        links = (list(scrape.iterlinks(html_root, url))
+                 if html_root is not None
+                 else [])
+        save_scraped_document(self.output_dir,
+                              url, response, contents, html_root, skipped_urls)
+        self.new_pages[url] = {'fingerprint': self.get_fingerprint(url),
+                               'links': links}
+
+    def save(self):
+        """Remove the pages which no longer exist and write out the manifest."""
+        for url in set(self.old_pages) - set(self.new_pages):
+            filename = path.join(self.output_dir, normalize_filename(url).lstrip('/'))
+            if not url.endswith('/') and path.exists(filename):
+                logging.info("Removing: '%s'", filename)
+                os.remove(filename)
+
+        with open(path.join(self.output_dir, MANIFEST_FILENAME), 'w') as outfile:
+            json.dump(self.new_pages, outfile, indent=1, sort_keys=True)
+
+
+def bake_to_directory(webargs, output_dir, quiet=False, full_mode=True,
+                      num_workers=1, in_process=False, incremental=False):
     """Serve and bake a Beancount's web to a directory.
 
     Args:
@@ -126,10 +223,25 @@ def bake_to_directory(webargs, output_dir, quiet=False, full_mode=True):
       quiet: A boolean, True to suppress web server fetch log.
       full_mode: If true, fetch the full set of pages, not just the subset that
         is palatable.
+      num_workers: An integer, the number of pages to fetch concurrently.
+      in_process: A boolean, if true, render pages by calling the web
+        application directly instead of going through a server.
+      incremental: A boolean, if true, only render the pages whose data has
+        changed since the last bake to the same directory.
     Returns:
       True on success, False otherwise.
     """
-    callback = functools.partial(save_scraped_document, output_dir)
+    if incremental:
+        url_format = 'http://localhost:{}{{}}'.format(webargs.port)
+        fetch = (scrape.wsgi_fetcher(web.app)
+                 if in_process
+                 else urllib.request.urlopen)
+        manifest = BakeManifest(output_dir, fetch, url_format)
+        callback = manifest.save_scraped_document
+        get_cached_links = manifest.get_cached_links
+    else:
+        callback = functools.partial(save_scraped_document, output_dir)
+        get_cached_links = None
 
     if full_mode:
         ignore_regexps = None
@@ -150,7 +262,12 @@ def bake_to_directory(webargs, output_dir, quiet=False, full_mode=True):
                                                      callback,
                                                      webargs.port,
                                                      ignore_regexps,
-                                                     quiet)
+                                                     quiet,
+                                                     num_workers=num_workers,
+                                                     in_process=in_process,
+                                                     get_cached_links=get_cached_links)
+    if incremental:
+        manifest.save()
 
 
 def archive(command_template, directory, archive, quiet=False):
@@ -222,6 +339,18 @@ def main():
                        help=("Don't ignore some of the more numerious pages, "
                              "like monthly reports."))
 
+    group.add_argument('-j', '--jobs', action='store', type=int, default=1,
+                       help="The number of pages to fetch concurrently.")
+
+    group.add_argument('--in-process', action='store_true',
+                       help=("Render pages by calling the web application "
+                             "directly, without running a server."))
+
+    group.add_argument('--incremental', action='store_true',
+                       help=("Bake into an existing output directory, only "
+                             "rendering the pages whose data changed since the "
+                             "last bake to it."))
+
     opts = parser.parse_args()
 
     # Figure out the archival method.
@@ -237,14 +366,19 @@ def main():
     # Check pre-conditions on input/output filenames.
     if not path.exists(opts.filename):
         raise SystemExit("ERROR: Missing input file '{}'".format(opts.filename))
-    if path.exists(opts.output):
-        raise SystemExit("ERROR: Output path already exists '{}'".format(opts.output))
-    if path.exists(output_directory):
-        raise SystemExit(
-            "ERROR: Output directory already exists '{}'".format(output_directory))
+    if opts.incremental:
+        if archival_command:
+            raise SystemExit("ERROR: Cannot bake incrementally to an archive")
+    else:
+        if path.exists(opts.output):
+            raise SystemExit("ERROR: Output path already exists '{}'".format(opts.output))
+        if path.exists(output_directory):
+            raise SystemExit(
+                "ERROR: Output directory already exists '{}'".format(output_directory))
 
     # Bake to a directory hierarchy of files with local links.
-    bake_to_directory(opts, output_directory, opts.quiet, opts.full_mode)
+    bake_to_directory(opts, output_directory, opts.quiet, opts.full_mode,
+                      opts.jobs, opts.in_process, opts.incremental)
 
     # Verify the bake output files. This is just a sanity checking step.
     # You can also use "bean-doctor validate_html <file> to run this manually.
@@ -225,6 +225,115 @@ class TestScriptBake(test_utils.TestCase):
                 path.join(tmpdir, 'link/2015-06-14.something.pdf.html')))
 
 
+    @test_utils.docfile
+    def test_bake_in_process(self, filename):
+        """
+        2013-01-01 open Expenses:Restaurant
+        2013-01-01 open Assets:Cash
+
+        2014-03-02 * "Some basic transaction"
+          Expenses:Restaurant   50.02 USD
+          Assets:Cash
+        """
+        with test_utils.tempdir() as tmpdir:
+            outdir = path.join(tmpdir, 'output')
+            with test_utils.capture('stdout', 'stderr') as (output, _):
+                test_utils.run_with_args(bake.main, self.get_args() + [
+                    '--in-process', '--jobs=4', filename, outdir])
+            self.assertTrue(output.getvalue())
+            self.assertTrue(path.exists(path.join(outdir, 'index.html')))
+            self.assertTrue(path.exists(
+                path.join(outdir, 'view/all/journal/Assets:Cash.html')))
+            directories = [root for root, _, _ in os.walk(outdir)]
+            self.assertGreater(len(directories), 10)
+
+    def test_bake_incremental(self):
+        with test_utils.tempdir() as tmpdir:
+            filename = path.join(tmpdir, 'input.beancount')
+            with open(filename, 'w') as outfile:
+                outfile.write(textwrap.dedent("""
+                  2013-01-01 open Expenses:Restaurant
+                  2013-01-01 open Assets:Cash
+
+                  2013-03-02 * "Some basic transaction"
+                    Expenses:Restaurant   50.02 USD
+                    Assets:Cash
+
+                  2014-03-02 * "Another transaction"
+                    Expenses:Restaurant   20.00 USD
+                    Assets:Cash
+                """))
+            outdir = path.join(tmpdir, 'output')
+            args = self.get_args() + ['--in-process', '--incremental', filename, outdir]
+            with test_utils.capture('stdout', 'stderr'):
+                test_utils.run_with_args(bake.main, args)
+            self.assertTrue(path.exists(path.join(outdir, bake.MANIFEST_FILENAME)))
+
+            year_filename = path.join(outdir, 'view/year/2013/balsheet.html')
+            all_filename = path.join(outdir, 'view/all/balsheet.html')
+            year_mtime = os.stat(year_filename).st_mtime_ns
+            all_mtime = os.stat(all_filename).st_mtime_ns
+
+            # Add a transaction in a later year and bake again.
+            with open(filename, 'a') as outfile:
+                outfile.write(textwrap.dedent("""
+                  2014-04-02 * "Yet another transaction"
+                    Expenses:Restaurant   30.00 USD
+                    Assets:Cash
+                """))
+            with test_utils.capture('stdout', 'stderr'):
+                test_utils.run_with_args(bake.main, args)
+
+            # The page of the unchanged view has not been rendered again.
+            self.assertEqual(year_mtime, os.stat(year_filename).st_mtime_ns)
+            self.assertNotEqual(all_mtime, os.stat(all_filename).st_mtime_ns)
+
+    def test_bake_incremental_options_and_errors(self):
+        with test_utils.tempdir() as tmpdir:
+            filename = path.join(tmpdir, 'input.beancount')
+            source = textwrap.dedent("""
+              option "operating_currency" "{}"
+
+              2013-01-01 open Expenses:Restaurant
+              2013-01-01 open Assets:Cash
+
+              2013-03-02 * "Some basic transaction"
+                Expenses:Restaurant   50.02 USD
+                Assets:Cash
+
+              2014-01-01 balance Assets:Cash   {} USD
+            """)
+            with open(filename, 'w') as outfile:
+                outfile.write(source.format('USD', '0.00'))
+            outdir = path.join(tmpdir, 'output')
+            args = self.get_args() + ['--in-process', '--incremental', filename, outdir]
+            with test_utils.capture('stdout', 'stderr'):
+                test_utils.run_with_args(bake.main, args)
+            year_filename = path.join(outdir, 'view/year/2013/balsheet.html')
+
+            # Changing an option renders the pages of all the views again.
+            year_mtime = os.stat(year_filename).st_mtime_ns
+            with open(filename, 'w') as outfile:
+                outfile.write(source.format('CAD', '0.00'))
+            with test_utils.capture('stdout', 'stderr'):
+                test_utils.run_with_args(bake.main, args)
+            self.assertNotEqual(year_mtime, os.stat(year_filename).st_mtime_ns)
+
+            # So does changing an error, even outside of the view.
+            year_mtime = os.stat(year_filename).st_mtime_ns
+            with open(filename, 'w') as outfile:
+                outfile.write(source.format('CAD', '1.00'))
+            with test_utils.capture('stdout', 'stderr'):
+                test_utils.run_with_args(bake.main, args)
+            self.assertNotEqual(year_mtime, os.stat(year_filename).st_mtime_ns)
+
+    def test_bake_incremental_archive(self):
+        with test_utils.tempdir() as tmpdir:
+            with self.assertRaises(SystemExit):
+                test_utils.run_with_args(bake.main, self.get_args() + [
+                    '--incremental', __file__, path.join(tmpdir, 'output.tar.gz')])
+
+
 class TestScriptArchive(TestScriptBake):
 
     @test_utils.docfile
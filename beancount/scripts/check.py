@@ -11,7 +11,9 @@ import sys
 
 from beancount import loader
 from beancount.utils import misc_utils
+from beancount.utils import profiling
 from beancount.ops import validation
+from beancount.parser import printer
 
 
 def main():
@@ -23,21 +25,53 @@ def main():
     parser.add_argument('-v', '--verbose', action='store_true',
                         help='Print timings.')
 
+    parser.add_argument('--profile', action='store_true',
+                        help=('Print a profile of each of the stages of loading, '
+                              'plugins and validations to stderr.'))
+
+    parser.add_argument('--profile-json', action='store', metavar='FILENAME',
+                        help='Write the profile of the stages of loading as JSON.')
+
+    parser.add_argument('--profile-memory', action='store_true',
+                        help=('Also measure the peak memory used by each stage '
+                              'in the profile. This is slow.'))
+
     opts = parser.parse_args()
 
     if opts.verbose:
         logging.basicConfig(level=logging.INFO,
                             format='%(levelname)-8s: %(message)s')
 
+    profiler = None
+    if opts.profile or opts.profile_json or opts.profile_memory:
+        profiler = profiling.Profiler(trace_memory=opts.profile_memory)
+
     with misc_utils.log_time('beancount.loader (total)', logging.info):
         # Load up the file, print errors, checking and validation are invoked
         # automatically.
-        entries, errors, _ = loader.load_file(
+        entries, errors, options_map = loader.load_file(
             opts.filename,
             log_timings=logging.info,
             log_errors=sys.stderr,
-            # Force slow and hardcore validations, just for check.
-            extra_validations=validation.HARDCORE_VALIDATIONS)
+            extra_validations=validation.HARDCORE_VALIDATIONS,
+            profiler=profiler)
+
+        # Check the data types of all the entries, including those which the
+        # loader trusted because of the "check_plugin_entries_only" option.
+        if options_map['check_plugin_entries_only']:
+            type_errors = [error
+                           for error in validation.validate_data_types(entries,
+                                                                       options_map)
+                           if error not in errors]
+            printer.print_errors(type_errors, file=sys.stderr)
+            errors.extend(type_errors)
+
+    if profiler is not None:
+        if opts.profile or opts.profile_memory:
+            sys.stderr.write(profiler.format_table())
+        if opts.profile_json:
+            with open(opts.profile_json, 'w') as file:
+                profiler.write_json(file)
 
     # Exit with an error code if there were any errors, so this can be used in a
     # shell conditional.
@@ -1,8 +1,14 @@
 __copyright__ = "Copyright (C) 2014, 2016  Martin Blais"
 __license__ = "GNU GPLv2"
 
+import json
+import sys
+import tempfile
+from unittest import mock
+
 from beancount.utils import test_utils
 from beancount.scripts import check
+from beancount import loader_test
 
 
 class TestScriptCheck(test_utils.TestCase):
@@ -39,3 +45,58 @@ class TestScriptCheck(test_utils.TestCase):
         self.assertEqual(1, result)
         self.assertRegex(stderr.getvalue(), "Balance failed")
         self.assertRegex(stderr.getvalue(), "Assets:Cash")
+
+    @test_utils.docfile
+    def test_check_plugin_entries_only(self, filename):
+        """
+        option "check_plugin_entries_only" "TRUE"
+        plugin "invalid_posting_plugin"
+
+        2013-01-01 open Expenses:Restaurant
+        2013-01-01 open Assets:Cash
+
+        2014-03-02 * "Something"
+          Expenses:Restaurant   50.02 USD
+          Assets:Cash
+        """
+        # bean-check checks the types of all the entries, regardless of the
+        # option, including those modified in place by plugins.
+        module = loader_test.create_plugin_module(
+            'invalid_posting_plugin', loader_test.append_invalid_posting, False)
+        with mock.patch.dict(sys.modules, {'invalid_posting_plugin': module}), \
+             test_utils.capture('stderr') as stderr:
+            result = test_utils.run_with_args(check.main, [filename])
+        self.assertEqual(1, result)
+        self.assertRegex(stderr.getvalue(), "Invalid data types: Invalid flag type")
+
+    @test_utils.docfile
+    def test_profile(self, filename):
+        """
+        2013-01-01 open Expenses:Restaurant
+        2013-01-01 open Assets:Cash
+
+        2014-03-02 * "Something"
+          Expenses:Restaurant   50.02 USD
+          Assets:Cash
+        """
+        with test_utils.capture('stdout', 'stderr') as (_, stderr):
+            result = test_utils.run_with_args(check.main, ['--profile', filename])
+        self.assertEqual(0, result)
+        self.assertRegex(stderr.getvalue(), r'\bbooking\b')
+        self.assertRegex(stderr.getvalue(), r'beancount\.ops\.pad')
+        self.assertRegex(stderr.getvalue(), r'validator: OpenCloseValidator')
+
+    @test_utils.docfile
+    def test_profile_json(self, filename):
+        """
+        2013-01-01 open Assets:Cash
+        """
+        with tempfile.NamedTemporaryFile('r', suffix='.json') as json_file:
+            with test_utils.capture('stdout', 'stderr'):
+                result = test_utils.run_with_args(check.main, [
+                    '--profile-json', json_file.name, filename])
+            self.assertEqual(0, result)
+            profile = json.load(json_file)
+        names = [stage['name'] for stage in profile['stages']]
+        self.assertEqual(['parse', 'booking', 'run_transformations'], names[:3])
+        self.assertIn('validate', names)
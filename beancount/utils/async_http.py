@@ -0,0 +1,236 @@
+"""An asynchronous HTTP client which reuses its connections.
+
+This is a minimal HTTP/1.1 client for GET requests, written on the streams of
+asyncio. The connections opened to each host are kept alive after a response
+has been read and are reused for the following requests to that host, so that
+a large number of requests made to the same price source does not pay for a
+new connection, and TLS handshake, every time. The number of connections
+opened to each host is bounded; requests beyond it wait for a connection to
+be returned to the pool.
+"""
+__copyright__ = "Copyright (C) 2015-2017  Martin Blais"
+__license__ = "GNU GPLv2"
+
+import asyncio
+import collections
+import logging
+import ssl
+from urllib import parse
+
+
+# A response to a request.
+#
+# Attributes:
+#   status: An integer, the HTTP status code.
+#   reason: A string, the reason phrase of the status.
+#   headers: A dict of lower-cased header names to their string values.
+#   body: A bytes object, the content of the response.
+Response = collections.namedtuple('Response', 'status reason headers body')
+
+
+# The user agent sent with the requests.
+USER_AGENT = 'beancount'
+
+
+class HTTPError(OSError):
+    """An error in the response of a server."""
+
+
+class Connection:
+    """A connection to a host, which may process several requests in sequence.
+
+    Attributes:
+      reader: An asyncio.StreamReader instance.
+      writer: An asyncio.StreamWriter instance.
+      reused: A boolean, true if the connection has already processed a
+        request.
+    """
+
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+        self.reused = False
+
+    def close(self):
+        """Close the connection."""
+        self.writer.close()
+
+    async def request(self, host, target):
+        """Make a GET request and read its response.
+
+        Args:
+          host: A string, the value of the Host header.
+          target: A string, the path and query of the request.
+        Returns:
+          A pair of a Response instance and a boolean, true if the connection
+          may be reused for another request.
+        """
+        self.writer.write(
+            'GET {} HTTP/1.1\r\n'
+            'Host: {}\r\n'
+            'User-Agent: {}\r\n'
+            'Accept-Encoding: identity\r\n'
+            'Connection: keep-alive\r\n'
+            '\r\n'.format(target, host, USER_AGENT).encode('latin-1'))
+        await self.writer.drain()
+
+        # Read the status line and the headers.
+        status_line = await self.reader.readline()
+        if not status_line:
+            raise HTTPError("Connection closed by the server")
+        try:
+            version, status, reason = status_line.decode('latin-1').rstrip(
+                '\r\n').split(' ', 2)
+            status = int(status)
+        except ValueError:
+            raise HTTPError("Invalid status line: {!r}".format(status_line))
+        headers = {}
+        while True:
+            line = await self.reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+
+        # Read the body, and find out if the connection remains usable.
+        keep_alive = (version == 'HTTP/1.1' and
+                      headers.get('connection', '').lower() != 'close')
+        if headers.get('transfer-encoding', '').lower() == 'chunked':
+            body = await self.read_chunked()
+        elif 'content-length' in headers:
+            body = await self.reader.readexactly(int(headers['content-length']))
+        elif status in (204, 304) or 100 <= status < 200:
+            body = b''
+        else:
+            body = await self.reader.read()
+            keep_alive = False
+        self.reused = True
+        return Response(status, reason, headers, body), keep_alive
+
+    async def read_chunked(self):
+        """Read a body sent with the chunked transfer encoding.
+
+        Returns:
+          A bytes object, the decoded body.
+        """
+        chunks = []
+        while True:
+            size_line = await self.reader.readline()
+            size = int(size_line.split(b';', 1)[0].strip(), 16)
+            if size == 0:
+                break
+            chunks.append(await self.reader.readexactly(size))
+            await self.reader.readexactly(2)
+        # Skip the trailer.
+        while (await self.reader.readline()) not in (b'\r\n', b'\n', b''):
+            pass
+        return b''.join(chunks)
+
+
+class ConnectionPool:
+    """A pool of keep-alive connections, to make GET requests with.
+
+    The pool may only be used from the event loop it was first used in.
+
+    Attributes:
+      max_connections: An integer, the maximum number of connections open to
+        each host at any one time.
+      timeout: A float, the number of seconds after which a request is
+        abandoned with an asyncio.TimeoutError.
+      hosts: A dict of (host, port) pairs to the (host, port) pairs to connect
+        to instead, e.g. to direct the requests made to a source to a local
+        server, or None.
+      num_connections: An integer, the number of connections opened so far.
+    """
+
+    def __init__(self, max_connections=2, timeout=5, hosts=None):
+        self.max_connections = max_connections
+        self.timeout = timeout
+        self.hosts = hosts or {}
+        self.num_connections = 0
+
+        # A dict of (scheme, host, port) to the semaphore bounding the
+        # connections to that host, and to the list of its idle connections.
+        self._semaphores = {}
+        self._idle = collections.defaultdict(list)
+        self._ssl_context = None
+
+    async def get(self, url):
+        """Fetch a URL.
+
+        Args:
+          url: A string, an http:// or https:// URL.
+        Returns:
+          A Response instance. Responses with an error status are returned as
+          any other.
+        Raises:
+          OSError: If the connection failed or the response is invalid.
+          asyncio.TimeoutError: If no response was obtained within the timeout.
+        """
+        return await asyncio.wait_for(self._get(url), self.timeout)
+
+    async def _get(self, url):
+        urlparts = parse.urlsplit(url)
+        if urlparts.scheme not in ('http', 'https'):
+            raise ValueError("Unsupported URL: {}".format(url))
+        port = urlparts.port or (443 if urlparts.scheme == 'https' else 80)
+        key = (urlparts.scheme, urlparts.hostname, port)
+        target = urlparts.path or '/'
+        if urlparts.query:
+            target += '?' + urlparts.query
+
+        semaphore = self._semaphores.get(key, None)
+        if semaphore is None:
+            semaphore = self._semaphores[key] = asyncio.Semaphore(self.max_connections)
+        async with semaphore:
+            logging.debug("Reading %s", url)
+            while True:
+                connection = await self._acquire(key)
+                try:
+                    response, keep_alive = await connection.request(urlparts.netloc,
+                                                                    target)
+                except (OSError, asyncio.IncompleteReadError) as exc:
+                    connection.close()
+                    # The server may have closed an idle connection in the
+                    # meantime; retry on a new connection.
+                    if connection.reused:
+                        continue
+                    if isinstance(exc, OSError):
+                        raise
+                    raise HTTPError("Incomplete response from {}".format(url)) from exc
+                except BaseException:
+                    connection.close()
+                    raise
+                break
+            if keep_alive:
+                self._idle[key].append(connection)
+            else:
+                connection.close()
+            return response
+
+    async def _acquire(self, key):
+        """Return an idle connection to a host, or open a new one."""
+        idle = self._idle[key]
+        while idle:
+            connection = idle.pop()
+            if not connection.reader.at_eof():
+                return connection
+            connection.close()
+        scheme, hostname, port = key
+        host, port = self.hosts.get((hostname, port), (hostname, port))
+        if scheme == 'https':
+            if self._ssl_context is None:
+                self._ssl_context = ssl.create_default_context()
+            reader, writer = await asyncio.open_connection(
+                host, port, ssl=self._ssl_context, server_hostname=hostname)
+        else:
+            reader, writer = await asyncio.open_connection(host, port)
+        self.num_connections += 1
+        return Connection(reader, writer)
+
+    def close(self):
+        """Close all the idle connections."""
+        for idle in self._idle.values():
+            for connection in idle:
+                connection.close()
+        self._idle.clear()
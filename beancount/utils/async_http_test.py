@@ -0,0 +1,112 @@
+__copyright__ = "Copyright (C) 2015-2017  Martin Blais"
+__license__ = "GNU GPLv2"
+
+import asyncio
+import socket
+import unittest
+
+from beancount.utils import async_http
+from beancount.utils import test_utils
+
+
+def run(coroutine):
+    """Run a coroutine to completion on a new event loop."""
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coroutine)
+    finally:
+        loop.close()
+
+
+class TestConnectionPool(unittest.TestCase):
+
+    def setUp(self):
+        self.server = test_utils.ReplayHTTPServer({
+            '/quote?s=HOOL': b'USD,553.37',
+            '/quote?s=AAPL': b'USD,112.12',
+            '/chunked': [b'Date,Close\n', b'2014-05-06,515.14\n'],
+            '/error': (500, b'Internal Server Error'),
+        })
+        self.server.__enter__()
+        self.addCleanup(self.server.__exit__)
+        self.url = 'http://{}:{}'.format(*self.server.address)
+
+    def fetch_all(self, pool, paths):
+        async def fetch():
+            try:
+                return await asyncio.gather(*[pool.get(self.url + path)
+                                              for path in paths])
+            finally:
+                pool.close()
+        return run(fetch())
+
+    def test_get(self):
+        pool = async_http.ConnectionPool()
+        responses = self.fetch_all(pool, ['/quote?s=HOOL', '/chunked',
+                                          '/error', '/missing'])
+        self.assertEqual([(200, b'USD,553.37'),
+                          (200, b'Date,Close\n2014-05-06,515.14\n'),
+                          (500, b'Internal Server Error'),
+                          (404, b'Not Found')],
+                         [(response.status, response.body) for response in responses])
+        self.assertEqual('10', responses[0].headers['content-length'])
+
+    def test_keep_alive(self):
+        pool = async_http.ConnectionPool(max_connections=2)
+        paths = ['/quote?s=HOOL', '/quote?s=AAPL'] * 50
+        responses = self.fetch_all(pool, paths)
+        self.assertEqual([b'USD,553.37', b'USD,112.12'] * 50,
+                         [response.body for response in responses])
+        self.assertEqual(sorted(paths), sorted(self.server.requests))
+        self.assertLessEqual(pool.num_connections, 2)
+        self.assertEqual(pool.num_connections, self.server.num_connections)
+
+    def test_hosts(self):
+        pool = async_http.ConnectionPool(hosts={('quotes.example.com', 80):
+                                                self.server.address})
+        async def fetch():
+            try:
+                return await pool.get('http://quotes.example.com/quote?s=HOOL')
+            finally:
+                pool.close()
+        self.assertEqual(b'USD,553.37', run(fetch()).body)
+
+    def test_idle_connection_closed(self):
+        self.server.requests_per_connection = 1
+        pool = async_http.ConnectionPool(max_connections=1)
+        async def fetch():
+            try:
+                return [await pool.get(self.url + path)
+                        for path in ['/quote?s=HOOL', '/quote?s=AAPL', '/chunked']]
+            finally:
+                pool.close()
+        self.assertEqual([b'USD,553.37', b'USD,112.12', b'Date,Close\n2014-05-06,515.14\n'],
+                         [response.body for response in run(fetch())])
+        self.assertEqual(3, pool.num_connections)
+
+    def test_invalid_url(self):
+        pool = async_http.ConnectionPool()
+        with self.assertRaises(ValueError):
+            run(pool.get('ftp://example.com/quote'))
+
+    def test_connection_refused(self):
+        sock = socket.socket()
+        sock.bind(('127.0.0.1', 0))
+        port = sock.getsockname()[1]
+        sock.close()
+        pool = async_http.ConnectionPool()
+        with self.assertRaises(OSError):
+            run(pool.get('http://127.0.0.1:{}/quote'.format(port)))
+
+    def test_timeout(self):
+        sock = socket.socket()
+        sock.bind(('127.0.0.1', 0))
+        sock.listen(1)
+        self.addCleanup(sock.close)
+        pool = async_http.ConnectionPool(timeout=0.1)
+        with self.assertRaises(asyncio.TimeoutError):
+            run(pool.get('http://127.0.0.1:{}/quote'.format(sock.getsockname()[1])))
+
+
+if __name__ == '__main__':
+    unittest.main()
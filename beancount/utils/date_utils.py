@@ -4,6 +4,8 @@ __copyright__ = "Copyright (C) 2014-2016  Martin Blais"
 __license__ = "GNU GPLv2"
 
 import datetime
+import functools
+import re
 
 import dateutil.parser
 
@@ -39,6 +41,95 @@ def parse_date_liberally(string):
     return dateutil.parser.parse(string).date()
 
 
+# The regular expressions of the strptime() directives which date_parser() can
+# parse without calling strptime(), and the names of the fields they set.
+_FAST_DIRECTIVES = {
+    'Y': (r'(\d{4})', 'year'),
+    'y': (r'(\d{2})', 'short_year'),
+    'm': (r'(\d{1,2})', 'month'),
+    'd': (r'(\d{1,2})', 'day'),
+}
+
+
+def compile_date_format(date_format):
+    """Compile a strptime() format of numeric fields to a regular expression.
+
+    Args:
+      date_format: A format string, e.g. '%m/%d/%Y'.
+    Returns:
+      A pair of a compiled regular expression and the list of the names of
+      the fields of its groups, or None if the format has directives other
+      than %Y, %y, %m, %d and %%.
+    """
+    pattern = []
+    fields = []
+    chars = iter(date_format)
+    for char in chars:
+        if char == '%':
+            directive = next(chars, None)
+            if directive == '%':
+                pattern.append('%')
+            elif directive in _FAST_DIRECTIVES:
+                regexp, field = _FAST_DIRECTIVES[directive]
+                pattern.append(regexp)
+                fields.append(field)
+            else:
+                return None
+        elif char.isspace():
+            pattern.append(r'\s+')
+        else:
+            pattern.append(re.escape(char))
+    if len(set(fields)) != len(fields) or 'day' not in fields or 'month' not in fields:
+        return None
+    if ('year' in fields) == ('short_year' in fields):
+        return None
+    return re.compile(''.join(pattern)), fields
+
+
+def date_parser(date_format=None):
+    """Create a function which parses date strings, memoizing its results.
+
+    If a format is given, dates are parsed as with datetime.strptime(). Formats
+    which only consist of numeric day, month and year fields, which are the
+    vast majority of those found in downloaded files, are matched with a
+    precompiled regular expression instead, which is much faster. Without a
+    format, dates are parsed with parse_date_liberally(). In any case, leading
+    and trailing whitespace is ignored, and each distinct string is only
+    parsed once.
+
+    Args:
+      date_format: A strptime() format string, or None.
+    Returns:
+      A function of a string to a datetime.date instance, which raises
+      ValueError if the string can't be parsed.
+    """
+    compiled = compile_date_format(date_format) if date_format else None
+    if compiled is not None:
+        regexp, fields = compiled
+        def parse(string):
+            match = regexp.fullmatch(string)
+            if match is None:
+                raise ValueError("Date '{}' does not match format '{}'".format(
+                    string, date_format))
+            values = dict(zip(fields, map(int, match.groups())))
+            year = values.get('year', None)
+            if year is None:
+                # Use the same pivot year as strptime().
+                year = values['short_year']
+                year += 1900 if year >= 69 else 2000
+            return datetime.date(year, values['month'], values['day'])
+    elif date_format:
+        def parse(string):
+            return datetime.datetime.strptime(string, date_format).date()
+    else:
+        parse = parse_date_liberally
+
+    @functools.lru_cache(maxsize=None)
+    def parse_cached(string):
+        return parse(string.strip())
+    return parse_cached
+
+
 def render_ofx_date(dtime):
     """Render a datetime to the OFX format.
 
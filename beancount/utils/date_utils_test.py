@@ -23,6 +23,31 @@ class TestDateUtils(unittest.TestCase):
         self.assertEqual(datetime.date(2014, 12, 7),
                          date_utils.parse_date_liberally('7-Dec-2014'))
 
+    def test_date_parser(self):
+        for date_format, string in [('%m/%d/%Y', '12/7/2014'),
+                                    ('%m/%d/%Y', ' 12/07/2014 '),
+                                    ('%d.%m.%y', '07.12.14'),
+                                    ('%Y%m%d', '20141207'),
+                                    ('%Y-%m-%d %%', '2014-12-07  %'),
+                                    ('%d %b %Y', '07 Dec 2014'),
+                                    (None, '7-Dec-2014')]:
+            parse_date = date_utils.date_parser(date_format)
+            self.assertEqual(datetime.date(2014, 12, 7), parse_date(string))
+            self.assertEqual(datetime.date(2014, 12, 7), parse_date(string))
+        self.assertEqual(datetime.date(1969, 1, 2),
+                         date_utils.date_parser('%y-%m-%d')('69-01-02'))
+
+        parse_date = date_utils.date_parser('%m/%d/%Y')
+        for string in ['2014-12-07', '12/7/14', '13/7/2014', '12/7/2014 x']:
+            with self.assertRaises(ValueError):
+                parse_date(string)
+
+    def test_compile_date_format(self):
+        self.assertIsNotNone(date_utils.compile_date_format('%d/%m/%Y'))
+        self.assertIsNone(date_utils.compile_date_format('%d %b %Y'))
+        self.assertIsNone(date_utils.compile_date_format('%m/%Y'))
+        self.assertIsNone(date_utils.compile_date_format('%d/%m/%Y/%y'))
+
     def test_next_month(self):
         self.assertEqual(datetime.date(2015, 11, 1),
                          date_utils.next_month(datetime.date(2015, 10, 1)))
@@ -3,12 +3,34 @@
 __copyright__ = "Copyright (C) 2015-2016  Martin Blais"
 __license__ = "GNU GPLv2"
 
+import time
 import urllib.error
 import logging
 from urllib import request
 
 
-def retrying_urlopen(url, timeout=5, max_retry=5):
+# The maximum delay between two attempts, in seconds.
+MAX_RETRY_DELAY = 60
+
+
+def retry_delays(max_retry, backoff):
+    """Generate the delays to wait before each attempt of a retried operation.
+
+    The first attempt is immediate, and the delays before the following ones
+    grow exponentially, doubling every time, up to MAX_RETRY_DELAY.
+
+    Args:
+      max_retry: The maximum number of attempts.
+      backoff: A float, the delay before the second attempt, in seconds. If
+        zero, attempts are made without waiting.
+    Yields:
+      Floats, the number of seconds to wait before each attempt.
+    """
+    for attempt in range(max_retry):
+        yield min(backoff * 2 ** (attempt - 1), MAX_RETRY_DELAY) if attempt else 0
+
+
+def retrying_urlopen(url, timeout=5, max_retry=5, backoff=0):
     """Open and download the given URL, retrying if it times out.
 
     Args:
@@ -16,10 +38,14 @@ def retrying_urlopen(url, timeout=5, max_retry=5):
       timeout: A timeout after which to stop waiting for a response and return an
         error.
       max_retry: The maximum number of times to retry.
+      backoff: A float, the delay before the first retry, in seconds. See
+        retry_delays().
     Returns:
       The contents of the fetched URL.
     """
-    for _ in range(max_retry):
+    for delay in retry_delays(max_retry, backoff):
+        if delay:
+            time.sleep(delay)
         logging.debug("Reading %s", url)
         try:
             response = request.urlopen(url, timeout=timeout)
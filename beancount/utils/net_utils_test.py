@@ -32,3 +32,21 @@ class TestRetryingUrlopen(unittest.TestCase):
         with mock.patch('urllib.request.urlopen',
                         side_effect=[None, None, None, None, None, None]):
             self.assertIsNone(net_utils.retrying_urlopen('http://nowhere.com'))
+
+    def test_backoff(self):
+        response = http.client.HTTPResponse(mock.MagicMock())
+        response.status = 200
+        with mock.patch('urllib.request.urlopen',
+                        side_effect=[None, None, response]):
+            with mock.patch('time.sleep') as mock_sleep:
+                self.assertIs(net_utils.retrying_urlopen('http://nowhere.com',
+                                                         backoff=0.5), response)
+        self.assertEqual([mock.call(0.5), mock.call(1.0)], mock_sleep.call_args_list)
+
+
+class TestRetryDelays(unittest.TestCase):
+
+    def test_retry_delays(self):
+        self.assertEqual([0, 1, 2, 4, 8], list(net_utils.retry_delays(5, 1)))
+        self.assertEqual([0, 0, 0], list(net_utils.retry_delays(3, 0)))
+        self.assertEqual(net_utils.MAX_RETRY_DELAY, list(net_utils.retry_delays(20, 1))[-1])
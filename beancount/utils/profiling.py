@@ -0,0 +1,246 @@
+"""Structured profiling of the stages of loading a ledger.
+
+A Profiler records, for each stage of a process, e.g., parsing, booking, each
+plugin and each validation, its wall-clock time, its CPU time, optionally its
+peak memory use, and how it changed the list of entries it processed. Stages
+may be nested. The loader creates stages with the stage() context manager,
+which does nothing if no profiler is given, in the same way log_time() does
+nothing without a logging function.
+"""
+__copyright__ = "Copyright (C) 2016  Martin Blais"
+__license__ = "GNU GPLv2"
+
+import collections
+import contextlib
+import io
+import json
+import time
+import tracemalloc
+
+
+# The profile of a single stage.
+#
+# Attributes:
+#   name: A string, the name of the stage.
+#   depth: An integer, the nesting level of the stage; top-level stages are 0.
+#   wall_time: A float, the elapsed wall-clock time, in seconds.
+#   cpu_time: A float, the CPU time of the process, in seconds, or None if not
+#     measured.
+#   memory_delta: An integer, the peak memory allocated during the stage above
+#     the memory allocated at its start, in bytes, or None if memory is not traced.
+#   num_entries: An integer, the number of entries output by the stage, or None
+#     if the stage isn't given entries.
+#   added: An integer, the number of new entries, or None.
+#   removed: An integer, the number of entries removed, or None.
+#   modified: An integer, the number of entries replaced by a different object
+#     for the same directive (with the same type and source location), or None.
+StageProfile = collections.namedtuple(
+    'StageProfile',
+    'name depth wall_time cpu_time memory_delta num_entries added removed modified')
+
+
+def entry_source_key(entry):
+    """Return a key identifying the directive an entry was created for.
+
+    Args:
+      entry: A directive.
+    Returns:
+      A hashable tuple of the type of the entry and its source location.
+    """
+    meta = entry.meta or {}
+    return (type(entry), meta.get('filename'), meta.get('lineno'))
+
+
+def count_changes(entries_before, entries_after):
+    """Count the entries added, removed and modified between two lists of entries.
+
+    Entries are compared by identity. An entry which is not in the first list is
+    counted as modified if an entry for the same directive (see
+    entry_source_key()) was removed from it, and as added otherwise.
+
+    Args:
+      entries_before: A list of directives.
+      entries_after: A list of directives.
+    Returns:
+      A triple of integers, the number of entries added, removed and modified.
+    """
+    ids_before = {id(entry): entry for entry in entries_before}
+    ids_after = {id(entry): entry for entry in entries_after}
+    new_keys = collections.Counter(entry_source_key(entry)
+                                   for entry_id, entry in ids_after.items()
+                                   if entry_id not in ids_before)
+    old_keys = collections.Counter(entry_source_key(entry)
+                                   for entry_id, entry in ids_before.items()
+                                   if entry_id not in ids_after)
+    modified = sum((new_keys & old_keys).values())
+    return (sum(new_keys.values()) - modified,
+            sum(old_keys.values()) - modified,
+            modified)
+
+
+class Stage:
+    """A stage being profiled. This is created by stage().
+
+    Attributes:
+      entries: The list of entries output by the stage, if provided. Set this
+        from the stage's code if the stage does not modify its input list in
+        place.
+    """
+
+    def __init__(self, entries=None):
+        self.entries = entries
+
+
+class Profiler:
+    """A recorder of the profiles of the stages of a process.
+
+    Attributes:
+      trace_memory: A boolean, true if memory allocations are traced. This slows
+        down the process considerably.
+      profiles: A list of StageProfile instances, in the order the stages were
+        started.
+    """
+
+    def __init__(self, trace_memory=False):
+        self.trace_memory = trace_memory
+        self.profiles = []
+
+        # A stack of the peak memory measured so far in each of the stages
+        # being run, as lists of [memory at the start, peak memory].
+        self._memory_stack = []
+
+    @contextlib.contextmanager
+    def stage(self, name, entries=None):
+        """Profile a stage. See the module-level stage() function."""
+        index = len(self.profiles)
+        depth = len(self._memory_stack)
+        self.profiles.append(None)
+        entries_before = list(entries) if entries is not None else None
+        stage = Stage(entries)
+
+        # Start tracing memory for the outermost stage.
+        started_tracing = False
+        if self.trace_memory:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                started_tracing = True
+            current, peak = tracemalloc.get_traced_memory()
+            if self._memory_stack:
+                parent = self._memory_stack[-1]
+                parent[1] = max(parent[1], peak)
+            if hasattr(tracemalloc, 'reset_peak'):
+                tracemalloc.reset_peak()
+            memory = [current, current]
+            self._memory_stack.append(memory)
+        else:
+            self._memory_stack.append(None)
+
+        time1 = time.time()
+        cpu_time1 = time.process_time()
+        try:
+            yield stage
+        finally:
+            wall_time = time.time() - time1
+            cpu_time = time.process_time() - cpu_time1
+
+            self._memory_stack.pop()
+            memory_delta = None
+            if self.trace_memory:
+                memory[1] = max(memory[1], tracemalloc.get_traced_memory()[1])
+                memory_delta = memory[1] - memory[0]
+                if self._memory_stack:
+                    parent = self._memory_stack[-1]
+                    parent[1] = max(parent[1], memory[1])
+                if started_tracing:
+                    tracemalloc.stop()
+
+            num_entries = added = removed = modified = None
+            if stage.entries is not None:
+                num_entries = len(stage.entries)
+                if entries_before is not None:
+                    added, removed, modified = count_changes(entries_before,
+                                                             stage.entries)
+
+            self.profiles[index] = StageProfile(name, depth, wall_time, cpu_time,
+                                                memory_delta, num_entries,
+                                                added, removed, modified)
+
+    def record(self, name, wall_time):
+        """Record a stage whose wall time was measured by the caller.
+
+        This is used for work which isn't run as a contiguous block, e.g., the
+        validators run together in a single pass over the entries.
+
+        Args:
+          name: A string, the name of the stage.
+          wall_time: A float, the wall-clock time spent in the stage, in seconds.
+        """
+        self.profiles.append(StageProfile(name, len(self._memory_stack), wall_time,
+                                          None, None, None, None, None, None))
+
+    def to_json(self):
+        """Convert the profiles to a JSON-serializable object.
+
+        Returns:
+          A dict with a 'stages' list of dicts, one per stage.
+        """
+        return {'stages': [profile._asdict()
+                           for profile in self.profiles
+                           if profile is not None]}
+
+    def write_json(self, file):
+        """Write the profiles as JSON to a file.
+
+        Args:
+          file: A file object to write to.
+        """
+        json.dump(self.to_json(), file, indent=2)
+        file.write('\n')
+
+    def format_table(self):
+        """Render the profiles as a human-readable table.
+
+        Returns:
+          A string, the rendered table.
+        """
+        def fmt(value, format_spec):
+            return '' if value is None else format(value, format_spec)
+
+        oss = io.StringIO()
+        line_format = '{:<48} {:>9} {:>9} {:>9} {:>8} {:>7} {:>7} {:>7}\n'
+        oss.write(line_format.format('Stage', 'Wall ms', 'CPU ms', 'Mem KB',
+                                     'Entries', 'Added', 'Removed', 'Modif'))
+        for profile in self.profiles:
+            if profile is None:
+                continue
+            oss.write(line_format.format(
+                ('  ' * profile.depth + profile.name)[:48],
+                fmt(profile.wall_time * 1000, '.1f'),
+                fmt(profile.cpu_time and profile.cpu_time * 1000, '.1f'),
+                fmt(profile.memory_delta and profile.memory_delta // 1024, 'd'),
+                fmt(profile.num_entries, 'd'),
+                fmt(profile.added, 'd'),
+                fmt(profile.removed, 'd'),
+                fmt(profile.modified, 'd')))
+        return oss.getvalue()
+
+
+@contextlib.contextmanager
+def stage(name, profiler, entries=None):
+    """A context manager that profiles a stage, if a profiler is given.
+
+    Args:
+      name: A string, the name of the stage.
+      profiler: An instance of Profiler, or None, in which case this is a no-op.
+      entries: An optional list of the entries input to the stage. If provided,
+        the changes made to it are counted. If the stage does not modify the
+        list in place, set the 'entries' attribute of the yielded Stage to the
+        output list.
+    Yields:
+      A Stage instance.
+    """
+    if profiler is None:
+        yield Stage(entries)
+    else:
+        with profiler.stage(name, entries) as stage_:
+            yield stage_
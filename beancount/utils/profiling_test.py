@@ -0,0 +1,123 @@
+__copyright__ = "Copyright (C) 2016  Martin Blais"
+__license__ = "GNU GPLv2"
+
+import io
+import json
+import unittest
+
+from beancount.core import data
+from beancount.utils import profiling
+from beancount import loader
+
+
+class TestCountChanges(unittest.TestCase):
+
+    @loader.load_doc()
+    def test_count_changes(self, entries, _, __):
+        """
+        2014-01-01 open Assets:Cash
+        2014-01-01 open Expenses:Food
+        2014-01-01 open Expenses:Drinks
+
+        2014-02-01 * "Lunch"
+          Expenses:Food     10 USD
+          Assets:Cash
+        """
+        self.assertEqual((0, 0, 0), profiling.count_changes(entries, list(entries)))
+
+        txn = entries[-1]
+        new_entries = ([entry for entry in entries[:-1]
+                        if entry.account != 'Expenses:Drinks'] +
+                       [txn._replace(narration='Dinner'),
+                        data.Note(data.new_metadata('<test>', 0), txn.date,
+                                  'Assets:Cash', 'Paid')])
+        self.assertEqual((1, 1, 1), profiling.count_changes(entries, new_entries))
+
+
+class TestProfiler(unittest.TestCase):
+
+    def test_stage_noop(self):
+        entries = [1, 2]
+        with profiling.stage('noop', None, entries) as stage:
+            self.assertIs(entries, stage.entries)
+
+    def test_stage_nested(self):
+        profiler = profiling.Profiler()
+        entries = []
+        with profiling.stage('outer', profiler, entries) as outer:
+            with profiling.stage('inner', profiler):
+                pass
+            profiler.record('recorded', 0.5)
+            outer.entries = entries + [
+                data.Note(data.new_metadata('<test>', 0), None, 'Assets:Cash', '')]
+
+        self.assertEqual([('outer', 0), ('inner', 1), ('recorded', 1)],
+                         [(profile.name, profile.depth)
+                          for profile in profiler.profiles])
+        outer_profile = profiler.profiles[0]
+        self.assertEqual((1, 1, 0, 0), (outer_profile.num_entries,
+                                        outer_profile.added,
+                                        outer_profile.removed,
+                                        outer_profile.modified))
+        self.assertIsNone(outer_profile.memory_delta)
+        self.assertGreaterEqual(outer_profile.wall_time, 0)
+        self.assertEqual(0.5, profiler.profiles[2].wall_time)
+
+    def test_stage_exception(self):
+        profiler = profiling.Profiler()
+        with self.assertRaises(ValueError):
+            with profiling.stage('failing', profiler):
+                raise ValueError
+        self.assertEqual(['failing'], [profile.name for profile in profiler.profiles])
+
+    def test_trace_memory(self):
+        profiler = profiling.Profiler(trace_memory=True)
+        with profiling.stage('outer', profiler):
+            with profiling.stage('inner', profiler):
+                objects = [object() for _ in range(10000)]
+            del objects
+        outer_profile, inner_profile = profiler.profiles
+        self.assertGreater(inner_profile.memory_delta, 10000 * 16)
+        self.assertGreaterEqual(outer_profile.memory_delta, inner_profile.memory_delta)
+
+    def test_output(self):
+        profiler = profiling.Profiler()
+        with profiling.stage('parse', profiler, []):
+            pass
+        profiler.record('validator: Something', 0.001)
+
+        oss = io.StringIO()
+        profiler.write_json(oss)
+        stages = json.loads(oss.getvalue())['stages']
+        self.assertEqual(['parse', 'validator: Something'],
+                         [stage['name'] for stage in stages])
+        self.assertEqual(0, stages[0]['num_entries'])
+        self.assertIsNone(stages[1]['cpu_time'])
+
+        table = profiler.format_table()
+        self.assertRegex(table, r'^Stage ')
+        self.assertRegex(table, r'\nvalidator: Something +1\.0 ')
+
+
+class TestLoaderProfile(unittest.TestCase):
+
+    def test_load_string(self):
+        profiler = profiling.Profiler()
+        entries, errors, _ = loader.load_string("""
+          plugin "beancount.plugins.auto_accounts"
+
+          2014-02-01 * "Lunch"
+            Expenses:Food     10 USD
+            Assets:Cash
+        """, dedent=True, profiler=profiler)
+        self.assertFalse(errors)
+        profiles = {profile.name: profile for profile in profiler.profiles}
+        self.assertEqual(0, profiles['run_transformations'].depth)
+        self.assertEqual(1, profiles['beancount.plugins.auto_accounts'].depth)
+        self.assertEqual(2, profiles['beancount.plugins.auto_accounts'].added)
+        self.assertEqual(len(entries), profiles['run_transformations'].num_entries)
+        self.assertEqual(2, profiles['validator: OpenCloseValidator'].depth)
+
+
+if __name__ == '__main__':
+    unittest.main()
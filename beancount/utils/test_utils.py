@@ -18,6 +18,8 @@ import shutil
 import itertools
 import os
 import subprocess
+import threading
+from http import server
 from os import path
 
 
@@ -364,3 +366,94 @@ def record(fun):
         return return_value
     wrapped.calls = []
     return wrapped
+
+
+class ReplayHTTPServer(server.HTTPServer):
+    """A local HTTP server which replays recorded responses.
+
+    The server runs on its own threads and keeps its connections alive, so that
+    it can stand in for the server of a price source, in order to test clients
+    without making requests over the network. Requests for unrecorded paths get
+    a 404 response.
+
+    Attributes:
+      responses: A dict of request paths, including the query, to responses.
+        Each response is either a bytes object, the body of a 200 response, a
+        pair of an integer status and a body, or a list of bytes objects, the
+        chunks of a 200 response sent with the chunked transfer encoding.
+      requests_per_connection: An integer, the number of requests after which
+        each connection is closed, without notifying the client, or None.
+      requests: A list of the paths of the requests received, in order.
+      num_connections: An integer, the number of connections accepted.
+    """
+
+    def __init__(self, responses, requests_per_connection=None):
+        super().__init__(('127.0.0.1', 0), ReplayHTTPRequestHandler)
+        self.responses = responses
+        self.requests_per_connection = requests_per_connection
+        self.requests = []
+        self.num_connections = 0
+        self.lock = threading.Lock()
+
+    @property
+    def address(self):
+        """The (host, port) pair the server listens on."""
+        return self.server_address[:2]
+
+    def process_request(self, request, client_address):
+        # Serve each connection on its own thread.
+        with self.lock:
+            self.num_connections += 1
+        thread = threading.Thread(target=self.process_request_thread,
+                                  args=(request, client_address), daemon=True)
+        thread.start()
+
+    def process_request_thread(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:  # pylint: disable=broad-except
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+
+    def __enter__(self):
+        threading.Thread(target=self.serve_forever, args=(0.05,), daemon=True).start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.shutdown()
+        self.server_close()
+
+
+class ReplayHTTPRequestHandler(server.BaseHTTPRequestHandler):
+    """The handler of the requests of a ReplayHTTPServer."""
+
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+    num_requests = 0
+
+    def do_GET(self):  # pylint: disable=invalid-name
+        with self.server.lock:
+            self.server.requests.append(self.path)
+        self.num_requests += 1
+        if self.num_requests == self.server.requests_per_connection:
+            self.close_connection = True
+        response = self.server.responses.get(self.path, (404, b'Not Found'))
+        if isinstance(response, bytes):
+            response = (200, response)
+        if isinstance(response, list):
+            self.send_response(200)
+            self.send_header('Transfer-Encoding', 'chunked')
+            self.end_headers()
+            for chunk in response + [b'']:
+                self.wfile.write('{:x}\r\n'.format(len(chunk)).encode('ascii') +
+                                 chunk + b'\r\n')
+        else:
+            status, body = response
+            self.send_response(status)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    def log_message(self, *args):  # pylint: disable=arguments-differ
+        pass
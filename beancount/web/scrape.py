@@ -1,12 +1,17 @@
 __copyright__ = "Copyright (C) 2015-2016  Martin Blais"
 __license__ = "GNU GPLv2"
 
+from concurrent import futures
 from os import path
+import email.message
+import io
 import re
+import urllib.error
 import urllib.request
 import urllib.parse
 import logging
 import os
+import wsgiref.util
 
 import lxml.html
 
@@ -41,18 +46,35 @@ def iterlinks(html, html_path):
         yield link
 
 
-def scrape_urls(url_format, callback, ignore_regexp=None):
+def scrape_urls(url_format, callback, ignore_regexp=None,
+                fetch=None, num_workers=1, get_cached_links=None):
     """Recursively scrape pages from a web address.
 
+    Pages are fetched concurrently by a pool of 'num_workers' threads. Regardless
+    of the number of workers, the callback is always invoked from the calling
+    thread, one page at a time.
+
     Args:
       url_format: The pattern for building links from relative paths.
       callback: A callback function to invoke on each page to validate it.
         The function is called with the response and the url as arguments.
         This function should trigger an error on failure (via an exception).
       ignore_regexp: A regular expression string, the urls to ignore.
+      fetch: An optional function to fetch a full URL with, returning a response
+        object with the same interface as that of urllib.request.urlopen(). If
+        not provided, urlopen() is used. See wsgi_fetcher() for an alternative.
+      num_workers: An integer, the number of pages to fetch concurrently.
+      get_cached_links: An optional function which, given a URL, returns the
+        list of links found on its page when it was last processed if that page
+        does not need to be fetched again, or None if it does. Pages with cached
+        links are not fetched and the callback is not invoked for them; their
+        links are followed as if they had been.
     Returns:
       A set of all the processed URLs and a set of all the skipped URLs.
     """
+    if fetch is None:
+        fetch = lambda url: urllib.request.urlopen(url)
+
     # The set of all URLs seen so far.
     seen = set()
 
@@ -64,15 +86,45 @@ def scrape_urls(url_format, callback, ignore_regexp=None):
     all_processed_urls = set()
     all_skipped_urls = set()
 
-    # Loop over all URLs remaining to process.
-    while process_list:
-        url = process_list.pop()
+    def schedule_links(links):
+        """Register all the unseen links to be processed.
 
+        Args:
+          links: An iterable of URL strings.
+        Returns:
+          A set of the links which were skipped.
+        """
+        skipped_urls = set()
+        for link in links:
+
+            # Skip URLs to be ignored.
+            if ignore_regexp and re.match(ignore_regexp, link):
+                logging.debug("Skipping: %s", link)
+                skipped_urls.add(link)
+                all_skipped_urls.add(link)
+                continue
+
+            # Check if link has already been seen.
+            if link in seen:
+                logging.debug('Seen: "%s"', link)
+                continue
+
+            # Schedule the link for scraping.
+            logging.debug('Scheduling: "%s"', link)
+            process_list.append(link)
+            seen.add(link)
+        return skipped_urls
+
+    def fetch_url(url):
+        """Fetch a URL and read its contents. This runs in a worker thread.
+
+        Args:
+          url: A string, the URL path to fetch.
+        Returns:
+          A pair of the response object and its contents, as bytes.
+        """
         logging.debug("Processing: %s", url)
-        all_processed_urls.add(url)
-
-        # Fetch the URL and check its return status.
-        response = urllib.request.urlopen(url_format.format(url))
+        response = fetch(url_format.format(url))
 
         # Generate errors on redirects.
         redirected_url = urllib.parse.urlparse(response.geturl()).path
@@ -80,42 +132,137 @@ def scrape_urls(url_format, callback, ignore_regexp=None):
             logging.error("Redirected: %s -> %s", url, redirected_url)
 
         # Read the contents. This can only be done once.
-        response_contents = response.read()
-
-        skipped_urls = set()
-        content_type = response.info().get_content_type()
-        if content_type == 'text/html':
-            # Process all the links in the page and register all the unseen links to
-            # be processed.
-            html_root = lxml.html.document_fromstring(response_contents)
-            for link in iterlinks(html_root, url):
-
-                # Skip URLs to be ignored.
-                if ignore_regexp and re.match(ignore_regexp, link):
-                    logging.debug("Skipping: %s", link)
-                    skipped_urls.add(link)
-                    all_skipped_urls.add(link)
+        return response, response.read()
+
+    # Loop over all URLs remaining to process, keeping up to 'num_workers'
+    # requests in flight at any time.
+    with futures.ThreadPoolExecutor(max_workers=num_workers) as executor:
+        pending = {}
+        while process_list or pending:
+            while process_list and len(pending) < num_workers:
+                url = process_list.pop()
+                all_processed_urls.add(url)
+
+                cached_links = get_cached_links(url) if get_cached_links else None
+                if cached_links is not None:
+                    logging.debug("Cached: %s", url)
+                    schedule_links(cached_links)
                     continue
 
-                # Check if link has already been seen.
-                if link in seen:
-                    logging.debug('Seen: "%s"', link)
-                    continue
+                pending[executor.submit(fetch_url, url)] = url
+
+            if not pending:
+                continue
 
-                # Schedule the link for scraping.
-                logging.debug('Scheduling: "%s"', link)
-                process_list.append(link)
-                seen.add(link)
+            done, _ = futures.wait(pending, return_when=futures.FIRST_COMPLETED)
+            for future in sorted(done, key=pending.get):
+                url = pending.pop(future)
+                response, response_contents = future.result()
 
-        else:
-            html_root = None
+                content_type = response.info().get_content_type()
+                if content_type == 'text/html':
+                    # Process all the links in the page and register all the
+                    # unseen links to be processed.
+                    html_root = lxml.html.document_fromstring(response_contents)
+                    skipped_urls = schedule_links(iterlinks(html_root, url))
+                else:
+                    html_root = None
+                    skipped_urls = set()
 
-        # Call back for processing.
-        callback(url, response, response_contents, html_root, skipped_urls)
+                # Call back for processing.
+                callback(url, response, response_contents, html_root, skipped_urls)
 
     return all_processed_urls, all_skipped_urls
 
 
+class WSGIResponse:
+    """A response from a WSGI application, mimicking that of urlopen().
+
+    Attributes:
+      url: A string, the originally requested URL.
+      status: An integer, the HTTP status code of the response.
+      headers: An instance of email.message.Message, the response headers.
+    """
+
+    def __init__(self, url, final_url, status, headers, contents):
+        self.url = url
+        self.status = status
+        self.headers = headers
+        self._final_url = final_url
+        self._contents = contents
+
+    def geturl(self):
+        """Return the URL of the resource retrieved, after redirects."""
+        return self._final_url
+
+    def info(self):
+        """Return the response headers."""
+        return self.headers
+
+    def read(self):
+        """Return the contents of the response, as bytes."""
+        return self._contents
+
+
+def wsgi_fetcher(wsgi_app, max_redirects=10):
+    """Create a function that fetches URLs by calling a WSGI app in-process.
+
+    This bypasses HTTP sockets and the server entirely, which avoids the
+    overhead of the network stack and of the single-threaded development server.
+    Redirects are followed, and error statuses raise an HTTPError exception, just
+    like urllib.request.urlopen() does.
+
+    Args:
+      wsgi_app: A WSGI application callable.
+      max_redirects: An integer, the maximum number of redirects to follow.
+    Returns:
+      A function that accepts a full URL and returns a WSGIResponse instance.
+    """
+    def fetch(url):
+        final_url = url
+        for _ in range(max_redirects + 1):
+            urlparts = urllib.parse.urlsplit(final_url)
+            environ = {
+                'REQUEST_METHOD': 'GET',
+                'PATH_INFO': urllib.parse.unquote(urlparts.path) or '/',
+                'QUERY_STRING': urlparts.query,
+                'wsgi.input': io.BytesIO(),
+                'wsgi.errors': io.StringIO(),
+            }
+            if urlparts.netloc:
+                environ['HTTP_HOST'] = urlparts.netloc
+            wsgiref.util.setup_testing_defaults(environ)
+
+            status_headers = []
+            def start_response(status, headers, exc_info=None):
+                status_headers[:] = [status, headers]
+            chunks = wsgi_app(environ, start_response)
+            try:
+                contents = b''.join(chunks)
+            finally:
+                if hasattr(chunks, 'close'):
+                    chunks.close()
+
+            status, headerlist = status_headers
+            code = int(status.split()[0])
+            headers = email.message.Message()
+            for name, value in headerlist:
+                headers[name] = value
+
+            if code in (301, 302, 303, 307, 308):
+                final_url = urllib.parse.urljoin(final_url, headers['Location'])
+                continue
+            if code >= 400:
+                raise urllib.error.HTTPError(final_url, code, status, headers,
+                                             io.BytesIO(contents))
+            return WSGIResponse(url, final_url, code, headers, contents)
+
+        raise urllib.error.HTTPError(final_url, code, "Too many redirects",
+                                     headers, None)
+
+    return fetch
+
+
 def validate_local_links(filename):
     """Open and parse the given HTML filename and verify all local targets exist.
 
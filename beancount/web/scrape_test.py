@@ -4,6 +4,7 @@ __license__ = "GNU GPLv2"
 import os
 import collections
 import textwrap
+import urllib.error
 import urllib.parse
 import re
 from os import path
@@ -95,6 +96,67 @@ class TestScrapeURLs(test_utils.TestCase):
                              '/path/to/file1',
                              '/path/to/image.png'}, set(self.results.keys()))
 
+    @mock.patch('urllib.request.urlopen', fetch_url)
+    def test_scrape_urls__concurrent(self):
+        url_format = 'http://something{}'
+        self.results = {}
+        scrape.scrape_urls(url_format, self.callback, ignore_regexp='^/doc',
+                           num_workers=4)
+        self.assertSetEqual({'/',
+                             '/path/to/file1',
+                             '/path/to/image.png'}, set(self.results.keys()))
+
+    def test_scrape_urls__fetch(self):
+        url_format = 'http://something{}'
+        self.results = {}
+        scrape.scrape_urls(url_format, self.callback,
+                           fetch=TestScrapeURLs.fetch_url)
+        self.assertSetEqual({'/',
+                             '/path/to/file1',
+                             '/path/to/image.png'}, set(self.results.keys()))
+
+    @mock.patch('urllib.request.urlopen', fetch_url)
+    def test_scrape_urls__cached_links(self):
+        url_format = 'http://something{}'
+        self.results = {}
+        cached = {'/path/to/file1': ['/path/to/image.png']}
+        processed, _ = scrape.scrape_urls(url_format, self.callback,
+                                          get_cached_links=cached.get)
+        self.assertSetEqual({'/', '/path/to/file1', '/path/to/image.png'}, processed)
+        self.assertSetEqual({'/',
+                             '/path/to/image.png'}, set(self.results.keys()))
+
+
+class TestWSGIFetcher(test_utils.TestCase):
+
+    @staticmethod
+    def wsgi_app(environ, start_response):
+        urlpath = environ['PATH_INFO']
+        if urlpath == '/':
+            start_response('302 Found', [('Location', '/index?a=1')])
+            return [b'']
+        elif urlpath == '/index':
+            start_response('200 OK', [('Content-Type', 'text/html')])
+            return ['<html>{}</html>'.format(environ['QUERY_STRING']).encode('utf8')]
+        else:
+            start_response('404 Not Found', [('Content-Type', 'text/plain')])
+            return [b'Not found']
+
+    def test_wsgi_fetcher(self):
+        fetch = scrape.wsgi_fetcher(self.wsgi_app)
+        response = fetch('http://localhost:8080/')
+        self.assertEqual(200, response.status)
+        self.assertEqual('http://localhost:8080/', response.url)
+        self.assertEqual('http://localhost:8080/index?a=1', response.geturl())
+        self.assertEqual('text/html', response.info().get_content_type())
+        self.assertEqual(b'<html>a=1</html>', response.read())
+
+    def test_wsgi_fetcher__error(self):
+        fetch = scrape.wsgi_fetcher(self.wsgi_app)
+        with self.assertRaises(urllib.error.HTTPError) as context:
+            fetch('http://localhost:8080/missing')
+        self.assertEqual(404, context.exception.code)
+
 
 class TestScrapeVerification(test_utils.TestCase):
 
@@ -83,15 +83,18 @@ class View:
         account_types = options.get_account_types(options_map)
         with misc_utils.log_time('realize_opening', logging.info):
             self.opening_real_accounts = realization.realize(self.opening_entries,
-                                                             account_types)
+                                                             account_types,
+                                                             compact=True)
 
         with misc_utils.log_time('realize', logging.info):
             self.real_accounts = realization.realize(self.entries,
-                                                     account_types)
+                                                     account_types,
+                                                     compact=True)
 
         with misc_utils.log_time('realize_closing', logging.info):
             self.closing_real_accounts = realization.realize(self.closing_entries,
-                                                             account_types)
+                                                             account_types,
+                                                             compact=True)
 
         assert self.real_accounts is not None
         assert self.closing_real_accounts is not None
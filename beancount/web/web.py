@@ -7,12 +7,14 @@ __license__ = "GNU GPLv2"
 
 import argparse
 from os import path
+import hashlib
 import io
 import logging
 import re
 import sys
 import time
 import threading
+import urllib.parse
 import datetime
 import calendar
 
@@ -28,6 +30,8 @@ from beancount.core import compare
 from beancount.core import convert
 from beancount.ops import basicops
 from beancount.core import prices
+from beancount.core import price_store
+from beancount.core import realization
 from beancount.utils import misc_utils
 from beancount.utils import text_utils
 from beancount.web import bottle_utils
@@ -707,21 +711,135 @@ def networth():
     "Render a table of the net worth for this filter."
 
     html_table = render_report(holdings_reports.NetWorthReport, request.view.entries)
+    html_series_table = render_report(holdings_reports.NetWorthReport,
+                                      request.view.entries, ['--period', 'monthly'])
     return render_view(
         pagetitle="Net Worth",
-        contents=html_table)
+        contents=html_table + '<h2>Monthly</h2>\n' + html_series_table)
 
 
 
 @viewapp.route('/journal/all', name='journal_all')
 def journal_all():
     "A list of all the entries in this realization."
-    bottle.redirect(request.app.get_url('journal', account_name=''))
+    url = request.app.get_url('journal', account_name='')
+    if request.query_string:
+        url = '{}?{}'.format(url, request.query_string)
+    bottle.redirect(url)
+
+
+# The number of rows to render per page of a journal.
+JOURNAL_PAGE_SIZE = 500
+
+
+# A cache of journal indexes, keyed by (view, account name). This is reset along
+# with the view cache when the input file is reloaded.
+app.journal_indexes = {}
+
+
+def get_journal_index(real_accounts, account_name):
+    """Get the cached index of the journal of an account in the current view.
+
+    Args:
+      real_accounts: The root RealAccount instance to find the account in.
+      account_name: A string, the name of the account, or an empty string, for
+        the journal of all accounts.
+    Returns:
+      An instance of journal_html.JournalIndex.
+    Raises:
+      bottle.HTTPError: If the account does not exist.
+    """
+    key = (request.view, account_name)
+    try:
+        journal_index = app.journal_indexes[key]
+    except KeyError:
+        real_account = (realization.get(real_accounts, account_name)
+                        if account_name
+                        else real_accounts)
+        if real_account is None:
+            raise bottle.HTTPError(404, "Invalid account: '{}'".format(account_name))
+        txn_postings = realization.get_postings(real_account)
+        journal_index = app.journal_indexes[key] = journal_html.build_journal_index(
+            txn_postings, JOURNAL_PAGE_SIZE)
+    return journal_index
+
+
+JOURNAL_PAGER = bottle.SimpleTemplate("""
+<p class="pager">
+  % if page > 0:
+  <a href="{{newer_query}}">&laquo; Newer</a>
+  % end
+  <span>Page {{page+1}} of {{num_pages}}</span>
+  % if page + 1 < num_pages:
+  <a href="{{older_query}}" class="older">Older &raquo;</a>
+  % end
+</p>
+""")
+
+
+def get_page_query(query, page):
+    """Build the query string of a page of a journal.
+
+    Args:
+      query: A bottle.MultiDict of the query parameters of the current page.
+      page: An integer, the page number to link to.
+    Returns:
+      A string, the query string with the same parameters as 'query', but the
+      page number replaced.
+    """
+    params = [(key, value)
+              for key, value in query.allitems()
+              if key not in ('page', 'partial')]
+    params.append(('page', str(page)))
+    return '?' + urllib.parse.urlencode(params)
+
+# A script that fetches older pages of a journal and appends their rows to the
+# current table when the "Older" link is clicked, instead of navigating to it.
+JOURNAL_SCRIPT = """
+<script>
+document.addEventListener('click', function(event) {
+  var link = event.target;
+  if (!link.classList || !link.classList.contains('older')) {
+    return;
+  }
+  event.preventDefault();
+  var url = new URL(link.href);
+  url.searchParams.set('partial', '1');
+  var request = new XMLHttpRequest();
+  request.open('GET', url.href);
+  request.onload = function() {
+    if (request.status != 200) {
+      window.location = link.getAttribute('href');
+      return;
+    }
+    var table = document.querySelector('table.entry-table');
+    table.insertAdjacentHTML('beforeend', request.responseText);
+    var page = parseInt(request.getResponseHeader('X-Journal-Page'));
+    var num_pages = parseInt(request.getResponseHeader('X-Journal-Pages'));
+    if (page + 1 < num_pages) {
+      // Keep the other parameters of the page, e.g. 'postings'.
+      url.searchParams.delete('partial');
+      url.searchParams.set('page', page + 1);
+      link.setAttribute('href', url.search);
+    } else {
+      link.parentNode.removeChild(link);
+    }
+  };
+  request.send();
+});
+</script>
+"""
 
 
 @viewapp.route('/journal/<account_name:re:.*>', name='journal')
 def journal_(account_name=None):
-    "A list of all the entries for this account realization."
+    """A list of all the entries for this account realization.
+
+    The journal is rendered newest-first, one page of JOURNAL_PAGE_SIZE rows at a
+    time; the 'page' query parameter selects which. If the 'partial' parameter is
+    set, only the rows of the table are returned, for the client to append to an
+    already rendered page.
+    """
 
     # Ensure we support slashes and colons equally.
     # Old style used to be slashes; now we're using colons, it works everywhere.
@@ -734,26 +852,48 @@ def journal_(account_name=None):
                                                                    app.account_types):
             real_accounts = request.view.closing_real_accounts
 
-    # Render the report.
-    args = []
-    if account_name:
-        args.append('--account={}'.format(account_name))
-
     render_postings = request.params.get('postings', True)
     if isinstance(render_postings, str):
         render_postings = render_postings.lower() in ('1', 'true')
-    if render_postings:
-        args.append('--verbose')
 
     try:
-        html_journal = render_real_report(journal_reports.JournalReport,
-                                          real_accounts, args, leaf_only=False)
-    except KeyError as e:
-        raise bottle.HTTPError(404, '{}'.format(e))
+        page = int(request.params.get('page', 0))
+    except ValueError:
+        raise bottle.HTTPError(400, "Invalid page number")
+    partial = bool(request.params.get('partial', False))
+
+    journal_index = get_journal_index(real_accounts, account_name)
+    num_pages = journal_html.get_num_pages(journal_index, JOURNAL_PAGE_SIZE)
+    if not 0 <= page < num_pages:
+        raise bottle.HTTPError(404, "Invalid page number: {}".format(page))
 
+    formatter = HTMLFormatter(app.options['dcontext'],
+                              request.app.get_url, False)
+    oss = io.StringIO()
+    journal_html.html_entries_table_with_balance_page(
+        oss, journal_index, formatter, page, JOURNAL_PAGE_SIZE, render_postings,
+        header=not partial)
+
+    if partial:
+        response.content_type = 'text/html'
+        response.set_header('X-Journal-Page', str(page))
+        response.set_header('X-Journal-Pages', str(num_pages))
+        return oss.getvalue()
+
+    pager = JOURNAL_PAGER.render(page=page, num_pages=num_pages,
+                                 newer_query=get_page_query(request.query, page - 1),
+                                 older_query=get_page_query(request.query, page + 1))
     return render_view(pagetitle='{}'.format(account_name or
                                              'General Ledger (All Accounts)'),
-                       contents=html_journal)
+                       contents=oss.getvalue() + pager,
+                       scripts=JOURNAL_SCRIPT)
+
+
+@viewapp.route('/fingerprint', name='view_fingerprint')
+def view_fingerprint():
+    "Render a hash of the contents of this view, see get_fingerprint_url()."
+    response.content_type = 'text/plain'
+    return get_fingerprint(request.view)
 
 
 @viewapp.route('/conversions', name='conversions')
@@ -858,8 +998,10 @@ def stats_postings():
 # Views.
 
 
-# A cache for views that have been created (on access).
+# A cache for views that have been created (on access), and a lock to avoid
+# creating the same view more than once when serving concurrent requests.
 app.views = {}
+app.views_lock = threading.Lock()
 
 
 def handle_view(path_depth):
@@ -877,12 +1019,13 @@ def handle_view(path_depth):
         def wrapper(*args, **kwargs):
             components = request.path.split('/')
             viewid = '/'.join(components[:path_depth+1])
-            try:
-                # Try fetching the view from the cache.
-                view = app.views[viewid]
-            except KeyError:
-                # We need to create the view.
-                view = app.views[viewid] = callback(*args, **kwargs)
+            with app.views_lock:
+                try:
+                    # Try fetching the view from the cache.
+                    view = app.views[viewid]
+                except KeyError:
+                    # We need to create the view.
+                    view = app.views[viewid] = callback(*args, **kwargs)
 
             # Save the view for the subrequest and redirect. populate_view()
             # picks this up and saves it in request.view.
@@ -926,7 +1069,8 @@ def url_restrict_generator(url_prefix):
                                       '/source',
                                       '/link',
                                       '/context',
-                                      '/third_party']]
+                                      '/third_party',
+                                      '/fingerprint']]
 
     def url_restrict_handler(callback):
         def wrapper(*args, **kwargs):
@@ -994,6 +1138,86 @@ def component(component=None, path=None):
                                'Component: {}'.format(component), component)
 
 
+# A regular expression matching the prefix of the URLs of pages served by views.
+VIEW_PREFIX_REGEXP = re.compile(r'/view/(all|year/\d\d\d\d/month/\d\d|year/\d\d\d\d|'
+                                r'(tag|payee|component)/[^/]*)/')
+
+
+# A cache of fingerprints of the global application and of views, keyed by view
+# (or None, for the global application). This is reset on reload.
+app.fingerprints = {}
+
+
+def render_options_key(options_map):
+    """Render the options pages are rendered with to a comparable value.
+
+    Args:
+      options_map: A dict of options, as produced by the parser.
+    Returns:
+      A sorted list of pairs of option name and string value. The hash of the
+      input files is excluded, as it changes with any modification.
+    """
+    return sorted((key, str(sorted(value) if isinstance(value, set) else value))
+                  for key, value in options_map.items()
+                  if key != 'input_hash')
+
+
+def get_fingerprint(view=None):
+    """Compute a hash of the data which pages of a view are rendered from.
+
+    Two pages rendered from data with the same fingerprint are identical. This is
+    used by bean-bake to avoid rendering pages again if they have not changed.
+    The fingerprint of a view covers its entries, and the options and errors of
+    the ledger, which all the pages render.
+
+    Args:
+      view: An instance of views.View, or None, for the pages of the global
+        application, which are rendered from the full list of entries.
+    Returns:
+      A string, a hexadecimal hash.
+    """
+    try:
+        return app.fingerprints[view]
+    except KeyError:
+        pass
+    md5 = hashlib.md5()
+    # All the pages render the options, e.g. the title or the display context,
+    # and the errors, e.g. their count in the header.
+    md5.update(repr((render_options_key(app.options), app.active_years))
+               .encode('utf8'))
+    for error in app.errors:
+        md5.update(error.message.encode('utf8'))
+    if view is None:
+        md5.update(app.source.encode('utf8'))
+    for entry in (app.entries if view is None else view.entries):
+        md5.update('{}{}:{}'.format(compare.hash_entry(entry),
+                                    entry.meta.get('filename'),
+                                    entry.meta.get('lineno')).encode('utf8'))
+    fingerprint = app.fingerprints[view] = md5.hexdigest()
+    return fingerprint
+
+
+def get_fingerprint_url(url):
+    """Get the URL of the fingerprint of the data a page is rendered from.
+
+    Args:
+      url: A string, the path of a page served by this application.
+    Returns:
+      A string, the path of the page serving its fingerprint.
+    """
+    match = VIEW_PREFIX_REGEXP.match(url)
+    return (app.router.build('fingerprint')
+            if match is None
+            else '{}fingerprint'.format(match.group(0)))
+
+
+@app.route('/fingerprint', name='fingerprint')
+def fingerprint():
+    "Render a hash of the contents of the ledger, see get_fingerprint_url()."
+    response.content_type = 'text/plain'
+    return get_fingerprint()
+
+
 #--------------------------------------------------------------------------------
 # Bootstrapping and main program.
 
@@ -1028,13 +1252,16 @@ def auto_reload_input_file(callback):
             app.account_types = options.get_account_types(options_map)
 
             # Pre-compute the price database.
-            app.price_map = prices.build_price_map(entries)
+            app.price_map = prices.build_price_map(entries,
+                                                   price_store.open_store(options_map))
 
             # Pre-compute the list of active years.
             app.active_years = list(getters.get_active_years(entries))
 
             # Reset the view cache.
             app.views.clear()
+            app.journal_indexes.clear()
+            app.fingerprints.clear()
 
         else:
             # For now, the overlay is a link to the errors page. Always render
@@ -1070,10 +1297,15 @@ def incognito(callback):
 # Global template.
 template = None
 
-def run_app(args, quiet=None):
-    logging.basicConfig(level=logging.INFO,
-                        format='%(levelname)-8s: %(message)s')
+def setup_app(args):
+    """Install the plugins and load the templates required to serve the app.
 
+    Args:
+      args: An argparse parsed options object, with all the options from
+        add_web_arguments().
+    Returns:
+      A function to call to uninstall the plugins when done serving.
+    """
     app_installs = []
     view_installs = []
 
@@ -1102,18 +1334,30 @@ def run_app(args, quiet=None):
     with open(path.join(path.dirname(__file__), 'web.css')) as f:
         global STYLE; STYLE = f.read()
 
-    # Run the server.
     app.args = args
+
+    def teardown():
+        "Uninstall applications."
+        for function in app_installs:
+            app.uninstall(function)
+        for function in view_installs:
+            viewapp.uninstall(function)
+    return teardown
+
+
+def run_app(args, quiet=None):
+    logging.basicConfig(level=logging.INFO,
+                        format='%(levelname)-8s: %(message)s')
+
+    teardown = setup_app(args)
+
+    # Run the server.
     bind_address = '0.0.0.0' if args.public else 'localhost'
     app.run(host=bind_address, port=args.port,
             debug=args.debug, reloader=False,
             quiet=args.quiet if hasattr(args, 'quiet') else quiet)
 
-    # Uninstall applications.
-    for function in app_installs:
-        app.uninstall(function)
-    for function in view_installs:
-        viewapp.uninstall(function)
+    teardown()
 
 
 # The global server instance.
@@ -1192,7 +1436,8 @@ def main():
     run_app(args)
 
 
-def scrape_webapp(filename, callback, port, ignore_regexp, quiet=True, extra_args=None):
+def scrape_webapp(filename, callback, port, ignore_regexp, quiet=True, extra_args=None,
+                  num_workers=1, in_process=False, get_cached_links=None):
     """Run a web server on a Beancount file and scrape it.
 
     This is the main entry point of this module.
@@ -1207,6 +1452,11 @@ def scrape_webapp(filename, callback, port, ignore_regexp, quiet=True, extra_arg
       quiet: True if we shouldn't log the web server pages.
       extra_args: Extra arguments to bean-web that we want to start the
         server with.
+      num_workers: An integer, the number of pages to fetch concurrently.
+      in_process: A boolean, if true, don't start a server; call the application
+        directly instead, without going through HTTP sockets.
+      get_cached_links: An optional function to avoid fetching pages which have
+        not changed. See scrape.scrape_urls().
     Returns:
       A set of all the processed URLs and a set of all the skipped URLs.
     """
@@ -1224,16 +1474,26 @@ def scrape_webapp(filename, callback, port, ignore_regexp, quiet=True, extra_arg
         all_args.extend(extra_args)
     args = argparser.parse_args(args=all_args)
 
-    thread = thread_server_start(args)
+    if in_process:
+        teardown = setup_app(args)
+        fetch = scrape.wsgi_fetcher(app)
+    else:
+        thread = thread_server_start(args)
+        fetch = None
 
     # Skips:
     # - Docs cannot be read for external files.
     #
     # - Components views... well there are just too many, makes the tests
     #   impossibly slow. Just keep the A's so some are covered.
-    url_lists = scrape.scrape_urls(url_format, callback, ignore_regexp)
-
-    thread_server_shutdown(thread)
+    try:
+        url_lists = scrape.scrape_urls(url_format, callback, ignore_regexp,
+                                       fetch, num_workers, get_cached_links)
+    finally:
+        if in_process:
+            teardown()
+        else:
+            thread_server_shutdown(thread)
 
     return url_lists
 
@@ -5,10 +5,28 @@ import unittest
 import urllib.parse
 from os import path
 
+import bottle
+
 from beancount.web import web
 from beancount.utils import test_utils
 
 
+class TestJournalPager(unittest.TestCase):
+
+    def test_get_page_query(self):
+        query = bottle.MultiDict([('postings', 'false'), ('page', '2'), ('partial', '1')])
+        self.assertEqual('?postings=false&page=3', web.get_page_query(query, 3))
+        self.assertEqual('?page=0', web.get_page_query(bottle.MultiDict(), 0))
+
+    def test_render_pager(self):
+        query = bottle.MultiDict([('postings', 'false'), ('page', '1')])
+        html = web.JOURNAL_PAGER.render(page=1, num_pages=3,
+                                        newer_query=web.get_page_query(query, 0),
+                                        older_query=web.get_page_query(query, 2))
+        self.assertIn('href="?postings=false&amp;page=0"', html)
+        self.assertIn('href="?postings=false&amp;page=2"', html)
+
+
 class TestWeb(unittest.TestCase):
 
     # Docs cannot be read for external files.
@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""Benchmark the full booking algorithm on accounts holding many lots.
+
+This generates a ledger with a FIFO account accumulating a small lot every day,
+as dividend reinvestments do, with a sale every month, and a STRICT account
+whose sales name the lot they reduce by its cost. It times booking the parsed
+entries; run it on an older checkout to compare implementations, e.g., before
+booking_full indexed the lots of each account.
+"""
+__copyright__ = "Copyright (C) 2016  Martin Blais"
+__license__ = "GNU GPLv2"
+
+import argparse
+import datetime
+import hashlib
+import io
+import logging
+import random
+
+from beancount.core import data
+from beancount.core import inventory
+from beancount.parser import booking
+from beancount.parser import parser
+
+from bench_realize import benchmark
+
+
+def generate_ledger(num_days, seed=0):
+    """Generate a ledger with accounts accumulating a lot per day.
+
+    Args:
+      num_days: An integer, the number of days of purchases.
+      seed: An integer, the seed for the random prices.
+    Returns:
+      A string, the ledger.
+    """
+    rnd = random.Random(seed)
+    oss = io.StringIO()
+    oss.write('2000-01-01 open Assets:Fifo  "FIFO"\n'
+              '2000-01-01 open Assets:Strict  "STRICT"\n'
+              '2000-01-01 open Assets:Cash\n'
+              '2000-01-01 open Income:Gains\n\n')
+    date = datetime.date(2000, 1, 2)
+    strict_prices = []
+    for day in range(num_days):
+        # Make the prices unique, so that they identify each lot.
+        price = '{}.{:05d}'.format(rnd.randrange(50, 150), day)
+        oss.write('{} * "Reinvest"\n'
+                  '  Assets:Fifo      0.5 HOOL {{{} USD}}\n'
+                  '  Assets:Strict    1 HOOL {{{} USD}}\n'
+                  '  Assets:Cash\n\n'.format(date, price, price))
+        strict_prices.append(price)
+        if day % 30 == 29:
+            sold_price = strict_prices.pop(rnd.randrange(len(strict_prices)))
+            oss.write('{} * "Sell"\n'
+                      '  Assets:Fifo     -7 HOOL {{}} @ 100.00 USD\n'
+                      '  Assets:Strict   -1 HOOL {{{} USD}} @ 100.00 USD\n'
+                      '  Assets:Cash      800.00 USD\n'
+                      '  Income:Gains\n\n'.format(date, sold_price))
+        date += datetime.timedelta(days=1)
+    return oss.getvalue()
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format='%(levelname)-8s: %(message)s')
+    parser_ = argparse.ArgumentParser(description=__doc__.strip())
+    parser_.add_argument('--days', type=int, default=5000,
+                         help='Number of days of purchases')
+    parser_.add_argument('--repeat', type=int, default=3,
+                         help='Number of runs')
+    args = parser_.parse_args()
+
+    entries, errors, options_map = parser.parse_string(generate_ledger(args.days))
+    assert not errors, errors[:1]
+    logging.info("%d entries", len(entries))
+
+    elapsed, (booked_entries, errors) = benchmark(
+        booking.book, entries, options_map, repeat=args.repeat)
+    print('{:40}: {:8.3f} secs'.format('book', elapsed))
+    assert not errors, errors[:1]
+
+    # Print a digest of the booked postings to compare with other versions.
+    balance = inventory.Inventory()
+    md5 = hashlib.md5()
+    for txn in data.filter_txns(booked_entries):
+        for posting in txn.postings:
+            md5.update(str((posting.account, posting.units, posting.cost)).encode())
+            if posting.account == 'Assets:Fifo':
+                balance.add_position(posting)
+    logging.info("%d lots left in Assets:Fifo; digest of booked postings: %s",
+                 len(balance), md5.hexdigest())
+
+
+if __name__ == '__main__':
+    main()
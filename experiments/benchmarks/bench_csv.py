@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+"""Benchmark the CSV importer against its previous implementation.
+
+The previous implementation parsed the date of every row with
+date_utils.parse_date_liberally(), looked up each column in the configuration
+for every row, and built the list of all the entries before returning it. The
+current implementation compiles the column accessors once, parses each distinct
+date string once, with a precompiled regular expression if a date format is
+configured, and produces the entries as the rows are read.
+
+Unlike the other benchmarks, this one generates its input: a brokerage-style
+CSV export with a configurable number of rows.
+"""
+__copyright__ = "Copyright (C) 2016  Martin Blais"
+__license__ = "GNU GPLv2"
+
+import argparse
+import csv
+import datetime
+import logging
+import random
+import tempfile
+from os import path
+
+from beancount.core.number import D
+from beancount.core.amount import Amount
+from beancount.core import data
+from beancount.ingest import cache
+from beancount.ingest.importers import csv as csv_importer
+from beancount.ingest.importers.csv import Col
+from beancount.utils.date_utils import parse_date_liberally
+
+from bench_realize import benchmark
+
+
+def get_amounts_reference(iconfig, row):
+    """The previous csv.get_amounts(), replaced by csv.compile_amounts()."""
+    debit, credit = None, None
+    if Col.AMOUNT in iconfig:
+        credit = row[iconfig[Col.AMOUNT]]
+    else:
+        debit, credit = [row[iconfig[col]] if col in iconfig else None
+                         for col in [Col.AMOUNT_DEBIT, Col.AMOUNT_CREDIT]]
+    return (-D(debit) if debit else None,
+            D(credit) if credit else None)
+
+
+def extract_reference(importer, file):
+    """The previous implementation of csv.Importer.extract()."""
+    entries = []
+
+    # Normalize the configuration to fetch by index.
+    iconfig, has_header = csv_importer.normalize_config(importer.config, file.head())
+
+    # Skip header, if one was detected.
+    reader = iter(csv.reader(open(file.name)))
+    if has_header:
+        next(reader)
+    def get(row, ftype):
+        return row[iconfig[ftype]] if ftype in iconfig else None
+
+    # Parse all the transactions.
+    first_row = last_row = None
+    for index, row in enumerate(reader, 1):
+        if not row:
+            continue
+        if first_row is None:
+            first_row = row
+        last_row = row
+
+        date = get(row, Col.DATE)
+        txn_date = get(row, Col.TXN_DATE)
+        payee = get(row, Col.PAYEE)
+        fields = filter(None, [get(row, field)
+                               for field in (Col.NARRATION1,
+                                             Col.NARRATION2,
+                                             Col.NARRATION3)])
+        narration = ' -- '.join(fields)
+        tag = get(row, Col.TAG)
+        tags = {tag} if tag is not None else data.EMPTY_SET
+
+        meta = data.new_metadata(file.name, index)
+        if txn_date is not None:
+            meta['txndate'] = parse_date_liberally(txn_date)
+        date = parse_date_liberally(date)
+        txn = data.Transaction(meta, date, importer.FLAG, payee, narration,
+                               tags, data.EMPTY_SET, [])
+        entries.append(txn)
+
+        amount_debit, amount_credit = get_amounts_reference(iconfig, row)
+        for amount in [amount_debit, amount_credit]:
+            if amount is None:
+                continue
+            units = Amount(amount, importer.currency)
+            txn.postings.append(
+                data.Posting(importer.account, units, None, None, None, None))
+
+    # Parse the final balance.
+    if Col.BALANCE in iconfig and first_row and last_row:
+        first_date = parse_date_liberally(get(first_row, Col.DATE))
+        last_date = parse_date_liberally(get(last_row, Col.DATE))
+        is_ascending = first_date < last_date
+        row = last_row if is_ascending else first_row
+        date = parse_date_liberally(get(row, Col.DATE)) + datetime.timedelta(days=1)
+        balance = D(get(row, Col.BALANCE))
+        meta = data.new_metadata(file.name, index)
+        entries.append(
+            data.Balance(meta, date,
+                         importer.account, Amount(balance, importer.currency),
+                         None, None))
+
+    return entries
+
+
+def write_csv_file(filename, num_rows):
+    """Write a CSV file of transactions, in ascending order of dates.
+
+    Args:
+      filename: A string, the name of the file to write.
+      num_rows: An integer, the number of rows.
+    """
+    rand = random.Random(0)
+    date = datetime.date(2000, 1, 1)
+    balance = D('0.00')
+    with open(filename, 'w', newline='') as outfile:
+        writer = csv.writer(outfile)
+        writer.writerow(['Trade Date', 'Settlement Date', 'Description',
+                         'Symbol', 'Amount', 'Balance'])
+        for index in range(num_rows):
+            if index % 50 == 0:
+                date += datetime.timedelta(days=1)
+            amount = D(rand.randint(-100000, 100000)) / 100
+            balance += amount
+            writer.writerow([date.strftime('%m/%d/%Y'),
+                             (date + datetime.timedelta(days=2)).strftime('%m/%d/%Y'),
+                             'TRADE {}'.format(index), 'SYM{}'.format(index % 100),
+                             str(amount), str(balance)])
+
+
+def create_importer(date_format=None):
+    """Create an importer for the generated file."""
+    return csv_importer.Importer({Col.DATE: 'Settlement Date',
+                                  Col.TXN_DATE: 'Trade Date',
+                                  Col.NARRATION1: 'Description',
+                                  Col.NARRATION2: 'Symbol',
+                                  Col.AMOUNT: 'Amount',
+                                  Col.BALANCE: 'Balance'},
+                                 'Assets:Brokerage', 'USD',
+                                 'Trade Date,Settlement Date',
+                                 date_format=date_format)
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format='%(levelname)-8s: %(message)s')
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    parser.add_argument('--rows', type=int, default=100000,
+                        help='Number of rows of the generated file')
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='Number of runs of each implementation')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        filename = path.join(tmpdir, 'trades.csv')
+        write_csv_file(filename, args.rows)
+        file = cache.get_file(filename)
+        logging.info("%d rows", args.rows)
+
+        elapsed_ref, result_ref = benchmark(extract_reference, create_importer(), file,
+                                            repeat=args.repeat)
+        print('{:40}: {:8.3f} secs'.format('extract (reference)', elapsed_ref))
+
+        importer = create_importer()
+        elapsed, result = benchmark(lambda: list(importer.extract(file)),
+                                    repeat=args.repeat)
+        print('{:40}: {:8.3f} secs'.format('extract', elapsed))
+        assert result_ref == result, "Entries differ"
+
+        importer = create_importer('%m/%d/%Y')
+        elapsed, result = benchmark(lambda: list(importer.extract(file)),
+                                    repeat=args.repeat)
+        print('{:40}: {:8.3f} secs'.format('extract (date format)', elapsed))
+        assert result_ref == result, "Entries differ"
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""Benchmark rendering reports with cached and compiled number formatters.
+
+Previously, every formatter built a new DisplayFormatter from its display
+context, and formatted each number by parsing a format string. Formatters are
+now cached per display context and build arguments, and format numbers with
+precompiled per-currency functions. This renders the balance of every account
+and the journal of every account, creating a new formatter for each, as the web
+interface does on each request.
+"""
+__copyright__ = "Copyright (C) 2016  Martin Blais"
+__license__ = "GNU GPLv2"
+
+import argparse
+import io
+import logging
+from os import path
+
+from beancount.core import display_context
+from beancount.core import realization
+from beancount.reports import html_formatter
+from beancount.reports import journal_html
+from beancount import loader
+
+from bench_realize import benchmark
+from bench_realize import scale_entries
+
+
+class ReferenceDisplayFormatter(display_context.DisplayFormatter):
+    """The previous implementation of DisplayFormatter."""
+
+    def __init__(self, dcontext, precision, fmtstrings):
+        super().__init__(dcontext, precision, fmtstrings)
+        self.fmtfuncs = {currency: fmtstr.format
+                         for currency, fmtstr in fmtstrings.items()}
+
+    def format(self, number, currency='__default__'):
+        try:
+            func = self.fmtfuncs[currency]
+        except KeyError:
+            func = self.fmtfuncs['__default__']
+        return func(number)
+
+
+class ReferenceHTMLFormatter(html_formatter.HTMLFormatter):
+    """An HTML formatter building its uncached, reference number formatter."""
+
+    def __init__(self, dcontext):
+        super().__init__(dcontext)
+        precision = display_context.Precision.MOST_COMMON
+        fmtstrings = dcontext._build_natural(precision, dcontext.commas, 0)
+        self._dformat = ReferenceDisplayFormatter(dcontext, precision, fmtstrings)
+
+
+def render_balances(formatter_class, dcontext, real_root):
+    """Render the balance of every account with a new formatter for each."""
+    oss = io.StringIO()
+    for real_account in realization.iter_children(real_root):
+        formatter = formatter_class(dcontext)
+        oss.write(formatter.render_inventory(realization.compute_balance(real_account)))
+    return oss.getvalue()
+
+
+def render_journals(formatter_class, dcontext, real_root):
+    """Render the journal of every account with a new formatter for each."""
+    oss = io.StringIO()
+    for real_account in realization.iter_children(real_root):
+        formatter = formatter_class(dcontext)
+        journal_html.html_entries_table_with_balance(
+            oss, real_account.txn_postings, formatter)
+    return oss.getvalue()
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format='%(levelname)-8s: %(message)s')
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    parser.add_argument('filename', nargs='?',
+                        default=path.join(path.dirname(__file__),
+                                          '../../examples/example.beancount'),
+                        help='Beancount input filename')
+    parser.add_argument('--scale', type=int, default=5,
+                        help='Number of copies of each entry to render')
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='Number of runs of each implementation')
+    args = parser.parse_args()
+
+    entries, _, options_map = loader.load_file(args.filename)
+    entries = scale_entries(entries, args.scale)
+    dcontext = options_map['dcontext']
+    real_root = realization.realize(entries)
+
+    for name, render in [('balances', render_balances),
+                         ('journals', render_journals)]:
+        results = []
+        for title, formatter_class in [
+                ('render {} (reference)', ReferenceHTMLFormatter),
+                ('render {}', html_formatter.HTMLFormatter)]:
+            elapsed, result = benchmark(render, formatter_class, dcontext,
+                                        real_root, repeat=args.repeat)
+            print('{:40}: {:8.3f} secs'.format(title.format(name), elapsed))
+            results.append(result)
+        assert results[0] == results[1], "Renderings differ"
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,320 @@
+#!/usr/bin/env python3
+"""Benchmark the holdings computations against their previous implementations.
+
+The previous implementation of holdings.get_final_holdings() realized the whole
+ledger and looked up a price for every position, and the holdings were
+converted and aggregated with a price lookup per holding and a pass per group.
+The net worth at a series of dates was computed by truncating the entries and
+recomputing the holdings at every date. The current implementation accumulates
+the balances directly, values the positions of each (currency, cost-currency)
+pair with a single lookup, and computes a whole series of holdings in a single
+pass over the entries with holdings.get_holdings_series().
+"""
+__copyright__ = "Copyright (C) 2016  Martin Blais"
+__license__ = "GNU GPLv2"
+
+import argparse
+import bisect
+import collections
+import datetime
+import logging
+from os import path
+
+from beancount.core.number import ZERO
+from beancount.core import account
+from beancount.core import account_types
+from beancount.core import data
+from beancount.core import flags
+from beancount.core import prices
+from beancount.core import realization
+from beancount.ops import holdings
+from beancount.ops.holdings import Holding
+from beancount.utils import misc_utils
+from beancount import loader
+
+from bench_realize import benchmark
+from bench_realize import scale_entries
+
+
+def get_final_holdings_reference(entries, included_account_types=None, price_map=None, date=None):
+    """The previous implementation of holdings.get_final_holdings()."""
+    # Remove the entries inserted by unrealized gains/losses. Those entries do
+    # affect asset accounts, and we don't want them to appear in holdings.
+    #
+    # Note: Perhaps it would make sense to generalize this concept of "inserted
+    # unrealized gains."
+    simple_entries = [entry
+                      for entry in entries
+                      if (not isinstance(entry, data.Transaction) or
+                          entry.flag != flags.FLAG_UNREALIZED)]
+
+    # Realize the accounts into a tree (because we want the positions by-account).
+    root_account = realization.realize(simple_entries)
+
+    # For each account, look at the list of positions and build a list.
+    holdings = []
+    for real_account in sorted(list(realization.iter_children(root_account)),
+                               key=lambda ra: ra.account):
+
+        if included_account_types:
+            # Skip accounts of invalid types, we only want to reflect the requested
+            # account types, typically assets and liabilities.
+            account_type = account_types.get_account_type(real_account.account)
+            if account_type not in included_account_types:
+                continue
+
+        for pos in real_account.balance.get_positions():
+            if pos.cost is not None:
+                # Get price information if we have a price_map.
+                market_value = None
+                if price_map is not None:
+                    base_quote = (pos.units.currency, pos.cost.currency)
+                    price_date, price_number = prices.get_price(price_map,
+                                                                base_quote, date)
+                    if price_number is not None:
+                        market_value = pos.units.number * price_number
+                else:
+                    price_date, price_number = None, None
+
+                holding = Holding(real_account.account,
+                                  pos.units.number,
+                                  pos.units.currency,
+                                  pos.cost.number,
+                                  pos.cost.currency,
+                                  pos.units.number * pos.cost.number,
+                                  market_value,
+                                  price_number,
+                                  price_date)
+            else:
+                holding = Holding(real_account.account,
+                                  pos.units.number,
+                                  pos.units.currency,
+                                  None,
+                                  pos.units.currency,
+                                  pos.units.number,
+                                  pos.units.number,
+                                  None,
+                                  None)
+            holdings.append(holding)
+
+    return holdings
+
+
+def aggregate_holdings_by_reference(holdings, keyfun):
+    """The previous implementation of holdings.aggregate_holdings_by()."""
+    # Aggregate the groups of holdings.
+    grouped = collections.defaultdict(list)
+    for holding in holdings:
+        key = (keyfun(holding), holding.cost_currency)
+        grouped[key].append(holding)
+    grouped_holdings = (aggregate_holdings_list_reference(key_holdings)
+                        for key_holdings in grouped.values())
+
+    # We could potentially filter out holdings with zero units here. These types
+    # of holdings might occur on a group with leaked (i.e., non-zero) cost basis
+    # and zero units. However, sometimes are valid merging of multiple
+    # currencies may occur, and the number value will be legitimately set to
+    # ZERO (for various reasons downstream), so we prefer not to ignore the
+    # holding. Callers must be prepared to deal with a holding of ZERO units and
+    # a non-zero cost basis. {0ed05c502e63, b/16}
+    ## nonzero_holdings = (holding
+    ##                     for holding in grouped_holdings
+    ##                     if holding.number != ZERO)
+
+    # Return the holdings in order.
+    return sorted(grouped_holdings,
+                  key=lambda holding: (holding.account, holding.currency))
+
+
+def aggregate_holdings_list_reference(holdings):
+    """The previous implementation of holdings.aggregate_holdings_list()."""
+    if not holdings:
+        return None
+
+    # Note: Holding is a bit overspecified with book and market values. We
+    # recompute them from cost and price numbers here anyhow.
+    units, total_book_value, total_market_value = ZERO, ZERO, ZERO
+    accounts = set()
+    currencies = set()
+    cost_currencies = set()
+    price_dates = set()
+    book_value_seen = False
+    market_value_seen = False
+    for holding in holdings:
+        units += holding.number
+        accounts.add(holding.account)
+        price_dates.add(holding.price_date)
+        currencies.add(holding.currency)
+        cost_currencies.add(holding.cost_currency)
+
+        if holding.book_value is not None:
+            total_book_value += holding.book_value
+            book_value_seen = True
+        elif holding.cost_number is not None:
+            total_book_value += holding.number * holding.cost_number
+            book_value_seen = True
+
+        if holding.market_value is not None:
+            total_market_value += holding.market_value
+            market_value_seen = True
+        elif holding.price_number is not None:
+            total_market_value += holding.number * holding.price_number
+            market_value_seen = True
+
+    if book_value_seen:
+        average_cost = total_book_value / units if units else None
+    else:
+        total_book_value = None
+        average_cost = None
+
+    if market_value_seen:
+        average_price = total_market_value / units if units else None
+    else:
+        total_market_value = None
+        average_price = None
+
+    if len(cost_currencies) != 1:
+        raise ValueError("Cost currencies are not homogeneous for aggregation: {}".format(
+            ','.join(map(str, cost_currencies))))
+
+    units = units if len(currencies) == 1 else ZERO
+    currency = currencies.pop() if len(currencies) == 1 else '*'
+    cost_currency = cost_currencies.pop()
+    account_ = (accounts.pop()
+                if len(accounts) == 1
+                else account.commonprefix(accounts))
+    price_date = price_dates.pop() if len(price_dates) == 1 else None
+    return Holding(account_, units, currency, average_cost, cost_currency,
+                   total_book_value, total_market_value, average_price, price_date)
+
+
+def convert_to_currency_reference(price_map, target_currency, holdings_list):
+    """The previous implementation of holdings.convert_to_currency()."""
+    # A list of the fields we should convert.
+    convert_fields = ('cost_number', 'book_value', 'market_value', 'price_number')
+
+    new_holdings = []
+    for holding in holdings_list:
+        if holding.cost_currency == target_currency:
+            # The holding is already priced in the target currency; do nothing.
+            new_holding = holding
+        else:
+            if holding.cost_currency is None:
+                # There is no cost currency; make the holding priced in its own
+                # units. The price-map should yield a rate of 1.0 and everything
+                # else works out.
+                if holding.currency is None:
+                    raise ValueError("Invalid currency '{}'".format(holding.currency))
+                holding = holding._replace(cost_currency=holding.currency)
+
+                # Fill in with book and market value as well.
+                if holding.book_value is None:
+                    holding = holding._replace(book_value=holding.number)
+                if holding.market_value is None:
+                    holding = holding._replace(market_value=holding.number)
+
+            assert holding.cost_currency, "Missing cost currency: {}".format(holding)
+            base_quote = (holding.cost_currency, target_currency)
+
+            # Get the conversion rate and replace the required numerical
+            # fields..
+            _, rate = prices.get_latest_price(price_map, base_quote)
+            if rate is not None:
+                new_holding = misc_utils.map_namedtuple_attributes(
+                    convert_fields,
+                    lambda number, r=rate: number if number is None else number * r,
+                    holding)
+                # Ensure we set the new cost currency after conversion.
+                new_holding = new_holding._replace(cost_currency=target_currency)
+            else:
+                # Could not get the rate... clear every field and set the cost
+                # currency to None. This enough marks the holding conversion as
+                # a failure.
+                new_holding = misc_utils.map_namedtuple_attributes(
+                    convert_fields, lambda number: None, holding)
+                new_holding = new_holding._replace(cost_currency=None)
+
+        new_holdings.append(new_holding)
+
+    return new_holdings
+
+
+def net_worths(get_final_holdings, convert_to_currency, aggregate_holdings_by,
+               entries, options_map, price_map):
+    """Compute the net worth of the final holdings in each operating currency."""
+    holdings_list = get_final_holdings(entries, ('Assets', 'Liabilities'), price_map)
+    worths = []
+    for currency in options_map['operating_currency']:
+        currency_holdings = convert_to_currency(price_map, currency, holdings_list)
+        worths.append(aggregate_holdings_by(currency_holdings,
+                                            lambda holding: holding.cost_currency))
+    return worths
+
+
+def holdings_series_reference(entries, dates, price_map):
+    """Compute the holdings at each date by recomputing them from the truncated entries."""
+    entry_dates = [entry.date for entry in entries]
+    return [(date, get_final_holdings_reference(
+        entries[:bisect.bisect_right(entry_dates, date)],
+        ('Assets', 'Liabilities'), price_map, date))
+            for date in dates]
+
+
+def holdings_series(entries, dates, price_map):
+    """Compute the holdings at each date in a single pass."""
+    return list(holdings.get_holdings_series(entries, dates, ('Assets', 'Liabilities'),
+                                             price_map))
+
+
+def month_dates(entries):
+    """Return the first day of every month spanned by the transactions."""
+    date = next(data.filter_txns(entries)).date.replace(day=1)
+    dates = []
+    while date <= entries[-1].date:
+        dates.append(date)
+        date = (date + datetime.timedelta(days=32)).replace(day=1)
+    return dates
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format='%(levelname)-8s: %(message)s')
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    parser.add_argument('filename', nargs='?',
+                        default=path.join(path.dirname(__file__),
+                                          '../../examples/example.beancount'),
+                        help='Beancount input filename')
+    parser.add_argument('--scale', type=int, default=10,
+                        help='Number of copies of each entry')
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='Number of runs of each implementation')
+    args = parser.parse_args()
+
+    entries, _, options_map = loader.load_file(args.filename)
+    entries = scale_entries(entries, args.scale)
+    price_map = prices.build_price_map(entries)
+    dates = month_dates(entries)
+    logging.info("%d entries, %d dates", len(entries), len(dates))
+
+    elapsed_ref, result_ref = benchmark(
+        net_worths, get_final_holdings_reference, convert_to_currency_reference,
+        aggregate_holdings_by_reference, entries, options_map, price_map,
+        repeat=args.repeat)
+    print('{:40}: {:8.3f} secs'.format('net worth (reference)', elapsed_ref))
+    elapsed, result = benchmark(
+        net_worths, holdings.get_final_holdings, holdings.convert_to_currency,
+        holdings.aggregate_holdings_by, entries, options_map, price_map,
+        repeat=args.repeat)
+    print('{:40}: {:8.3f} secs'.format('net worth', elapsed))
+    assert result_ref == result, "Net worths differ"
+
+    elapsed_ref, result_ref = benchmark(holdings_series_reference,
+                                        entries, dates, price_map, repeat=args.repeat)
+    print('{:40}: {:8.3f} secs'.format('holdings series (reference)', elapsed_ref))
+    elapsed, result = benchmark(holdings_series, entries, dates, price_map,
+                                repeat=args.repeat)
+    print('{:40}: {:8.3f} secs'.format('holdings series', elapsed))
+    assert result_ref == result, "Holdings series differ"
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,231 @@
+#!/usr/bin/env python3
+"""Benchmark pad.pad() against the previous implementation.
+
+The previous implementation grouped the postings of the entire ledger by account
+with realization.postings_by_account(), then gathered and sorted the postings of
+each padded account and its subaccounts. The current implementation processes
+the entries in a single pass, keeping running balances only for the padded
+accounts.
+
+Pad directives are inserted before the balance assertions of the checking
+account of the example ledger, with the asserted amounts altered so that every
+pad inserts a transaction.
+"""
+__copyright__ = "Copyright (C) 2016  Martin Blais"
+__license__ = "GNU GPLv2"
+
+import argparse
+import datetime
+import logging
+from os import path
+
+from beancount.core.number import D
+from beancount.core import account
+from beancount.core import amount
+from beancount.core import data
+from beancount.core import flags
+from beancount.core import inventory
+from beancount.core import position
+from beancount.core import realization
+from beancount.ops import balance
+from beancount.ops import pad
+from beancount.utils import misc_utils
+from beancount import loader
+
+from bench_realize import benchmark
+from bench_realize import scale_entries
+
+
+def pad_reference(entries, options_map):
+    """The previous implementation of pad.pad()."""
+    pad_errors = []
+
+    # Find all the pad entries and group them by account.
+    pads = list(misc_utils.filter_type(entries, data.Pad))
+    pad_dict = misc_utils.groupby(lambda x: x.account, pads)
+
+    # Partially realize the postings, so we can iterate them by account.
+    by_account = realization.postings_by_account(entries)
+
+    # A dict of pad -> list of entries to be inserted.
+    new_entries = {id(pad): [] for pad in pads}
+
+    # Process each account that has a padding group.
+    for account_, pad_list in sorted(pad_dict.items()):
+
+        # Last encountered / currency active pad entry.
+        active_pad = None
+
+        # Gather all the postings for the account and its children.
+        postings = []
+        is_child = account.parent_matcher(account_)
+        for item_account, item_postings in by_account.items():
+            if is_child(item_account):
+                postings.extend(item_postings)
+        postings.sort(key=data.posting_sortkey)
+
+        # A set of currencies already padded so far in this account.
+        padded_lots = set()
+
+        pad_balance = inventory.Inventory()
+        for entry in postings:
+
+            assert not isinstance(entry, data.Posting)
+            if isinstance(entry, data.TxnPosting):
+                # This is a transaction; update the running balance for this
+                # account.
+                pad_balance.add_position(entry.posting)
+
+            elif isinstance(entry, data.Pad):
+                if entry.account == account_:
+                    # Mark this newly encountered pad as active and allow all lots
+                    # to be padded heretofore.
+                    active_pad = entry
+                    padded_lots = set()
+
+            elif isinstance(entry, data.Balance):
+                check_amount = entry.amount
+
+                # Compare the current balance amount to the expected one from
+                # the check entry. IMPORTANT: You need to understand that this
+                # does not check a single position, but rather checks that the
+                # total amount for a particular currency (which itself is
+                # distinct from the cost).
+                balance_amount = pad_balance.get_currency_units(check_amount.currency)
+                diff_amount = amount.sub(balance_amount, check_amount)
+
+                # Use the specified tolerance or automatically infer it.
+                tolerance = balance.get_balance_tolerance(entry, options_map)
+
+                if abs(diff_amount.number) > tolerance:
+                    # The check fails; we need to pad.
+
+                    # Pad only if pad entry is active and we haven't already
+                    # padded that lot since it was last encountered.
+                    if active_pad and (check_amount.currency not in padded_lots):
+
+                        # Note: we decide that it's an error to try to pad
+                        # positions at cost; we check here that all the existing
+                        # positions with that currency have no cost.
+                        positions = [pos
+                                     for pos in pad_balance.get_positions()
+                                     if pos.units.currency == check_amount.currency]
+                        for position_ in positions:
+                            if position_.cost is not None:
+                                pad_errors.append(
+                                    pad.PadError(entry.meta,
+                                             ("Attempt to pad an entry with cost for "
+                                              "balance: {}".format(pad_balance)),
+                                             active_pad))
+
+                        # Thus our padding lot is without cost by default.
+                        diff_position = position.Position.from_amounts(
+                            amount.Amount(check_amount.number - balance_amount.number,
+                                          check_amount.currency))
+
+                        # Synthesize a new transaction entry for the difference.
+                        narration = ('(Padding inserted for Balance of {} for '
+                                     'difference {})').format(check_amount, diff_position)
+                        new_entry = data.Transaction(
+                            active_pad.meta.copy(), active_pad.date, flags.FLAG_PADDING,
+                            None, narration, data.EMPTY_SET, data.EMPTY_SET, [])
+
+                        new_entry.postings.append(
+                            data.Posting(active_pad.account,
+                                         diff_position.units, diff_position.cost,
+                                         None, None, None))
+                        neg_diff_position = -diff_position
+                        new_entry.postings.append(
+                            data.Posting(active_pad.source_account,
+                                         neg_diff_position.units, neg_diff_position.cost,
+                                         None, None, None))
+
+                        # Save it for later insertion after the active pad.
+                        new_entries[id(active_pad)].append(new_entry)
+
+                        # Fixup the running balance.
+                        pos, _ = pad_balance.add_position(diff_position)
+                        if pos is not None and pos.is_negative_at_cost():
+                            raise ValueError(
+                                "Position held at cost goes negative: {}".format(pos))
+
+                # Mark this lot as padded. Further checks should not pad this lot.
+                padded_lots.add(check_amount.currency)
+
+    # Insert the newly created entries right after the pad entries that created them.
+    padded_entries = []
+    for entry in entries:
+        padded_entries.append(entry)
+        if isinstance(entry, data.Pad):
+            entry_list = new_entries[id(entry)]
+            if entry_list:
+                padded_entries.extend(entry_list)
+            else:
+                # Generate errors on unused pad entries.
+                pad_errors.append(
+                    pad.PadError(entry.meta, "Unused Pad entry", entry))
+
+    return padded_entries, pad_errors
+
+
+def insert_pads(entries, account_name, source_account):
+    """Insert a Pad before each balance assertion of an account.
+
+    Args:
+      entries: A sorted list of directives.
+      account_name: A string, the name of the account to pad.
+      source_account: A string, the name of the account to pad from.
+    Returns:
+      A sorted list of directives.
+    """
+    new_entries = []
+    for entry in entries:
+        if isinstance(entry, data.Balance) and entry.account == account_name:
+            new_entries.append(data.Pad(data.new_metadata('<bench>', 0),
+                                        entry.date - datetime.timedelta(days=1),
+                                        account_name, source_account))
+            entry = entry._replace(amount=amount.add(entry.amount,
+                                                     amount.Amount(D('1.00'),
+                                                                   entry.amount.currency)))
+        new_entries.append(entry)
+    new_entries.sort(key=data.entry_sortkey)
+    return new_entries
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format='%(levelname)-8s: %(message)s')
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    parser.add_argument('filename', nargs='?',
+                        default=path.join(path.dirname(__file__),
+                                          '../../examples/example.beancount'),
+                        help='Beancount input filename')
+    parser.add_argument('--scale', type=int, default=20,
+                        help='Number of copies of each entry')
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='Number of runs of each implementation')
+    parser.add_argument('--account', default='Assets:US:BofA:Checking',
+                        help='Name of the account to pad')
+    parser.add_argument('--source-account', default='Equity:Opening-Balances',
+                        help='Name of the account to pad from')
+    args = parser.parse_args()
+
+    entries, _, options_map = loader.load_file(args.filename)
+    entries = scale_entries(insert_pads(entries, args.account, args.source_account),
+                            args.scale)
+    logging.info("%d entries", len(entries))
+
+    elapsed_ref, (entries_ref, errors_ref) = benchmark(
+        pad_reference, entries, options_map, repeat=args.repeat)
+    print('{:40}: {:8.3f} secs'.format('pad (reference)', elapsed_ref))
+    elapsed, (padded_entries, errors) = benchmark(
+        pad.pad, entries, options_map, repeat=args.repeat)
+    print('{:40}: {:8.3f} secs'.format('pad', elapsed))
+
+    assert padded_entries == entries_ref, "Padded entries differ"
+    assert errors == errors_ref, "Errors differ"
+    logging.info("%d entries inserted, %d errors",
+                 len(padded_entries) - len(entries), len(errors))
+
+
+if __name__ == '__main__':
+    main()
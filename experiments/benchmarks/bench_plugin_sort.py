@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""Benchmark sorting the entries between plugins with cached integer sort keys.
+
+The loader used to sort the entries with data.entry_sortkey() after every
+plugin. It now uses loader.sort_entries(), which caches an integer sort key per
+entry and only reorders the list if it isn't already sorted. This simulates a
+chain of plugins on a large ledger, where most plugins leave the entries in
+order and some append a few new entries.
+"""
+__copyright__ = "Copyright (C) 2016  Martin Blais"
+__license__ = "GNU GPLv2"
+
+import argparse
+import functools
+import logging
+import random
+from os import path
+
+from beancount.core import data
+from beancount import loader
+
+from bench_realize import benchmark
+from bench_realize import scale_entries
+
+
+def run_plugins(sort, entries, new_entries_list):
+    """Simulate running plugins, sorting after each of them.
+
+    Args:
+      sort: A function to sort the list of entries in place.
+      entries: A sorted list of directives.
+      new_entries_list: A list of lists of directives, the new entries appended
+        by each plugin.
+    Returns:
+      The final list of entries.
+    """
+    entries = list(entries)
+    for new_entries in new_entries_list:
+        entries = entries + new_entries
+        sort(entries)
+    return entries
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format='%(levelname)-8s: %(message)s')
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    parser.add_argument('filename', nargs='?',
+                        default=path.join(path.dirname(__file__),
+                                          '../../examples/example.beancount'),
+                        help='Beancount input filename')
+    parser.add_argument('--scale', type=int, default=20,
+                        help='Number of copies of each entry to sort')
+    parser.add_argument('--plugins', type=int, default=15,
+                        help='Number of plugins to simulate')
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='Number of runs of each implementation')
+    args = parser.parse_args()
+
+    entries, _, _ = loader.load_file(args.filename)
+    # Copy the replicated entries, as a real ledger has distinct objects.
+    entries = [entry._replace() for entry in scale_entries(entries, args.scale)]
+    logging.info("%d entries, %d plugins", len(entries), args.plugins)
+
+    # One plugin in three appends a few copies of random entries.
+    rnd = random.Random(0)
+    new_entries_list = [
+        ([entry._replace(meta=dict(entry.meta))
+          for entry in rnd.sample(entries, 100)]
+         if index % 3 == 0 else [])
+        for index in range(args.plugins)]
+
+    elapsed_ref, result_ref = benchmark(
+        run_plugins, lambda entries: entries.sort(key=data.entry_sortkey),
+        entries, new_entries_list, repeat=args.repeat)
+    print('{:40}: {:8.3f} secs'.format('sort with tuple keys', elapsed_ref))
+
+    elapsed, result = benchmark(
+        lambda *args: run_plugins(
+            functools.partial(loader.sort_entries, sortkey_cache=loader.SortKeyCache()),
+            *args),
+        entries, new_entries_list, repeat=args.repeat)
+    print('{:40}: {:8.3f} secs'.format('sort_entries with cached keys', elapsed))
+
+    assert all(entry1 is entry2
+               for entry1, entry2 in zip(result_ref, result)), "Orders differ"
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""Benchmark realization.realize() against the previous, two-pass implementation.
+
+The previous implementation first grouped the postings by account, then computed
+the balance of each leaf, and aggregating balances up the tree walked all the
+subaccounts of each node again. The current implementation builds the tree and
+the leaf balances in a single pass and caches the aggregated balances.
+"""
+__copyright__ = "Copyright (C) 2016  Martin Blais"
+__license__ = "GNU GPLv2"
+
+import argparse
+import gc
+import logging
+import time
+from os import path
+
+from beancount.core import data
+from beancount.core import inventory
+from beancount.core import realization
+from beancount import loader
+
+
+def realize_reference(entries, min_accounts=None, compute_balance=True):
+    """The previous implementation of realization.realize()."""
+    txn_postings_map = realization.postings_by_account(entries)
+    real_root = realization.RealAccount('')
+    for account_name, txn_postings in txn_postings_map.items():
+        real_account = realization.get_or_create(real_root, account_name)
+        real_account.txn_postings = txn_postings
+        if compute_balance:
+            real_account.balance = realization.compute_postings_balance(txn_postings)
+    if min_accounts:
+        for account_name in min_accounts:
+            realization.get_or_create(real_root, account_name)
+    return real_root
+
+
+def compute_balance_reference(real_account):
+    """The previous implementation of realization.compute_balance()."""
+    total_balance = inventory.Inventory()
+    for real_acc in realization.iter_children(real_account):
+        total_balance += real_acc.balance
+    return total_balance
+
+
+def scale_entries(entries, scale):
+    """Replicate a list of entries, keeping them sorted.
+
+    Args:
+      entries: A sorted list of directives.
+      scale: An integer, the number of copies of each entry to produce.
+    Returns:
+      A sorted list of directives.
+    """
+    return [entry for entry in entries for _ in range(scale)]
+
+
+def benchmark(function, *args, repeat=3):
+    """Time a function, returning the best time and its last result.
+
+    Args:
+      function: The function to call.
+      *args: Arguments to the function.
+      repeat: The number of times to call it.
+    Returns:
+      A pair of the best time in seconds and the result of the last call.
+    """
+    best = None
+    for _ in range(repeat):
+        gc.collect()
+        time_before = time.time()
+        result = function(*args)
+        elapsed = time.time() - time_before
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def realize_and_aggregate(realize, compute_balance, entries):
+    """Realize entries and compute the balance of every account of the tree."""
+    real_root = realize(entries)
+    balances = {real_account.account: compute_balance(real_account)
+                for real_account in realization.iter_children(real_root)}
+    return real_root, balances
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format='%(levelname)-8s: %(message)s')
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    parser.add_argument('filename', nargs='?',
+                        default=path.join(path.dirname(__file__),
+                                          '../../examples/example.beancount'),
+                        help='Beancount input filename')
+    parser.add_argument('--scale', type=int, default=50,
+                        help='Number of copies of each entry to realize')
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='Number of runs of each implementation')
+    args = parser.parse_args()
+
+    entries, _, _ = loader.load_file(args.filename)
+    entries = scale_entries(entries, args.scale)
+    num_postings = sum(len(entry.postings)
+                       for entry in data.filter_txns(entries))
+    logging.info("%d entries, %d postings", len(entries), num_postings)
+
+    for title, realize in [('realize (reference)', realize_reference),
+                           ('realize', realization.realize)]:
+        elapsed, _ = benchmark(realize, entries, repeat=args.repeat)
+        print('{:40}: {:8.3f} secs'.format(title, elapsed))
+
+    elapsed_ref, (real_root_ref, balances_ref) = benchmark(
+        realize_and_aggregate, realize_reference, compute_balance_reference, entries,
+        repeat=args.repeat)
+    print('{:40}: {:8.3f} secs'.format('realize + all balances (reference)', elapsed_ref))
+    elapsed, (real_root, balances) = benchmark(
+        realize_and_aggregate, realization.realize, realization.compute_balance, entries,
+        repeat=args.repeat)
+    print('{:40}: {:8.3f} secs'.format('realize + all balances', elapsed))
+
+    assert real_root == real_root_ref, "Realizations differ"
+    assert balances == balances_ref, "Balances differ"
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""Benchmark the memory used by compact realizations against regular ones.
+
+A regular realization stores a TxnPosting tuple for each posting in the list of
+its account. A compact realization (realize(..., compact=True)) stores two
+integers per posting in a shared table instead and creates the TxnPosting
+instances on the fly, whenever the lists of postings are iterated over.
+"""
+__copyright__ = "Copyright (C) 2016  Martin Blais"
+__license__ = "GNU GPLv2"
+
+import argparse
+import gc
+import logging
+import tracemalloc
+from os import path
+
+from beancount.core import data
+from beancount.core import realization
+from beancount import loader
+
+from bench_realize import benchmark
+from bench_realize import scale_entries
+
+
+def measure_memory(function, *args):
+    """Measure the memory allocated by a function and retained by its result.
+
+    Args:
+      function: The function to call.
+      *args: Arguments to the function.
+    Returns:
+      A pair of the number of bytes retained and the result of the call.
+    """
+    gc.collect()
+    tracemalloc.start()
+    try:
+        result = function(*args)
+        gc.collect()
+        size, _ = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return size, result
+
+
+def iterate_all_postings(real_root):
+    """Iterate over the postings of all the accounts of a realization."""
+    return sum(1
+               for real_account in realization.iter_children(real_root)
+               for _ in real_account.txn_postings)
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format='%(levelname)-8s: %(message)s')
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    parser.add_argument('filename', nargs='?',
+                        default=path.join(path.dirname(__file__),
+                                          '../../examples/example.beancount'),
+                        help='Beancount input filename')
+    parser.add_argument('--scale', type=int, default=50,
+                        help='Number of copies of each entry to realize')
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='Number of runs of each implementation')
+    args = parser.parse_args()
+
+    entries, _, _ = loader.load_file(args.filename)
+    entries = scale_entries(entries, args.scale)
+    num_postings = sum(len(entry.postings)
+                       for entry in data.filter_txns(entries))
+    logging.info("%d entries, %d postings", len(entries), num_postings)
+
+    real_roots = []
+    for title, compact in [('regular', False), ('compact', True)]:
+        realize = lambda entries: realization.realize(entries, compact=compact)
+        size, real_root = measure_memory(realize, entries)
+        print('{:40}: {:8.1f} MB'.format('realize memory ({})'.format(title),
+                                         size / 1024 / 1024))
+        elapsed, _ = benchmark(realize, entries, repeat=args.repeat)
+        print('{:40}: {:8.3f} secs'.format('realize ({})'.format(title), elapsed))
+        elapsed, _ = benchmark(iterate_all_postings, real_root, repeat=args.repeat)
+        print('{:40}: {:8.3f} secs'.format('iterate postings ({})'.format(title),
+                                           elapsed))
+        real_roots.append(real_root)
+
+    assert real_roots[0] == real_roots[1], "Realizations differ"
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""Benchmark similar.find_similar_entries() against its previous implementation.
+
+The previous implementation scanned the existing entries for each new entry:
+it bisected the dates of the whole list of existing entries to find those in the
+window of the new entry, and compared them all. The current implementation
+indexes the existing transactions by date bucket, account, currency and
+magnitude of amount, and compares only the candidates found in the index.
+
+The ledger is scaled up with distinct copies of its entries, and the new
+entries are the transactions of its last year, moved by a day, half of them with
+amounts different enough not to be duplicates.
+"""
+__copyright__ = "Copyright (C) 2016  Martin Blais"
+__license__ = "GNU GPLv2"
+
+import argparse
+import datetime
+import logging
+from os import path
+
+from beancount.core.number import D
+from beancount.core import data
+from beancount.ingest import similar
+from beancount import loader
+
+from bench_realize import benchmark
+
+
+def find_similar_entries_reference(entries, source_entries, comparator=None,
+                                   window_days=2):
+    """The previous implementation of similar.find_similar_entries()."""
+    window_head = datetime.timedelta(days=window_days)
+    window_tail = datetime.timedelta(days=window_days + 1)
+
+    if comparator is None:
+        comparator = similar.SimilarityComparator()
+
+    # For each of the new entries, look at entries at a nearby date.
+    duplicates = []
+    for entry in data.filter_txns(entries):
+        for source_entry in data.filter_txns(
+                data.iter_entry_dates(source_entries,
+                                      entry.date - window_head,
+                                      entry.date + window_tail)):
+            if comparator(entry, source_entry):
+                duplicates.append((entry, source_entry))
+                break
+    return duplicates
+
+
+def create_new_entries(entries):
+    """Create imported transactions from the last year of a ledger.
+
+    Args:
+      entries: A sorted list of directives.
+    Returns:
+      A list of Transaction directives.
+    """
+    txns = list(data.filter_txns(entries))
+    date_first = txns[-1].date - datetime.timedelta(days=365)
+    new_entries = []
+    for index, entry in enumerate(txns):
+        if entry.date < date_first:
+            continue
+        postings = entry.postings
+        if index % 2:
+            postings = [posting._replace(units=posting.units._replace(
+                number=posting.units.number * D('1.1')))
+                        if posting.units.number is not None else posting
+                        for posting in postings]
+        new_entries.append(entry._replace(date=entry.date + datetime.timedelta(days=1),
+                                          postings=postings))
+    return new_entries
+
+
+def copy_entries(entries, scale):
+    """Replicate a list of entries with distinct copies, keeping them sorted.
+
+    Unlike scale_entries(), each copy is a new object, as the entries of a
+    large ledger would be.
+
+    Args:
+      entries: A sorted list of directives.
+      scale: An integer, the number of copies of each entry to produce.
+    Returns:
+      A sorted list of directives.
+    """
+    return [entry._replace(meta=dict(entry.meta))
+            for entry in entries for _ in range(scale)]
+
+
+def identities(duplicates):
+    """Return the identities of pairs of entries, to compare results."""
+    return [(id(entry), id(source_entry)) for entry, source_entry in duplicates]
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format='%(levelname)-8s: %(message)s')
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    parser.add_argument('filename', nargs='?',
+                        default=path.join(path.dirname(__file__),
+                                          '../../examples/example.beancount'),
+                        help='Beancount input filename')
+    parser.add_argument('--scale', type=int, default=20,
+                        help='Number of copies of each entry')
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='Number of runs of each implementation')
+    args = parser.parse_args()
+
+    entries, _, __ = loader.load_file(args.filename)
+    new_entries = create_new_entries(entries)
+    entries = copy_entries(entries, args.scale)
+    logging.info("%d existing entries, %d new entries", len(entries), len(new_entries))
+
+    elapsed_ref, result_ref = benchmark(find_similar_entries_reference,
+                                        new_entries, entries, repeat=args.repeat)
+    print('{:40}: {:8.3f} secs'.format('find_similar_entries (reference)', elapsed_ref))
+    elapsed, result = benchmark(similar.find_similar_entries,
+                                new_entries, entries, repeat=args.repeat)
+    print('{:40}: {:8.3f} secs'.format('find_similar_entries', elapsed))
+    assert identities(result_ref) == identities(result), "Duplicates differ"
+    logging.info("%d duplicates", len(result))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""Benchmark interpolate.infer_tolerances() against the previous implementation.
+
+The previous implementation computed the tolerance of every posting and built a
+new tolerances dict for every transaction, which booking stores in the metadata
+of each transaction. The current implementation only computes tolerances for
+each distinct set of (currency, exponent) pairs and shares the resulting dicts
+between transactions.
+"""
+__copyright__ = "Copyright (C) 2016  Martin Blais"
+__license__ = "GNU GPLv2"
+
+import argparse
+import logging
+import tracemalloc
+from os import path
+
+from beancount.core.number import MISSING
+from beancount.core.number import ONE
+from beancount.core.number import ZERO
+from beancount.core import data
+from beancount.core import interpolate
+from beancount.utils import defdict
+from beancount import loader
+
+from bench_realize import benchmark
+from bench_realize import scale_entries
+
+
+def infer_tolerances_reference(postings, options_map):
+    """The previous implementation of infer_tolerances(), without use_cost."""
+    inferred_tolerance_multiplier = options_map["inferred_tolerance_multiplier"]
+    tolerances = options_map['inferred_tolerance_default'].copy()
+    for posting in postings:
+        if posting.meta and interpolate.AUTOMATIC_META in posting.meta:
+            continue
+        units = posting.units
+        if units is MISSING or units is None:
+            continue
+        currency = units.currency
+        expo = units.number.as_tuple().exponent
+        if expo < 0:
+            tolerance = ONE.scaleb(expo) * inferred_tolerance_multiplier
+            tolerances[currency] = max(tolerance,
+                                       tolerances.get(currency, -1024))
+    default = tolerances.pop('*', ZERO)
+    return defdict.ImmutableDictWithDefault(default, tolerances)
+
+
+def infer_all(infer, postings_list, options_map):
+    """Infer the tolerances of a list of lists of postings."""
+    return [infer(postings, options_map) for postings in postings_list]
+
+
+def measure_memory(function, *args):
+    """Return the memory allocated by the result of a function, in bytes."""
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        result = function(*args)
+        return tracemalloc.get_traced_memory()[0] - before, result
+    finally:
+        tracemalloc.stop()
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format='%(levelname)-8s: %(message)s')
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    parser.add_argument('filename', nargs='?',
+                        default=path.join(path.dirname(__file__),
+                                          '../../examples/example.beancount'),
+                        help='Beancount input filename')
+    parser.add_argument('--scale', type=int, default=20,
+                        help='Number of copies of each entry')
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='Number of runs of each implementation')
+    args = parser.parse_args()
+
+    entries, _, options_map = loader.load_file(args.filename)
+    assert not options_map["infer_tolerance_from_cost"]
+    postings_list = [entry.postings
+                     for entry in scale_entries(list(data.filter_txns(entries)),
+                                                args.scale)]
+    logging.info("%d transactions", len(postings_list))
+
+    elapsed_ref, result_ref = benchmark(infer_all, infer_tolerances_reference,
+                                        postings_list, options_map, repeat=args.repeat)
+    print('{:40}: {:8.3f} secs'.format('infer_tolerances (reference)', elapsed_ref))
+    elapsed, result = benchmark(infer_all, interpolate.infer_tolerances,
+                                postings_list, options_map, repeat=args.repeat)
+    print('{:40}: {:8.3f} secs'.format('infer_tolerances', elapsed))
+    assert all(tolerances_ref == tolerances and
+               tolerances_ref.default == tolerances.default
+               for tolerances_ref, tolerances in zip(result_ref, result)), (
+                   "Tolerances differ")
+
+    memory_ref, _ = measure_memory(infer_all, infer_tolerances_reference,
+                                   postings_list, options_map)
+    print('{:40}: {:8.1f} KB'.format('memory (reference)', memory_ref / 1024))
+    memory, result = measure_memory(infer_all, interpolate.infer_tolerances,
+                                    postings_list, options_map)
+    print('{:40}: {:8.1f} KB'.format('memory', memory / 1024))
+    logging.info("%d distinct tolerance dicts", len(set(map(id, result))))
+
+
+if __name__ == '__main__':
+    main()
@@ -15,9 +15,10 @@ from matplotlib import pyplot
 import numpy
 
 from beancount.core import data
+from beancount.core import prices
 from beancount.ops import holdings
+from beancount.parser import options
 from beancount import loader
-from beancount.reports import holdings_reports
 
 
 EXTRAPOLATE_WORTHS = 1000000, 1500000, 2000000, 2500000, 3000000, 4000000, 5000000, 6000000
@@ -56,8 +57,6 @@ def main():
                 break
 
     net_worths_dict = collections.defaultdict(list)
-    index = 0
-    current_entries = []
 
     dtend = datetime.date.today()
     if args.period == 'weekly':
@@ -67,41 +66,19 @@ def main():
     elif args.period == 'daily':
         period = rrule.rrule(rrule.DAILY, dtstart=dtstart, until=dtend)
 
-    for dtime in period:
-        date = dtime.date()
+    # Compute the net worth in each operating currency at all the dates, in a
+    # single pass over the entries.
+    price_map = prices.build_price_map(entries)
+    account_types = options.get_account_types(options_map)
+    currencies = options_map['operating_currency']
+    for date, net_worths in holdings.get_net_worth_series(
+            entries, [dtime.date() for dtime in period], currencies, price_map,
+            (account_types.assets, account_types.liabilities)):
         logging.info(date)
-
-        # Append new entries until the given date.
-        while True:
-            entry = entries[index]
-            if entry.date >= date:
-                break
-            current_entries.append(entry)
-            index += 1
-
-        # Get the list of holdings.
-        raw_holdings_list, price_map = holdings_reports.get_assets_holdings(current_entries,
-                                                                            options_map)
-
-        # Convert the currencies.
-        for currency in options_map['operating_currency']:
-            holdings_list = holdings.convert_to_currency(price_map,
-                                                         currency,
-                                                         raw_holdings_list)
-
-            holdings_list = holdings.aggregate_holdings_by(
-                holdings_list, lambda holding: holding.cost_currency)
-
-            holdings_list = [holding
-                             for holding in holdings_list
-                             if holding.currency and holding.cost_currency]
-
-            # If after conversion there are no valid holdings, skip the currency
-            # altogether.
-            if not holdings_list:
-                continue
-
-            net_worths_dict[currency].append((date, holdings_list[0].market_value))
+        for currency, net_worth in zip(currencies, net_worths):
+            # If there are no valid holdings, skip the currency altogether.
+            if net_worth is not None:
+                net_worths_dict[currency].append((date, net_worth))
 
     # Extrapolate milestones in various currencies.
     days_interp = 365